@@ -0,0 +1,714 @@
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+from core_apps.common.metrics import observe_s3_request
+from core_apps.common.s3_checksums import S3_CHECKSUM_ALGORITHMS, checksum_file
+
+logger = logging.getLogger(__name__)
+
+
+# object metadata (ContentType, ...) next to the objects: <root>/.movio-meta/<bucket>/<key>.json
+META_DIR_NAME = ".movio-meta"
+
+# in progress multipart uploads: <root>/.movio-multipart/<upload id>/{upload.json, <part number>.part}
+MULTIPART_DIR_NAME = ".movio-multipart"
+
+# boto3 TransferConfig defaults, S3 minimum part size (except the last part)
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+
+# injected transient errors: (code, message, http status)
+THROTTLE_ERROR = ("SlowDown", "Please reduce your request rate.", 503)
+INTERNAL_ERROR = ("InternalError", "We encountered an internal error. Please try again.", 500)
+
+# object metadata accepted in ExtraArgs / put_object, returned by head_object / get_object
+OBJECT_METADATA_ARGS = (
+    "ContentType",
+    "ContentEncoding",
+    "ContentDisposition",
+    "CacheControl",
+    "Metadata",
+)
+
+# additional checksums of the objects: stored at the upload (ChecksumAlgorithm, or the value sent and
+# validated), returned by head_object / get_object with ChecksumMode="ENABLED"
+OBJECT_CHECKSUM_ARGS = tuple(f"Checksum{algorithm}" for algorithm in S3_CHECKSUM_ALGORITHMS)
+
+
+class LocalS3Client:
+    """Filesystem stand-in of the boto3 S3 client, for benchmarks and load tests without AWS.
+
+    Only the calls of the pipeline are supported, with the boto3 signatures. An object is the file
+    <root>/<bucket>/<key>; a missing object raises the same ClientError (NoSuchKey / 404) as S3.
+    A presigned url is the local path of the object, which ffmpeg and ffprobe read as well.
+
+    Faults can be injected on every request: a latency (plus uniform jitter), a transfer time at
+    bandwidth_bytes_per_second (per request, 0: unlimited), and transient errors (SlowDown 503 at
+    throttle_rate, InternalError 500 at error_rate). As botocore does, a transient error is retried
+    up to max_attempts with a randomized exponential backoff before it's raised.
+
+    request_limiter (s3_rate_limit.S3RequestLimiter): every attempt waits for its slot and token, as
+    the attempts of the boto3 client do, the injected SlowDowns are its throttle events.
+    """
+
+    def __init__(
+        self,
+        root,
+        latency_seconds: float = 0.0,
+        latency_jitter_seconds: float = 0.0,
+        bandwidth_bytes_per_second: int = 0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        max_attempts: int = 5,
+        seed: int = None,
+        request_limiter=None,
+    ) -> None:
+        self.root = str(root)
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.bandwidth_bytes_per_second = bandwidth_bytes_per_second
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_attempts = max(max_attempts, 1)
+        self.request_limiter = request_limiter
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self.request_counts = Counter()  # operation: requests (attempts)
+        self.error_counts = Counter()  # error code: injected errors
+        self.retry_count = 0
+
+    # ######## injected faults
+
+    def get_injected_error(self, size_bytes: int):
+        """Wait the latency and transfer time of a request, returns the injected error (or None)."""
+
+        delay = self.latency_seconds
+        if self.latency_jitter_seconds:
+            delay += self.random.uniform(0, self.latency_jitter_seconds)
+        if self.bandwidth_bytes_per_second:
+            delay += size_bytes / self.bandwidth_bytes_per_second
+        if delay > 0:
+            time.sleep(delay)
+
+        draw = self.random.random()
+        if draw < self.throttle_rate:
+            return THROTTLE_ERROR
+        if draw < self.throttle_rate + self.error_rate:
+            return INTERNAL_ERROR
+        return None
+
+    def request(self, operation: str, call, size_bytes: int = 0, bucket: str = None, key: str = None):
+        """Run call() as the request `operation` (on the object bucket / key), with the injected faults and the retries."""
+
+        for attempt in range(1, self.max_attempts + 1):
+            slot = None
+            if self.request_limiter is not None:
+                slot = self.request_limiter.acquire(operation, bucket, key)
+            started_at = time.perf_counter()
+            injected_error = self.get_injected_error(size_bytes)
+            with self.lock:
+                self.request_counts[operation] += 1
+
+            if injected_error is None:
+                try:
+                    response = call()
+                except ClientError as e:
+                    observe_s3_request(
+                        operation, time.perf_counter() - started_at, e.response["Error"]["Code"]
+                    )
+                    if slot is not None:
+                        self.request_limiter.release(slot, "error")
+                    raise
+                except Exception:
+                    if slot is not None:
+                        self.request_limiter.release(slot, "error")
+                    raise
+                observe_s3_request(operation, time.perf_counter() - started_at)
+                if slot is not None:
+                    self.request_limiter.release(slot, "success")
+                return response
+
+            code, message, status = injected_error
+            with self.lock:
+                self.error_counts[code] += 1
+            observe_s3_request(operation, time.perf_counter() - started_at, code)
+            if slot is not None:
+                self.request_limiter.release(
+                    slot, "throttled" if injected_error is THROTTLE_ERROR else "error"
+                )
+
+            if attempt == self.max_attempts:
+                raise self.client_error(code, message, operation, status)
+
+            with self.lock:
+                self.retry_count += 1
+            # botocore legacy retry mode: rand(0, 1) * 2 ** (attempts - 1)
+            time.sleep(self.random.random() * 2 ** (attempt - 1))
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": dict(self.request_counts),
+                "injected_errors": dict(self.error_counts),
+                "retries": self.retry_count,
+                "bytes_downloaded": self.bytes_downloaded,
+                "bytes_uploaded": self.bytes_uploaded,
+            }
+
+    # ######## helpers
+
+    def get_object_path(self, bucket: str, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, bucket, key))
+        # keys are relative to the bucket, never outside of it
+        if not path.startswith(os.path.realpath(os.path.join(self.root, bucket)) + os.sep):
+            raise self.client_error("InvalidKey", f"Invalid key: {key}", "PutObject", 400)
+        return path
+
+    def get_meta_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, META_DIR_NAME, bucket, key + ".json")
+
+    @staticmethod
+    def client_error(code: str, message: str, operation: str, status: int) -> ClientError:
+        return ClientError(
+            {
+                "Error": {"Code": code, "Message": message},
+                "ResponseMetadata": {"HTTPStatusCode": status},
+            },
+            operation,
+        )
+
+    def get_existing_object_path(self, bucket: str, key: str, operation: str) -> str:
+        path = self.get_object_path(bucket, key)
+        if not os.path.isfile(path):
+            # head_object has no body, S3 answers a bare 404
+            code = "404" if operation == "HeadObject" else "NoSuchKey"
+            raise self.client_error(
+                code, "The specified key does not exist.", operation, 404
+            )
+        return path
+
+    def count_bytes(self, direction: str, size_bytes: int) -> None:
+        with self.lock:
+            if direction == "download":
+                self.bytes_downloaded += size_bytes
+            else:
+                self.bytes_uploaded += size_bytes
+
+    def write_object(
+        self, bucket: str, key: str, write, metadata: dict, etag: str = None, part_count: int = None
+    ) -> int:
+        """write(file): writes the object content, atomically published once complete.
+
+        part_count: of a multipart upload, its checksum is suffixed "-<parts>" as the composite ones of S3
+        (the stand-in keeps the full object checksum as the value).
+        """
+
+        path = self.get_object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp_path, "wb") as file:
+            write(file)
+
+        try:
+            checksums = self.get_object_checksums(tmp_path, metadata, part_count)
+        except ClientError:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+        meta_path = self.get_meta_path(bucket, key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, "w") as file:
+            object_metadata = {
+                arg: metadata[arg] for arg in OBJECT_METADATA_ARGS if arg in metadata
+            }
+            object_metadata.update(checksums)
+            # a multipart object keeps its "<md5 of the part md5s>-<parts>" ETag
+            if etag is not None:
+                object_metadata["ETag"] = etag
+            json.dump(object_metadata, file)
+
+        size_bytes = os.path.getsize(path)
+        self.count_bytes("upload", size_bytes)
+        return size_bytes
+
+    def get_object_checksums(self, path: str, metadata: dict, part_count: int = None) -> dict:
+        """{Checksum<ALGORITHM>: value} of an uploaded object, BadDigest when the value sent doesn't match."""
+
+        checksums = {}
+        for algorithm in S3_CHECKSUM_ALGORITHMS:
+            sent_checksum = metadata.get(f"Checksum{algorithm}")
+            if sent_checksum is None and metadata.get("ChecksumAlgorithm") != algorithm:
+                continue
+
+            checksum, _ = checksum_file(path, algorithm)
+            if sent_checksum is not None and sent_checksum != checksum:
+                raise self.client_error(
+                    "BadDigest",
+                    f"The {algorithm} you specified did not match the calculated checksum.",
+                    "PutObject",
+                    400,
+                )
+            if part_count is not None:
+                checksum = f"{checksum}-{part_count}"
+            checksums[f"Checksum{algorithm}"] = checksum
+        return checksums
+
+    def read_metadata(self, bucket: str, key: str) -> dict:
+        try:
+            with open(self.get_meta_path(bucket, key)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def describe_object(self, bucket: str, key: str, path: str, checksum_mode: bool = False) -> dict:
+        """checksum_mode: with the checksums of the object (ChecksumMode="ENABLED")."""
+
+        stat = os.stat(path)
+        metadata = self.read_metadata(bucket, key)
+        if not checksum_mode:
+            metadata = {
+                arg: value for arg, value in metadata.items() if arg not in OBJECT_CHECKSUM_ARGS
+            }
+        return {
+            "ContentLength": stat.st_size,
+            "LastModified": datetime.datetime.fromtimestamp(
+                stat.st_mtime, tz=datetime.timezone.utc
+            ),
+            "ETag": f'"{int(stat.st_mtime_ns)}-{stat.st_size}"',
+            "ContentType": "binary/octet-stream",
+            **metadata,
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }
+
+    # ######## S3 calls
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        size_bytes = os.path.getsize(Filename)
+        multipart_threshold = getattr(Config, "multipart_threshold", DEFAULT_MULTIPART_THRESHOLD)
+        if size_bytes >= multipart_threshold:
+            # as the boto3 managed transfer: parts of Config.multipart_chunksize
+            self.upload_file_multipart(Filename, Bucket, Key, ExtraArgs, Callback, Config)
+            return
+
+        def write(file):
+            with open(Filename, "rb") as source:
+                shutil.copyfileobj(source, file, length=1024 * 1024)
+
+        self.request(
+            "PutObject",
+            lambda: self.write_object(Bucket, Key, write, ExtraArgs or {}),
+            size_bytes,
+            Bucket,
+            Key,
+        )
+        if Callback is not None:
+            Callback(size_bytes)
+
+    def upload_file_multipart(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        with open(Filename, "rb") as source:
+            self.upload_stream_multipart(source, Bucket, Key, ExtraArgs, Callback, Config)
+
+    def upload_stream_multipart(self, source, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        """Parts of Config.multipart_chunksize read from source (a binary file object), in order."""
+
+        chunksize = max(
+            getattr(Config, "multipart_chunksize", DEFAULT_MULTIPART_CHUNKSIZE),
+            MIN_MULTIPART_PART_SIZE,
+        )
+        upload_id = self.create_multipart_upload(Bucket=Bucket, Key=Key, **(ExtraArgs or {}))[
+            "UploadId"
+        ]
+        try:
+            parts = []
+            for part_number in range(1, 10001):
+                chunk = source.read(chunksize)
+                if not chunk and parts:
+                    break
+                response = self.upload_part(
+                    Bucket=Bucket,
+                    Key=Key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=chunk,
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+                if Callback is not None:
+                    Callback(len(chunk))
+                if len(chunk) < chunksize:
+                    break
+
+            self.complete_multipart_upload(
+                Bucket=Bucket,
+                Key=Key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            # as boto3: a failed managed upload aborts its multipart upload
+            try:
+                self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id)
+            except ClientError:
+                pass
+            raise
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        """As boto3: a single PutObject under the multipart threshold, else parts read in order."""
+
+        multipart_threshold = getattr(Config, "multipart_threshold", DEFAULT_MULTIPART_THRESHOLD)
+        body = Fileobj.read(multipart_threshold)
+        if len(body) < multipart_threshold:
+            self.put_object(Bucket=Bucket, Key=Key, Body=body, **(ExtraArgs or {}))
+            if Callback is not None:
+                Callback(len(body))
+            return
+
+        self.upload_stream_multipart(
+            PrefixedReader(body, Fileobj), Bucket, Key, ExtraArgs, Callback, Config
+        )
+
+    def download_fileobj(self, Bucket, Key, Fileobj, ExtraArgs=None, Callback=None, Config=None):
+        size_bytes = self.head_object(Bucket=Bucket, Key=Key)["ContentLength"]
+
+        def copy():
+            path = self.get_existing_object_path(Bucket, Key, "GetObject")
+            with open(path, "rb") as source:
+                shutil.copyfileobj(source, Fileobj, length=1024 * 1024)
+
+        self.request("GetObject", copy, size_bytes, Bucket, Key)
+
+        self.count_bytes("download", size_bytes)
+        if Callback is not None:
+            Callback(size_bytes)
+
+    def download_file(self, Bucket, Key, Filename, ExtraArgs=None, Callback=None, Config=None):
+        size_bytes = self.head_object(Bucket=Bucket, Key=Key)["ContentLength"]
+
+        def copy():
+            path = self.get_existing_object_path(Bucket, Key, "GetObject")
+            os.makedirs(os.path.dirname(os.path.abspath(Filename)), exist_ok=True)
+            shutil.copyfile(path, Filename)
+
+        self.request("GetObject", copy, size_bytes, Bucket, Key)
+
+        size_bytes = os.path.getsize(Filename)
+        self.count_bytes("download", size_bytes)
+        if Callback is not None:
+            Callback(size_bytes)
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+
+        def put():
+            self.write_object(Bucket, Key, lambda file: file.write(Body), kwargs)
+            path = self.get_object_path(Bucket, Key)
+            return {
+                "ETag": self.describe_object(Bucket, Key, path)["ETag"],
+                "ResponseMetadata": {"HTTPStatusCode": 200},
+            }
+
+        return self.request("PutObject", put, len(Body), Bucket, Key)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        def get():
+            path = self.get_existing_object_path(Bucket, Key, "GetObject")
+            with open(path, "rb") as file:
+                body = file.read()
+            self.count_bytes("download", len(body))
+            return {
+                **self.describe_object(
+                    Bucket, Key, path, checksum_mode=kwargs.get("ChecksumMode") == "ENABLED"
+                ),
+                "Body": io.BytesIO(body),
+            }
+
+        size_bytes = 0
+        if self.bandwidth_bytes_per_second:
+            size_bytes = self.head_object(Bucket=Bucket, Key=Key)["ContentLength"]
+        return self.request("GetObject", get, size_bytes, Bucket, Key)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        def head():
+            path = self.get_existing_object_path(Bucket, Key, "HeadObject")
+            return self.describe_object(
+                Bucket, Key, path, checksum_mode=kwargs.get("ChecksumMode") == "ENABLED"
+            )
+
+        return self.request("HeadObject", head, bucket=Bucket, key=Key)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        return self.request(
+            "DeleteObject", lambda: self.remove_object(Bucket, Key), bucket=Bucket, key=Key
+        )
+
+    def remove_object(self, bucket: str, key: str) -> dict:
+        # as S3: deleting a missing key is not an error
+        path = self.get_object_path(bucket, key)
+        for path_to_remove in (path, self.get_meta_path(bucket, key)):
+            try:
+                os.remove(path_to_remove)
+            except FileNotFoundError:
+                pass
+        return {"ResponseMetadata": {"HTTPStatusCode": 204}}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        def delete():
+            deleted = []
+            for item in Delete.get("Objects", []):
+                self.remove_object(Bucket, item["Key"])
+                deleted.append({"Key": item["Key"]})
+            return {"Deleted": deleted, "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        return self.request("DeleteObjects", delete, bucket=Bucket)
+
+    # ######## multipart uploads
+
+    def get_upload_dir(self, upload_id: str, operation: str) -> str:
+        upload_dir = os.path.join(self.root, MULTIPART_DIR_NAME, os.path.basename(upload_id))
+        if not os.path.isfile(os.path.join(upload_dir, "upload.json")):
+            raise self.client_error(
+                "NoSuchUpload", "The specified upload does not exist.", operation, 404
+            )
+        return upload_dir
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        def create():
+            self.get_object_path(Bucket, Key)  # validates the key
+            upload_id = uuid.uuid4().hex
+            upload_dir = os.path.join(self.root, MULTIPART_DIR_NAME, upload_id)
+            os.makedirs(upload_dir)
+            with open(os.path.join(upload_dir, "upload.json"), "w") as file:
+                json.dump(
+                    {
+                        "Bucket": Bucket,
+                        "Key": Key,
+                        "Initiated": time.time(),
+                        "Metadata": {
+                            arg: kwargs[arg]
+                            for arg in (*OBJECT_METADATA_ARGS, "ChecksumAlgorithm")
+                            if arg in kwargs
+                        },
+                    },
+                    file,
+                )
+            return {
+                "Bucket": Bucket,
+                "Key": Key,
+                "UploadId": upload_id,
+                "ResponseMetadata": {"HTTPStatusCode": 200},
+            }
+
+        return self.request("CreateMultipartUpload", create, bucket=Bucket, key=Key)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b"", **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+
+        def upload():
+            upload_dir = self.get_upload_dir(UploadId, "UploadPart")
+            part_path = os.path.join(upload_dir, f"{int(PartNumber)}.part")
+            with open(part_path + ".tmp", "wb") as file:
+                file.write(Body)
+            os.replace(part_path + ".tmp", part_path)
+            return {
+                "ETag": f'"{hashlib.md5(Body).hexdigest()}"',
+                "ResponseMetadata": {"HTTPStatusCode": 200},
+            }
+
+        return self.request("UploadPart", upload, len(Body), Bucket, Key)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        def complete():
+            operation = "CompleteMultipartUpload"
+            upload_dir = self.get_upload_dir(UploadId, operation)
+            with open(os.path.join(upload_dir, "upload.json")) as file:
+                upload = json.load(file)
+
+            parts = MultipartUpload.get("Parts", [])
+            part_numbers = [part["PartNumber"] for part in parts]
+            if not parts or part_numbers != sorted(set(part_numbers)):
+                raise self.client_error(
+                    "InvalidPartOrder", "The list of parts was not in ascending order.", operation, 400
+                )
+
+            part_paths = []
+            part_digests = []
+            for index, part in enumerate(parts):
+                part_path = os.path.join(upload_dir, f"{int(part['PartNumber'])}.part")
+                if not os.path.isfile(part_path):
+                    raise self.client_error(
+                        "InvalidPart", "One or more of the specified parts could not be found.", operation, 400
+                    )
+                with open(part_path, "rb") as file:
+                    digest = hashlib.md5(file.read())
+                if part["ETag"].strip('"') != digest.hexdigest():
+                    raise self.client_error(
+                        "InvalidPart", "One or more of the specified parts could not be found.", operation, 400
+                    )
+                if index < len(parts) - 1 and os.path.getsize(part_path) < MIN_MULTIPART_PART_SIZE:
+                    raise self.client_error(
+                        "EntityTooSmall", "Your proposed upload is smaller than the minimum allowed size.", operation, 400
+                    )
+                part_paths.append(part_path)
+                part_digests.append(digest.digest())
+
+            def write(file):
+                for part_path in part_paths:
+                    with open(part_path, "rb") as source:
+                        shutil.copyfileobj(source, file, length=1024 * 1024)
+
+            etag = f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(parts)}"'
+            self.write_object(
+                Bucket, Key, write, upload["Metadata"], etag=etag, part_count=len(parts)
+            )
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            return {
+                "Bucket": Bucket,
+                "Key": Key,
+                "ETag": etag,
+                "Location": self.get_object_path(Bucket, Key),
+                "ResponseMetadata": {"HTTPStatusCode": 200},
+            }
+
+        return self.request("CompleteMultipartUpload", complete, bucket=Bucket, key=Key)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        def abort():
+            shutil.rmtree(self.get_upload_dir(UploadId, "AbortMultipartUpload"))
+            return {"ResponseMetadata": {"HTTPStatusCode": 204}}
+
+        return self.request("AbortMultipartUpload", abort, bucket=Bucket, key=Key)
+
+    def list_multipart_uploads(self, Bucket, Prefix="", **kwargs):
+        def list_uploads():
+            uploads = []
+            multipart_root = os.path.join(self.root, MULTIPART_DIR_NAME)
+            upload_ids = sorted(os.listdir(multipart_root)) if os.path.isdir(multipart_root) else []
+            for upload_id in upload_ids:
+                try:
+                    with open(os.path.join(multipart_root, upload_id, "upload.json")) as file:
+                        upload = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                if upload["Bucket"] == Bucket and upload["Key"].startswith(Prefix):
+                    uploads.append(
+                        {
+                            "Key": upload["Key"],
+                            "UploadId": upload_id,
+                            "Initiated": datetime.datetime.fromtimestamp(
+                                upload["Initiated"], tz=datetime.timezone.utc
+                            ),
+                        }
+                    )
+            return {
+                "Bucket": Bucket,
+                "Uploads": uploads,
+                "IsTruncated": False,
+                "ResponseMetadata": {"HTTPStatusCode": 200},
+            }
+
+        return self.request("ListMultipartUploads", list_uploads, bucket=Bucket)
+
+    # ######## listing
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, **kwargs):
+        return self.request(
+            "ListObjectsV2",
+            lambda: self.list_keys(Bucket, Prefix, MaxKeys, ContinuationToken),
+            bucket=Bucket,
+        )
+
+    def list_keys(self, bucket: str, prefix: str, max_keys: int, continuation_token: str) -> dict:
+        bucket_root = os.path.join(self.root, bucket)
+        keys = []
+        for directory, _, files in os.walk(bucket_root):
+            for file in files:
+                if file.endswith(".part"):
+                    continue
+                key = os.path.relpath(os.path.join(directory, file), bucket_root)
+                key = key.replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        keys.sort()
+
+        if continuation_token is not None:
+            keys = [key for key in keys if key > continuation_token]
+
+        page = keys[:max_keys]
+        response = {
+            "KeyCount": len(page),
+            "IsTruncated": len(keys) > max_keys,
+            "Contents": [
+                {
+                    "Key": key,
+                    "Size": os.path.getsize(os.path.join(bucket_root, key)),
+                }
+                for key in page
+            ],
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_paginator(self, operation_name: str):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(f"LocalS3Client has no paginator for {operation_name}")
+        return LocalListObjectsV2Paginator(self)
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        return self.get_object_path(Params["Bucket"], Params["Key"])
+
+
+class PrefixedReader:
+    """A binary file object read after the bytes already read from it (prefix)."""
+
+    def __init__(self, prefix: bytes, fileobj) -> None:
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.fileobj.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.fileobj.read(), b""
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        return data
+
+
+class LocalListObjectsV2Paginator:
+    def __init__(self, client: LocalS3Client) -> None:
+        self.client = client
+
+    def paginate(self, **kwargs):
+        continuation_token = None
+        while True:
+            page = self.client.list_objects_v2(
+                ContinuationToken=continuation_token, **kwargs
+            )
+            yield page
+            if not page["IsTruncated"]:
+                return
+            continuation_token = page["NextContinuationToken"]
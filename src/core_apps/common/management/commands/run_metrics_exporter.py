@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core_apps.common.metrics import start_metrics_exporter
+
+
+class Command(BaseCommand):
+    """Standalone Prometheus Exporter for the Celery Worker Hosts (no Django app served)
+
+    Serves the aggregate of the worker processes of the host, from PROMETHEUS_MULTIPROC_DIR.
+    """
+
+    help = "Serves the Prometheus metrics of the celery worker processes of this host"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--port", type=int, default=settings.MOVIO_METRICS_EXPORTER_PORT
+        )
+        parser.add_argument("--addr", default="0.0.0.0")
+
+    def handle(self, *args, **options):
+        start_metrics_exporter(options["port"], addr=options["addr"])
+        while True:
+            time.sleep(3600)
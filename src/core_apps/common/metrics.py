@@ -0,0 +1,277 @@
+"""
+Prometheus metrics of the pipeline.
+
+The celery prefork children can't be scraped one by one: with PROMETHEUS_MULTIPROC_DIR set
+(before the import of prometheus_client), every process writes its samples to its own mmap file
+in the directory, and the standalone exporter of the worker container (manage.py run_metrics_exporter)
+aggregates them. The web process serves no /metrics: it can't see the directory of the workers.
+A metric update is an in-process add on a value owned by the process, no IPC, no shared lock.
+"""
+
+import logging
+import os
+import time
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
+
+STAGE_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+S3_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+MQ_PUBLISH_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ENCODE_SPEED_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 4, 8, 16)
+MESSAGE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576, 4194304)
+RATE_LIMIT_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+stage_duration_seconds = Histogram(
+    "movio_stage_duration_seconds",
+    "Duration of a pipeline stage (celery task).",
+    ["stage", "status"],
+    buckets=STAGE_DURATION_BUCKETS,
+)
+stage_errors_total = Counter(
+    "movio_stage_errors_total",
+    "Failed pipeline stages, by exception type.",
+    ["stage", "exception"],
+)
+s3_request_duration_seconds = Histogram(
+    "movio_s3_request_duration_seconds",
+    "Latency of a single S3 API request.",
+    ["operation"],
+    buckets=S3_LATENCY_BUCKETS,
+)
+s3_request_errors_total = Counter(
+    "movio_s3_request_errors_total",
+    "Failed S3 API requests, by error code or exception type.",
+    ["operation", "exception"],
+)
+s3_bytes_total = Counter(
+    "movio_s3_bytes_total",
+    "Bytes transferred from and to S3.",
+    ["direction"],
+)
+ffmpeg_duration_seconds = Histogram(
+    "movio_ffmpeg_duration_seconds",
+    "Wall time of an ffmpeg command.",
+    ["stage", "outcome"],
+    buckets=STAGE_DURATION_BUCKETS,
+)
+encode_speed_ratio = Histogram(
+    "movio_encode_speed_ratio",
+    "ffmpeg speed multiplier (media seconds per wall second) of a finished command.",
+    ["stage"],
+    buckets=ENCODE_SPEED_BUCKETS,
+)
+queue_wait_seconds = Histogram(
+    "movio_queue_wait_seconds",
+    "Delay between the dispatch of a submission and the start of its first task.",
+    ["lane"],
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+mq_publish_duration_seconds = Histogram(
+    "movio_mq_publish_duration_seconds",
+    "Latency of a video process result publish (connect, declare and publish).",
+    ["outcome"],
+    buckets=MQ_PUBLISH_BUCKETS,
+)
+s3_integrity_errors_total = Counter(
+    "movio_s3_integrity_errors_total",
+    "S3 transfers whose size or checksum didn't match, by direction (download or upload).",
+    ["direction"],
+)
+mq_message_bytes = Histogram(
+    "movio_mq_message_bytes",
+    "Size of a published video process result message (bytes), by message type.",
+    ["message_type"],
+    buckets=MESSAGE_SIZE_BUCKETS,
+)
+result_subtitle_payloads_total = Counter(
+    "movio_result_subtitle_payloads_total",
+    "Subtitles of the result messages, by delivery (inline, reference or none) and encoding.",
+    ["delivery", "encoding"],
+)
+workspace_reclaimed_bytes_total = Counter(
+    "movio_workspace_reclaimed_bytes_total",
+    "Bytes of orphaned local workspaces reclaimed by the sweeper.",
+)
+translation_memory_lookups_total = Counter(
+    "movio_translation_memory_lookups_total",
+    "Cue texts looked up in the translation memory, by result (hit or miss).",
+    ["result"],
+)
+translation_characters_total = Counter(
+    "movio_translation_characters_total",
+    "Characters of the cue texts translated, by source (memory or translator).",
+    ["source"],
+)
+s3_throttle_events_total = Counter(
+    "movio_s3_throttle_events_total",
+    "S3 request attempts throttled (503 SlowDown), by bucket and operation.",
+    ["bucket", "operation"],
+)
+s3_rate_limit_wait_seconds = Histogram(
+    "movio_s3_rate_limit_wait_seconds",
+    "Wait of an S3 request attempt for its concurrency slot and token (its count rate: the effective request rate), by bucket and kind (read or write).",
+    ["bucket", "kind"],
+    buckets=RATE_LIMIT_WAIT_BUCKETS,
+)
+# a gauge of the process: the latest rate seen of the shared token buckets, the limits of the live processes summed
+s3_request_rate_limit = Gauge(
+    "movio_s3_request_rate_limit",
+    "Allowed S3 request rate (requests per second) of the latest token bucket used, by bucket and kind.",
+    ["bucket", "kind"],
+    multiprocess_mode="mostrecent",
+)
+s3_concurrency_limit = Gauge(
+    "movio_s3_concurrency_limit",
+    "Adaptive limit of the S3 requests in flight (AIMD).",
+    multiprocess_mode="livesum",
+)
+text_asset_bytes_total = Counter(
+    "movio_text_asset_bytes_total",
+    "Bytes of the text assets (manifests, subtitles) uploaded compressed, before (original) and after (stored) the compression.",
+    ["kind"],
+)
+
+
+def observe_stage(stage: str, status: str, duration_seconds: float, exception: str = None) -> None:
+    stage_duration_seconds.labels(stage=stage, status=status).observe(duration_seconds)
+    if exception is not None:
+        stage_errors_total.labels(stage=stage, exception=exception).inc()
+
+
+def record_s3_bytes(direction: str, size_bytes: int) -> None:
+    """direction: download or upload"""
+
+    s3_bytes_total.labels(direction=direction).inc(size_bytes)
+
+
+def record_s3_integrity_error(direction: str) -> None:
+    s3_integrity_errors_total.labels(direction=direction).inc()
+
+
+def observe_s3_request(operation: str, duration_seconds: float, exception: str = None) -> None:
+    """exception: the error code (or exception type) of a failed request."""
+
+    s3_request_duration_seconds.labels(operation=operation).observe(duration_seconds)
+    if exception is not None:
+        s3_request_errors_total.labels(operation=operation, exception=exception).inc()
+
+
+def observe_ffmpeg(stage: str, outcome: str, wall_seconds: float, speed: float = None) -> None:
+    ffmpeg_duration_seconds.labels(stage=stage, outcome=outcome).observe(wall_seconds)
+    if speed:
+        encode_speed_ratio.labels(stage=stage).observe(speed)
+
+
+def observe_queue_wait(lane: str, wait_seconds: float) -> None:
+    queue_wait_seconds.labels(lane=lane).observe(wait_seconds)
+
+
+def observe_mq_publish(outcome: str, duration_seconds: float) -> None:
+    mq_publish_duration_seconds.labels(outcome=outcome).observe(duration_seconds)
+
+
+def observe_mq_message_size(message_type: str, size_bytes: int) -> None:
+    mq_message_bytes.labels(message_type=message_type).observe(size_bytes)
+
+
+def record_result_subtitle_payload(delivery: str, encoding: str) -> None:
+    result_subtitle_payloads_total.labels(delivery=delivery, encoding=encoding).inc()
+
+
+def record_workspace_reclaimed(size_bytes: int) -> None:
+    workspace_reclaimed_bytes_total.inc(size_bytes)
+
+
+def record_translation_memory(hits: int, misses: int, characters_saved: int, characters_translated: int) -> None:
+    translation_memory_lookups_total.labels(result="hit").inc(hits)
+    translation_memory_lookups_total.labels(result="miss").inc(misses)
+    translation_characters_total.labels(source="memory").inc(characters_saved)
+    translation_characters_total.labels(source="translator").inc(characters_translated)
+
+
+def record_text_asset_compression(original_bytes: int, stored_bytes: int) -> None:
+    text_asset_bytes_total.labels(kind="original").inc(original_bytes)
+    text_asset_bytes_total.labels(kind="stored").inc(stored_bytes)
+
+
+def record_s3_throttle(bucket: str, operation: str) -> None:
+    s3_throttle_events_total.labels(bucket=bucket, operation=operation).inc()
+
+
+def observe_s3_rate_limit_wait(bucket: str, kind: str, wait_seconds: float) -> None:
+    s3_rate_limit_wait_seconds.labels(bucket=bucket, kind=kind).observe(wait_seconds)
+
+
+def set_s3_request_rate_limit(bucket: str, kind: str, rate: float) -> None:
+    s3_request_rate_limit.labels(bucket=bucket, kind=kind).set(rate)
+
+
+def set_s3_concurrency_limit(limit: float) -> None:
+    s3_concurrency_limit.set(int(limit))
+
+
+def instrument_s3_client(s3_client) -> None:
+    """Time every S3 API request of the client (including the parts of the managed transfers) through botocore events."""
+
+    def before_call(model, context, **kwargs):
+        context["movio_started_at"] = time.perf_counter()
+
+    def after_call(model, http_response, parsed, context, **kwargs):
+        started_at = context.pop("movio_started_at", None)
+        error_code = None
+        if http_response.status_code >= 300:
+            error_code = (parsed.get("Error") or {}).get("Code") or str(
+                http_response.status_code
+            )
+        if started_at is not None:
+            observe_s3_request(model.name, time.perf_counter() - started_at, error_code)
+        elif error_code is not None:
+            s3_request_errors_total.labels(
+                operation=model.name, exception=error_code
+            ).inc()
+
+    def after_call_error(exception, context, **kwargs):
+        context.pop("movio_started_at", None)
+        operation = kwargs.get("event_name", "").rsplit(".", 1)[-1]
+        s3_request_errors_total.labels(
+            operation=operation, exception=type(exception).__name__
+        ).inc()
+
+    s3_client.meta.events.register("before-call.s3", before_call)
+    s3_client.meta.events.register("after-call.s3", after_call)
+    s3_client.meta.events.register("after-call-error.s3", after_call_error)
+
+
+def get_metrics_registry():
+    """The registry to export: the aggregate of every process in PROMETHEUS_MULTIPROC_DIR when set."""
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def mark_metrics_process_dead(pid: int) -> None:
+    """Drop the live samples of a dead process (celery pool child) from the multiprocess directory."""
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def start_metrics_exporter(port: int, addr: str = "0.0.0.0") -> None:
+    start_http_server(port, addr=addr, registry=get_metrics_registry())
+    logger.info(f"\n[=> METRICS EXPORTER STARTED]: Serving Metrics on {addr}:{port}/metrics")
+
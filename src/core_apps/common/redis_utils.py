@@ -0,0 +1,22 @@
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_redis_client():
+    try:
+        return redis.Redis.from_url(
+            settings.MOVIO_REDIS_URL,
+            decode_responses=True,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+    except (redis.RedisError, ValueError) as e:
+        logger.error(f"Failed to create Redis Client: {str(e)}")
+        raise e
@@ -0,0 +1,241 @@
+"""
+Streaming checksums of the S3 transfers (settings.MOVIO_S3_CHECKSUM_ALGORITHM).
+
+A file is checksummed while the transfer reads it (ChecksumReader) or writes it (ChecksumWriter):
+every byte is hashed once, as it streams, the file is never read a second time. The algorithms are
+S3 additional checksums, so the values are comparable with the ones S3 keeps for its objects:
+- "CRC32": zlib, no extra dependency
+- "CRC32C": the optional crc32c package (CRC32 without it)
+- "none": plain transfers
+
+An upload sends ChecksumAlgorithm (S3 validates the bytes it receives against it) and checks the
+bytes read against the size the file had (and the size expected by the caller, e.g. the segment
+index): a file truncated under the uploader fails instead of being uploaded. A download is checked
+against the size and the full object checksum of the object (not the composite "<value>-<parts>"
+checksums of multipart uploads, only the size then).
+"""
+
+import base64
+import logging
+import os
+import zlib
+
+from django.conf import settings
+
+try:
+    import crc32c
+except ImportError:
+    crc32c = None
+
+from core_apps.common.metrics import record_s3_integrity_error
+
+logger = logging.getLogger(__name__)
+
+S3_CHECKSUM_ALGORITHMS = ("CRC32", "CRC32C")
+
+CHECKSUM_CHUNK_BYTES = 1024 * 1024
+
+
+class S3IntegrityError(Exception):
+    pass
+
+
+def get_checksum_algorithm():
+    """The checksum algorithm of the transfers, None for plain transfers."""
+
+    algorithm = (settings.MOVIO_S3_CHECKSUM_ALGORITHM or "none").upper()
+    if algorithm == "NONE":
+        return None
+    if algorithm == "CRC32C" and crc32c is None:
+        return "CRC32"
+    if algorithm not in S3_CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported S3 checksum algorithm: {algorithm}")
+    return algorithm
+
+
+class StreamingChecksum:
+    """Running checksum of a byte stream, formatted as S3 does (base64 of the big endian value)."""
+
+    def __init__(self, algorithm: str) -> None:
+        self.algorithm = algorithm
+        self.value = 0
+        self.size_bytes = 0
+
+    def update(self, data: bytes) -> None:
+        if self.algorithm == "CRC32C":
+            self.value = crc32c.crc32c(data, self.value)
+        else:
+            self.value = zlib.crc32(data, self.value)
+        self.size_bytes += len(data)
+
+    def to_s3(self) -> str:
+        return base64.b64encode(self.value.to_bytes(4, "big")).decode("ascii")
+
+
+def checksum_bytes(data: bytes, algorithm: str) -> str:
+    checksum = StreamingChecksum(algorithm)
+    checksum.update(data)
+    return checksum.to_s3()
+
+
+def checksum_file(path: str, algorithm: str) -> tuple:
+    """(S3 checksum, bytes) of a file, read by chunks."""
+
+    checksum = StreamingChecksum(algorithm)
+    with open(path, "rb") as checksum_file:
+        while chunk := checksum_file.read(CHECKSUM_CHUNK_BYTES):
+            checksum.update(chunk)
+    return checksum.to_s3(), checksum.size_bytes
+
+
+class ChecksumReader:
+    """Read through file object: the bytes read are checksummed, in the order of the file.
+
+    The transfer may seek (its size) and read a range again (a retry): only the bytes past the ones
+    already checksummed are hashed. A range skipped makes the checksum incomplete.
+    """
+
+    def __init__(self, fileobj, algorithm: str) -> None:
+        self.fileobj = fileobj
+        self.checksum = StreamingChecksum(algorithm)
+        self.incomplete = False
+
+    def read(self, size: int = -1) -> bytes:
+        position = self.fileobj.tell()
+        data = self.fileobj.read(size)
+        if position > self.checksum.size_bytes:
+            self.incomplete = True
+        elif data:
+            new_data = data[self.checksum.size_bytes - position :]
+            if new_data:
+                self.checksum.update(new_data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.fileobj.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+
+class ChecksumWriter:
+    """Write through file object of a download, the bytes written are checksummed.
+
+    Not seekable: the managed transfer writes its ranges in order (never at random offsets).
+    """
+
+    def __init__(self, fileobj, algorithm: str) -> None:
+        self.fileobj = fileobj
+        self.checksum = StreamingChecksum(algorithm)
+
+    def write(self, data: bytes) -> int:
+        self.checksum.update(data)
+        return self.fileobj.write(data)
+
+    def seekable(self) -> bool:
+        return False
+
+    def writable(self) -> bool:
+        return True
+
+
+def get_transfer_record(bucket: str, checksum: StreamingChecksum, **kwargs) -> dict:
+    """Entry of the transfer manifest of a video."""
+
+    return {
+        "bucket": bucket,
+        "size_bytes": checksum.size_bytes,
+        "algorithm": checksum.algorithm,
+        "checksum": checksum.to_s3(),
+        **kwargs,
+    }
+
+
+def upload_file_with_checksum(
+    s3_client,
+    path: str,
+    bucket: str,
+    key: str,
+    extra_args: dict = None,
+    expected_size: int = None,
+    algorithm: str = None,
+) -> dict:
+    """Upload a file checksummed as it streams, returns its transfer record (None with no checksum algorithm).
+
+    S3IntegrityError: the bytes read don't match the size of the file (or expected_size).
+    """
+
+    algorithm = algorithm or get_checksum_algorithm()
+    if algorithm is None:
+        s3_client.upload_file(Filename=path, Bucket=bucket, Key=key, ExtraArgs=extra_args)
+        return None
+
+    with open(path, "rb") as source:
+        file_size = os.fstat(source.fileno()).st_size
+        reader = ChecksumReader(source, algorithm)
+        s3_client.upload_fileobj(
+            reader,
+            bucket,
+            key,
+            ExtraArgs={**(extra_args or {}), "ChecksumAlgorithm": algorithm},
+        )
+
+    uploaded_bytes = reader.checksum.size_bytes
+    if reader.incomplete or uploaded_bytes != file_size or (
+        expected_size is not None and uploaded_bytes != expected_size
+    ):
+        record_s3_integrity_error("upload")
+        raise S3IntegrityError(
+            f"Uploaded {uploaded_bytes} bytes of {path} ({file_size} bytes, expected: {expected_size}): s3://{bucket}/{key}"
+        )
+    return get_transfer_record(bucket, reader.checksum)
+
+
+def download_file_with_checksum(
+    s3_client, bucket: str, key: str, path: str, algorithm: str = None
+) -> dict:
+    """Download an object checksummed as it streams, verified against the object, returns its transfer record.
+
+    S3IntegrityError: the size or the (full object) checksum of the bytes received doesn't match the object.
+    """
+
+    head = s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode="ENABLED")
+
+    # the algorithm of the object's checksum when it has one we compute
+    expected_checksum = None
+    for object_algorithm in S3_CHECKSUM_ALGORITHMS:
+        if head.get(f"Checksum{object_algorithm}") and (
+            object_algorithm != "CRC32C" or crc32c is not None
+        ):
+            algorithm = object_algorithm
+            expected_checksum = head[f"Checksum{object_algorithm}"]
+            break
+    algorithm = algorithm or get_checksum_algorithm() or "CRC32"
+    # composite checksum of a multipart upload: "<checksum of the part checksums>-<parts>"
+    verified = expected_checksum is not None and "-" not in expected_checksum
+
+    with open(path, "wb") as target:
+        writer = ChecksumWriter(target, algorithm)
+        s3_client.download_fileobj(bucket, key, writer)
+
+    if writer.checksum.size_bytes != head["ContentLength"] or (
+        verified and writer.checksum.to_s3() != expected_checksum
+    ):
+        record_s3_integrity_error("download")
+        raise S3IntegrityError(
+            f"Downloaded s3://{bucket}/{key}: {writer.checksum.size_bytes} bytes, checksum {writer.checksum.to_s3()}, "
+            f"expected {head['ContentLength']} bytes, checksum {expected_checksum}"
+        )
+    return get_transfer_record(bucket, writer.checksum, key=key, verified=verified)
+
+
+if (settings.MOVIO_S3_CHECKSUM_ALGORITHM or "").upper() == "CRC32C" and crc32c is None:
+    logger.warning(
+        "\n[## S3 CHECKSUM WARNING]: MOVIO_S3_CHECKSUM_ALGORITHM is CRC32C but the crc32c package is not installed, CRC32 is used."
+    )
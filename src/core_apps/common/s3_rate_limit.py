@@ -0,0 +1,396 @@
+"""
+S3 request rate limiting shared by the workers (settings.MOVIO_S3_RATE_LIMIT_ENABLED).
+
+S3 scales its request rate per prefix (about 3,500 PUT/POST/DELETE and 5,500 GET/HEAD per second)
+and answers 503 SlowDown above it. Dozens of upload batches write under the prefix of the same
+video at once: retried independently, the throttled requests come back together and the storm
+goes on. Every request attempt (retries included) of the S3 client goes through:
+
+- a token bucket per (bucket, read / write, prefix: the first MOVIO_S3_RATE_LIMIT_PREFIX_DEPTH
+  "directories" of the key), shared by the fleet in redis (MOVIO_S3_RATE_LIMIT_BACKEND "redis",
+  a Lua script: the refill and the reservation are atomic). A request reserves a token and sleeps
+  until it's due. While redis is unreachable, a bucket of the process (LocalTokenBucketStore) at
+  rate / MOVIO_S3_RATE_LIMIT_FALLBACK_PROCESSES stands in.
+- AIMD on the rate of the bucket: a SlowDown halves it (MOVIO_S3_RATE_LIMIT_DECREASE_FACTOR, once per
+  MOVIO_S3_RATE_LIMIT_DECREASE_INTERVAL_SECONDS: the workers seeing the same storm decrease it once),
+  it grows back by MOVIO_S3_RATE_LIMIT_INCREASE_PER_SECOND every second, up to the S3 rate.
+- AIMD on the requests in flight of the process (AdaptiveConcurrencyLimit, the transfer threads):
+  a SlowDown halves the limit, every success adds 1 / limit, between MOVIO_S3_MIN_CONCURRENCY and
+  MOVIO_S3_MAX_CONCURRENCY.
+
+The retries of botocore (MOVIO_S3_RETRY_MODE "standard") wait a full jitter exponential backoff, so
+do the retries of the tasks (get_retry_backoff_seconds). Prometheus: the throttle events, the wait
+for a token, the rate of the buckets and the concurrency limit.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+
+import redis
+
+from core_apps.common.metrics import (
+    observe_s3_rate_limit_wait,
+    record_s3_throttle,
+    set_s3_concurrency_limit,
+    set_s3_request_rate_limit,
+)
+from core_apps.common.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# key of the token bucket of a prefix: redis hash {tokens, rate, updated_at, decreased_at}
+RATE_LIMIT_KEY = "movio:s3-rate-limit:{bucket}:{kind}:{prefix}"
+
+S3_READ_OPERATIONS = {
+    "GetObject",
+    "HeadObject",
+    "ListObjectsV2",
+    "ListMultipartUploads",
+    "ListParts",
+}
+
+S3_THROTTLE_ERROR_CODES = {"SlowDown", "503 SlowDown", "Throttling", "RequestLimitExceeded"}
+
+
+# take: reserve a token (ARGV[1] "take") or decrease the rate (ARGV[1] "throttle"), returns [wait, rate]
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local max_rate = tonumber(ARGV[2])
+local min_rate = tonumber(ARGV[3])
+local burst_seconds = tonumber(ARGV[4])
+local increase_per_second = tonumber(ARGV[5])
+local decrease_factor = tonumber(ARGV[6])
+local decrease_interval = tonumber(ARGV[7])
+local ttl_seconds = tonumber(ARGV[8])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'rate', 'updated_at', 'decreased_at')
+local rate = tonumber(state[2]) or max_rate
+local updated_at = tonumber(state[3]) or now
+local decreased_at = tonumber(state[4]) or 0
+local elapsed = math.max(now - updated_at, 0)
+
+rate = math.min(max_rate, rate + increase_per_second * elapsed)
+local capacity = math.max(rate * burst_seconds, 1)
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + rate * elapsed)
+
+local wait = 0
+if ARGV[1] == 'throttle' then
+    if now - decreased_at >= decrease_interval then
+        rate = math.max(min_rate, rate * decrease_factor)
+        decreased_at = now
+    end
+    tokens = math.min(tokens, 0)
+else
+    tokens = tokens - 1
+    if tokens < 0 then
+        wait = -tokens / rate
+    end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'rate', rate, 'updated_at', now, 'decreased_at', decreased_at)
+redis.call('EXPIRE', KEYS[1], ttl_seconds)
+return {tostring(wait), tostring(rate)}
+"""
+
+
+def get_rate_limit_kind(operation: str) -> str:
+    return "read" if operation in S3_READ_OPERATIONS else "write"
+
+
+def get_rate_limit_prefix(key: str) -> str:
+    """The first MOVIO_S3_RATE_LIMIT_PREFIX_DEPTH directories of the key ("" at the root of the bucket)."""
+
+    if not key:
+        return ""
+    directories = key.split("/")[:-1]
+    return "/".join(directories[: settings.MOVIO_S3_RATE_LIMIT_PREFIX_DEPTH])
+
+
+def get_max_rate(kind: str) -> float:
+    if kind == "read":
+        return settings.MOVIO_S3_RATE_LIMIT_READ_PER_SECOND
+    return settings.MOVIO_S3_RATE_LIMIT_WRITE_PER_SECOND
+
+
+def get_retry_backoff_seconds(retries: int) -> float:
+    """Full jitter exponential backoff of the retry number `retries` (0 for the first retry)."""
+
+    return random.uniform(
+        0,
+        min(
+            settings.MOVIO_S3_RETRY_BACKOFF_CAP_SECONDS,
+            settings.MOVIO_S3_RETRY_BACKOFF_BASE_SECONDS * 2**retries,
+        ),
+    )
+
+
+class RedisTokenBucketStore:
+    """Token buckets in redis, shared by the workers (the clock of redis: no skew between the nodes)."""
+
+    def __init__(self) -> None:
+        self.script = None
+
+    def call(self, action: str, key: str, max_rate: float) -> tuple:
+        if self.script is None:
+            self.script = get_redis_client().register_script(TOKEN_BUCKET_SCRIPT)
+        wait, rate = self.script(
+            keys=[key],
+            args=[
+                action,
+                max_rate,
+                settings.MOVIO_S3_RATE_LIMIT_MIN_PER_SECOND,
+                settings.MOVIO_S3_RATE_LIMIT_BURST_SECONDS,
+                settings.MOVIO_S3_RATE_LIMIT_INCREASE_PER_SECOND,
+                settings.MOVIO_S3_RATE_LIMIT_DECREASE_FACTOR,
+                settings.MOVIO_S3_RATE_LIMIT_DECREASE_INTERVAL_SECONDS,
+                settings.MOVIO_S3_RATE_LIMIT_IDLE_TTL_SECONDS,
+            ],
+        )
+        return float(wait), float(rate)
+
+    def take(self, key: str, max_rate: float) -> tuple:
+        """Reserve a token, returns (seconds to wait for it, rate of the bucket)."""
+
+        return self.call("take", key, max_rate)
+
+    def throttle(self, key: str, max_rate: float) -> float:
+        """A SlowDown: decrease the rate of the bucket, returns it."""
+
+        return self.call("throttle", key, max_rate)[1]
+
+
+class LocalTokenBucketStore:
+    """In process stand-in of RedisTokenBucketStore (MOVIO_S3_RATE_LIMIT_BACKEND "local", redis down)."""
+
+    def __init__(self, rate_share: float = 1.0) -> None:
+        # part of the S3 rate this process may use
+        self.rate_share = rate_share
+        self.buckets = {}  # key: [tokens, rate, updated_at, decreased_at]
+        self.lock = threading.Lock()
+
+    def get_bucket(self, key: str, max_rate: float, now: float) -> list:
+        bucket = self.buckets.get(key)
+        if bucket is None or now - bucket[2] > settings.MOVIO_S3_RATE_LIMIT_IDLE_TTL_SECONDS:
+            # a bucket per prefix (video): the idle ones expire, as the redis keys do
+            self.buckets = {
+                bucket_key: state
+                for bucket_key, state in self.buckets.items()
+                if now - state[2] <= settings.MOVIO_S3_RATE_LIMIT_IDLE_TTL_SECONDS
+            }
+            bucket = self.buckets[key] = [None, max_rate, now, float("-inf")]
+
+        elapsed = max(now - bucket[2], 0)
+        bucket[1] = min(
+            max_rate, bucket[1] + settings.MOVIO_S3_RATE_LIMIT_INCREASE_PER_SECOND * self.rate_share * elapsed
+        )
+        capacity = max(bucket[1] * settings.MOVIO_S3_RATE_LIMIT_BURST_SECONDS, 1)
+        bucket[0] = capacity if bucket[0] is None else min(capacity, bucket[0] + bucket[1] * elapsed)
+        bucket[2] = now
+        return bucket
+
+    def take(self, key: str, max_rate: float) -> tuple:
+        with self.lock:
+            bucket = self.get_bucket(key, max_rate * self.rate_share, time.monotonic())
+            bucket[0] -= 1
+            return (-bucket[0] / bucket[1] if bucket[0] < 0 else 0.0), bucket[1]
+
+    def throttle(self, key: str, max_rate: float) -> float:
+        with self.lock:
+            now = time.monotonic()
+            bucket = self.get_bucket(key, max_rate * self.rate_share, now)
+            if now - bucket[3] >= settings.MOVIO_S3_RATE_LIMIT_DECREASE_INTERVAL_SECONDS:
+                bucket[1] = max(
+                    settings.MOVIO_S3_RATE_LIMIT_MIN_PER_SECOND * self.rate_share,
+                    bucket[1] * settings.MOVIO_S3_RATE_LIMIT_DECREASE_FACTOR,
+                )
+                bucket[3] = now
+            bucket[0] = min(bucket[0], 0)
+            return bucket[1]
+
+
+class AdaptiveConcurrencyLimit:
+    """AIMD limit of the S3 requests in flight of the process, shared by its threads."""
+
+    def __init__(self, minimum: int, maximum: int) -> None:
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.decreased_at = float("-inf")
+        self.condition = threading.Condition()
+        set_s3_concurrency_limit(self.limit)
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, outcome: str) -> None:
+        """outcome: "success" (additive increase), "throttled" (multiplicative decrease) or "error"."""
+
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == "throttled":
+                now = time.monotonic()
+                if now - self.decreased_at >= settings.MOVIO_S3_RATE_LIMIT_DECREASE_INTERVAL_SECONDS:
+                    self.limit = max(
+                        self.minimum, self.limit * settings.MOVIO_S3_RATE_LIMIT_DECREASE_FACTOR
+                    )
+                    self.decreased_at = now
+                    set_s3_concurrency_limit(self.limit)
+            elif outcome == "success" and self.limit < self.maximum:
+                previous_limit = int(self.limit)
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                if int(self.limit) != previous_limit:
+                    set_s3_concurrency_limit(self.limit)
+            self.condition.notify_all()
+
+
+class S3RequestLimiter:
+    """Rate (shared token buckets) and concurrency (AIMD) limits of the S3 request attempts of a client."""
+
+    def __init__(self, store=None, concurrency_limit: AdaptiveConcurrencyLimit = None) -> None:
+        if store is None:
+            store = (
+                LocalTokenBucketStore()
+                if settings.MOVIO_S3_RATE_LIMIT_BACKEND == "local"
+                else RedisTokenBucketStore()
+            )
+        self.store = store
+        self.fallback_store = LocalTokenBucketStore(
+            rate_share=1 / max(settings.MOVIO_S3_RATE_LIMIT_FALLBACK_PROCESSES, 1)
+        )
+        # the store is retried after this time (monotonic) once it failed
+        self.fallback_until = 0.0
+        self.concurrency_limit = concurrency_limit or AdaptiveConcurrencyLimit(
+            settings.MOVIO_S3_MIN_CONCURRENCY, settings.MOVIO_S3_MAX_CONCURRENCY
+        )
+
+    def call_store(self, action: str, key: str, max_rate: float):
+        """The action on the store, on the local fallback while the store (redis) is unreachable."""
+
+        if time.monotonic() >= self.fallback_until:
+            try:
+                return getattr(self.store, action)(key, max_rate)
+            except redis.RedisError as e:
+                self.fallback_until = (
+                    time.monotonic() + settings.MOVIO_S3_RATE_LIMIT_REDIS_RETRY_SECONDS
+                )
+                logger.warning(
+                    f"\n[## S3 RATE LIMIT WARNING]: Shared Token Buckets Unreachable, Local Buckets for {settings.MOVIO_S3_RATE_LIMIT_REDIS_RETRY_SECONDS}s.\nException: {str(e)}"
+                )
+        return getattr(self.fallback_store, action)(key, max_rate)
+
+    def acquire(self, operation: str, bucket: str, key: str) -> tuple:
+        """Wait for a request slot and a token of the prefix, returns the slot to release."""
+
+        kind = get_rate_limit_kind(operation)
+        rate_limit_key = RATE_LIMIT_KEY.format(
+            bucket=bucket, kind=kind, prefix=get_rate_limit_prefix(key)
+        )
+
+        started_at = time.perf_counter()
+        self.concurrency_limit.acquire()
+        try:
+            wait_seconds, rate = self.call_store("take", rate_limit_key, get_max_rate(kind))
+        except Exception:
+            self.concurrency_limit.release("error")
+            raise
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        observe_s3_rate_limit_wait(bucket, kind, time.perf_counter() - started_at)
+        set_s3_request_rate_limit(bucket, kind, rate)
+        return operation, bucket, kind, rate_limit_key
+
+    def release(self, slot: tuple, outcome: str) -> None:
+        """outcome: "success", "throttled" (a SlowDown: the rate of the prefix decreases) or "error"."""
+
+        operation, bucket, kind, rate_limit_key = slot
+        self.concurrency_limit.release(outcome)
+        if outcome == "throttled":
+            record_s3_throttle(bucket, operation)
+            try:
+                rate = self.call_store("throttle", rate_limit_key, get_max_rate(kind))
+                set_s3_request_rate_limit(bucket, kind, rate)
+            except Exception as e:
+                logger.warning(
+                    f"\n[## S3 RATE LIMIT WARNING]: Throttle Not Recorded: {rate_limit_key}\nException: {str(e)}"
+                )
+
+
+def get_response_outcome(response, caught_exception) -> str:
+    """Outcome of a botocore attempt: "success", "throttled" or "error"."""
+
+    if caught_exception is not None or response is None:
+        return "error"
+    http_response, parsed = response
+    error_code = (parsed.get("Error") or {}).get("Code")
+    if error_code in S3_THROTTLE_ERROR_CODES or http_response.status_code in (429, 503):
+        return "throttled"
+    if http_response.status_code >= 300:
+        return "error"
+    return "success"
+
+
+def install_s3_request_limiter(s3_client) -> None:
+    """Limit every request attempt of a boto3 S3 client (the retries of botocore and the parts of the managed transfers).
+
+    The limiter of the process is looked up per request: the client is created before the fork of the celery pool.
+    """
+
+    def before_parameter_build(params, model, context, **kwargs):
+        context["movio_rate_limit_target"] = (params.get("Bucket"), params.get("Key"))
+
+    def request_created(request, operation_name, **kwargs):
+        context = request.context
+        target = context.get("movio_rate_limit_target")
+        limiter = get_s3_request_limiter()
+        # presigned urls, and an attempt already holding its slot
+        if limiter is None or target is None or context.get("movio_rate_limit_slot") is not None:
+            return
+        context["movio_rate_limit_slot"] = (limiter, limiter.acquire(operation_name, *target))
+
+    def release(context, outcome):
+        limiter_slot = context.pop("movio_rate_limit_slot", None)
+        if limiter_slot is not None:
+            limiter, slot = limiter_slot
+            limiter.release(slot, outcome)
+
+    def needs_retry(request_dict, response=None, caught_exception=None, **kwargs):
+        release(request_dict["context"], get_response_outcome(response, caught_exception))
+
+    def after_call(context, **kwargs):
+        release(context, "success")
+
+    def after_call_error(context, **kwargs):
+        release(context, "error")
+
+    s3_client.meta.events.register("before-parameter-build.s3", before_parameter_build)
+    # before the signature of the request
+    s3_client.meta.events.register_first("request-created.s3", request_created)
+    s3_client.meta.events.register("needs-retry.s3", needs_retry)
+    s3_client.meta.events.register("after-call.s3", after_call)
+    s3_client.meta.events.register("after-call-error.s3", after_call_error)
+
+
+_limiter = None
+_limiter_pid = None
+
+
+def get_s3_request_limiter():
+    """The limiter of the process (None when disabled), created again in a forked child."""
+
+    global _limiter, _limiter_pid
+    if not settings.MOVIO_S3_RATE_LIMIT_ENABLED:
+        return None
+    if _limiter is None or _limiter_pid != os.getpid():
+        _limiter = S3RequestLimiter()
+        _limiter_pid = os.getpid()
+    return _limiter
@@ -7,20 +7,46 @@ import boto3
 from botocore import config
 from botocore.exceptions import ClientError
 
+from core_apps.common.local_s3 import LocalS3Client
+from core_apps.common.metrics import instrument_s3_client
+from core_apps.common.s3_rate_limit import get_s3_request_limiter, install_s3_request_limiter
+
 logger = logging.getLogger(__name__)
 
 @lru_cache(maxsize=1)
 def get_s3_client():
+    # settings.MOVIO_S3_BACKEND "local": filesystem stand-in for benchmarks and load tests
+    if settings.MOVIO_S3_BACKEND == "local":
+        return LocalS3Client(
+            settings.MOVIO_LOCAL_S3_ROOT,
+            latency_seconds=settings.MOVIO_LOCAL_S3_LATENCY_SECONDS,
+            latency_jitter_seconds=settings.MOVIO_LOCAL_S3_LATENCY_JITTER_SECONDS,
+            bandwidth_bytes_per_second=settings.MOVIO_LOCAL_S3_BANDWIDTH_BYTES_PER_SECOND,
+            error_rate=settings.MOVIO_LOCAL_S3_ERROR_RATE,
+            throttle_rate=settings.MOVIO_LOCAL_S3_THROTTLE_RATE,
+            max_attempts=settings.MOVIO_LOCAL_S3_MAX_ATTEMPTS,
+            seed=settings.MOVIO_LOCAL_FAULT_SEED,
+            request_limiter=get_s3_request_limiter(),
+        )
+
     try: 
-        return boto3.client(
+        s3_client = boto3.client(
             "s3",
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
             region_name=settings.AWS_S3_REGION_NAME,
             config=config.Config(
-                max_pool_connections=20
+                max_pool_connections=settings.MOVIO_S3_MAX_CONCURRENCY,
+                retries={
+                    "mode": settings.MOVIO_S3_RETRY_MODE,
+                    "max_attempts": settings.MOVIO_S3_MAX_ATTEMPTS,
+                },
             )
         )
+        instrument_s3_client(s3_client)
+        if settings.MOVIO_S3_RATE_LIMIT_ENABLED:
+            install_s3_request_limiter(s3_client)
+        return s3_client
     except ClientError as e: 
         logger.error(f"Failed to create S3 Clietn: {str(e)}")
         raise e
\ No newline at end of file
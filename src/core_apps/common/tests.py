@@ -1,3 +1,236 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import redis
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from core_apps.common.local_s3 import LocalS3Client
+from core_apps.common.s3_checksums import (
+    ChecksumReader,
+    S3IntegrityError,
+    checksum_bytes,
+    checksum_file,
+    download_file_with_checksum,
+    upload_file_with_checksum,
+)
+from core_apps.common.s3_rate_limit import (
+    AdaptiveConcurrencyLimit,
+    LocalTokenBucketStore,
+    S3RequestLimiter,
+)
+from core_apps.common.vtt import WebVTTWriter, read_cues, write_cues
+
+# the sample subtitle at the root of the repository
+SAMPLE_VTT_PATH = settings.BASE_DIR.parent / "popey_president.vtt"
+
+
+def get_cue_tuples(path: str) -> list:
+    return [
+        (cue.identifier, cue.start, cue.end, cue.settings, cue.text)
+        for cue in read_cues(path)
+    ]
+
+
+class WebVTTRoundTripTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def get_tmp_path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_sample_round_trip(self):
+        output_path = self.get_tmp_path("round-trip.vtt")
+        cue_count = write_cues(output_path, read_cues(SAMPLE_VTT_PATH))
+
+        self.assertEqual(get_cue_tuples(output_path), get_cue_tuples(SAMPLE_VTT_PATH))
+        self.assertEqual(cue_count, len(get_cue_tuples(SAMPLE_VTT_PATH)))
+        with open(SAMPLE_VTT_PATH, encoding="utf-8") as sample_file, open(
+            output_path, encoding="utf-8"
+        ) as output_file:
+            self.assertEqual(output_file.read().strip(), sample_file.read().strip())
+
+    def test_identifiers_settings_and_skipped_blocks(self):
+        input_path = self.get_tmp_path("input.vtt")
+        with open(input_path, "w", encoding="utf-8") as input_file:
+            input_file.write(
+                "\ufeffWEBVTT - title\n\n"
+                "NOTE a comment\n\n"
+                "STYLE\n::cue { color: yellow }\n\n"
+                "intro\n00:00:01.000 --> 00:00:02.500 align:start line:0\nfirst\nsecond line\n\n"
+                " --> 00:00:03.000\nskipped\n\n"
+                "01:00:03.000 --> 01:00:04.000\nlast\n"
+            )
+
+        cues = list(read_cues(input_path))
+        self.assertEqual(
+            [(cue.identifier, cue.start, cue.end, cue.settings, cue.text) for cue in cues],
+            [
+                ("intro", "00:00:01.000", "00:00:02.500", "align:start line:0", "first\nsecond line"),
+                (None, "01:00:03.000", "01:00:04.000", None, "last"),
+            ],
+        )
+        self.assertEqual(cues[1].start_seconds, 3603.0)
+
+        output_path = self.get_tmp_path("output.vtt")
+        with open(output_path, "w", encoding="utf-8") as output_file:
+            writer = WebVTTWriter(output_file)
+            writer.write_cues(cues)
+        self.assertEqual(writer.cue_count, 2)
+        self.assertEqual(list(map(repr, read_cues(output_path))), list(map(repr, cues)))
+
+
+class S3ChecksumTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.s3_client = LocalS3Client(os.path.join(self.tmp_dir.name, "s3"))
+        self.data = os.urandom(256 * 1024)
+        self.source_path = self.get_tmp_path("source.bin")
+        with open(self.source_path, "wb") as source_file:
+            source_file.write(self.data)
+
+    def get_tmp_path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_reader_checksums_every_byte_once(self):
+        reader = ChecksumReader(io.BytesIO(self.data), "CRC32")
+        reader.read(1000)
+        # a retried range is not hashed twice
+        reader.seek(500)
+        reader.read(1000)
+        reader.read()
+
+        self.assertFalse(reader.incomplete)
+        self.assertEqual(reader.checksum.to_s3(), checksum_bytes(self.data, "CRC32"))
+        self.assertEqual(reader.checksum.size_bytes, len(self.data))
+
+    def test_reader_skipping_a_range_is_incomplete(self):
+        reader = ChecksumReader(io.BytesIO(self.data), "CRC32")
+        reader.seek(1000)
+        reader.read()
+
+        self.assertTrue(reader.incomplete)
+
+    def test_upload_and_verified_download(self):
+        upload_record = upload_file_with_checksum(
+            self.s3_client, self.source_path, "bucket", "video/source.bin", algorithm="CRC32"
+        )
+        download_path = self.get_tmp_path("download.bin")
+        download_record = download_file_with_checksum(
+            self.s3_client, "bucket", "video/source.bin", download_path
+        )
+
+        self.assertEqual(upload_record["checksum"], checksum_file(self.source_path, "CRC32")[0])
+        self.assertEqual(download_record["checksum"], upload_record["checksum"])
+        self.assertTrue(download_record["verified"])
+        with open(download_path, "rb") as download_file:
+            self.assertEqual(download_file.read(), self.data)
+
+    def test_corrupted_object_fails_the_download(self):
+        upload_file_with_checksum(
+            self.s3_client, self.source_path, "bucket", "video/source.bin", algorithm="CRC32"
+        )
+        with open(self.s3_client.get_object_path("bucket", "video/source.bin"), "r+b") as object_file:
+            object_file.write(bytes(byte ^ 0xFF for byte in self.data[:16]))
+
+        with self.assertRaises(S3IntegrityError):
+            download_file_with_checksum(
+                self.s3_client, "bucket", "video/source.bin", self.get_tmp_path("download.bin")
+            )
+
+    def test_upload_of_an_unexpected_size_fails(self):
+        with self.assertRaises(S3IntegrityError):
+            upload_file_with_checksum(
+                self.s3_client,
+                self.source_path,
+                "bucket",
+                "video/source.bin",
+                expected_size=len(self.data) + 1,
+                algorithm="CRC32",
+            )
+
+
+@override_settings(
+    MOVIO_S3_RATE_LIMIT_BURST_SECONDS=1,
+    MOVIO_S3_RATE_LIMIT_MIN_PER_SECOND=1,
+    MOVIO_S3_RATE_LIMIT_INCREASE_PER_SECOND=0,
+    MOVIO_S3_RATE_LIMIT_DECREASE_FACTOR=0.5,
+    MOVIO_S3_RATE_LIMIT_DECREASE_INTERVAL_SECONDS=60,
+)
+class S3RateLimitTests(SimpleTestCase):
+    def test_token_bucket_burst_then_wait(self):
+        store = LocalTokenBucketStore()
+
+        waits = [store.take("prefix", max_rate=4)[0] for _ in range(6)]
+
+        # a burst of rate * MOVIO_S3_RATE_LIMIT_BURST_SECONDS tokens, then one token every 1 / rate
+        self.assertEqual(waits[:4], [0.0] * 4)
+        self.assertAlmostEqual(waits[4], 0.25, places=2)
+        self.assertAlmostEqual(waits[5], 0.5, places=2)
+
+    def test_throttle_decreases_the_rate_once_per_interval(self):
+        store = LocalTokenBucketStore()
+        store.take("prefix", max_rate=8)
+
+        self.assertEqual(store.throttle("prefix", max_rate=8), 4)
+        # the same storm seen by another request
+        self.assertEqual(store.throttle("prefix", max_rate=8), 4)
+        self.assertEqual(store.take("other-prefix", max_rate=8), (0.0, 8))
+
+    def test_rate_share_of_the_fallback_buckets(self):
+        store = LocalTokenBucketStore(rate_share=0.25)
+
+        self.assertEqual(store.take("prefix", max_rate=8)[1], 2)
+
+    def test_concurrency_limit_aimd(self):
+        limit = AdaptiveConcurrencyLimit(minimum=1, maximum=8)
+
+        limit.acquire()
+        limit.release("throttled")
+        self.assertEqual(limit.limit, 4)
+
+        # + 1 / limit per success
+        for _ in range(5):
+            limit.acquire()
+            limit.release("success")
+        self.assertEqual(int(limit.limit), 5)
+        self.assertEqual(limit.in_flight, 0)
+
+    def test_concurrency_limit_blocks_at_the_limit(self):
+        limit = AdaptiveConcurrencyLimit(minimum=1, maximum=1)
+        limit.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            limit.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+
+        limit.release("success")
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    @override_settings(MOVIO_S3_RATE_LIMIT_REDIS_RETRY_SECONDS=60)
+    def test_unreachable_store_falls_back_to_local_buckets(self):
+        store = mock.Mock()
+        store.take.side_effect = redis.ConnectionError
+        limiter = S3RequestLimiter(
+            store=store, concurrency_limit=AdaptiveConcurrencyLimit(minimum=1, maximum=4)
+        )
+
+        slot = limiter.acquire("PutObject", "bucket", "segments/video/chunk-00001.m4s")
+        limiter.release(slot, "success")
+        limiter.release(limiter.acquire("GetObject", "bucket", "segments/video/manifest.mpd"), "success")
+
+        # the store is not retried before MOVIO_S3_RATE_LIMIT_REDIS_RETRY_SECONDS
+        self.assertEqual(store.take.call_count, 1)
+        self.assertEqual(limiter.concurrency_limit.in_flight, 0)
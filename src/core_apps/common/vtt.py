@@ -0,0 +1,251 @@
+"""
+Streaming WebVTT cue parser and writer.
+
+The cues are parsed one at a time from any iterable of lines (an open file reads lazily), so a
+subtitle is never held whole in memory. The timestamps and cue settings are kept as written
+(start_seconds / end_seconds parse them on demand), a parsed file is written back unchanged.
+NOTE, STYLE and REGION blocks are skipped.
+
+    with open(path) as vtt_file:
+        for cue in iter_cues(vtt_file):
+            ...
+
+    with open(output_path, "w") as output_file:
+        writer = WebVTTWriter(output_file)
+        writer.write_cues(cues)
+
+iter_cue_segments splits the cues on a fixed segment duration (segmented WebVTT of DASH).
+"""
+
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIMING_SEPARATOR = "-->"
+
+# blocks of the file that are not cues
+SKIPPED_BLOCKS = ("NOTE", "STYLE", "REGION")
+
+
+class WebVTTError(ValueError):
+    pass
+
+
+def parse_timestamp(timestamp: str) -> float:
+    """Seconds of a WebVTT timestamp: "mm:ss.ttt" or "hh:mm:ss.ttt"."""
+
+    try:
+        parts = timestamp.split(":")
+        if len(parts) == 2:
+            hours, (minutes, seconds) = 0, parts
+        elif len(parts) == 3:
+            hours, minutes, seconds = parts
+        else:
+            raise ValueError
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        raise WebVTTError(f"Invalid WebVTT timestamp: {timestamp!r}")
+
+
+def format_timestamp(seconds: float) -> str:
+    """"hh:mm:ss.ttt" of a number of seconds."""
+
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+class Cue:
+    __slots__ = ("identifier", "start", "end", "settings", "text")
+
+    def __init__(
+        self, start: str, end: str, text: str, identifier: str = None, settings: str = None
+    ) -> None:
+        self.start = start
+        self.end = end
+        self.text = text
+        self.identifier = identifier
+        self.settings = settings
+
+    @property
+    def start_seconds(self) -> float:
+        return parse_timestamp(self.start)
+
+    @property
+    def end_seconds(self) -> float:
+        return parse_timestamp(self.end)
+
+    def with_text(self, text: str):
+        """The same cue (timing, identifier, settings) with another text."""
+
+        return Cue(self.start, self.end, text, self.identifier, self.settings)
+
+    def __repr__(self) -> str:
+        return f"Cue({self.start} --> {self.end}, {self.text!r})"
+
+
+def parse_timing_line(line: str) -> tuple:
+    """(start, end, settings) of "start --> end [settings]"."""
+
+    start, _, rest = line.partition(TIMING_SEPARATOR)
+    end_and_settings = rest.split(None, 1)
+    if not start.strip() or not end_and_settings:
+        raise WebVTTError(f"Invalid WebVTT cue timing: {line!r}")
+
+    settings = end_and_settings[1].strip() if len(end_and_settings) > 1 else None
+    return start.strip(), end_and_settings[0], settings
+
+
+def iter_blocks(lines):
+    """Blocks of lines separated by blank lines, without their line endings."""
+
+    block = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def iter_cues(lines):
+    """Cues of a WebVTT file, parsed lazily from an iterable of lines (e.g. an open file).
+
+    Raises WebVTTError when the file doesn't start with the WEBVTT signature. A block with an
+    invalid timing is skipped (as WebVTT players do), with a warning.
+    """
+
+    blocks = iter_blocks(lines)
+
+    header = next(blocks, None)
+    signature = header[0].lstrip("\ufeff") if header else ""
+    if not (signature == "WEBVTT" or signature.startswith(("WEBVTT ", "WEBVTT\t"))):
+        raise WebVTTError("Missing WEBVTT signature.")
+
+    for index, line in enumerate(header[1:], start=1):
+        if TIMING_SEPARATOR in line:
+            # no blank line after the header: the first cue is in the header block
+            blocks = itertools.chain([header[index:]], blocks)
+            break
+
+    for block in blocks:
+        if block[0].split(None, 1)[0] in SKIPPED_BLOCKS:
+            continue
+
+        identifier = None
+        if TIMING_SEPARATOR not in block[0]:
+            identifier, block = block[0], block[1:]
+        if not block or TIMING_SEPARATOR not in block[0]:
+            logger.warning(f"\n[## WEBVTT WARNING]: Block Without Cue Timing Skipped: {identifier!r}")
+            continue
+
+        try:
+            start, end, settings = parse_timing_line(block[0])
+        except WebVTTError as e:
+            logger.warning(f"\n[## WEBVTT WARNING]: Cue Skipped.\nException: {str(e)}")
+            continue
+
+        yield Cue(start, end, "\n".join(block[1:]), identifier, settings)
+
+
+def read_cues(path: str):
+    """Cues of a WebVTT file, the file is read as the cues are consumed."""
+
+    with open(path, encoding="utf-8") as vtt_file:
+        yield from iter_cues(vtt_file)
+
+
+def format_cue(cue: Cue) -> str:
+    timing = f"{cue.start} {TIMING_SEPARATOR} {cue.end}"
+    if cue.settings:
+        timing = f"{timing} {cue.settings}"
+    if cue.identifier is not None:
+        return f"{cue.identifier}\n{timing}\n{cue.text}\n\n"
+    return f"{timing}\n{cue.text}\n\n"
+
+
+class WebVTTWriter:
+    """Writes the cues to a text file object as they come, the WEBVTT header first."""
+
+    def __init__(self, file) -> None:
+        self.file = file
+        self.cue_count = 0
+        self.file.write("WEBVTT\n\n")
+
+    def write_cue(self, cue: Cue) -> None:
+        self.file.write(format_cue(cue))
+        self.cue_count += 1
+
+    def write_cues(self, cues) -> int:
+        """Write every cue of an iterable, returns the number of cues written."""
+
+        write = self.file.write
+        count = 0
+        for cue in cues:
+            write(format_cue(cue))
+            count += 1
+        self.cue_count += count
+        return count
+
+
+def write_cues(path: str, cues) -> int:
+    with open(path, "w", encoding="utf-8") as vtt_file:
+        return WebVTTWriter(vtt_file).write_cues(cues)
+
+
+def clip_cue(cue: Cue, start_seconds: float, end_seconds: float) -> Cue:
+    """The cue within [start_seconds, end_seconds], its timestamps kept as written when not clipped."""
+
+    cue_start_seconds = cue.start_seconds
+    cue_end_seconds = cue.end_seconds
+    if cue_start_seconds >= start_seconds and cue_end_seconds <= end_seconds:
+        return cue
+
+    return Cue(
+        cue.start if cue_start_seconds >= start_seconds else format_timestamp(start_seconds),
+        cue.end if cue_end_seconds <= end_seconds else format_timestamp(end_seconds),
+        cue.text,
+        cue.identifier,
+        cue.settings,
+    )
+
+
+def iter_cue_segments(cues, segment_duration: float, segment_count: int):
+    """The cues of every segment [n * segment_duration, (n + 1) * segment_duration) of the timeline, in order.
+
+    Every one of the segment_count segments is yielded, the empty ones included (a list of cues).
+    A cue spanning several segments is clipped to each of them, the cues after the last segment
+    are kept in it. The cues are read as the segments are consumed (WebVTT cues are ordered by start time).
+    """
+
+    cues = iter(cues)
+    next_cue = next(cues, None)
+    # cues started in a previous segment, still running
+    running_cues = []
+
+    for index in range(segment_count):
+        segment_start = index * segment_duration
+        segment_end = (
+            (index + 1) * segment_duration if index < segment_count - 1 else float("inf")
+        )
+
+        while next_cue is not None and next_cue.start_seconds < segment_end:
+            running_cues.append(next_cue)
+            next_cue = next(cues, None)
+
+        segment_cues = []
+        still_running_cues = []
+        for cue in running_cues:
+            if cue.end_seconds > segment_start:
+                segment_cues.append(clip_cue(cue, segment_start, segment_end))
+            if cue.end_seconds > segment_end:
+                still_running_cues.append(cue)
+        running_cues = still_running_cues
+
+        yield segment_cues
@@ -0,0 +1,262 @@
+import json
+import logging
+import shutil
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from celery import current_app
+from kombu.exceptions import ChannelError
+
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.mq_manager.priority_lanes import get_probe_executor, get_s3_object_size
+
+logger = logging.getLogger(__name__)
+
+
+# redis hash of the dispatched but not yet downloaded videos: {video_id: "expected_bytes:reserved_at"}
+PENDING_DOWNLOADS_KEY = "movio:admission:pending-downloads"
+
+# redis sorted set of the running encodes (member: task_id, score: started_at)
+IN_FLIGHT_ENCODES_KEY = "movio:admission:in-flight-encodes"
+
+
+def reserve_pending_download(video_id: str, expected_bytes: int) -> None:
+    """Reserve the disk space of a download, from the dispatch until the download task ends."""
+
+    get_redis_client().hset(
+        PENDING_DOWNLOADS_KEY, video_id, f"{int(expected_bytes)}:{time.time()}"
+    )
+
+
+def release_pending_download(video_id: str) -> None:
+    try:
+        get_redis_client().hdel(PENDING_DOWNLOADS_KEY, video_id)
+    except Exception as e:
+        # the reservation expires after MOVIO_ADMISSION_RESERVATION_TTL_SECONDS anyway
+        logger.warning(
+            f"\n[## ADMISSION CONTROL WARNING]: Pending Download Reservation Could Not Be Released.\nException: {str(e)}"
+        )
+
+
+def get_pending_download_bytes() -> int:
+    """Sum of the reserved bytes, stale reservations are dropped."""
+
+    redis_client = get_redis_client()
+    min_reserved_at = time.time() - settings.MOVIO_ADMISSION_RESERVATION_TTL_SECONDS
+
+    pending_bytes = 0
+    stale_video_ids = []
+    for video_id, reservation in redis_client.hgetall(PENDING_DOWNLOADS_KEY).items():
+        expected_bytes, reserved_at = reservation.split(":")
+        if float(reserved_at) < min_reserved_at:
+            stale_video_ids.append(video_id)
+            continue
+        pending_bytes += int(expected_bytes)
+
+    if stale_video_ids:
+        redis_client.hdel(PENDING_DOWNLOADS_KEY, *stale_video_ids)
+
+    return pending_bytes
+
+
+@contextmanager
+def track_in_flight_encode(task_id: str):
+    """Count an ffmpeg encode as in flight for the admission controller while the block runs."""
+
+    try:
+        get_redis_client().zadd(IN_FLIGHT_ENCODES_KEY, {task_id: time.time()})
+    except Exception as e:
+        logger.warning(
+            f"\n[## ADMISSION CONTROL WARNING]: In Flight Encode Could Not Be Tracked.\nException: {str(e)}"
+        )
+
+    try:
+        yield
+    finally:
+        try:
+            get_redis_client().zrem(IN_FLIGHT_ENCODES_KEY, task_id)
+        except Exception as e:
+            logger.warning(
+                f"\n[## ADMISSION CONTROL WARNING]: In Flight Encode Could Not Be Untracked.\nException: {str(e)}"
+            )
+
+
+def get_in_flight_encodes() -> int:
+    redis_client = get_redis_client()
+    min_started_at = time.time() - settings.MOVIO_ADMISSION_ENCODE_TTL_SECONDS
+    redis_client.zremrangebyscore(IN_FLIGHT_ENCODES_KEY, "-inf", min_started_at)
+    return redis_client.zcard(IN_FLIGHT_ENCODES_KEY)
+
+
+def get_broker_queue_depth() -> int:
+    """Messages waiting in the celery queues of the pipeline (priority lanes and the default queue)."""
+
+    queues = [lane["queue"] for lane in settings.MOVIO_PRIORITY_LANES] + ["celery"]
+    depth = 0
+
+    with current_app.connection_for_read() as connection:
+        channel = connection.default_channel
+        for queue in queues:
+            try:
+                depth += channel.queue_declare(queue=queue, passive=True).message_count
+            except ChannelError:
+                # the queue doesn't exist yet: nothing waiting
+                continue
+
+    return depth
+
+
+def get_free_disk_bytes() -> int:
+    storage_root = settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT
+    storage_root.mkdir(parents=True, exist_ok=True)
+    return shutil.disk_usage(storage_root).free
+
+
+class AdmissionController:
+    """Admission controller of the consumer.
+
+    Tracks the free disk space of MOVIO_LOCAL_VIDEO_STORAGE_ROOT (minus the pending downloads),
+    the celery queue depth and the in flight encodes. The controller pauses at the limits and
+    resumes only once every signal is back under MOVIO_ADMISSION_RESUME_RATIO of its limit (hysteresis),
+    so the consumer doesn't flap around a limit.
+
+    The signals are collected once per consumer tick (evaluate), admit works on them plus what it admitted
+    since, so nothing on the consumer thread waits on S3, redis or the broker per submission. The size of a
+    submission is looked up off the consumer thread (start_size_lookup).
+
+    Every decision is logged as a metrics line: [=> ADMISSION CONTROL METRICS]: {...}
+    """
+
+    def __init__(self) -> None:
+        self.paused = False
+        self.signals = None
+        # admitted since the signals were collected: {"bytes", "count"}
+        self.admitted = {"bytes": 0, "count": 0}
+        # S3 size lookups of the queued submissions: {video_id: future}
+        self.size_lookups = {}
+
+    def collect_signals(self) -> dict:
+        free_disk_bytes = get_free_disk_bytes()
+        pending_download_bytes = get_pending_download_bytes()
+        return {
+            "free_disk_bytes": free_disk_bytes,
+            "pending_download_bytes": pending_download_bytes,
+            "available_disk_bytes": free_disk_bytes - pending_download_bytes,
+            "queue_depth": get_broker_queue_depth(),
+            "in_flight_encodes": get_in_flight_encodes(),
+        }
+
+    def is_over_limits(self, signals: dict, ratio: float = 1.0) -> list:
+        """Names of the signals over their limit (scaled by ratio), empty list if none."""
+
+        over_limits = []
+        min_free_disk_bytes = settings.MOVIO_ADMISSION_MIN_FREE_DISK_BYTES / ratio
+
+        if signals["available_disk_bytes"] < min_free_disk_bytes:
+            over_limits.append("disk")
+        if signals["queue_depth"] >= settings.MOVIO_ADMISSION_MAX_QUEUE_DEPTH * ratio:
+            over_limits.append("queue_depth")
+        if signals["in_flight_encodes"] >= settings.MOVIO_ADMISSION_MAX_IN_FLIGHT_ENCODES * ratio:
+            over_limits.append("in_flight_encodes")
+
+        return over_limits
+
+    def refresh_signals(self) -> dict:
+        self.signals = self.collect_signals()
+        self.admitted = {"bytes": 0, "count": 0}
+        return self.signals
+
+    def evaluate(self) -> bool:
+        """Re-evaluate the pause state, returns True if the consumer may dispatch."""
+
+        signals = self.refresh_signals()
+
+        if self.paused:
+            over_limits = self.is_over_limits(
+                signals, ratio=settings.MOVIO_ADMISSION_RESUME_RATIO
+            )
+            if not over_limits:
+                self.paused = False
+                self.log_decision("resume", signals, over_limits)
+        else:
+            over_limits = self.is_over_limits(signals)
+            if over_limits:
+                self.paused = True
+                self.log_decision("pause", signals, over_limits)
+
+        return not self.paused
+
+    def start_size_lookup(self, mq_data: dict) -> None:
+        """Look up the size of a queued submission in the background, picked up by admit."""
+
+        video_id = mq_data.get("video_id")
+        if "s3_file_size_bytes" in mq_data or video_id in self.size_lookups:
+            return
+
+        self.size_lookups[video_id] = get_probe_executor().submit(
+            get_s3_object_size, mq_data["s3_file_key"]
+        )
+
+    def discard_size_lookup(self, video_id: str) -> None:
+        future = self.size_lookups.pop(video_id, None)
+        if future is not None:
+            future.cancel()
+
+    def admit(self, mq_data: dict) -> bool:
+        """Admission of a single submission: its expected download must fit in the available disk.
+
+        A refused submission stays queued, it doesn't pause the consumer: a smaller one might still fit.
+        """
+
+        if self.paused:
+            return False
+
+        if "s3_file_size_bytes" not in mq_data:
+            self.start_size_lookup(mq_data)
+            future = self.size_lookups[mq_data.get("video_id")]
+            if not future.done():
+                # admitted on a later release, once the size is known
+                return False
+
+            self.size_lookups.pop(mq_data.get("video_id"), None)
+            try:
+                mq_data["s3_file_size_bytes"] = future.result()
+            except Exception as e:
+                # unknown size: only the watermarks apply, the download task fails on its own if the object is gone
+                logger.warning(
+                    f"\n[## ADMISSION CONTROL WARNING]: Expected Download Size Unknown.\nException: {str(e)}"
+                )
+                mq_data["s3_file_size_bytes"] = None
+
+        signals = dict(self.signals or self.refresh_signals())
+        expected_bytes = mq_data.get("s3_file_size_bytes") or 0
+        # the downloads admitted since the signals were collected are not reserved in them yet,
+        # and each admitted chain is one more message in the celery queues
+        signals["available_disk_bytes"] -= self.admitted["bytes"] + expected_bytes
+        signals["queue_depth"] += self.admitted["count"]
+
+        over_limits = self.is_over_limits(signals)
+        if over_limits:
+            self.log_decision("reject", signals, over_limits, mq_data)
+            return False
+
+        self.admitted["bytes"] += expected_bytes
+        self.admitted["count"] += 1
+        self.log_decision("admit", signals, over_limits, mq_data)
+        return True
+
+    def log_decision(
+        self, decision: str, signals: dict, over_limits: list, mq_data: dict = None
+    ) -> None:
+        metrics = {
+            "decision": decision,
+            "over_limits": over_limits,
+            "video_id": mq_data.get("video_id") if mq_data else None,
+            "expected_download_bytes": (
+                mq_data.get("s3_file_size_bytes") if mq_data else None
+            ),
+            **signals,
+        }
+        logger.info(f"\n[=> ADMISSION CONTROL METRICS]: {json.dumps(metrics)}")
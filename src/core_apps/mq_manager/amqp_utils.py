@@ -0,0 +1,20 @@
+import pika
+
+from django.conf import settings
+
+from core_apps.mq_manager.local_amqp import LocalBlockingConnection
+
+
+def get_amqp_connection(params: pika.URLParameters):
+    """Blocking connection to the broker of settings.MOVIO_AMQP_BACKEND.
+
+    "cloudamqp": CloudAMQP (RabbitMQ), "local": the in-process broker stand-in, for benchmarks and load tests.
+    """
+
+    if settings.MOVIO_AMQP_BACKEND == "local":
+        return LocalBlockingConnection(
+            params,
+            connection_error_rate=settings.MOVIO_LOCAL_AMQP_CONNECTION_ERROR_RATE,
+            publish_latency_seconds=settings.MOVIO_LOCAL_AMQP_PUBLISH_LATENCY_SECONDS,
+        )
+    return pika.BlockingConnection(parameters=params)
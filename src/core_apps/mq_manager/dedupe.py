@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from core_apps.common.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+DEDUPE_KEY = "movio:dedupe:{video_id}:{s3_file_key_hash}"
+DUPLICATE_SUPPRESSED_COUNTER_KEY = "movio:dedupe:duplicate-suppressed"
+
+IN_FLIGHT = "in-flight"
+FINISHED = "finished"
+
+
+class RedisDedupeStore:
+    """Dedupe entries in redis, shared by the consumer and the celery workers."""
+
+    def claim(self, key: str, ttl: int) -> bool:
+        return bool(get_redis_client().set(key, IN_FLIGHT, nx=True, ex=ttl))
+
+    def set(self, key: str, state: str, ttl: int) -> None:
+        get_redis_client().set(key, state, ex=ttl)
+
+    def delete(self, key: str) -> None:
+        get_redis_client().delete(key)
+
+    def get(self, key: str):
+        return get_redis_client().get(key)
+
+    def increment_suppressed(self) -> int:
+        return get_redis_client().incr(DUPLICATE_SUPPRESSED_COUNTER_KEY)
+
+    def get_suppressed(self) -> int:
+        return int(get_redis_client().get(DUPLICATE_SUPPRESSED_COUNTER_KEY) or 0)
+
+
+class LocalDedupeStore:
+    """In process stand-in of RedisDedupeStore.
+
+    Only the consumer sees it, the workers can't mark a pipeline as finished,
+    so the entries just expire after their TTL.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.entries = {}  # key: (state, expires_at)
+        self.suppressed = 0
+
+    def _get_live(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.time():
+            self.entries.pop(key, None)
+            return None
+        return entry[0]
+
+    def claim(self, key: str, ttl: int) -> bool:
+        with self.lock:
+            if self._get_live(key) is not None:
+                return False
+            self.entries[key] = (IN_FLIGHT, time.time() + ttl)
+            return True
+
+    def set(self, key: str, state: str, ttl: int) -> None:
+        with self.lock:
+            self.entries[key] = (state, time.time() + ttl)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def get(self, key: str):
+        with self.lock:
+            return self._get_live(key)
+
+    def increment_suppressed(self) -> int:
+        with self.lock:
+            self.suppressed += 1
+            return self.suppressed
+
+    def get_suppressed(self) -> int:
+        return self.suppressed
+
+
+class VideoDedupeWindow:
+    """Idempotent dispatch of the submissions, keyed on video_id + s3_file_key.
+
+    A submission claims its key before it's dispatched. A duplicate (RabbitMQ redelivery, API Service retry)
+    is suppressed while the first pipeline is in flight (MOVIO_DEDUPE_IN_FLIGHT_TTL_SECONDS) or
+    recently finished successfully (MOVIO_DEDUPE_FINISHED_TTL_SECONDS). A failed pipeline releases
+    the key so that a retry goes through.
+    """
+
+    def __init__(self, store=None) -> None:
+        if store is None:
+            store = (
+                LocalDedupeStore()
+                if settings.MOVIO_DEDUPE_BACKEND == "local"
+                else RedisDedupeStore()
+            )
+        self.store = store
+
+    def get_key(self, mq_data: dict) -> str:
+        s3_file_key_hash = hashlib.sha1(
+            (mq_data.get("s3_file_key") or "").encode("utf-8")
+        ).hexdigest()
+        return DEDUPE_KEY.format(
+            video_id=mq_data.get("video_id"), s3_file_key_hash=s3_file_key_hash
+        )
+
+    def claim(self, mq_data: dict) -> bool:
+        """Claim the submission, returns False if it's a duplicate (and counts it as suppressed)."""
+
+        key = self.get_key(mq_data)
+        if self.store.claim(key, settings.MOVIO_DEDUPE_IN_FLIGHT_TTL_SECONDS):
+            return True
+
+        suppressed = self.store.increment_suppressed()
+        logger.warning(
+            f"\n[## DEDUPE WARNING]: Duplicate Submission Suppressed.\nVideo ID: {mq_data.get('video_id')}, State: {self.store.get(key)}, Suppressed Total: {suppressed}"
+        )
+        return False
+
+    def release(self, mq_data: dict) -> None:
+        """Forget the submission, e.g. it couldn't be dispatched."""
+
+        self.store.delete(self.get_key(mq_data))
+
+    def finish(self, mq_data: dict, success: bool) -> None:
+        """Keep a finished pipeline in the window for a while, forget a failed one so it can be retried."""
+
+        key = self.get_key(mq_data)
+        if success:
+            self.store.set(key, FINISHED, settings.MOVIO_DEDUPE_FINISHED_TTL_SECONDS)
+        else:
+            self.store.delete(key)
+
+    def get_suppressed_count(self) -> int:
+        return self.store.get_suppressed()
+
+
+video_dedupe_window = VideoDedupeWindow()
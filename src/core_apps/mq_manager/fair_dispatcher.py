@@ -0,0 +1,388 @@
+import json
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+from django.conf import settings
+
+from core_apps.common.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# redis sorted sets of the in flight pipelines (member: video_id, score: dispatched_at)
+IN_FLIGHT_KEY = "movio:fair-share:in-flight"
+USER_IN_FLIGHT_KEY = "movio:fair-share:in-flight:{user_id}"
+
+# latest stats snapshot published by the consumer
+FAIR_SHARE_STATS_KEY = "movio:fair-share:stats"
+
+
+def get_submission_user_id(mq_data: dict) -> str:
+    return (mq_data.get("user_data") or {}).get("user_id") or "anonymous"
+
+
+class RedisInFlightStore:
+    """In flight pipelines per user, shared by the consumer and the celery workers.
+
+    Entries older than MOVIO_FAIR_SHARE_IN_FLIGHT_TTL_SECONDS are ignored, so a chain that died
+    without reaching a terminal task doesn't hold a slot forever.
+    """
+
+    def _min_score(self) -> float:
+        return time.time() - settings.MOVIO_FAIR_SHARE_IN_FLIGHT_TTL_SECONDS
+
+    def add(self, user_id: str, video_id: str) -> None:
+        redis_client = get_redis_client()
+        now = time.time()
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.zadd(IN_FLIGHT_KEY, {video_id: now})
+        pipeline.zadd(USER_IN_FLIGHT_KEY.format(user_id=user_id), {video_id: now})
+        pipeline.execute()
+
+    def remove(self, user_id: str, video_id: str) -> None:
+        redis_client = get_redis_client()
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.zrem(IN_FLIGHT_KEY, video_id)
+        pipeline.zrem(USER_IN_FLIGHT_KEY.format(user_id=user_id), video_id)
+        pipeline.execute()
+
+    def counts(self, user_ids: list) -> tuple:
+        """Return (total in flight, {user_id: in flight})."""
+
+        redis_client = get_redis_client()
+        min_score = self._min_score()
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.zremrangebyscore(IN_FLIGHT_KEY, "-inf", min_score)
+        pipeline.zcard(IN_FLIGHT_KEY)
+        for user_id in user_ids:
+            pipeline.zcount(USER_IN_FLIGHT_KEY.format(user_id=user_id), min_score, "+inf")
+        results = pipeline.execute()
+        return results[1], dict(zip(user_ids, results[2:]))
+
+
+class LocalInFlightStore:
+    """In process stand-in of RedisInFlightStore (single consumer, local benchmarks)."""
+
+    def __init__(self) -> None:
+        self.in_flight = {}
+
+    def add(self, user_id: str, video_id: str) -> None:
+        self.in_flight[video_id] = user_id
+
+    def remove(self, user_id: str, video_id: str) -> None:
+        self.in_flight.pop(video_id, None)
+
+    def counts(self, user_ids: list) -> tuple:
+        per_user = {user_id: 0 for user_id in user_ids}
+        for owner in self.in_flight.values():
+            if owner in per_user:
+                per_user[owner] += 1
+        return len(self.in_flight), per_user
+
+
+class FairShareDispatcher:
+    """Fair share dispatcher between the MQ consumer and celery.
+
+    Submissions are kept in per user virtual queues and released with deficit round robin:
+    on each visit a user earns `weight` credits, and every released pipeline costs one credit.
+    A user is skipped while it has MOVIO_FAIR_SHARE_PER_USER_MAX_IN_FLIGHT pipelines in flight, and
+    nothing is released while MOVIO_FAIR_SHARE_MAX_IN_FLIGHT pipelines are in flight.
+
+    `dispatch` is called with the mq data of each released submission, e.g. to apply the celery chain.
+    It returns False to drop the submission (a duplicate): acked, without an in flight slot.
+    `admit` (optional) is called with the mq data before each release: a submission it refuses stays queued,
+    the next ones of the user are tried, so a submission that doesn't fit doesn't hold the others.
+
+    `on_dispatched` of a submission is called once its pipeline is applied, `on_failed(requeue=False)` when it
+    never will be: cancelled, or rejected by `dispatch` (KeyError / ValueError: a malformed submission).
+    Any other failure of `dispatch` (broker or redis down) keeps the submission queued, in its place, and
+    pauses the release with an exponential backoff (MOVIO_FAIR_SHARE_DISPATCH_RETRY_SECONDS).
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable,
+        in_flight_store=None,
+        max_in_flight: int = None,
+        per_user_max_in_flight: int = None,
+        user_max_in_flight: dict = None,
+        user_weights: dict = None,
+        admit: Callable = None,
+    ) -> None:
+        self.dispatch = dispatch
+        self.admit = admit
+        self.in_flight_store = in_flight_store or RedisInFlightStore()
+        self.max_in_flight = max_in_flight or settings.MOVIO_FAIR_SHARE_MAX_IN_FLIGHT
+        self.per_user_max_in_flight = (
+            per_user_max_in_flight or settings.MOVIO_FAIR_SHARE_PER_USER_MAX_IN_FLIGHT
+        )
+        self.user_max_in_flight = (
+            user_max_in_flight
+            if user_max_in_flight is not None
+            else settings.MOVIO_FAIR_SHARE_USER_MAX_IN_FLIGHT
+        )
+        self.user_weights = (
+            user_weights if user_weights is not None else settings.MOVIO_FAIR_SHARE_USER_WEIGHTS
+        )
+
+        # user_id: deque of (mq_data, submitted_at, on_dispatched, on_failed)
+        self.virtual_queues = {}
+        # round robin order of the users with queued submissions
+        self.active_users = deque()
+        self.deficits = {}
+
+        # user_id: {"dispatched", "total_wait_seconds", "max_wait_seconds"}
+        self.user_stats = {}
+
+        # backoff of the release after a failed dispatch
+        self.dispatch_failures = 0
+        self.dispatch_retry_at = 0.0
+
+    def submit(
+        self,
+        mq_data: dict,
+        on_dispatched: Callable = None,
+        on_failed: Callable = None,
+    ) -> None:
+        """Queue a submission in the virtual queue of its user."""
+
+        user_id = get_submission_user_id(mq_data)
+
+        if user_id not in self.virtual_queues:
+            self.virtual_queues[user_id] = deque()
+        if not self.virtual_queues[user_id]:
+            self.active_users.append(user_id)
+            self.deficits[user_id] = 0
+
+        self.virtual_queues[user_id].append(
+            (mq_data, time.time(), on_dispatched, on_failed)
+        )
+
+    def cancel(self, video_id: str) -> list:
+        """Drop the queued (not yet released) submissions of a video, returns their mq data.
+
+        on_failed(requeue=False) of each dropped submission is called, as it will never be dispatched.
+        """
+
+        cancelled = []
+        for user_id, queue in self.virtual_queues.items():
+            for entry in [entry for entry in queue if entry[0].get("video_id") == video_id]:
+                queue.remove(entry)
+                mq_data, submitted_at, on_dispatched, on_failed = entry
+                if on_failed:
+                    on_failed(requeue=False)
+                cancelled.append(mq_data)
+
+        # users left without queued submissions
+        for user_id in [user_id for user_id in self.active_users if not self.virtual_queues[user_id]]:
+            self.active_users.remove(user_id)
+            self.deficits.pop(user_id, None)
+
+        return cancelled
+
+    def get_user_weight(self, user_id: str) -> int:
+        return max(int(self.user_weights.get(user_id, 1)), 1)
+
+    def get_user_max_in_flight(self, user_id: str) -> int:
+        return self.user_max_in_flight.get(user_id, self.per_user_max_in_flight)
+
+    def release(self) -> int:
+        """Release queued submissions as long as the in flight caps allow, returns the released count."""
+
+        if not self.active_users or time.time() < self.dispatch_retry_at:
+            return 0
+
+        total_in_flight, users_in_flight = self.in_flight_store.counts(
+            list(self.active_users)
+        )
+        released = 0
+
+        # keep visiting users while a full round robin pass releases something
+        progress = True
+        while progress and self.active_users and total_in_flight < self.max_in_flight:
+            progress = False
+
+            for _ in range(len(self.active_users)):
+                if not self.active_users:
+                    break
+
+                user_id = self.active_users[0]
+                queue = self.virtual_queues[user_id]
+                weight = self.get_user_weight(user_id)
+                user_cap = self.get_user_max_in_flight(user_id)
+
+                # credits are capped to one quantum, a capped user can't build up a burst
+                self.deficits[user_id] = min(self.deficits[user_id] + weight, weight)
+
+                while (
+                    queue
+                    and self.deficits[user_id] >= 1
+                    and users_in_flight.get(user_id, 0) < user_cap
+                    and total_in_flight < self.max_in_flight
+                ):
+                    entry = self.pop_admitted(queue)
+                    if entry is None:
+                        # none of the user's submissions is admitted now: the next user's turn
+                        break
+
+                    mq_data, submitted_at, on_dispatched, on_failed = entry
+                    try:
+                        is_dispatched = self._dispatch(
+                            user_id, mq_data, submitted_at, on_dispatched, on_failed
+                        )
+                    except Exception:
+                        # back in its place, the release pauses until the backoff is over
+                        queue.appendleft(entry)
+                        return released
+
+                    if is_dispatched:
+                        users_in_flight[user_id] = users_in_flight.get(user_id, 0) + 1
+                        total_in_flight += 1
+                        released += 1
+                    self.deficits[user_id] -= 1
+                    progress = True
+
+                if not queue:
+                    self.active_users.popleft()
+                    self.deficits.pop(user_id, None)
+                else:
+                    self.active_users.rotate(-1)
+
+                if total_in_flight >= self.max_in_flight:
+                    break
+
+        return released
+
+    def pop_admitted(self, queue: deque):
+        """Pop the first submission of a virtual queue that `admit` admits, None if none is."""
+
+        if self.admit is None:
+            return queue.popleft()
+
+        for entry in queue:
+            if self.admit(entry[0]):
+                queue.remove(entry)
+                return entry
+        return None
+
+    def _dispatch(self, user_id, mq_data, submitted_at, on_dispatched, on_failed) -> bool:
+        wait_seconds = time.time() - submitted_at
+
+        try:
+            is_dispatched = self.dispatch(mq_data)
+        except (KeyError, ValueError) as e:
+            # malformed submission: a redelivery would fail the same way
+            logger.error(
+                f"\n\n[XX FAIR SHARE DISPATCH ERROR XX]: Submission Rejected.\nUser: {user_id}\nException: {repr(e)}\n"
+            )
+            if on_failed:
+                on_failed(requeue=False)
+            return False
+        except Exception as e:
+            self.dispatch_failures += 1
+            retry_in = min(
+                settings.MOVIO_FAIR_SHARE_DISPATCH_RETRY_SECONDS * 2 ** (self.dispatch_failures - 1),
+                settings.MOVIO_FAIR_SHARE_DISPATCH_RETRY_MAX_SECONDS,
+            )
+            self.dispatch_retry_at = time.time() + retry_in
+            logger.error(
+                f"\n\n[XX FAIR SHARE DISPATCH ERROR XX]: Submission Could Not Be Dispatched, Retrying in: {retry_in} seconds.\nUser: {user_id}\nException: {str(e)}\n"
+            )
+            raise
+
+        self.dispatch_failures = 0
+
+        if is_dispatched is False:
+            if on_dispatched:
+                on_dispatched()
+            return False
+
+        # the chain is applied: a bookkeeping failure must not fail (and redeliver) the submission
+        try:
+            self.in_flight_store.add(user_id, mq_data.get("video_id"))
+        except Exception as e:
+            logger.warning(
+                f"\n[## FAIR SHARE WARNING]: In Flight Slot Could Not Be Recorded, the Pipeline Runs Uncounted.\nUser: {user_id}\nException: {str(e)}"
+            )
+
+        if on_dispatched:
+            on_dispatched()
+
+        stats = self.user_stats.setdefault(
+            user_id,
+            {"dispatched": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0},
+        )
+        stats["dispatched"] += 1
+        stats["total_wait_seconds"] += wait_seconds
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait_seconds)
+
+        logger.info(
+            f"\n[=> FAIR SHARE DISPATCH]: Submission Released.\nUser: {user_id}, Wait: {wait_seconds:.2f} seconds."
+        )
+        return True
+
+    def get_stats(self) -> dict:
+        """Per user queue length and wait time, plus Jain's fairness index of the weighted dispatch counts."""
+
+        users = {}
+        for user_id in set(self.user_stats) | set(self.virtual_queues):
+            stats = self.user_stats.get(user_id, {})
+            dispatched = stats.get("dispatched", 0)
+            users[user_id] = {
+                "queued": len(self.virtual_queues.get(user_id, ())),
+                "dispatched": dispatched,
+                "mean_wait_seconds": (
+                    stats["total_wait_seconds"] / dispatched if dispatched else 0.0
+                ),
+                "max_wait_seconds": stats.get("max_wait_seconds", 0.0),
+                "weight": self.get_user_weight(user_id),
+            }
+
+        # 1.0: every user got the same share of its weight, 1/n: one user got everything
+        shares = [
+            user["dispatched"] / user["weight"]
+            for user in users.values()
+            if user["dispatched"]
+        ]
+        fairness_index = (
+            sum(shares) ** 2 / (len(shares) * sum(share**2 for share in shares))
+            if shares
+            else 1.0
+        )
+
+        return {
+            "queued": sum(user["queued"] for user in users.values()),
+            "fairness_index": fairness_index,
+            "users": users,
+        }
+
+    def publish_stats(self) -> None:
+        """Store the stats snapshot in redis for the fair_share_report command."""
+
+        try:
+            get_redis_client().set(FAIR_SHARE_STATS_KEY, json.dumps(self.get_stats()))
+        except Exception as e:
+            logger.warning(
+                f"\n[## FAIR SHARE WARNING]: Stats Could Not Be Published.\nException: {str(e)}"
+            )
+
+
+def mark_pipeline_finished(mq_data: dict) -> None:
+    """Free the in flight slot of a pipeline, called by the terminal tasks of the chain."""
+
+    try:
+        RedisInFlightStore().remove(
+            get_submission_user_id(mq_data), mq_data.get("video_id")
+        )
+    except Exception as e:
+        # the slot expires after MOVIO_FAIR_SHARE_IN_FLIGHT_TTL_SECONDS anyway
+        logger.warning(
+            f"\n[## FAIR SHARE WARNING]: In Flight Slot Could Not Be Freed.\nException: {str(e)}"
+        )
+
+
+def get_fair_share_stats() -> dict:
+    stats = get_redis_client().get(FAIR_SHARE_STATS_KEY)
+    return json.loads(stats) if stats else {}
@@ -5,6 +5,8 @@ import pika
 
 from django.conf import settings
 
+from core_apps.mq_manager.amqp_utils import get_amqp_connection
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,9 +19,16 @@ class CloudAMQPHandler:
         self.params = pika.URLParameters(self.broker_url)
 
     def connect(self):
-        self.__connection = pika.BlockingConnection(parameters=self.params)
+        self.__connection = get_amqp_connection(self.params)
         self.channel = self.__connection.channel()
 
+    def call_later(self, delay: float, callback: Callable) -> None:
+        """Schedule a callback in the connection ioloop (consumer thread)."""
+        self.__connection.call_later(delay, callback)
+
+    def process_data_events(self, time_limit: float = 0) -> None:
+        self.__connection.process_data_events(time_limit=time_limit)
+
     def prepare_exchange_and_queue(self) -> None:
         self.channel.exchange_declare(
             exchange=settings.MOVIO_RAW_VIDEO_SUBMISSION_EXCHANGE_NAME,
@@ -40,24 +49,76 @@ class S3VideoConsumerMQ(CloudAMQPHandler):
         Movio API Service [S3 Uploaded Video]
     """
 
-    def consume_messages(self, callback: Callable) -> None:
+    def consume_messages(
+        self,
+        callback: Callable,
+        on_tick: Callable = None,
+        tick_interval: float = None,
+    ) -> None:
+        """Consume the submissions.
+
+        The messages are acked by the callback side (once released to celery), hence the prefetch
+        count bounds the submissions held by the consumer.
+        on_tick: called every tick_interval seconds from the consumer thread (e.g. release queued submissions).
+        """
         try:
             self.connect()
             self.prepare_exchange_and_queue()
 
-            self.channel.basic_consume(
-                settings.MOVIO_RAW_VIDEO_SUBMISSION_QUEUE_NAME, callback, auto_ack=True
+            self.channel.basic_qos(
+                prefetch_count=settings.MOVIO_MQ_CONSUMER_PREFETCH_COUNT
             )
+            self.callback = callback
+            self.consumer_tag = None
+            self.resume_consuming()
+
+            if on_tick is not None:
+                self.schedule_tick(on_tick, tick_interval)
 
             logger.info(
                 f"\n\n[=> MQ S3 Video Consumer LISTEN]: Message Consumption from Movio API Service [S3 Uploaded Video] - Started."
             )
-            self.channel.start_consuming()
+
+            # not channel.start_consuming(): it returns as soon as the consumer is paused (cancelled).
+            while True:
+                self.process_data_events(time_limit=1)
             
         except Exception as e:
             logger.exception(
                 f"\n\n[XX MQ S3 Video Consumer EXCEPTION]: Exception Occurred During Cnsuming Messages  Movio API Service [S3 Uploaded Video]\n[EXCEPTION]: {str(e)}\n"
             )
 
+    def pause_consuming(self) -> None:
+        """Stop the deliveries (backpressure), already delivered messages are kept."""
+
+        if self.consumer_tag is None:
+            return
+        self.channel.basic_cancel(self.consumer_tag)
+        self.consumer_tag = None
+        logger.warning(
+            f"\n\n[## MQ S3 Video Consumer PAUSED]: Message Consumption from Movio API Service [S3 Uploaded Video] - Paused."
+        )
+
+    def resume_consuming(self) -> None:
+        if self.consumer_tag is not None:
+            return
+        self.consumer_tag = self.channel.basic_consume(
+            settings.MOVIO_RAW_VIDEO_SUBMISSION_QUEUE_NAME, self.callback, auto_ack=False
+        )
+
+    def schedule_tick(self, on_tick: Callable, tick_interval: float) -> None:
+        """Call on_tick every tick_interval seconds, in the consumer thread."""
+
+        def tick():
+            try:
+                on_tick()
+            except Exception as e:
+                logger.exception(
+                    f"\n\n[XX MQ S3 Video Consumer EXCEPTION]: Exception Occurred During Consumer Tick.\n[EXCEPTION]: {str(e)}\n"
+                )
+            self.call_later(tick_interval, tick)
+
+        self.call_later(tick_interval, tick)
+
 
 s3_video_consumer_mq = S3VideoConsumerMQ()
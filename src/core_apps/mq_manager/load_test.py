@@ -0,0 +1,429 @@
+"""
+Load test of the consumer and the publisher against the local S3 and AMQP stand-ins
+(settings.MOVIO_S3_BACKEND / MOVIO_AMQP_BACKEND = "local"), with their injected faults.
+
+Synthetic submissions are published to the local broker and consumed by mq_callback.callback
+(fair share dispatcher, acks). A released submission claims its dedupe key and runs a simulated pipeline on a
+thread pool standing in for the celery workers: download and delete of the raw video, processing
+time, segment and manifest uploads, and the result publish through VideoProcessResultPublisherMQ.
+No celery and no ffmpeg: what's measured is the consumer, the dispatcher, the S3 calls and the publisher.
+"""
+
+import json
+import logging
+import os
+import platform
+import queue
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from pika.exceptions import AMQPConnectionError
+
+from core_apps.common.s3_utils import get_s3_client
+from core_apps.mq_manager import mq_callback
+from core_apps.mq_manager.dedupe import LocalDedupeStore, VideoDedupeWindow
+from core_apps.mq_manager.fair_dispatcher import FairShareDispatcher, LocalInFlightStore
+from core_apps.mq_manager.from_api_service_consumer import s3_video_consumer_mq
+from core_apps.mq_manager.local_amqp import local_broker
+from core_apps.mq_manager.to_api_service_producer import VideoProcessResultPublisherMQ
+
+logger = logging.getLogger(__name__)
+
+LOAD_TEST_S3_PREFIX = "movio-load-test"
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    values = sorted(values)
+
+    def at(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    return {
+        "count": len(values),
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": values[-1],
+    }
+
+
+class SimulatedPipelineWorkers:
+    """Thread pool running the simulated pipeline of the released submissions.
+
+    The pipelines end on the worker threads, the consumer thread frees their in flight slot
+    (drain_finished), as the celery workers do through the shared in flight store.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        workers: int,
+        segments: int,
+        segment_bytes: int,
+        processing_seconds: float,
+        workspace_dir: str,
+        dedupe_window: VideoDedupeWindow,
+    ) -> None:
+        self.s3_client = s3_client
+        self.dedupe_window = dedupe_window
+        self.segments = segments
+        self.processing_seconds = processing_seconds
+        self.workspace_dir = workspace_dir
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="movio-load-test-worker"
+        )
+        self.finished = queue.Queue()  # (mq_data, outcome)
+        self.outcomes = {}  # video_id: {"outcome", "dispatched_at", "finished_at", "error"}
+        self.lock = threading.Lock()
+
+        # one segment file, uploaded under every segment key
+        self.segment_path = os.path.join(workspace_dir, "segment.m4s")
+        with open(self.segment_path, "wb") as segment_file:
+            segment_file.write(os.urandom(segment_bytes))
+
+    def dispatch(self, mq_data: dict) -> bool:
+        # claimed on dispatch, as mq_callback.dispatch_video_pipeline does
+        if not self.dedupe_window.claim(mq_data):
+            return False
+
+        with self.lock:
+            self.outcomes[mq_data["video_id"]] = {"dispatched_at": time.time()}
+        self.executor.submit(self.run_pipeline, mq_data)
+        return True
+
+    def run_pipeline(self, mq_data: dict) -> None:
+        video_id = mq_data["video_id"]
+        local_video_file_path = os.path.join(self.workspace_dir, f"{video_id}.mkv")
+        segments_root = f"{settings.AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT}/{video_id}"
+        outcome, error = "finished", None
+
+        try:
+            self.s3_client.download_file(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=mq_data["s3_file_key"],
+                Filename=local_video_file_path,
+            )
+            self.s3_client.delete_object(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=mq_data["s3_file_key"]
+            )
+
+            if self.processing_seconds:
+                time.sleep(self.processing_seconds)
+
+            for segment_index in range(self.segments):
+                self.s3_client.upload_file(
+                    Filename=self.segment_path,
+                    Bucket=settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                    Key=f"{segments_root}/segment_{segment_index}.m4s",
+                )
+            self.s3_client.put_object(
+                Bucket=settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                Key=f"{segments_root}/manifest.mpd",
+                Body=f"<MPD><!-- {video_id} --></MPD>",
+                ContentType="application/dash+xml",
+            )
+
+            # a publisher per pipeline: the publisher is not thread safe
+            is_published, message = VideoProcessResultPublisherMQ().publish_data(
+                video_process_data=json.dumps(
+                    {
+                        "message_type": "video-process-result",
+                        "video_id": video_id,
+                        "user_id": mq_data["user_data"]["user_id"],
+                        "email": mq_data["user_data"]["email"],
+                        "s3_manifest_file_url": f"{segments_root}/manifest.mpd",
+                        "subtitle_en_vtt_data": None,
+                    }
+                )
+            )
+            if not is_published:
+                outcome, error = "publish-failed", message
+        except Exception as e:
+            outcome, error = "failed", str(e)
+        finally:
+            if os.path.exists(local_video_file_path):
+                os.remove(local_video_file_path)
+
+        with self.lock:
+            self.outcomes[video_id].update(
+                {"outcome": outcome, "finished_at": time.time(), "error": error}
+            )
+        self.finished.put((mq_data, outcome))
+
+    def drain_finished(self, dispatcher: FairShareDispatcher) -> int:
+        drained = 0
+        while True:
+            try:
+                mq_data, outcome = self.finished.get_nowait()
+            except queue.Empty:
+                return drained
+            dispatcher.in_flight_store.remove(
+                mq_data["user_data"]["user_id"], mq_data["video_id"]
+            )
+            self.dedupe_window.finish(mq_data, success=outcome == "finished")
+            drained += 1
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+def connect_with_retries(handler, attempts: int = 10) -> None:
+    """Connect a consumer / publisher handler, through the injected connection failures."""
+
+    for attempt in range(1, attempts + 1):
+        try:
+            handler.connect()
+            return
+        except AMQPConnectionError:
+            if attempt == attempts:
+                raise
+            time.sleep(0.1 * attempt)
+
+
+def build_submissions(count: int, users: int, input_path: str, s3_client) -> list:
+    """Store a raw video per submission (as the API Service uploads it, without the injected faults)."""
+
+    with open(input_path, "rb") as input_file:
+        input_data = input_file.read()
+
+    submissions = []
+    for index in range(count):
+        video_id = str(uuid.uuid4())
+        user_id = f"load-test-user-{index % users}"
+        s3_file_key = f"{LOAD_TEST_S3_PREFIX}/{video_id}/{video_id}__load-test.mkv"
+        s3_client.write_object(
+            settings.AWS_STORAGE_BUCKET_NAME,
+            s3_file_key,
+            lambda file: file.write(input_data),
+            {},
+        )
+        submissions.append(
+            {
+                "video_id": video_id,
+                "s3_file_key": s3_file_key,
+                "video_filename_with_extention": os.path.basename(s3_file_key),
+                "s3_file_size_bytes": os.path.getsize(input_path),
+                "user_data": {"user_id": user_id, "email": f"{user_id}@movio.local"},
+            }
+        )
+    return submissions
+
+
+def run_load_test(
+    submissions: int,
+    users: int,
+    workers: int,
+    max_in_flight: int,
+    rate: float,
+    duplicate_rate: float,
+    input_bytes: int,
+    segments: int,
+    segment_bytes: int,
+    processing_seconds: float,
+    timeout_seconds: float,
+) -> dict:
+    """Publish the synthetic submissions (rate per second, 0: all at once) and run them to completion.
+
+    duplicate_rate: share of the submissions published twice (redeliveries), to exercise the dedupe window.
+    """
+
+    s3_client = get_s3_client()
+    local_broker.purge()
+    local_broker.random.seed(settings.MOVIO_LOCAL_FAULT_SEED)
+    s3_stats_before = s3_client.get_stats()
+
+    workspace_dir = tempfile.mkdtemp(prefix="movio-load-test-")
+    input_path = os.path.join(workspace_dir, "input.mkv")
+    with open(input_path, "wb") as input_file:
+        input_file.write(os.urandom(input_bytes))
+
+    dedupe_window = VideoDedupeWindow(store=LocalDedupeStore())
+    pipeline_workers = SimulatedPipelineWorkers(
+        s3_client,
+        workers=workers,
+        segments=segments,
+        segment_bytes=segment_bytes,
+        processing_seconds=processing_seconds,
+        workspace_dir=workspace_dir,
+        dedupe_window=dedupe_window,
+    )
+    # the consumer side of the load test: in process stores, the simulated workers instead of celery
+    dispatcher = FairShareDispatcher(
+        dispatch=pipeline_workers.dispatch,
+        in_flight_store=LocalInFlightStore(),
+        max_in_flight=max_in_flight,
+    )
+
+    logger.info(f"\n[=> LOAD TEST]: Uploading {submissions} Synthetic Submissions.")
+    messages = build_submissions(submissions, users, input_path, s3_client)
+    duplicates = set(
+        message["video_id"]
+        for message in messages[: int(len(messages) * duplicate_rate)]
+    )
+
+    # the consumer as mq_callback.main() sets it up, without its endless loop
+    connect_with_retries(s3_video_consumer_mq)
+    s3_video_consumer_mq.prepare_exchange_and_queue()
+    s3_video_consumer_mq.channel.basic_qos(
+        prefetch_count=settings.MOVIO_MQ_CONSUMER_PREFETCH_COUNT
+    )
+    s3_video_consumer_mq.callback = mq_callback.callback
+    s3_video_consumer_mq.consumer_tag = None
+    s3_video_consumer_mq.resume_consuming()
+
+    result_reader = VideoProcessResultPublisherMQ()
+    connect_with_retries(result_reader)
+    result_reader.prepare_exchange_and_queue()
+
+    published_at = {}
+    completion_seconds = []
+    results_received = 0
+    original_dispatcher = mq_callback.fair_share_dispatcher
+    mq_callback.fair_share_dispatcher = dispatcher
+
+    started_at = time.perf_counter()
+    next_index = 0
+    try:
+        while time.perf_counter() - started_at < timeout_seconds:
+            # load generator: the submissions due at the rate
+            due = (
+                len(messages)
+                if not rate
+                else min(int((time.perf_counter() - started_at) * rate) + 1, len(messages))
+            )
+            for message in messages[next_index:due]:
+                for _ in range(2 if message["video_id"] in duplicates else 1):
+                    s3_video_consumer_mq.channel.basic_publish(
+                        exchange=settings.MOVIO_RAW_VIDEO_SUBMISSION_EXCHANGE_NAME,
+                        routing_key=settings.MOVIO_RAW_VIDEO_SUBMISSION_ROUTING_KEY,
+                        body=json.dumps(message),
+                    )
+                published_at.setdefault(message["video_id"], time.perf_counter())
+            next_index = max(next_index, due)
+
+            s3_video_consumer_mq.process_data_events(time_limit=0.05)
+            pipeline_workers.drain_finished(dispatcher)
+            dispatcher.release()
+
+            while True:
+                method, _, body = result_reader.channel.basic_get(
+                    settings.MOVIO_PROCESSED_VIDEO_RESULT_QUEUE_NAME, auto_ack=True
+                )
+                if method is None:
+                    break
+                results_received += 1
+                video_id = json.loads(body).get("video_id")
+                if video_id in published_at:
+                    completion_seconds.append(time.perf_counter() - published_at[video_id])
+
+            with pipeline_workers.lock:
+                ended = sum(
+                    1 for outcome in pipeline_workers.outcomes.values() if "outcome" in outcome
+                )
+            if next_index == len(messages) and ended == len(messages):
+                break
+    finally:
+        mq_callback.fair_share_dispatcher = original_dispatcher
+        pipeline_workers.shutdown()
+
+    elapsed_seconds = time.perf_counter() - started_at
+
+    outcomes = {}
+    dispatch_to_finish_seconds = []
+    for outcome in pipeline_workers.outcomes.values():
+        name = outcome.get("outcome", "unfinished")
+        outcomes[name] = outcomes.get(name, 0) + 1
+        if "finished_at" in outcome:
+            dispatch_to_finish_seconds.append(outcome["finished_at"] - outcome["dispatched_at"])
+
+    s3_stats = s3_client.get_stats()
+    s3_requests = {
+        operation: count - s3_stats_before["requests"].get(operation, 0)
+        for operation, count in s3_stats["requests"].items()
+    }
+    fair_share_stats = dispatcher.get_stats()
+
+    report = {
+        "meta": {
+            "started_at": time.time() - elapsed_seconds,
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "submissions": submissions,
+            "users": users,
+            "workers": workers,
+            "rate": rate,
+            "duplicate_rate": duplicate_rate,
+            "input_bytes": input_bytes,
+            "segments": segments,
+            "segment_bytes": segment_bytes,
+            "processing_seconds": processing_seconds,
+            "prefetch_count": settings.MOVIO_MQ_CONSUMER_PREFETCH_COUNT,
+            "max_in_flight": dispatcher.max_in_flight,
+            "faults": {
+                "s3_latency_seconds": s3_client.latency_seconds,
+                "s3_latency_jitter_seconds": s3_client.latency_jitter_seconds,
+                "s3_bandwidth_bytes_per_second": s3_client.bandwidth_bytes_per_second,
+                "s3_error_rate": s3_client.error_rate,
+                "s3_throttle_rate": s3_client.throttle_rate,
+                "s3_max_attempts": s3_client.max_attempts,
+                "amqp_connection_error_rate": settings.MOVIO_LOCAL_AMQP_CONNECTION_ERROR_RATE,
+                "amqp_publish_latency_seconds": settings.MOVIO_LOCAL_AMQP_PUBLISH_LATENCY_SECONDS,
+                "seed": settings.MOVIO_LOCAL_FAULT_SEED,
+            },
+        },
+        "elapsed_seconds": elapsed_seconds,
+        "throughput_per_second": (
+            outcomes.get("finished", 0) / elapsed_seconds if elapsed_seconds else 0.0
+        ),
+        "outcomes": outcomes,
+        "results_received": results_received,
+        "duplicates_suppressed": dedupe_window.get_suppressed_count(),
+        "completion_seconds": percentiles(completion_seconds),
+        "dispatch_to_finish_seconds": percentiles(dispatch_to_finish_seconds),
+        "mean_dispatch_wait_seconds": (
+            statistics.mean(user["mean_wait_seconds"] for user in fair_share_stats["users"].values())
+            if fair_share_stats["users"]
+            else 0.0
+        ),
+        "fairness_index": fair_share_stats["fairness_index"],
+        "s3": {
+            "requests": s3_requests,
+            "injected_errors": {
+                code: count - s3_stats_before["injected_errors"].get(code, 0)
+                for code, count in s3_stats["injected_errors"].items()
+            },
+            "retries": s3_stats["retries"] - s3_stats_before["retries"],
+        },
+        "broker": local_broker.get_stats(),
+    }
+
+    cleanup_load_test_objects(s3_client, messages)
+    shutil.rmtree(workspace_dir, ignore_errors=True)
+    return report
+
+
+def cleanup_load_test_objects(s3_client, messages: list) -> None:
+    """Remove the raw videos left behind (failed pipelines) and the uploaded segments, without the injected faults."""
+
+    object_prefixes = [(settings.AWS_STORAGE_BUCKET_NAME, LOAD_TEST_S3_PREFIX)] + [
+        (
+            settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+            f"{settings.AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT}/{message['video_id']}",
+        )
+        for message in messages
+    ]
+    for bucket, prefix in object_prefixes:
+        shutil.rmtree(os.path.join(s3_client.root, bucket, prefix), ignore_errors=True)
+        shutil.rmtree(
+            os.path.dirname(s3_client.get_meta_path(bucket, f"{prefix}/")), ignore_errors=True
+        )
@@ -0,0 +1,310 @@
+import fnmatch
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import pika
+from pika.exceptions import AMQPConnectionError
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBroker:
+    """In-process stand-in of the RabbitMQ broker: exchanges, queues and bindings in memory.
+
+    Shared by every connection of the process, so the consumer, the publisher and a load generator
+    running in the same process talk to each other without CloudAMQP.
+    """
+
+    def __init__(self, seed: int = None) -> None:
+        self.condition = threading.Condition()
+        self.exchanges = {}  # name: type
+        self.queues = {}  # name: deque of (delivery properties, body, redelivered)
+        self.bindings = []  # (exchange, queue, binding key)
+
+        # draws of the injected faults of the connections
+        self.random = random.Random(seed)
+        # published, unroutable, delivered, redelivered, connection_errors
+        self.stats = Counter()
+        self.max_queue_depths = {}
+
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct") -> None:
+        with self.condition:
+            self.exchanges.setdefault(exchange, exchange_type)
+
+    def queue_declare(self, queue: str) -> int:
+        with self.condition:
+            return len(self.queues.setdefault(queue, deque()))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str = None) -> None:
+        with self.condition:
+            binding = (exchange, queue, routing_key if routing_key is not None else queue)
+            if binding not in self.bindings:
+                self.bindings.append(binding)
+
+    def get_routed_queues(self, exchange: str, routing_key: str) -> list:
+        # default exchange: the routing key is the queue name
+        if exchange == "":
+            return [routing_key] if routing_key in self.queues else []
+
+        exchange_type = self.exchanges.get(exchange, "direct")
+        queues = []
+        for bound_exchange, queue, binding_key in self.bindings:
+            if bound_exchange != exchange:
+                continue
+            if (
+                exchange_type == "fanout"
+                or (exchange_type == "direct" and binding_key == routing_key)
+                or (exchange_type == "topic" and _topic_matches(binding_key, routing_key))
+            ):
+                queues.append(queue)
+        return queues
+
+    def publish(self, exchange: str, routing_key: str, body, properties=None) -> int:
+        """Route a message, returns the number of queues it was routed to (unroutable messages are dropped)."""
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        with self.condition:
+            queues = self.get_routed_queues(exchange, routing_key)
+            self.stats["published"] += 1
+            if not queues:
+                self.stats["unroutable"] += 1
+            for queue in queues:
+                self.queues[queue].append(
+                    (
+                        SimpleNamespace(exchange=exchange, routing_key=routing_key),
+                        properties or pika.BasicProperties(),
+                        body,
+                        False,
+                    )
+                )
+                self.max_queue_depths[queue] = max(
+                    self.max_queue_depths.get(queue, 0), len(self.queues[queue])
+                )
+            self.condition.notify_all()
+        return len(queues)
+
+    def get(self, queue: str):
+        with self.condition:
+            messages = self.queues.get(queue)
+            return messages.popleft() if messages else None
+
+    def requeue(self, queue: str, message) -> None:
+        envelope, properties, body, _ = message
+        with self.condition:
+            self.queues.setdefault(queue, deque()).appendleft(
+                (envelope, properties, body, True)
+            )
+            self.stats["redelivered"] += 1
+            self.condition.notify_all()
+
+    def wait(self, timeout: float) -> None:
+        with self.condition:
+            self.condition.wait(timeout=timeout)
+
+    def get_message_count(self, queue: str) -> int:
+        with self.condition:
+            return len(self.queues.get(queue, ()))
+
+    def count(self, stat: str) -> None:
+        with self.condition:
+            self.stats[stat] += 1
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            return {
+                **self.stats,
+                "queue_depths": {queue: len(messages) for queue, messages in self.queues.items()},
+                "max_queue_depths": dict(self.max_queue_depths),
+            }
+
+    def purge(self) -> None:
+        with self.condition:
+            self.exchanges.clear()
+            self.queues.clear()
+            self.bindings.clear()
+            self.stats.clear()
+            self.max_queue_depths.clear()
+
+
+def _topic_matches(binding_key: str, routing_key: str) -> bool:
+    # approximation of the AMQP topic match: "*" one word, "#" any number of words
+    pattern = binding_key.replace("#", "\0").replace("*", "[!.]*").replace("\0", "*")
+    return fnmatch.fnmatchcase(routing_key, pattern)
+
+
+local_broker = LocalBroker()
+
+
+class LocalChannel:
+    """pika BlockingChannel API on the local broker (the calls of the consumer and the publisher)."""
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch_count = 0
+        self.consumers = {}  # consumer tag: (queue, on_message_callback, auto_ack)
+        self.unacked = {}  # delivery tag: (queue, message)
+        self.delivery_tags = itertools.count(1)
+        self.consumer_tags = itertools.count(1)
+        self.is_open = True
+
+    def exchange_declare(self, exchange, exchange_type="direct", **kwargs):
+        self.broker.exchange_declare(exchange, exchange_type)
+
+    def queue_declare(self, queue, passive=False, **kwargs):
+        message_count = self.broker.queue_declare(queue)
+        return SimpleNamespace(
+            method=SimpleNamespace(queue=queue, message_count=message_count, consumer_count=0)
+        )
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self.broker.queue_bind(queue, exchange, routing_key)
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.connection.publish_latency_seconds:
+            time.sleep(self.connection.publish_latency_seconds)
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, consumer_tag=None, **kwargs):
+        consumer_tag = consumer_tag or f"local-ctag-{next(self.consumer_tags)}"
+        self.consumers[consumer_tag] = (queue, on_message_callback, auto_ack)
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag=None):
+        self.consumers.pop(consumer_tag, None)
+
+    def basic_get(self, queue, auto_ack=False):
+        message = self.broker.get(queue)
+        if message is None:
+            return None, None, None
+        return self._deliver_method(queue, message, auto_ack), message[1], message[2]
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._settle(delivery_tag, multiple, requeue=False)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._settle(delivery_tag, multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self._settle(delivery_tag, False, requeue=requeue)
+
+    def close(self):
+        # as RabbitMQ: the unacked messages of a closed channel are redelivered
+        for delivery_tag in list(self.unacked):
+            self._settle(delivery_tag, False, requeue=True)
+        self.consumers.clear()
+        self.is_open = False
+
+    def _deliver_method(self, queue, message, auto_ack: bool):
+        envelope, _, _, redelivered = message
+        delivery_tag = next(self.delivery_tags)
+        self.broker.count("delivered")
+        if not auto_ack:
+            self.unacked[delivery_tag] = (queue, message)
+        return SimpleNamespace(
+            delivery_tag=delivery_tag,
+            exchange=envelope.exchange,
+            routing_key=envelope.routing_key,
+            redelivered=redelivered,
+        )
+
+    def _settle(self, delivery_tag, multiple: bool, requeue: bool) -> None:
+        if multiple:
+            delivery_tags = [tag for tag in self.unacked if tag <= delivery_tag]
+        else:
+            delivery_tags = [delivery_tag]
+
+        for tag in delivery_tags:
+            entry = self.unacked.pop(tag, None)
+            if entry is not None and requeue:
+                self.broker.requeue(*entry)
+
+    def dispatch(self) -> bool:
+        """Deliver the available messages to the consumers within the prefetch window, True if any was delivered."""
+
+        delivered = False
+        for queue, on_message_callback, auto_ack in list(self.consumers.values()):
+            while not self.prefetch_count or len(self.unacked) < self.prefetch_count:
+                message = self.broker.get(queue)
+                if message is None:
+                    break
+                method = self._deliver_method(queue, message, auto_ack)
+                on_message_callback(self, method, message[1], message[2])
+                delivered = True
+        return delivered
+
+
+class LocalBlockingConnection:
+    """pika BlockingConnection API on the local broker.
+
+    Injected faults: the connection fails (AMQPConnectionError, as pika) at connection_error_rate,
+    and every publish waits publish_latency_seconds (the round trip to the broker).
+    """
+
+    def __init__(
+        self,
+        parameters=None,
+        broker: LocalBroker = None,
+        connection_error_rate: float = 0.0,
+        publish_latency_seconds: float = 0.0,
+    ) -> None:
+        self.broker = broker or local_broker
+        if connection_error_rate and self.broker.random.random() < connection_error_rate:
+            self.broker.count("connection_errors")
+            raise AMQPConnectionError("Injected connection failure of the local broker.")
+
+        self.publish_latency_seconds = publish_latency_seconds
+        self.channels = []
+        self.timers = []  # heap of (due at, sequence, callback)
+        self.timer_sequence = itertools.count()
+        self.is_open = True
+
+    def channel(self) -> LocalChannel:
+        channel = LocalChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def call_later(self, delay: float, callback) -> None:
+        heapq.heappush(
+            self.timers, (time.monotonic() + delay, next(self.timer_sequence), callback)
+        )
+
+    def process_data_events(self, time_limit: float = 0) -> None:
+        """Run the due timers and deliver the available messages, waits up to time_limit for work."""
+
+        deadline = time.monotonic() + (time_limit or 0)
+        while True:
+            worked = False
+            while self.timers and self.timers[0][0] <= time.monotonic():
+                _, _, callback = heapq.heappop(self.timers)
+                callback()
+                worked = True
+
+            for channel in self.channels:
+                if channel.is_open and channel.dispatch():
+                    worked = True
+
+            remaining = deadline - time.monotonic()
+            if worked or remaining <= 0:
+                return
+
+            if self.timers:
+                remaining = min(remaining, max(self.timers[0][0] - time.monotonic(), 0))
+            self.broker.wait(timeout=min(remaining, 0.1))
+
+    def close(self) -> None:
+        for channel in self.channels:
+            if channel.is_open:
+                channel.close()
+        self.is_open = False
@@ -0,0 +1,16 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core_apps.mq_manager.dedupe import video_dedupe_window
+
+
+class Command(BaseCommand):
+    """Reports the Duplicate Submissions Suppressed by the Dedupe Window
+    """
+
+    help = "Reports the number of duplicate submissions suppressed by the dedupe window"
+
+    def handle(self, *args, **options):
+        report = {"duplicate_suppressed": video_dedupe_window.get_suppressed_count()}
+        self.stdout.write(json.dumps(report, indent=4))
@@ -0,0 +1,16 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core_apps.mq_manager.fair_dispatcher import get_fair_share_stats
+
+
+class Command(BaseCommand):
+    """Reports the Fair Share Dispatcher Stats of the Consumer
+    """
+
+    help = "Reports the per user queue length, wait times and the fairness index of the fair share dispatcher"
+
+    def handle(self, *args, **options):
+        stats = get_fair_share_stats()
+        self.stdout.write(json.dumps(stats, indent=4))
@@ -0,0 +1,16 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core_apps.mq_manager.priority_lanes import get_lane_queue_delay_report
+
+
+class Command(BaseCommand):
+    """Reports the Queue Delay of the Recent Submissions per Priority Lane
+    """
+
+    help = "Reports the queue delay (seconds) of the recent submissions per priority lane"
+
+    def handle(self, *args, **options):
+        report = get_lane_queue_delay_report()
+        self.stdout.write(json.dumps(report, indent=4))
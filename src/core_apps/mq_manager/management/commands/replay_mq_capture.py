@@ -0,0 +1,63 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core_apps.mq_manager.traffic_replay import load_capture, replay_capture
+
+
+class Command(BaseCommand):
+    """Replays an MQ Traffic Capture to the Submission Exchange, Reports the End to End Completion Latency
+
+    The capture is recorded by the consumer with MOVIO_MQ_CAPTURE_PATH set. The recorded raw videos
+    are usually gone (deleted by the pipeline): --synthetic-input points the replayed submissions
+    at a synthetic video uploaded for each of them.
+    """
+
+    help = "Re-publishes a JSONL capture of submission messages at 1x, Nx or a fixed rate and reports the completion latency percentiles (JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("capture", help="JSONL capture file")
+        pacing = parser.add_mutually_exclusive_group()
+        pacing.add_argument(
+            "--speed", type=float, default=1.0, help="N: the recorded timing N times faster"
+        )
+        pacing.add_argument("--rate", type=float, help="fixed rate, messages per second")
+        parser.add_argument("--limit", type=int, help="replay the first N messages only")
+        parser.add_argument(
+            "--synthetic-input", help="video uploaded for every replayed submission (payload rewrite)"
+        )
+        parser.add_argument(
+            "--wait-timeout", type=float, default=3600, help="seconds to wait for the results after the last publish"
+        )
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if settings.MOVIO_AMQP_BACKEND == "local":
+            raise CommandError(
+                "The local broker lives in the consumer process: use run_mq_load_test, or replay against RabbitMQ."
+            )
+        if options["speed"] <= 0 or (options["rate"] is not None and options["rate"] <= 0):
+            raise CommandError("--speed and --rate must be positive.")
+        if options["synthetic_input"] and not os.path.isfile(options["synthetic_input"]):
+            raise CommandError(f"Synthetic input not found: {options['synthetic_input']}")
+
+        records = load_capture(options["capture"], limit=options["limit"])
+        if not records:
+            raise CommandError(f"No messages to replay in {options['capture']}.")
+
+        report = replay_capture(
+            records,
+            speed=options["speed"],
+            rate=options["rate"],
+            synthetic_input_path=options["synthetic_input"],
+            wait_timeout_seconds=options["wait_timeout"],
+        )
+        report["meta"]["capture"] = os.path.abspath(options["capture"])
+
+        encoded_report = json.dumps(report, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as report_file:
+                report_file.write(encoded_report)
+        self.stdout.write(encoded_report)
@@ -0,0 +1,64 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core_apps.mq_manager.load_test import run_load_test
+
+
+class Command(BaseCommand):
+    """Load Test of the MQ Consumer and Publisher against the Local S3 and AMQP Stand-ins
+
+    Run with MOVIO_S3_BACKEND=local MOVIO_AMQP_BACKEND=local, the faults are injected through
+    the MOVIO_LOCAL_S3_* and MOVIO_LOCAL_AMQP_* settings.
+    """
+
+    help = "Drives synthetic submissions through the consumer, a simulated pipeline and the publisher, reports throughput, latencies and failures (JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--submissions", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=20, help="submitting users (fair share)")
+        parser.add_argument("--workers", type=int, default=16, help="simulated pipeline threads")
+        parser.add_argument(
+            "--max-in-flight", type=int, help="fair share in flight cap (default: --workers)"
+        )
+        parser.add_argument(
+            "--rate", type=float, default=0, help="submissions per second (0: all at once)"
+        )
+        parser.add_argument(
+            "--duplicate-rate", type=float, default=0.0, help="share of the submissions published twice"
+        )
+        parser.add_argument("--input-bytes", type=int, default=64 * 1024)
+        parser.add_argument("--segments", type=int, default=10, help="segment uploads per pipeline")
+        parser.add_argument("--segment-bytes", type=int, default=16 * 1024)
+        parser.add_argument(
+            "--processing-seconds", type=float, default=0.0, help="simulated encode time per pipeline"
+        )
+        parser.add_argument("--timeout", type=float, default=600)
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if settings.MOVIO_S3_BACKEND != "local" or settings.MOVIO_AMQP_BACKEND != "local":
+            raise CommandError(
+                "The load test runs against the local stand-ins only: set MOVIO_S3_BACKEND=local and MOVIO_AMQP_BACKEND=local."
+            )
+
+        report = run_load_test(
+            submissions=options["submissions"],
+            users=options["users"],
+            workers=options["workers"],
+            max_in_flight=options["max_in_flight"] or options["workers"],
+            rate=options["rate"],
+            duplicate_rate=options["duplicate_rate"],
+            input_bytes=options["input_bytes"],
+            segments=options["segments"],
+            segment_bytes=options["segment_bytes"],
+            processing_seconds=options["processing_seconds"],
+            timeout_seconds=options["timeout"],
+        )
+
+        encoded_report = json.dumps(report, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as report_file:
+                report_file.write(encoded_report)
+        self.stdout.write(encoded_report)
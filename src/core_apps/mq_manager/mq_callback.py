@@ -1,5 +1,7 @@
 import logging
 import json
+import functools
+import time
 import traceback
 
 from django.conf import settings
@@ -9,10 +11,12 @@ from core_apps.workers.tasks import (
     delete_video_file_from_s3,
     extract_cc_from_video,
     upload_subtitle_to_translate_lambda,
+    translate_subtitles,
     transcode_video_to_mp4,
     dash_segment_video,
     edit_manifest_to_add_subtitle_information,
     upload_dash_segments_to_s3_and_publish_message_callback,
+    generate_video_preview_clip,
 )
 
 from celery import chain, group, chord  # noqa
@@ -20,30 +24,221 @@ from celery import chain, group, chord  # noqa
 from core_apps.mq_manager.from_api_service_consumer import (
     s3_video_consumer_mq,
 )
+from core_apps.mq_manager.admission_control import (
+    AdmissionController,
+    release_pending_download,
+    reserve_pending_download,
+)
+from core_apps.mq_manager.dedupe import video_dedupe_window
+from core_apps.mq_manager.fair_dispatcher import FairShareDispatcher
+from core_apps.mq_manager.traffic_capture import traffic_recorder
+from core_apps.mq_manager.priority_lanes import (
+    classify_submission,
+    discard_duration_probe,
+    get_lane_routing_options,
+    start_duration_probe,
+)
+from core_apps.workers.pipeline_status import QUEUED, record_pipeline_state
+from core_apps.workers.source_hold import hold_source_video, release_source_video
+from core_apps.workers.cancellation import (
+    CANCELLED,
+    publish_cancellation_result,
+    request_cancellation,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+def dispatch_video_pipeline(mq_consumed_data: dict) -> bool:
+    """Apply the celery chain to process a video, called by the fair share dispatcher on release.
+
+    Returns False for a duplicate submission, dropped without a pipeline.
+    """
+
+    # Priority lane: every task of the pipeline goes to the lane queue, so short videos
+    # don't queue behind full length films. The lane travels with the mq data.
+    lane = classify_submission(mq_consumed_data)
+    mq_consumed_data["priority_lane"] = lane["name"]
+    mq_consumed_data["dispatched_at"] = time.time()
+
+    # the submission might carry its own deadline (UNIX timestamp)
+    if (
+        mq_consumed_data.get("deadline_at") is None
+        and settings.MOVIO_PIPELINE_DEFAULT_DEADLINE_SECONDS
+    ):
+        mq_consumed_data["deadline_at"] = (
+            mq_consumed_data["dispatched_at"]
+            + settings.MOVIO_PIPELINE_DEFAULT_DEADLINE_SECONDS
+        )
+    lane_routing_options = get_lane_routing_options(mq_consumed_data)
+
+    # the subtitles are translated by the Lambda (S3 event) or in the worker
+    if settings.MOVIO_SUBTITLE_TRANSLATION_MODE == "worker":
+        subtitle_translation_task = translate_subtitles
+    else:
+        subtitle_translation_task = upload_subtitle_to_translate_lambda
+
+    celery_pipeline_to_process_video = chain(
+        download_video_from_s3.s(mq_consumed_data).set(**lane_routing_options),
+        delete_video_file_from_s3.s().set(**lane_routing_options),
+        extract_cc_from_video.s().set(**lane_routing_options),
+        subtitle_translation_task.s().set(**lane_routing_options),
+        transcode_video_to_mp4.s().set(**lane_routing_options),
+        dash_segment_video.s().set(**lane_routing_options),
+        edit_manifest_to_add_subtitle_information.s().set(**lane_routing_options),
+        upload_dash_segments_to_s3_and_publish_message_callback.s().set(
+            **lane_routing_options
+        ),
+    )
+
+    # Idempotent dispatch: a redelivery or retry of a video in flight (or recently finished) is dropped.
+    # Claimed right before the chain is applied, not on consume: a message redelivered after a consumer
+    # crash is only a duplicate if its chain was applied.
+    try:
+        is_claimed = video_dedupe_window.claim(mq_consumed_data)
+    except Exception as e:
+        # dedupe store unavailable: better a duplicate encode than a lost video
+        is_claimed = True
+        logger.warning(
+            f"\n\n[## MQ Dispatch WARNING]: Dedupe Window Unavailable.\nError: {str(e)}\n"
+        )
+
+    if not is_claimed:
+        return False
+
+    # the claim is released on any failure below: the dispatcher retries the submission (or rejects it)
+    is_source_held = False
+    try:
+        # Fast lane: preview clip in parallel with the main chain, on its own queue.
+        # It reads the raw S3 object: held before the chain is applied, the chain then leaves its delete to the preview.
+        is_source_held = settings.MOVIO_PREVIEW_CLIP_ENABLED and hold_source_video(
+            mq_consumed_data["video_id"]
+        )
+
+        # the disk space of the download is reserved until the download task ends
+        if mq_consumed_data.get("s3_file_size_bytes"):
+            reserve_pending_download(
+                mq_consumed_data["video_id"], mq_consumed_data["s3_file_size_bytes"]
+            )
+
+        celery_pipeline_to_process_video.apply_async()
+    except Exception:
+        if is_source_held:
+            release_source_video(mq_consumed_data["video_id"])
+        release_pending_download(mq_consumed_data["video_id"])
+        video_dedupe_window.release(mq_consumed_data)
+        raise
+
+    if settings.MOVIO_PREVIEW_CLIP_ENABLED:
+        dispatch_video_preview_clip(mq_consumed_data)
+
+    record_pipeline_state(mq_consumed_data, QUEUED)
+
+    logger.info(
+        f"\n\n[=> MQ Pipeline Dispatched]: Video Process Pipeline Dispatched. Priority Lane: {lane['name']}\n"
+    )
+    return True
+
+
+def dispatch_video_preview_clip(mq_consumed_data: dict) -> None:
+    """Apply the preview clip task of a dispatched pipeline. A failure only loses the preview: the chain is applied."""
+
+    try:
+        generate_video_preview_clip.s(mq_consumed_data).apply_async(
+            queue=settings.MOVIO_PREVIEW_CELERY_QUEUE
+        )
+    except Exception as e:
+        # no preview to release the hold: the chain deletes the object itself, unless it already deferred the delete
+        if release_source_video(mq_consumed_data["video_id"]):
+            logger.warning(
+                f"\n[## MQ Dispatch WARNING]: Raw Video Delete Deferred to a Preview Never Dispatched, Left to the Bucket Lifecycle Rule: {mq_consumed_data['s3_file_key']}"
+            )
+        logger.error(
+            f"\n\n[XX MQ Dispatch Failed XX]: Preview Clip Could Not Be Dispatched.\n"
+            f"Error: {str(e)}\n"
+        )
+
+
+admission_controller = AdmissionController()
+
+fair_share_dispatcher = FairShareDispatcher(
+    dispatch=dispatch_video_pipeline,
+    admit=admission_controller.admit,
+)
+
+
+def cancel_video_pipeline(video_id: str) -> None:
+    """Handle a "cancel" message: a queued submission is dropped right away, a running pipeline
+    sees the shared cancellation flag, stops, cleans up and publishes the cancellation result.
+    """
+
+    request_cancellation(video_id)
+
+    for mq_data in fair_share_dispatcher.cancel(video_id):
+        discard_duration_probe(video_id)
+        admission_controller.discard_size_lookup(video_id)
+        publish_cancellation_result(mq_data, CANCELLED)
+
+    logger.info(
+        f"\n\n[=> MQ Cancel Message]: Cancellation Requested for Video: {video_id}\n"
+    )
+
+
 def callback(channel, method, properties, body):
-    """Callback to consume messages from Movio API Service"""
+    """Callback to consume messages from Movio API Service
+
+    The submission is queued in the fair share dispatcher, and the message is acked once the
+    dispatcher releases it to celery. A "cancel" message (message_type) cancels the pipeline of a video.
+    """
+
+    # capture for the replay tool (settings.MOVIO_MQ_CAPTURE_PATH), raw as received
+    traffic_recorder.record(method, properties, body)
 
     try:
         # body in bytes, decode to str then dict
         mq_consumed_data = json.loads(body.decode("utf-8"))
-
-        celery_pipeline_to_process_video = chain(
-            download_video_from_s3.s(mq_consumed_data),
-            delete_video_file_from_s3.s(),
-            extract_cc_from_video.s(),
-            upload_subtitle_to_translate_lambda.s(),
-            transcode_video_to_mp4.s(),
-            dash_segment_video.s(),
-            edit_manifest_to_add_subtitle_information.s(), 
-            upload_dash_segments_to_s3_and_publish_message_callback.s(),
+    except Exception as e:
+        channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+        logger.error(
+            f"\n\n[XX MQ Consume Failed XX]: MQ Message Could Not Be Decoded.\n"
+            f"Error: {str(e)}\n"
         )
+        return
 
-        celery_pipeline_to_process_video.apply_async()
+    if mq_consumed_data.get("message_type") == "cancel":
+        try:
+            cancel_video_pipeline(mq_consumed_data["video_id"])
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            # requeued: a lost cancel message would mean a full encode for a deleted video
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            logger.error(
+                f"\n\n[XX MQ Consume Failed XX]: MQ Cancel Message Failed.\n"
+                f"Error: {str(e)}\n"
+            )
+        return
+
+    # a cancel of the video only applies to the submissions consumed before it
+    mq_consumed_data["consumed_at"] = time.time()
+
+    def on_dispatch_failed(requeue: bool):
+        # a cancelled or malformed submission is dropped, a broker hiccup is retried by the dispatcher
+        channel.basic_nack(delivery_tag=method.delivery_tag, requeue=requeue)
+
+    fair_share_dispatcher.submit(
+        mq_consumed_data,
+        on_dispatched=functools.partial(
+            channel.basic_ack, delivery_tag=method.delivery_tag
+        ),
+        on_failed=on_dispatch_failed,
+    )
+    start_duration_probe(mq_consumed_data)
+    admission_controller.start_size_lookup(mq_consumed_data)
+
+    try:
+        # the submission stays queued if it can't be released now, the consumer tick retries.
+        fair_share_dispatcher.release()
 
         logger.info(
             f"\n\n[=> MQ Consume Started]: MQ Message Consume Success.\n"
@@ -56,7 +251,26 @@ def callback(channel, method, properties, body):
             f"Traceback: {traceback.format_exc()}\n"
         )
 
+
+def release_queued_submissions():
+    """Consumer tick: apply the backpressure, release the queued submissions as pipelines finish,
+    and publish the fair share stats.
+    """
+
+    if admission_controller.evaluate():
+        s3_video_consumer_mq.resume_consuming()
+        fair_share_dispatcher.release()
+    else:
+        s3_video_consumer_mq.pause_consuming()
+
+    fair_share_dispatcher.publish_stats()
+
+
 def main():
     # consuming the messaages from the queue where the Movio API Service publishes the video files data
     
-    s3_video_consumer_mq.consume_messages(callback=callback)
+    s3_video_consumer_mq.consume_messages(
+        callback=callback,
+        on_tick=release_queued_submissions,
+        tick_interval=settings.MOVIO_FAIR_SHARE_RELEASE_INTERVAL_SECONDS,
+    )
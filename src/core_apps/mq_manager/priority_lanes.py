@@ -0,0 +1,219 @@
+import json
+import logging
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from core_apps.common.metrics import observe_queue_wait
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.common.s3_utils import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+s3_client = get_s3_client()
+
+# redis list of the recent queue delays (seconds) of a lane: movio:lane-queue-delay:<lane_name>
+LANE_QUEUE_DELAY_KEY = "movio:lane-queue-delay:{lane_name}"
+
+# duration probes of the queued submissions, run off the consumer thread: {video_id: future}
+_duration_probes = {}
+_probe_executor = None
+
+
+def get_lane(lane_name: str) -> dict:
+    """Return the lane from settings.MOVIO_PRIORITY_LANES, the default lane if not found."""
+
+    for lane in settings.MOVIO_PRIORITY_LANES:
+        if lane["name"] == lane_name:
+            return lane
+
+    return get_lane(settings.MOVIO_PRIORITY_LANE_DEFAULT)
+
+
+def get_lane_routing_options(mq_data: dict) -> dict:
+    """Celery routing options (queue and priority) for the lane of a submission."""
+
+    lane = get_lane(mq_data.get("priority_lane", settings.MOVIO_PRIORITY_LANE_DEFAULT))
+    return {"queue": lane["queue"], "priority": lane["priority"]}
+
+
+def get_s3_object_size(s3_file_key: str) -> int:
+    """Size in bytes of the user uploaded video from S3 HEAD."""
+
+    response = s3_client.head_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=s3_file_key,
+    )
+    return response["ContentLength"]
+
+
+def probe_video_duration(s3_file_key: str) -> float:
+    """Duration in seconds of the user uploaded video, ffprobe only reads the container header."""
+
+    s3_presigned_url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": s3_file_key},
+        ExpiresIn=300,
+    )
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "json",
+        s3_presigned_url,
+    ]
+    output = subprocess.run(
+        command, check=True, capture_output=True, text=True, timeout=30
+    ).stdout
+    return float(json.loads(output)["format"]["duration"])
+
+
+def get_probe_executor() -> ThreadPoolExecutor:
+    global _probe_executor
+
+    if _probe_executor is None:
+        _probe_executor = ThreadPoolExecutor(
+            max_workers=settings.MOVIO_PRIORITY_LANE_PROBE_THREADS,
+            thread_name_prefix="movio-lane-probe",
+        )
+    return _probe_executor
+
+
+def start_duration_probe(mq_data: dict) -> None:
+    """Probe the duration of a queued submission in the background, picked up by classify_submission."""
+
+    video_id = mq_data.get("video_id")
+    if not settings.MOVIO_PRIORITY_LANE_PROBE_DURATION or video_id in _duration_probes:
+        return
+
+    _duration_probes[video_id] = get_probe_executor().submit(
+        probe_video_duration, mq_data["s3_file_key"]
+    )
+
+
+def discard_duration_probe(video_id: str) -> None:
+    future = _duration_probes.pop(video_id, None)
+    if future is not None:
+        future.cancel()
+
+
+def get_probed_duration(mq_data: dict):
+    """Duration of the submission if its probe is done, None otherwise (the consumer never waits for it)."""
+
+    future = _duration_probes.pop(mq_data.get("video_id"), None)
+    if future is None or not future.done():
+        if future is not None:
+            future.cancel()
+        return None
+
+    try:
+        return future.result()
+    except (ClientError, BotoCoreError, subprocess.SubprocessError, KeyError, ValueError) as e:
+        logger.warning(
+            f"\n[## PRIORITY LANE WARNING]: Duration Could Not Be Probed, Classified by Size Only.\nException: {str(e)}"
+        )
+        return None
+
+
+def classify_submission(mq_data: dict) -> dict:
+    """Classify a submission into a priority lane.
+
+    Runs in the consumer thread, so nothing here waits on S3 or ffprobe: the size comes from the
+    submission (s3_file_size_bytes, set by the admission control otherwise), the duration from the
+    background probe if it is done.
+
+    Returns the lane from settings.MOVIO_PRIORITY_LANES, the default lane if the submission can't be classified.
+    """
+
+    size_bytes = mq_data.get("s3_file_size_bytes")
+    duration_seconds = get_probed_duration(mq_data)
+
+    if size_bytes is None:
+        logger.warning(
+            f"\n[## PRIORITY LANE WARNING]: Submission Size Unknown, Using Default Lane: {settings.MOVIO_PRIORITY_LANE_DEFAULT}."
+        )
+        return get_lane(settings.MOVIO_PRIORITY_LANE_DEFAULT)
+
+    for lane in settings.MOVIO_PRIORITY_LANES:
+        if lane["max_size_bytes"] is not None and size_bytes > lane["max_size_bytes"]:
+            continue
+        if (
+            duration_seconds is not None
+            and lane["max_duration_seconds"] is not None
+            and duration_seconds > lane["max_duration_seconds"]
+        ):
+            continue
+
+        logger.info(
+            f"\n[=> PRIORITY LANE]: Submission Classified into Lane: {lane['name']}.\nSize: {size_bytes} bytes, Duration: {duration_seconds} seconds."
+        )
+        return lane
+
+    # the last lane has no thresholds, only reached for misconfigured lanes.
+    return settings.MOVIO_PRIORITY_LANES[-1]
+
+
+def record_lane_queue_delay(mq_data: dict) -> None:
+    """Record the delay between the dispatch by the consumer and the first task start of a submission."""
+
+    dispatched_at = mq_data.get("dispatched_at")
+    if dispatched_at is None:
+        return
+
+    lane_name = mq_data.get("priority_lane", settings.MOVIO_PRIORITY_LANE_DEFAULT)
+    queue_delay = max(time.time() - dispatched_at, 0.0)
+    observe_queue_wait(lane_name, queue_delay)
+
+    logger.info(
+        f"\n[=> PRIORITY LANE QUEUE DELAY]: Lane: {lane_name}, Queue Delay: {queue_delay:.2f} seconds."
+    )
+
+    try:
+        redis_client = get_redis_client()
+        key = LANE_QUEUE_DELAY_KEY.format(lane_name=lane_name)
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.lpush(key, f"{queue_delay:.3f}")
+        pipeline.ltrim(key, 0, settings.MOVIO_PRIORITY_LANE_QUEUE_DELAY_SAMPLES - 1)
+        pipeline.execute()
+    except Exception as e:
+        # reporting must never fail the pipeline
+        logger.warning(
+            f"\n[## PRIORITY LANE WARNING]: Queue Delay Could Not Be Recorded.\nException: {str(e)}"
+        )
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    index = min(int(round(percent / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def get_lane_queue_delay_report() -> dict:
+    """Queue delay stats (seconds) of the recent submissions, per lane."""
+
+    redis_client = get_redis_client()
+    report = {}
+
+    for lane in settings.MOVIO_PRIORITY_LANES:
+        key = LANE_QUEUE_DELAY_KEY.format(lane_name=lane["name"])
+        delays = sorted(float(delay) for delay in redis_client.lrange(key, 0, -1))
+
+        if not delays:
+            report[lane["name"]] = {"samples": 0}
+            continue
+
+        report[lane["name"]] = {
+            "samples": len(delays),
+            "p50": _percentile(delays, 50),
+            "p95": _percentile(delays, 95),
+            "max": delays[-1],
+            "mean": sum(delays) / len(delays),
+        }
+
+    return report
@@ -1,3 +1,510 @@
-from django.test import TestCase
+import functools
+import json
+import threading
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from core_apps.mq_manager import mq_callback, priority_lanes
+from core_apps.mq_manager.admission_control import AdmissionController
+from core_apps.mq_manager.dedupe import LocalDedupeStore, VideoDedupeWindow
+from core_apps.mq_manager.fair_dispatcher import FairShareDispatcher, LocalInFlightStore
+from core_apps.mq_manager.local_amqp import LocalBlockingConnection, LocalBroker
+from core_apps.mq_manager.priority_lanes import (
+    classify_submission,
+    get_lane_queue_delay_report,
+    get_lane_routing_options,
+)
+
+SUBMISSION_QUEUE = "movio-test-submissions"
+
+
+def make_submission(user_id: str, index: int) -> dict:
+    return {"video_id": f"{user_id}-{index}", "user_data": {"user_id": user_id}}
+
+
+class FairShareDispatcherTests(SimpleTestCase):
+    """Submissions published to the in-memory broker, consumed into the dispatcher and acked once released."""
+
+    def setUp(self):
+        self.broker = LocalBroker()
+        self.connection = LocalBlockingConnection(broker=self.broker)
+        self.addCleanup(self.connection.close)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=SUBMISSION_QUEUE)
+
+        self.in_flight_store = LocalInFlightStore()
+        self.dispatched = []
+
+    def get_dispatcher(self, **kwargs) -> FairShareDispatcher:
+        options = {
+            "dispatch": lambda mq_data: self.dispatched.append(mq_data["video_id"]),
+            "in_flight_store": self.in_flight_store,
+            "max_in_flight": 100,
+            "per_user_max_in_flight": 100,
+            "user_max_in_flight": {},
+            "user_weights": {},
+        }
+        options.update(kwargs)
+        return FairShareDispatcher(**options)
+
+    def get_pipeline_dispatcher(self) -> FairShareDispatcher:
+        """Dispatcher releasing to mq_callback.dispatch_video_pipeline, with a local dedupe window and no celery or redis."""
+
+        self.dedupe_window = VideoDedupeWindow(store=LocalDedupeStore())
+        patcher = mock.patch.multiple(
+            mq_callback,
+            video_dedupe_window=self.dedupe_window,
+            chain=mock.DEFAULT,
+            record_pipeline_state=mock.DEFAULT,
+            generate_video_preview_clip=mock.DEFAULT,
+            hold_source_video=mock.DEFAULT,
+            release_source_video=mock.DEFAULT,
+        )
+        mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.apply_async = mocks["chain"].return_value.apply_async
+        self.preview_apply_async = mocks["generate_video_preview_clip"].s.return_value.apply_async
+        self.release_source_video = mocks["release_source_video"]
+        mocks["hold_source_video"].return_value = True
+        return self.get_dispatcher(dispatch=mq_callback.dispatch_video_pipeline)
+
+    def publish(self, user_id: str, count: int) -> None:
+        for index in range(count):
+            self.channel.basic_publish(
+                exchange="",
+                routing_key=SUBMISSION_QUEUE,
+                body=json.dumps(make_submission(user_id, index)),
+            )
+
+    def consume(self, dispatcher: FairShareDispatcher) -> None:
+        """Deliver the published submissions to the dispatcher, as mq_callback.callback does."""
+
+        def callback(channel, method, properties, body):
+            dispatcher.submit(
+                json.loads(body.decode("utf-8")),
+                on_dispatched=functools.partial(
+                    channel.basic_ack, delivery_tag=method.delivery_tag
+                ),
+                on_failed=lambda requeue=True: channel.basic_nack(
+                    delivery_tag=method.delivery_tag, requeue=requeue
+                ),
+            )
+
+        self.channel.basic_consume(SUBMISSION_QUEUE, callback, auto_ack=False)
+        self.connection.process_data_events()
+
+    def finish(self, *video_ids: str) -> None:
+        for video_id in video_ids:
+            self.in_flight_store.remove(None, video_id)
+
+    def test_light_user_is_not_starved_by_heavy_user(self):
+        dispatcher = self.get_dispatcher(max_in_flight=4)
+        self.publish("heavy", 10)
+        self.publish("light", 2)
+        self.consume(dispatcher)
+
+        self.assertEqual(dispatcher.release(), 4)
+        self.assertEqual(self.dispatched, ["heavy-0", "light-0", "heavy-1", "light-1"])
+        # only the released submissions are acked
+        self.assertEqual(len(self.channel.unacked), 8)
+
+        # the light user is done, the heavy user gets the freed slots
+        self.finish(*self.dispatched)
+        self.assertEqual(dispatcher.release(), 4)
+        self.assertEqual(self.dispatched[4:], ["heavy-2", "heavy-3", "heavy-4", "heavy-5"])
+        self.assertEqual(len(self.channel.unacked), 4)
+
+    def test_user_weights_share_the_dispatch(self):
+        dispatcher = self.get_dispatcher(max_in_flight=6, user_weights={"heavy": 2})
+        self.publish("heavy", 10)
+        self.publish("light", 10)
+        self.consume(dispatcher)
+
+        dispatcher.release()
+        self.assertEqual([video_id.split("-")[0] for video_id in self.dispatched].count("heavy"), 4)
+        self.assertEqual(dispatcher.get_stats()["fairness_index"], 1.0)
+        self.assertEqual(dispatcher.get_stats()["users"]["light"]["queued"], 8)
+
+    def test_per_user_in_flight_cap(self):
+        dispatcher = self.get_dispatcher(
+            per_user_max_in_flight=2, user_max_in_flight={"vip": 3}
+        )
+        self.publish("heavy", 5)
+        self.publish("vip", 5)
+        self.consume(dispatcher)
+
+        self.assertEqual(dispatcher.release(), 5)
+        self.assertEqual(self.in_flight_store.counts(["heavy", "vip"]), (5, {"heavy": 2, "vip": 3}))
+
+        # nothing more while the caps hold, one more once a heavy pipeline finishes
+        self.assertEqual(dispatcher.release(), 0)
+        self.finish("heavy-0")
+        self.assertEqual(dispatcher.release(), 1)
+        self.assertEqual(self.dispatched[-1], "heavy-2")
+
+    def test_unreleased_submissions_are_redelivered(self):
+        dispatcher = self.get_dispatcher(max_in_flight=1)
+        self.publish("user", 3)
+        self.consume(dispatcher)
+        dispatcher.release()
+
+        # the consumer goes away: the submissions it held but never released are back in the queue
+        self.channel.close()
+        self.assertEqual(self.broker.get_message_count(SUBMISSION_QUEUE), 2)
+        redelivered = [json.loads(self.broker.get(SUBMISSION_QUEUE)[2]) for _ in range(2)]
+        self.assertEqual(
+            sorted(mq_data["video_id"] for mq_data in redelivered), ["user-1", "user-2"]
+        )
+
+    def test_admit_holds_the_submissions(self):
+        admit = mock.Mock(return_value=False)
+        dispatcher = self.get_dispatcher(admit=admit)
+        self.publish("user", 3)
+        self.consume(dispatcher)
+
+        self.assertEqual(dispatcher.release(), 0)
+        self.assertEqual(self.dispatched, [])
+        self.assertEqual(len(self.channel.unacked), 3)
+
+        # a submission that doesn't fit doesn't hold the ones behind it
+        admit.side_effect = lambda mq_data: mq_data["video_id"] != "user-0"
+        self.assertEqual(dispatcher.release(), 2)
+        self.assertEqual(self.dispatched, ["user-1", "user-2"])
+
+        admit.side_effect = None
+        admit.return_value = True
+        self.assertEqual(dispatcher.release(), 1)
+        self.assertEqual(self.dispatched, ["user-1", "user-2", "user-0"])
+        self.assertEqual(len(self.channel.unacked), 0)
+
+    def test_cancel_drops_the_queued_submission(self):
+        dispatcher = self.get_dispatcher(max_in_flight=1)
+        self.publish("user", 2)
+        self.consume(dispatcher)
+        dispatcher.release()
+
+        cancelled = dispatcher.cancel("user-1")
+
+        self.assertEqual([mq_data["video_id"] for mq_data in cancelled], ["user-1"])
+        self.assertEqual(dispatcher.get_stats()["queued"], 0)
+        # rejected, not redelivered
+        self.assertEqual(len(self.channel.unacked), 0)
+        self.assertEqual(self.broker.get_message_count(SUBMISSION_QUEUE), 0)
+
+        self.finish("user-0")
+        self.assertEqual(dispatcher.release(), 0)
+        self.assertEqual(self.dispatched, ["user-0"])
+
+    @override_settings(
+        MOVIO_FAIR_SHARE_DISPATCH_RETRY_SECONDS=10,
+        MOVIO_FAIR_SHARE_DISPATCH_RETRY_MAX_SECONDS=15,
+    )
+    def test_failed_dispatch_is_retried_with_backoff(self):
+        dispatch = mock.Mock(side_effect=ConnectionError)
+        dispatcher = self.get_dispatcher(dispatch=dispatch)
+        self.publish("user", 2)
+        self.consume(dispatcher)
+
+        with mock.patch("core_apps.mq_manager.fair_dispatcher.time.time", return_value=1000):
+            self.assertEqual(dispatcher.release(), 0)
+            # the release stops at the failure, held (not redelivered) until the backoff is over
+            self.assertEqual(dispatch.call_count, 1)
+            self.assertEqual(dispatcher.get_stats()["queued"], 2)
+            self.assertEqual(len(self.channel.unacked), 2)
+            self.assertEqual(self.broker.get_message_count(SUBMISSION_QUEUE), 0)
+            self.assertEqual(dispatcher.release(), 0)
+            self.assertEqual(dispatch.call_count, 1)
+
+        with mock.patch("core_apps.mq_manager.fair_dispatcher.time.time", return_value=1010):
+            self.assertEqual(dispatcher.release(), 0)
+        # doubled, up to the max
+        self.assertEqual(dispatcher.dispatch_retry_at, 1025)
+
+        dispatch.side_effect = lambda mq_data: self.dispatched.append(mq_data["video_id"])
+        with mock.patch("core_apps.mq_manager.fair_dispatcher.time.time", return_value=1025):
+            self.assertEqual(dispatcher.release(), 2)
+        # in order
+        self.assertEqual(self.dispatched, ["user-0", "user-1"])
+        self.assertEqual(dispatcher.dispatch_failures, 0)
+        self.assertEqual(len(self.channel.unacked), 0)
+
+    def test_malformed_submission_is_rejected(self):
+        dispatcher = self.get_dispatcher(dispatch=mock.Mock(side_effect=KeyError("video_id")))
+        self.publish("user", 1)
+        self.consume(dispatcher)
+
+        self.assertEqual(dispatcher.release(), 0)
+        self.assertEqual(dispatcher.get_stats()["queued"], 0)
+        self.assertEqual(dispatcher.dispatch_retry_at, 0)
+        self.assertEqual(len(self.channel.unacked), 0)
+        self.assertEqual(self.broker.get_message_count(SUBMISSION_QUEUE), 0)
+        self.assertEqual(self.in_flight_store.in_flight, {})
+
+    def test_bookkeeping_failure_still_acks_the_dispatched_submission(self):
+        dispatcher = self.get_dispatcher()
+        self.publish("user", 1)
+        self.consume(dispatcher)
+
+        with mock.patch.object(self.in_flight_store, "add", side_effect=ConnectionError):
+            self.assertEqual(dispatcher.release(), 1)
+
+        self.assertEqual(self.dispatched, ["user-0"])
+        self.assertEqual(len(self.channel.unacked), 0)
+        self.assertEqual(self.broker.get_message_count(SUBMISSION_QUEUE), 0)
+
+    def test_submission_redelivered_before_its_release_is_dispatched(self):
+        dispatcher = self.get_pipeline_dispatcher()
+        self.publish("user", 1)
+        self.consume(dispatcher)
+
+        # the consumer goes away before the release: the redelivery is not a duplicate
+        self.channel.close()
+        self.channel = self.connection.channel()
+        dispatcher = self.get_dispatcher(dispatch=mq_callback.dispatch_video_pipeline)
+        self.consume(dispatcher)
+
+        self.assertEqual(dispatcher.release(), 1)
+        self.assertEqual(self.apply_async.call_count, 1)
+        self.assertEqual(len(self.channel.unacked), 0)
+
+    def test_duplicate_is_acked_without_a_pipeline(self):
+        dispatcher = self.get_pipeline_dispatcher()
+        self.publish("user", 1)
+        self.publish("user", 1)
+        self.consume(dispatcher)
+
+        self.assertEqual(dispatcher.release(), 1)
+        self.assertEqual(self.apply_async.call_count, 1)
+        self.assertEqual(self.preview_apply_async.call_count, 1)
+        self.assertEqual(self.dedupe_window.get_suppressed_count(), 1)
+        self.assertEqual(self.in_flight_store.in_flight, {"user-0": "user"})
+        self.assertEqual(len(self.channel.unacked), 0)
+
+    @override_settings(MOVIO_FAIR_SHARE_DISPATCH_RETRY_SECONDS=0)
+    def test_failed_dispatch_releases_the_claim(self):
+        dispatcher = self.get_pipeline_dispatcher()
+        self.apply_async.side_effect = ConnectionError
+        self.publish("user", 1)
+        self.consume(dispatcher)
+        self.assertEqual(dispatcher.release(), 0)
+        # no preview without its pipeline, the raw video hold is released
+        self.assertEqual(self.preview_apply_async.call_count, 0)
+        self.release_source_video.assert_called_once_with("user-0")
+
+        # still queued, the retry is not a duplicate
+        self.apply_async.side_effect = None
+        self.assertEqual(dispatcher.release(), 1)
+        self.assertEqual(self.preview_apply_async.call_count, 1)
+        self.assertEqual(len(self.channel.unacked), 0)
+
+
+@override_settings(
+    MOVIO_ADMISSION_MIN_FREE_DISK_BYTES=100,
+    MOVIO_ADMISSION_MAX_QUEUE_DEPTH=10,
+    MOVIO_ADMISSION_MAX_IN_FLIGHT_ENCODES=4,
+    MOVIO_ADMISSION_RESUME_RATIO=0.5,
+)
+class AdmissionControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.signals = {
+            "free_disk_bytes": 1000,
+            "pending_download_bytes": 0,
+            "available_disk_bytes": 1000,
+            "queue_depth": 0,
+            "in_flight_encodes": 0,
+        }
+        self.controller = AdmissionController()
+        patcher = mock.patch.object(
+            self.controller, "collect_signals", side_effect=lambda: dict(self.signals)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pause_and_resume_with_hysteresis(self):
+        self.assertTrue(self.controller.evaluate())
+
+        self.signals["queue_depth"] = 10
+        self.assertFalse(self.controller.evaluate())
+
+        # under the limit, not yet under the resume ratio of it
+        self.signals["queue_depth"] = 6
+        self.assertFalse(self.controller.evaluate())
+
+        self.signals["queue_depth"] = 4
+        self.assertTrue(self.controller.evaluate())
+
+    def test_admit_counts_the_expected_download(self):
+        self.assertTrue(self.controller.admit({"video_id": "small", "s3_file_size_bytes": 800}))
+        self.assertFalse(self.controller.admit({"video_id": "large", "s3_file_size_bytes": 950}))
+
+        # a refused submission doesn't pause the consumer, a smaller one still fits
+        self.assertTrue(self.controller.admit({"video_id": "tiny", "s3_file_size_bytes": 50}))
+        self.assertTrue(self.controller.evaluate())
+
+    def test_signals_are_collected_once_per_tick(self):
+        self.controller.evaluate()
+        for index in range(3):
+            self.controller.admit({"video_id": f"video-{index}", "s3_file_size_bytes": 10})
+        self.assertEqual(self.controller.collect_signals.call_count, 1)
+
+        # each admitted chain counts in the queue depth until the next tick
+        self.signals["queue_depth"] = 7
+        self.controller.evaluate()
+        for index in range(3):
+            self.assertTrue(
+                self.controller.admit({"video_id": f"video-{index}", "s3_file_size_bytes": 10})
+            )
+        self.assertFalse(self.controller.admit({"video_id": "video-3", "s3_file_size_bytes": 10}))
+
+    def test_admit_looks_up_a_missing_size_off_the_consumer_thread(self):
+        mq_data = {"video_id": "video", "s3_file_key": "movio-temp-videos/video.mp4"}
+        looked_up = threading.Event()
+
+        with mock.patch(
+            "core_apps.mq_manager.admission_control.get_s3_object_size",
+            side_effect=lambda s3_file_key: looked_up.wait(5) and 300,
+        ) as get_s3_object_size:
+            # not admitted while the size is looked up
+            self.assertFalse(self.controller.admit(mq_data))
+
+            looked_up.set()
+            self.controller.size_lookups["video"].result(timeout=5)
+            self.assertTrue(self.controller.admit(mq_data))
+
+        get_s3_object_size.assert_called_once_with("movio-temp-videos/video.mp4")
+        self.assertEqual(mq_data["s3_file_size_bytes"], 300)
+
+
+class VideoDedupeWindowTests(SimpleTestCase):
+    def setUp(self):
+        self.window = VideoDedupeWindow(store=LocalDedupeStore())
+        self.mq_data = {"video_id": "video", "s3_file_key": "movio-temp-videos/video.mp4"}
+
+    def test_duplicate_is_suppressed_while_in_flight(self):
+        self.assertTrue(self.window.claim(self.mq_data))
+        self.assertFalse(self.window.claim(dict(self.mq_data)))
+        self.assertEqual(self.window.get_suppressed_count(), 1)
+
+    def test_finished_pipeline_stays_in_the_window(self):
+        self.window.claim(self.mq_data)
+        self.window.finish(self.mq_data, success=True)
+
+        self.assertFalse(self.window.claim(self.mq_data))
+
+    def test_failed_or_undispatched_pipeline_can_be_retried(self):
+        self.window.claim(self.mq_data)
+        self.window.finish(self.mq_data, success=False)
+        self.assertTrue(self.window.claim(self.mq_data))
+
+        self.window.release(self.mq_data)
+        self.assertTrue(self.window.claim(self.mq_data))
+
+    def test_new_upload_of_the_video_is_not_a_duplicate(self):
+        self.window.claim(self.mq_data)
+
+        self.assertTrue(
+            self.window.claim({**self.mq_data, "s3_file_key": "movio-temp-videos/video-2.mp4"})
+        )
+
+
+def make_lane(name: str, priority: int, max_size_bytes, max_duration_seconds) -> dict:
+    return {
+        "name": name,
+        "queue": f"lane-{name}",
+        "priority": priority,
+        "max_size_bytes": max_size_bytes,
+        "max_duration_seconds": max_duration_seconds,
+    }
+
+
+TEST_PRIORITY_LANES = [
+    make_lane("short", 0, 100, 60),
+    make_lane("standard", 3, 1000, 600),
+    make_lane("long", 6, None, None),
+]
+
+
+@override_settings(
+    MOVIO_PRIORITY_LANES=TEST_PRIORITY_LANES,
+    MOVIO_PRIORITY_LANE_DEFAULT="standard",
+    MOVIO_PRIORITY_LANE_PROBE_DURATION=True,
+)
+class PriorityLaneTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(priority_lanes._duration_probes, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_probed_duration(self, video_id: str, duration_seconds=None, exception=None) -> Future:
+        future = Future()
+        if exception is not None:
+            future.set_exception(exception)
+        elif duration_seconds is not None:
+            future.set_result(duration_seconds)
+        priority_lanes._duration_probes[video_id] = future
+        return future
+
+    def classify(self, size_bytes, duration_seconds=None) -> str:
+        if duration_seconds is not None:
+            self.set_probed_duration("video", duration_seconds)
+        return classify_submission({"video_id": "video", "s3_file_size_bytes": size_bytes})["name"]
+
+    def test_size_thresholds(self):
+        self.assertEqual(self.classify(100), "short")
+        self.assertEqual(self.classify(101), "standard")
+        self.assertEqual(self.classify(1000), "standard")
+        self.assertEqual(self.classify(1001), "long")
+
+    def test_duration_thresholds(self):
+        self.assertEqual(self.classify(10, duration_seconds=60), "short")
+        # small but long: the duration moves it down
+        self.assertEqual(self.classify(10, duration_seconds=61), "standard")
+        self.assertEqual(self.classify(10, duration_seconds=601), "long")
+        # both must fit
+        self.assertEqual(self.classify(1001, duration_seconds=1), "long")
+
+    def test_classified_by_size_until_the_probe_is_done(self):
+        future = self.set_probed_duration("video")
+        self.assertEqual(self.classify(10), "short")
+        # the pending probe is dropped, never waited for
+        self.assertTrue(future.cancelled())
+        self.assertNotIn("video", priority_lanes._duration_probes)
+
+        self.set_probed_duration("video", exception=ValueError("no duration"))
+        self.assertEqual(self.classify(10), "short")
+
+    def test_unknown_size_goes_to_the_default_lane(self):
+        self.set_probed_duration("video", 10)
+        self.assertEqual(classify_submission({"video_id": "video"})["name"], "standard")
+
+    def test_routing_options_of_the_lane(self):
+        self.assertEqual(
+            get_lane_routing_options({"priority_lane": "short"}),
+            {"queue": "lane-short", "priority": 0},
+        )
+        # unknown or missing lane: the default one
+        self.assertEqual(
+            get_lane_routing_options({"priority_lane": "removed"}),
+            {"queue": "lane-standard", "priority": 3},
+        )
+        self.assertEqual(get_lane_routing_options({}), {"queue": "lane-standard", "priority": 3})
+
+    def test_queue_delay_report(self):
+        short_lane_key = priority_lanes.LANE_QUEUE_DELAY_KEY.format(lane_name="short")
+        delays = {short_lane_key: ["4.000", "1.000", "2.000", "3.000"]}
+        redis_client = mock.Mock()
+        redis_client.lrange.side_effect = lambda key, start, end: delays.get(key, [])
+
+        with mock.patch.object(priority_lanes, "get_redis_client", return_value=redis_client):
+            report = get_lane_queue_delay_report()
+
+        self.assertEqual(
+            report,
+            {
+                "short": {"samples": 4, "p50": 3.0, "p95": 4.0, "max": 4.0, "mean": 2.5},
+                "standard": {"samples": 0},
+                "long": {"samples": 0},
+            },
+        )
@@ -1,11 +1,16 @@
 
 import json
 import logging
+import time
 
 import pika
 
 from django.conf import settings
 
+from core_apps.mq_manager.amqp_utils import get_amqp_connection
+
+from core_apps.common.metrics import observe_mq_message_size, observe_mq_publish
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,7 +24,7 @@ class CloudAMQPHandler:
         self.params = pika.URLParameters(self.broker_url)
 
     def connect(self):
-        self.__connection = pika.BlockingConnection(parameters=self.params)
+        self.__connection = get_amqp_connection(self.params)
         self.channel = self.__connection.channel()
 
     def prepare_exchange_and_queue(self) -> None:
@@ -42,8 +47,11 @@ class CloudAMQPHandler:
 class VideoProcessResultPublisherMQ(CloudAMQPHandler):
     """Interface Class to Publish Video Process Result Events to Movio-API-Service to Update the DB"""
 
-    def publish_data(self, video_process_data: json) -> None:
+    def publish_data(self, video_process_data: json, message_type: str = "unknown") -> tuple:
+        """Returns (is_published, message). message_type: label of the message size histogram."""
 
+        observe_mq_message_size(message_type, len(video_process_data))
+        started_at = time.perf_counter()
         try:
             self.connect()
             self.prepare_exchange_and_queue()
@@ -53,12 +61,14 @@ class VideoProcessResultPublisherMQ(CloudAMQPHandler):
                 routing_key=settings.MOVIO_PROCESSED_VIDEO_RESULT_ROUTING_KEY,
                 body=video_process_data,
             )
+            observe_mq_publish("success", time.perf_counter() - started_at)
             logger.info(
                 f"\n\n[=> MQ VIDEO PROCESS RESULT PUBLISH SUCCESS]: MQ Publish Success.\n\n"
             )
             message = "video-process-result-mq-publish-success."
             return True, message
         except Exception as e:
+            observe_mq_publish("error", time.perf_counter() - started_at)
             logger.exception(
                 f"\n\n[XX MQ VIDEO PROCESS RESULT PUBLISH ERROR XX]: MQ Publish Unsuccessful.\n[MQ EXCEPTION]: {str(e)}\n\n"
             )
@@ -0,0 +1,102 @@
+"""
+MQ traffic capture, for capacity planning (replayed by traffic_replay).
+
+The consumer appends every submission message it receives to a JSONL capture
+(settings.MOVIO_MQ_CAPTURE_PATH), one line per message:
+    {"recorded_at": <UNIX timestamp>, "exchange": ..., "routing_key": ..., "redelivered": ..., "body": {...}}
+The presigned url of a submission is recorded without its query string (the signature).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficRecorder:
+    """Appends the consumed submission messages to a JSONL capture file.
+
+    Disabled when path is None. Recording stops once the file reaches max_bytes, and an error
+    while recording never fails the consumption of the message.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.file = None
+        self.is_full = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None and not self.is_full
+
+    def record(self, method, properties, body: bytes) -> None:
+        if not self.enabled:
+            return
+
+        try:
+            line = json.dumps(
+                {
+                    "recorded_at": time.time(),
+                    "exchange": getattr(method, "exchange", None),
+                    "routing_key": getattr(method, "routing_key", None),
+                    "redelivered": bool(getattr(method, "redelivered", False)),
+                    **encode_capture_body(body),
+                }
+            )
+
+            with self.lock:
+                if self.file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self.file = open(self.path, "a", buffering=1)  # line buffered
+
+                if self.max_bytes and self.file.tell() + len(line) + 1 > self.max_bytes:
+                    self.is_full = True
+                    self.file.close()
+                    self.file = None
+                    logger.warning(
+                        f"\n[## MQ CAPTURE WARNING]: Capture File Full, Recording Stopped.\nFile: {self.path}"
+                    )
+                    return
+
+                self.file.write(line + "\n")
+        except Exception as e:
+            logger.warning(
+                f"\n[## MQ CAPTURE WARNING]: Message Could Not Be Recorded.\nException: {str(e)}"
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def strip_url_query(url: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+def encode_capture_body(body: bytes) -> dict:
+    """{"body": <decoded message>}, or {"raw_body": <text>} for a message that is not JSON."""
+
+    try:
+        message = json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return {"raw_body": body.decode("utf-8", errors="replace")}
+
+    if isinstance(message, dict) and message.get("s3_presigned_url"):
+        message["s3_presigned_url"] = strip_url_query(message["s3_presigned_url"])
+    return {"body": message}
+
+
+traffic_recorder = TrafficRecorder(
+    settings.MOVIO_MQ_CAPTURE_PATH, settings.MOVIO_MQ_CAPTURE_MAX_BYTES
+)
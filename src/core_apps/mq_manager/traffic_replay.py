@@ -0,0 +1,259 @@
+"""
+Replay of an MQ traffic capture (traffic_capture.TrafficRecorder), for capacity planning.
+
+replay_capture() publishes a capture to the submission exchange again, with the recorded
+inter-arrival times (scaled by speed) or at a fixed rate, and matches the result messages
+(on its own queue bound to the result exchange) to report the end to end completion latency.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+
+from django.conf import settings
+
+from core_apps.common.s3_utils import get_s3_client
+from core_apps.mq_manager.from_api_service_consumer import CloudAMQPHandler
+from core_apps.mq_manager.load_test import percentiles
+
+logger = logging.getLogger(__name__)
+
+RESULT_MESSAGE_TYPE = "video-process-result"
+PREVIEW_MESSAGE_TYPE = "video-preview"
+CANCELLED_MESSAGE_TYPE = "video-process-cancelled"
+
+# synthetic raw videos of a replay, same layout as the API Service uploads
+REPLAY_S3_KEY = "movio-temp-videos/{video_filename}/{extention}/{video_filename_with_extention}"
+
+
+def load_capture(path: str, limit: int = None) -> list:
+    """The records of a capture (JSON messages only), in recording order."""
+
+    records = []
+    with open(path) as capture_file:
+        for line in capture_file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "body" not in record:
+                continue
+            records.append(record)
+            if limit and len(records) >= limit:
+                break
+    records.sort(key=lambda record: record["recorded_at"])
+    return records
+
+
+def build_replay_schedule(records: list, speed: float = 1.0, rate: float = None) -> list:
+    """(offset seconds from the replay start, record): the recorded timing divided by speed, or rate per second."""
+
+    if not records:
+        return []
+    if rate:
+        return [(index / rate, record) for index, record in enumerate(records)]
+
+    first_recorded_at = records[0]["recorded_at"]
+    return [
+        ((record["recorded_at"] - first_recorded_at) / speed, record)
+        for record in records
+    ]
+
+
+def upload_synthetic_input(synthetic_input_path: str, s3_client) -> dict:
+    """Upload a synthetic raw video, returns the submission fields pointing at it."""
+
+    extention = os.path.splitext(synthetic_input_path)[1].lstrip(".") or "mp4"
+    video_filename = f"{uuid.uuid4()}__replay"
+    video_filename_with_extention = f"{video_filename}.{extention}"
+    s3_file_key = REPLAY_S3_KEY.format(
+        video_filename=video_filename,
+        extention=extention,
+        video_filename_with_extention=video_filename_with_extention,
+    )
+
+    s3_client.upload_file(
+        Filename=synthetic_input_path,
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=s3_file_key,
+    )
+    return {
+        "s3_file_key": s3_file_key,
+        "s3_file_url": f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/{s3_file_key}",
+        "s3_presigned_url": s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": s3_file_key},
+            ExpiresIn=settings.MOVIO_MQ_REPLAY_PRESIGNED_URL_EXPIRES_SECONDS,
+        ),
+        "s3_file_size_bytes": os.path.getsize(synthetic_input_path),
+        "video_filename_with_extention": video_filename_with_extention,
+    }
+
+
+def rewrite_message(message: dict, video_ids: dict, synthetic_input_path: str = None, s3_client=None) -> dict:
+    """The message to replay: a new video_id (the dedupe window would drop a known one), and for a
+    submission, the synthetic raw video when synthetic_input_path is set.
+
+    video_ids maps the recorded video ids to the replayed ones, so a cancel message follows its submission.
+    """
+
+    message = dict(message)
+    recorded_video_id = message.get("video_id")
+    if recorded_video_id is not None:
+        message["video_id"] = video_ids.setdefault(recorded_video_id, str(uuid.uuid4()))
+
+    if message.get("message_type") == "cancel":
+        return message
+
+    if synthetic_input_path is not None:
+        message.update(upload_synthetic_input(synthetic_input_path, s3_client))
+    return message
+
+
+class ReplayResultListener:
+    """Reads a copy of the result messages: its own auto delete queue, bound to the result exchange
+    with the binding key of the API Service queue (which still gets every message).
+    """
+
+    def __init__(self, channel) -> None:
+        self.channel = channel
+        self.queue_name = f"movio-replay-results-{uuid.uuid4().hex[:12]}"
+
+        self.channel.exchange_declare(
+            exchange=settings.MOVIO_PROCESSED_VIDEO_RESULT_SUBMISSION_EXCHANGE_NAME,
+            exchange_type=settings.MOVIO_PROCESSED_VIDEO_RESULT_EXCHANGE_TYPE,
+        )
+        self.channel.queue_declare(queue=self.queue_name, exclusive=True, auto_delete=True)
+        self.channel.queue_bind(
+            self.queue_name,
+            settings.MOVIO_PROCESSED_VIDEO_RESULT_SUBMISSION_EXCHANGE_NAME,
+            settings.MOVIO_PROCESSED_VIDEO_RESULT_BINDING_KEY,
+        )
+
+    def drain(self) -> list:
+        """The result messages received since the last drain, as (received_at, message)."""
+
+        messages = []
+        while True:
+            method, _, body = self.channel.basic_get(self.queue_name, auto_ack=True)
+            if method is None:
+                return messages
+            try:
+                messages.append((time.monotonic(), json.loads(body)))
+            except ValueError:
+                continue
+
+
+def replay_capture(
+    records: list,
+    speed: float = 1.0,
+    rate: float = None,
+    synthetic_input_path: str = None,
+    wait_timeout_seconds: float = 600,
+) -> dict:
+    """Publish the records to the submission exchange on schedule and wait for their results.
+
+    The synthetic raw videos are uploaded before the replay starts, so the uploads don't skew the schedule.
+    """
+
+    s3_client = get_s3_client() if synthetic_input_path is not None else None
+
+    video_ids = {}
+    messages = [
+        rewrite_message(record["body"], video_ids, synthetic_input_path, s3_client)
+        for record in records
+    ]
+    schedule = build_replay_schedule(records, speed=speed, rate=rate)
+
+    publisher = CloudAMQPHandler()
+    publisher.connect()
+    publisher.prepare_exchange_and_queue()
+    listener = ReplayResultListener(publisher.channel)
+
+    published_at = {}  # video_id: monotonic time of the submission publish
+    results = {}  # video_id: {message type: monotonic time of the first result}
+    publish_lags = []
+
+    def collect_results():
+        for received_at, message in listener.drain():
+            results.setdefault(message.get("video_id"), {}).setdefault(
+                message.get("message_type"), received_at
+            )
+
+    started_at = time.monotonic()
+    for (offset_seconds, record), message in zip(schedule, messages):
+        while True:
+            collect_results()
+            remaining = started_at + offset_seconds - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.05))
+
+        # a recorded deadline keeps its distance to the submission time
+        if message.get("deadline_at"):
+            message["deadline_at"] = time.time() + (
+                message["deadline_at"] - record["recorded_at"]
+            )
+
+        publisher.channel.basic_publish(
+            exchange=settings.MOVIO_RAW_VIDEO_SUBMISSION_EXCHANGE_NAME,
+            routing_key=record.get("routing_key") or settings.MOVIO_RAW_VIDEO_SUBMISSION_ROUTING_KEY,
+            body=json.dumps(message),
+        )
+        publish_time = time.monotonic()
+        publish_lags.append(publish_time - (started_at + offset_seconds))
+        if message.get("message_type") != "cancel":
+            published_at.setdefault(message["video_id"], publish_time)
+
+    publish_seconds = time.monotonic() - started_at
+    logger.info(
+        f"\n[=> MQ REPLAY]: {len(messages)} Messages Published in {publish_seconds:.2f} seconds, Waiting for the Results."
+    )
+
+    def is_ended(video_id):
+        message_types = results.get(video_id, {})
+        return RESULT_MESSAGE_TYPE in message_types or CANCELLED_MESSAGE_TYPE in message_types
+
+    wait_deadline = time.monotonic() + wait_timeout_seconds
+    while time.monotonic() < wait_deadline:
+        collect_results()
+        if all(is_ended(video_id) for video_id in published_at):
+            break
+        time.sleep(0.5)
+
+    completion_seconds = []
+    preview_seconds = []
+    result_types = {}
+    for video_id, message_types in results.items():
+        for message_type in message_types:
+            result_types[message_type] = result_types.get(message_type, 0) + 1
+        if video_id not in published_at:
+            continue
+        if RESULT_MESSAGE_TYPE in message_types:
+            completion_seconds.append(message_types[RESULT_MESSAGE_TYPE] - published_at[video_id])
+        if PREVIEW_MESSAGE_TYPE in message_types:
+            preview_seconds.append(message_types[PREVIEW_MESSAGE_TYPE] - published_at[video_id])
+
+    return {
+        "meta": {
+            "started_at": time.time() - (time.monotonic() - started_at),
+            "messages": len(messages),
+            "submissions": len(published_at),
+            "speed": None if rate else speed,
+            "rate": rate,
+            "synthetic_input": synthetic_input_path,
+            "recorded_span_seconds": (
+                records[-1]["recorded_at"] - records[0]["recorded_at"] if records else 0.0
+            ),
+        },
+        "publish_seconds": publish_seconds,
+        "achieved_rate": len(messages) / publish_seconds if publish_seconds else None,
+        "publish_lag_seconds": percentiles(publish_lags),
+        "completion_seconds": percentiles(completion_seconds),
+        "preview_seconds": percentiles(preview_seconds),
+        "result_types": result_types,
+        # failed pipelines publish no result
+        "without_result": sum(1 for video_id in published_at if not is_ended(video_id)),
+    }
@@ -6,3 +6,7 @@ class WorkersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core_apps.workers"
     verbose_name = _("Workers")
+
+    def ready(self):
+        # pipeline stage tracking of the celery tasks
+        import core_apps.workers.signals  # noqa: F401
@@ -0,0 +1,611 @@
+"""
+End to end pipeline benchmark: synthetic videos (ffmpeg lavfi) go through mq_callback.callback,
+the consumer, the fair share dispatcher and the whole celery chain, against the local S3 and AMQP
+stand-ins (settings.MOVIO_S3_BACKEND / MOVIO_AMQP_BACKEND = "local").
+
+- eager mode: the chain runs in this process (task_always_eager), every stage is profiled:
+  wall time, cpu time (this process and its ffmpeg children), peak RSS, peak disk of the
+  local workspace, S3 bytes downloaded / uploaded.
+- worker mode: the chain runs on the celery workers (which must share MOVIO_LOCAL_S3_ROOT),
+  the per stage wall times come from the pipeline status store.
+
+Every case runs with the segment output on the disk, and with --scratch ram/both in the RAM scratch
+too (the submissions force their scratch_tier, see scratch): compare_scratch_tiers reports the
+segmentation and upload stages of both tiers side by side.
+"""
+
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from celery.signals import task_postrun, task_prerun
+
+from core_apps.workers.signals import TASK_STAGES, get_task_pipeline_data
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_USER_DATA = {"user_id": "movio-benchmark", "email": "benchmark@movio.local"}
+
+# metrics compared against the baseline, per stage and for the whole run
+COMPARED_STAGE_METRICS = ("wall_seconds", "cpu_seconds")
+
+# stages writing or reading the segments (and the mp4), compared between the disk and the RAM scratch
+SCRATCH_STAGES = ("transcode", "dash-segment", "edit-manifest", "upload-segments", "local-cleanup")
+
+TERMINAL_PIPELINE_STATES = ("finished", "failed", "cancelled")
+
+
+# ######## synthetic inputs
+
+
+def get_benchmark_cases(
+    durations: list, resolutions: list, subtitles: list, scratch_tiers: list = ("disk",)
+) -> list:
+    """The disk cases keep their name (baselines), the RAM scratch cases are suffixed with -ram."""
+
+    return [
+        {
+            "name": f"{duration}s-{resolution}-{'cc' if with_subtitles else 'nocc'}"
+            + ("-ram" if scratch_tier == "ram" else ""),
+            "duration_seconds": duration,
+            "resolution": resolution,
+            "with_subtitles": with_subtitles,
+            "scratch_tier": scratch_tier,
+        }
+        for duration in durations
+        for resolution in resolutions
+        for with_subtitles in subtitles
+        for scratch_tier in scratch_tiers
+    ]
+
+
+def write_synthetic_subtitles(srt_path: str, duration_seconds: int) -> None:
+    def timestamp(seconds: int) -> str:
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d},000"
+
+    with open(srt_path, "w") as srt_file:
+        for index, start in enumerate(range(0, duration_seconds, 2), start=1):
+            end = min(start + 2, duration_seconds)
+            srt_file.write(
+                f"{index}\n{timestamp(start)} --> {timestamp(end)}\nBenchmark caption number {index}.\n\n"
+            )
+
+
+def generate_synthetic_video(case: dict, inputs_dir: str) -> str:
+    """Generate (once, then reused) the mkv input of a case: testsrc video, sine audio, optional srt subtitle track."""
+
+    os.makedirs(inputs_dir, exist_ok=True)
+    # the same input for both scratch tiers
+    input_name = case["name"].removesuffix("-ram")
+    output_path = os.path.join(inputs_dir, f"{input_name}.mkv")
+    if os.path.exists(output_path):
+        return output_path
+
+    duration = case["duration_seconds"]
+    command = [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc=size={case['resolution']}:rate=25:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:sample_rate=48000:duration={duration}",
+    ]
+    maps = ["-map", "0:v:0", "-map", "1:a:0"]
+
+    if case["with_subtitles"]:
+        srt_path = os.path.join(inputs_dir, f"{case['name']}.srt")
+        write_synthetic_subtitles(srt_path, duration)
+        command += ["-i", srt_path]
+        maps += ["-map", "2:s:0", "-c:s", "srt"]
+
+    command += maps + [
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-shortest",
+        output_path + ".part.mkv",
+    ]
+    subprocess.run(command, check=True)
+    os.replace(output_path + ".part.mkv", output_path)
+    return output_path
+
+
+def build_submission(case: dict, input_path: str, s3_client) -> dict:
+    """Upload the input as the API Service does and return its submission message."""
+
+    video_id = str(uuid.uuid4())
+    video_filename = f"{uuid.uuid4()}__bench-{case['name']}"
+    video_filename_with_extention = f"{video_filename}.mkv"
+    s3_file_key = f"movio-temp-videos/{video_filename}/mkv/{video_filename_with_extention}"
+
+    s3_client.upload_file(
+        Filename=input_path, Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_file_key
+    )
+    s3_presigned_url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": s3_file_key},
+        ExpiresIn=3600,
+    )
+    return {
+        "video_id": video_id,
+        "s3_file_key": s3_file_key,
+        "s3_file_url": s3_presigned_url,
+        "s3_presigned_url": s3_presigned_url,
+        "video_filename_with_extention": video_filename_with_extention,
+        "user_data": BENCHMARK_USER_DATA,
+        "scratch_tier": case.get("scratch_tier", "disk"),
+    }
+
+
+# ######## resource sampling
+
+
+def get_process_tree_rss_bytes(pid: int) -> int:
+    """RSS of a process and its descendants (ffmpeg), from /proc."""
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                # the command name (2nd field) might contain spaces
+                ppid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    rss_bytes = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/statm") as statm_file:
+                rss_bytes += int(statm_file.read().split()[1]) * resource.getpagesize()
+        except (OSError, IndexError, ValueError):
+            continue
+        pids.extend(children.get(current, []))
+    return rss_bytes
+
+
+def get_directories_size_bytes(directories: list) -> int:
+    size_bytes = 0
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                try:
+                    size_bytes += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    continue
+    return size_bytes
+
+
+def get_cpu_seconds() -> float:
+    """cpu time of this process and of its waited children (ffmpeg)."""
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        usage_self.ru_utime
+        + usage_self.ru_stime
+        + usage_children.ru_utime
+        + usage_children.ru_stime
+    )
+
+
+class StageProfiler:
+    """Per stage resources of the tasks run in this process (eager mode), through the celery task signals.
+
+    The stages nest in eager mode (the chord of the upload stage runs the result publish and the cleanup),
+    the times are exclusive: a stage stops accounting while a nested stage runs.
+    """
+
+    def __init__(self, s3_client, workspace_dirs: list, sample_interval: float = 0.2) -> None:
+        self.s3_client = s3_client
+        self.workspace_dirs = workspace_dirs
+        self.sample_interval = sample_interval
+
+        self.lock = threading.Lock()
+        self.stack = []  # running (task_id, stage), innermost last
+        self.stages = {}
+        self.segment = None
+        self.finished_videos = {}  # video_id: status
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def start(self) -> None:
+        task_prerun.connect(self.on_task_prerun, weak=False)
+        task_postrun.connect(self.on_task_postrun, weak=False)
+        self.sampler = threading.Thread(target=self.sample, name="benchmark-sampler", daemon=True)
+        self.sampler.start()
+
+    def stop(self) -> None:
+        task_prerun.disconnect(self.on_task_prerun)
+        task_postrun.disconnect(self.on_task_postrun)
+        self.stopped.set()
+        self.sampler.join()
+
+    def begin_case(self) -> None:
+        with self.lock:
+            self.stack = []
+            self.stages = {}
+            self.segment = None
+
+    def end_case(self) -> dict:
+        with self.lock:
+            return self.stages
+
+    def take_snapshot(self) -> dict:
+        return {
+            "wall": time.perf_counter(),
+            "cpu": get_cpu_seconds(),
+            "bytes_downloaded": getattr(self.s3_client, "bytes_downloaded", 0),
+            "bytes_uploaded": getattr(self.s3_client, "bytes_uploaded", 0),
+        }
+
+    def get_stage_entry(self, stage: str) -> dict:
+        return self.stages.setdefault(
+            stage,
+            {
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "bytes_downloaded": 0,
+                "bytes_uploaded": 0,
+                "peak_rss_bytes": 0,
+                "peak_disk_bytes": 0,
+            },
+        )
+
+    def switch_stage(self) -> None:
+        """Account the running segment to the innermost stage, and open a new segment (under the lock)."""
+
+        snapshot = self.take_snapshot()
+        if self.segment is not None and self.stack:
+            stage = self.get_stage_entry(self.stack[-1][1])
+            stage["wall_seconds"] += snapshot["wall"] - self.segment["wall"]
+            stage["cpu_seconds"] += snapshot["cpu"] - self.segment["cpu"]
+            stage["bytes_downloaded"] += (
+                snapshot["bytes_downloaded"] - self.segment["bytes_downloaded"]
+            )
+            stage["bytes_uploaded"] += snapshot["bytes_uploaded"] - self.segment["bytes_uploaded"]
+        self.segment = snapshot
+
+    def on_task_prerun(self, task_id=None, task=None, args=None, kwargs=None, **extra):
+        stage = TASK_STAGES.get(getattr(task, "name", None))
+        if stage is None:
+            return
+        # a failed pipeline only passes through the next tasks: not a stage run
+        _, upstream_failed = get_task_pipeline_data(args, kwargs)
+        if upstream_failed:
+            return
+        with self.lock:
+            self.switch_stage()
+            self.stack.append((task_id, stage))
+
+    def on_task_postrun(self, task_id=None, task=None, args=None, kwargs=None, retval=None, **extra):
+        stage = TASK_STAGES.get(getattr(task, "name", None))
+        if stage is None:
+            return
+        with self.lock:
+            if self.stack and self.stack[-1][0] == task_id:
+                self.switch_stage()
+                self.stack.pop()
+
+        mq_data, _ = get_task_pipeline_data(args, kwargs)
+        if mq_data is None or not isinstance(retval, dict):
+            return
+
+        # the pipeline ends with the local cleanup, or with a failure reaching the upload stage
+        video_id = mq_data.get("video_id")
+        if stage == "local-cleanup":
+            self.finished_videos[video_id] = "finished" if retval.get("success") else "failed"
+        elif stage == "upload-segments" and retval.get("success") == False:
+            self.finished_videos.setdefault(
+                video_id, "cancelled" if retval.get("cancelled_reason") else "failed"
+            )
+
+    def sample(self) -> None:
+        while not self.stopped.wait(self.sample_interval):
+            rss_bytes = get_process_tree_rss_bytes(os.getpid())
+            disk_bytes = get_directories_size_bytes(self.workspace_dirs)
+            with self.lock:
+                if not self.stack:
+                    continue
+                stage = self.get_stage_entry(self.stack[-1][1])
+                stage["peak_rss_bytes"] = max(stage["peak_rss_bytes"], rss_bytes)
+                stage["peak_disk_bytes"] = max(stage["peak_disk_bytes"], disk_bytes)
+
+
+# ######## runs
+
+
+def drain_result_messages(result_channel) -> list:
+    messages = []
+    while True:
+        method, _, body = result_channel.basic_get(
+            settings.MOVIO_PROCESSED_VIDEO_RESULT_QUEUE_NAME, auto_ack=True
+        )
+        if method is None:
+            return messages
+        try:
+            messages.append(json.loads(body))
+        except ValueError:
+            continue
+
+
+def run_case(case: dict, input_path: str, mode: str, context: dict, timeout_seconds: float) -> dict:
+    """Publish the submission of a case to the local broker, consume it through mq_callback.callback
+    and wait for the pipeline to end.
+    """
+
+    from core_apps.mq_manager import mq_callback
+    from core_apps.mq_manager.from_api_service_consumer import s3_video_consumer_mq
+    from core_apps.workers.pipeline_status import get_pipeline_status
+
+    s3_client = context["s3_client"]
+    profiler = context.get("profiler")
+
+    mq_data = build_submission(case, input_path, s3_client)
+    video_id = mq_data["video_id"]
+
+    if profiler is not None:
+        profiler.begin_case()
+    bytes_before = (s3_client.bytes_downloaded, s3_client.bytes_uploaded)
+    started_at = time.perf_counter()
+
+    s3_video_consumer_mq.channel.basic_publish(
+        exchange=settings.MOVIO_RAW_VIDEO_SUBMISSION_EXCHANGE_NAME,
+        routing_key=settings.MOVIO_RAW_VIDEO_SUBMISSION_ROUTING_KEY,
+        body=json.dumps(mq_data),
+    )
+
+    state = None
+    pipeline_status = None
+    while time.perf_counter() - started_at < timeout_seconds:
+        s3_video_consumer_mq.process_data_events(time_limit=0.2)
+        mq_callback.release_queued_submissions()
+
+        if mode == "eager":
+            state = profiler.finished_videos.get(video_id)
+        else:
+            pipeline_status = get_pipeline_status(video_id)
+            state = (pipeline_status or {}).get("state")
+            if state not in TERMINAL_PIPELINE_STATES:
+                state = None
+                time.sleep(1)
+
+        if state is not None:
+            break
+
+    total_wall_seconds = time.perf_counter() - started_at
+
+    if mode == "eager":
+        stages = profiler.end_case()
+    else:
+        # only the wall time of the stages is known from the status store
+        stages = {
+            stage: {"wall_seconds": stage_status.get("duration_seconds")}
+            for stage, stage_status in ((pipeline_status or {}).get("stages") or {}).items()
+        }
+
+    result_messages = [
+        message
+        for message in drain_result_messages(context["result_channel"])
+        if message.get("video_id") == video_id
+    ]
+
+    return {
+        "video_id": video_id,
+        "state": state or "timeout",
+        "result_message_types": sorted(message.get("message_type") for message in result_messages),
+        "total_wall_seconds": total_wall_seconds,
+        "bytes_downloaded": s3_client.bytes_downloaded - bytes_before[0],
+        "bytes_uploaded": s3_client.bytes_uploaded - bytes_before[1],
+        "stages": stages,
+    }
+
+
+def summarize_runs(runs: list) -> dict:
+    """Median of the runs of a case, per stage and for the whole run."""
+
+    summary = {
+        "total_wall_seconds": statistics.median(run["total_wall_seconds"] for run in runs),
+        "stages": {},
+    }
+    stage_names = {stage for run in runs for stage in run["stages"]}
+    for stage in sorted(stage_names):
+        metrics = {}
+        for metric in ("wall_seconds", "cpu_seconds", "peak_rss_bytes", "peak_disk_bytes", "bytes_downloaded", "bytes_uploaded"):
+            values = [
+                run["stages"][stage][metric]
+                for run in runs
+                if stage in run["stages"] and run["stages"][stage].get(metric) is not None
+            ]
+            metrics[metric] = statistics.median(values) if values else None
+        summary["stages"][stage] = metrics
+    return summary
+
+
+def compare_with_baseline(report: dict, baseline: dict, threshold: float, min_delta_seconds: float) -> list:
+    """Regressions: a case (or one of its stages) slower than the baseline by more than threshold
+    (relative) and min_delta_seconds (absolute, the noise floor of short stages).
+    """
+
+    regressions = []
+    baseline_cases = {case["name"]: case for case in baseline.get("cases", [])}
+
+    def check(case_name, stage, metric, current, previous):
+        if current is None or previous is None:
+            return
+        if current > previous * (1 + threshold) and current - previous > min_delta_seconds:
+            regressions.append(
+                {
+                    "case": case_name,
+                    "stage": stage,
+                    "metric": metric,
+                    "baseline": previous,
+                    "current": current,
+                    "change": (current - previous) / previous if previous else None,
+                }
+            )
+
+    for case in report["cases"]:
+        baseline_case = baseline_cases.get(case["name"])
+        if baseline_case is None:
+            continue
+
+        check(
+            case["name"],
+            None,
+            "total_wall_seconds",
+            case["summary"]["total_wall_seconds"],
+            baseline_case["summary"]["total_wall_seconds"],
+        )
+        for stage, metrics in case["summary"]["stages"].items():
+            baseline_metrics = baseline_case["summary"]["stages"].get(stage, {})
+            for metric in COMPARED_STAGE_METRICS:
+                check(case["name"], stage, metric, metrics.get(metric), baseline_metrics.get(metric))
+
+    return regressions
+
+
+def compare_scratch_tiers(report: dict) -> list:
+    """Wall time of the scratch stages of every case run on both tiers: disk, RAM and the speedup."""
+
+    cases = {case["name"]: case for case in report["cases"]}
+    comparisons = []
+    for ram_case in report["cases"]:
+        if ram_case.get("scratch_tier") != "ram":
+            continue
+        disk_case = cases.get(ram_case["name"].removesuffix("-ram"))
+        if disk_case is None:
+            continue
+
+        for stage in (*SCRATCH_STAGES, None):
+            if stage is None:
+                disk_seconds = disk_case["summary"]["total_wall_seconds"]
+                ram_seconds = ram_case["summary"]["total_wall_seconds"]
+            else:
+                disk_seconds = disk_case["summary"]["stages"].get(stage, {}).get("wall_seconds")
+                ram_seconds = ram_case["summary"]["stages"].get(stage, {}).get("wall_seconds")
+            if disk_seconds is None or ram_seconds is None:
+                continue
+
+            comparisons.append(
+                {
+                    "case": disk_case["name"],
+                    "stage": stage or "total",
+                    "disk_wall_seconds": disk_seconds,
+                    "ram_wall_seconds": ram_seconds,
+                    "speedup": disk_seconds / ram_seconds if ram_seconds else None,
+                }
+            )
+
+    return comparisons
+
+
+def get_ffmpeg_version() -> str:
+    try:
+        return subprocess.run(
+            ["ffmpeg", "-version"], check=True, capture_output=True, text=True
+        ).stdout.splitlines()[0]
+    except (subprocess.SubprocessError, OSError, IndexError):
+        return None
+
+
+def run_benchmark(cases: list, mode: str, repeat: int, inputs_dir: str, timeout_seconds: float) -> dict:
+    from core_apps.common.s3_utils import get_s3_client
+    from core_apps.mq_manager import mq_callback
+    from core_apps.mq_manager.from_api_service_consumer import s3_video_consumer_mq
+    from core_apps.mq_manager.to_api_service_producer import VideoProcessResultPublisherMQ
+    from movio_worker_service.celery import app as celery_app
+
+    s3_client = get_s3_client()
+
+    if mode == "eager":
+        celery_app.conf.task_always_eager = True
+
+    # the consumer as mq_callback.main() sets it up, without its endless loop
+    s3_video_consumer_mq.connect()
+    s3_video_consumer_mq.prepare_exchange_and_queue()
+    s3_video_consumer_mq.channel.basic_qos(
+        prefetch_count=settings.MOVIO_MQ_CONSUMER_PREFETCH_COUNT
+    )
+    s3_video_consumer_mq.callback = mq_callback.callback
+    s3_video_consumer_mq.consumer_tag = None
+    s3_video_consumer_mq.resume_consuming()
+
+    result_reader = VideoProcessResultPublisherMQ()
+    result_reader.connect()
+    result_reader.prepare_exchange_and_queue()
+
+    context = {"s3_client": s3_client, "result_channel": result_reader.channel}
+    if mode == "eager":
+        context["profiler"] = StageProfiler(
+            s3_client,
+            workspace_dirs=[
+                str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT),
+                str(settings.MOVIO_LOCAL_CC_STORAGE_ROOT),
+                settings.MOVIO_SCRATCH_RAM_DIR,
+            ],
+        )
+        context["profiler"].start()
+
+    report = {
+        "meta": {
+            "mode": mode,
+            "repeat": repeat,
+            "started_at": time.time(),
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "ffmpeg": get_ffmpeg_version(),
+        },
+        "cases": [],
+    }
+
+    try:
+        for case in cases:
+            input_path = generate_synthetic_video(case, inputs_dir)
+            runs = []
+            for run_index in range(repeat):
+                logger.info(
+                    f"\n[=> BENCHMARK]: Case: {case['name']}, Run: {run_index + 1}/{repeat}"
+                )
+                runs.append(run_case(case, input_path, mode, context, timeout_seconds))
+
+            report["cases"].append(
+                {
+                    **case,
+                    "input_bytes": os.path.getsize(input_path),
+                    "runs": runs,
+                    "summary": summarize_runs(runs),
+                }
+            )
+    finally:
+        if mode == "eager":
+            context["profiler"].stop()
+
+    report["meta"]["finished_at"] = time.time()
+    report["scratch_comparison"] = compare_scratch_tiers(report)
+    return report
@@ -0,0 +1,152 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from botocore.exceptions import ClientError
+
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.common.s3_utils import get_s3_client
+from core_apps.mq_manager.to_api_service_producer import (
+    video_process_result_publisher_mq,
+)
+from core_apps.workers.workspace import remove_local_video_files
+
+logger = logging.getLogger(__name__)
+
+s3_client = get_s3_client()
+
+
+# cancellation flag of a video (the time of the cancel), set by the consumer on a "cancel" message
+CANCEL_KEY = "movio:cancel:{video_id}"
+
+# cancellation reasons
+CANCELLED = "cancelled"
+DEADLINE_EXCEEDED = "deadline-exceeded"
+
+
+class PipelineCancelledError(Exception):
+    """The pipeline of the video was cancelled, or is past its deadline."""
+
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+        super().__init__(f"video-process-{reason}")
+
+
+def request_cancellation(video_id: str) -> None:
+    """Set the shared cancellation flag of a video, checked by the running tasks.
+
+    The flag cancels the submissions of the video consumed before it (consumed_at), not a later resubmission.
+    """
+
+    get_redis_client().set(
+        CANCEL_KEY.format(video_id=video_id),
+        time.time(),
+        ex=settings.MOVIO_CANCELLATION_TTL_SECONDS,
+    )
+
+
+def get_cancellation_reason(mq_data: dict):
+    """Return the cancellation reason of the pipeline, None if it should keep running."""
+
+    deadline_at = mq_data.get("deadline_at")
+    if deadline_at is not None and time.time() > float(deadline_at):
+        return DEADLINE_EXCEEDED
+
+    try:
+        cancelled_at = get_redis_client().get(
+            CANCEL_KEY.format(video_id=mq_data.get("video_id"))
+        )
+    except Exception as e:
+        # the flag can't be read: keep running rather than dropping the video
+        logger.warning(
+            f"\n[## CANCELLATION WARNING]: Cancellation Flag Could Not Be Read.\nException: {str(e)}"
+        )
+        return None
+
+    if cancelled_at is None:
+        return None
+
+    # a resubmission of the video, consumed after the cancel, keeps running
+    consumed_at = mq_data.get("consumed_at")
+    try:
+        if consumed_at is not None and float(consumed_at) > float(cancelled_at):
+            return None
+    except ValueError:
+        # flag set before the cancel time was stored in it
+        pass
+
+    return CANCELLED
+
+
+def delete_s3_prefix(bucket: str, prefix: str) -> int:
+    """Delete every object under an S3 prefix, returns the deleted count."""
+
+    deleted = 0
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        if objects:
+            s3_client.delete_objects(Bucket=bucket, Delete={"Objects": objects})
+            deleted += len(objects)
+    return deleted
+
+
+def cleanup_cancelled_pipeline(mq_data: dict) -> None:
+    """Remove the partial local files, the raw upload, and the already uploaded S3 segments and preview of a cancelled video."""
+
+    remove_local_video_files(mq_data)
+
+    # the raw upload: the delete task might not have run yet
+    try:
+        s3_client.delete_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=mq_data["s3_file_key"]
+        )
+    except ClientError as e:
+        logger.error(
+            f"\n[XX CANCELLATION CLEANUP ERROR XX]: Raw Video Could Not Be Deleted from S3.\nException: {str(e)}"
+        )
+
+    # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
+    raw_video_filename = mq_data["video_filename_with_extention"].split(".")[0]
+
+    for root in (
+        settings.AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT,
+        settings.AWS_MOVIO_S3_PREVIEWS_BUCKET_ROOT,
+        # the subtitles translated in the worker (or by the Lambda)
+        settings.AWS_MOVIO_S3_SUBTITLES_BUCKET_ROOT,
+    ):
+        try:
+            deleted = delete_s3_prefix(
+                settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                f"{root}/{raw_video_filename}/",
+            )
+            logger.info(
+                f"\n[=> CANCELLATION CLEANUP]: Deleted {deleted} S3 Objects from {root}/{raw_video_filename}/"
+            )
+        except ClientError as e:
+            logger.error(
+                f"\n[XX CANCELLATION CLEANUP ERROR XX]: S3 Objects Could Not Be Deleted from {root}/{raw_video_filename}/\nException: {str(e)}"
+            )
+
+
+def publish_cancellation_result(mq_data: dict, reason: str) -> bool:
+    """Publish a "video-process-cancelled" message on the video process result exchange, returns is_published."""
+
+    mq_data_to_publish = {
+        "message_type": "video-process-cancelled",
+        "video_id": mq_data.get("video_id"),
+        "user_id": (mq_data.get("user_data") or {}).get("user_id"),
+        "email": (mq_data.get("user_data") or {}).get("email"),
+        "reason": reason,
+    }
+    is_published, message = video_process_result_publisher_mq.publish_data(
+        video_process_data=json.dumps(mq_data_to_publish),
+        message_type=mq_data_to_publish["message_type"],
+    )
+    if not is_published:
+        logger.error(
+            f"\n[XX CANCELLATION RESULT ERROR XX]: Cancellation of Video {mq_data.get('video_id')} Not Published: {message}"
+        )
+    return is_published
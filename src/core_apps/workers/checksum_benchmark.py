@@ -0,0 +1,234 @@
+"""
+Transfer checksum benchmark: the cost of checksumming the S3 uploads as they stream (s3_checksums).
+
+The inputs are synthetic (random bytes): a set of segment sized files and a large file (multipart).
+They are uploaded to a LocalS3Client, plain (upload_file) and checksummed (upload_file_with_checksum)
+for each algorithm, the median of the repeats. By default there is no network (the upload is a local
+file copy, the worst case for the relative overhead), bandwidth_bytes_per_second simulates the link.
+The local client verifies the checksum it receives as S3 does: the checksummed wall time includes
+that second pass of the "server", client_overhead_percent is the cost of the client pass alone (the
+hash throughput over the bytes uploaded).
+
+The hash throughputs are measured over the bytes in memory, with sha256 and md5 (a content digest, a
+second read of the file) and xxhash (not an S3 checksum algorithm, a reference) when installed.
+"""
+
+import hashlib
+import logging
+import os
+import platform
+import shutil
+import statistics
+import time
+import zlib
+
+try:
+    import crc32c
+except ImportError:
+    crc32c = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+from core_apps.common.local_s3 import LocalS3Client
+from core_apps.common.s3_checksums import (
+    S3_CHECKSUM_ALGORITHMS,
+    StreamingChecksum,
+    upload_file_with_checksum,
+)
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def get_hash_functions() -> dict:
+    """{name: callable(chunks) hashing them}: the S3 algorithms available and the references."""
+
+    def streaming(algorithm):
+        def run(chunks):
+            checksum = StreamingChecksum(algorithm)
+            for chunk in chunks:
+                checksum.update(chunk)
+
+        return run
+
+    def hashlib_digest(name):
+        def run(chunks):
+            digest = hashlib.new(name)
+            for chunk in chunks:
+                digest.update(chunk)
+
+        return run
+
+    hash_functions = {"CRC32": streaming("CRC32")}
+    if crc32c is not None:
+        hash_functions["CRC32C"] = streaming("CRC32C")
+    if xxhash is not None:
+
+        def run_xxh3(chunks):
+            digest = xxhash.xxh3_64()
+            for chunk in chunks:
+                digest.update(chunk)
+
+        hash_functions["xxh3_64"] = run_xxh3
+    hash_functions["md5"] = hashlib_digest("md5")
+    hash_functions["sha256"] = hashlib_digest("sha256")
+    return hash_functions
+
+
+def write_random_file(path: str, size_bytes: int) -> None:
+    with open(path, "wb") as random_file:
+        remaining = size_bytes
+        while remaining:
+            chunk_bytes = min(remaining, HASH_CHUNK_BYTES)
+            random_file.write(os.urandom(chunk_bytes))
+            remaining -= chunk_bytes
+
+
+def get_benchmark_inputs(
+    inputs_dir: str, segment_count: int, segment_bytes: int, large_file_bytes: int
+) -> dict:
+    """{name: [paths]} of the input sets, generated once and reused."""
+
+    os.makedirs(inputs_dir, exist_ok=True)
+    inputs = {"segments": [], "large-file": []}
+    for index in range(segment_count):
+        path = os.path.join(inputs_dir, f"segment-{segment_bytes}-{index:05d}.m4s")
+        if not os.path.exists(path) or os.path.getsize(path) != segment_bytes:
+            write_random_file(path, segment_bytes)
+        inputs["segments"].append(path)
+    if large_file_bytes:
+        path = os.path.join(inputs_dir, f"large-{large_file_bytes}.mp4")
+        if not os.path.exists(path) or os.path.getsize(path) != large_file_bytes:
+            write_random_file(path, large_file_bytes)
+        inputs["large-file"].append(path)
+    return {name: paths for name, paths in inputs.items() if paths}
+
+
+def time_uploads(s3_client, paths: list, bucket: str, algorithm: str = None) -> float:
+    """Wall seconds to upload the files, plain (algorithm None) or checksummed."""
+
+    started_at = time.perf_counter()
+    for index, path in enumerate(paths):
+        key = f"{algorithm or 'plain'}/{index:05d}-{os.path.basename(path)}"
+        if algorithm is None:
+            s3_client.upload_file(Filename=path, Bucket=bucket, Key=key)
+        else:
+            upload_file_with_checksum(
+                s3_client, path, bucket, key, expected_size=os.path.getsize(path), algorithm=algorithm
+            )
+    return time.perf_counter() - started_at
+
+
+def time_hash(hash_function, paths: list) -> float:
+    """Seconds to hash the files, read in memory first (the hash alone is timed)."""
+
+    chunks = []
+    for path in paths:
+        with open(path, "rb") as input_file:
+            while chunk := input_file.read(HASH_CHUNK_BYTES):
+                chunks.append(chunk)
+
+    started_at = time.perf_counter()
+    hash_function(chunks)
+    return time.perf_counter() - started_at
+
+
+def run_checksum_benchmark(
+    inputs_dir: str,
+    output_dir: str,
+    segment_count: int,
+    segment_bytes: int,
+    large_file_bytes: int,
+    repeats: int,
+    bandwidth_bytes_per_second: int = 0,
+) -> dict:
+    bucket = "checksum-benchmark"
+    hash_functions = get_hash_functions()
+    algorithms = [algorithm for algorithm in S3_CHECKSUM_ALGORITHMS if algorithm in hash_functions]
+
+    report = {
+        "meta": {
+            "started_at": time.time(),
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "zlib": zlib.ZLIB_RUNTIME_VERSION,
+            "segment_count": segment_count,
+            "segment_bytes": segment_bytes,
+            "large_file_bytes": large_file_bytes,
+            "repeats": repeats,
+            "bandwidth_bytes_per_second": bandwidth_bytes_per_second,
+            "algorithms": algorithms,
+        },
+        "inputs": [],
+    }
+
+    inputs = get_benchmark_inputs(inputs_dir, segment_count, segment_bytes, large_file_bytes)
+    for name, paths in inputs.items():
+        logger.info(f"\n[=> CHECKSUM BENCHMARK]: Input: {name}")
+
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+        megabytes = total_bytes / (1024 * 1024)
+
+        hashes = {}
+        for hash_name, hash_function in hash_functions.items():
+            seconds = statistics.median(
+                time_hash(hash_function, paths) for _ in range(repeats)
+            )
+            hashes[hash_name] = {
+                "seconds": round(seconds, 4),
+                "mb_per_second": round(megabytes / seconds, 1) if seconds else None,
+            }
+
+        uploads = {}
+        for run_name in ["plain", *algorithms]:
+            run_seconds = []
+            for _ in range(repeats):
+                # a fresh bucket per run: the same writes every repeat
+                s3_root = os.path.join(output_dir, "s3")
+                shutil.rmtree(s3_root, ignore_errors=True)
+                s3_client = LocalS3Client(
+                    s3_root, bandwidth_bytes_per_second=bandwidth_bytes_per_second
+                )
+                run_seconds.append(
+                    time_uploads(
+                        s3_client, paths, bucket, None if run_name == "plain" else run_name
+                    )
+                )
+            seconds = statistics.median(run_seconds)
+            uploads[run_name] = {
+                "seconds": round(seconds, 4),
+                "mb_per_second": round(megabytes / seconds, 1) if seconds else None,
+            }
+
+        plain_seconds = uploads["plain"]["seconds"]
+        for algorithm in algorithms:
+            run = uploads[algorithm]
+            run["overhead_percent"] = (
+                round((run["seconds"] - plain_seconds) / plain_seconds * 100, 2)
+                if plain_seconds
+                else None
+            )
+            run["client_overhead_percent"] = (
+                round(hashes[algorithm]["seconds"] / plain_seconds * 100, 2)
+                if plain_seconds
+                else None
+            )
+
+        report["inputs"].append(
+            {
+                "name": name,
+                "files": len(paths),
+                "bytes": total_bytes,
+                "hashes": hashes,
+                "uploads": uploads,
+            }
+        )
+
+    shutil.rmtree(os.path.join(output_dir, "s3"), ignore_errors=True)
+    report["meta"]["finished_at"] = time.time()
+    return report
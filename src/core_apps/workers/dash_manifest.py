@@ -0,0 +1,280 @@
+"""
+In-memory DASH manifest with its segment index.
+
+The MPD written by ffmpeg is parsed once, right after the segmentation (DashManifest.from_ffmpeg_output):
+every Representation expands its SegmentTemplate (initialization, media, SegmentTimeline or duration)
+into the files it expects, checked and sized on the disk, the segment index:
+
+    {
+        "duration_seconds": 634.5,
+        "representations": {
+            "0": {
+                "content_type": "video",
+                "bandwidth": 2400000,
+                "init": ["init-stream0.m4s", 1024],
+                "media": [["chunk-stream0-00001.m4s", 1048576, 4.0], ...],  # [path, bytes, seconds]
+            },
+            ...
+        },
+    }
+
+(paths relative to the segments directory). The manifest travels the chain in memory (to_dict /
+from_dict): edit_manifest_to_add_subtitle_information adds the subtitles (and the files of the
+segmented ones) to it, the uploader takes its work list from the index (no directory walk), and the
+final MPD is generated from it and uploaded last, once every file of the index is uploaded.
+"""
+
+import math
+import os
+import re
+
+from lxml import etree
+
+from core_apps.workers.subtitle_segments import add_segment_template, parse_iso_8601_duration
+
+MPD_NAMESPACE = "urn:mpeg:dash:schema:mpd:2011"
+
+# name of the MPD ffmpeg writes in the segments directory, and of the uploaded one
+MANIFEST_FILE_NAME = "manifest.mpd"
+
+# $RepresentationID$, $Number$, $Number%05d$, $Time$, $Bandwidth$ (and $$)
+SEGMENT_TEMPLATE_IDENTIFIER_PATTERN = re.compile(
+    r"\$(?:(RepresentationID|Number|Time|Bandwidth)(?:%0(\d+)d)?)?\$"
+)
+
+
+class DashManifestError(Exception):
+    pass
+
+
+def format_segment_template(template: str, values: dict) -> str:
+    """Expand the identifiers of a SegmentTemplate attribute (values: {identifier: value})."""
+
+    def replace(match):
+        identifier, width = match.groups()
+        if identifier is None:
+            return "$"
+        value = values.get(identifier)
+        if value is None:
+            raise DashManifestError(f"No value for ${identifier}$ in the template {template}.")
+        if width:
+            return f"{int(value):0{int(width)}d}"
+        return str(value)
+
+    return SEGMENT_TEMPLATE_IDENTIFIER_PATTERN.sub(replace, template)
+
+
+def get_local_name(element) -> str:
+    return etree.QName(element).localname
+
+
+def find_child(element, local_name: str):
+    """The first child named local_name, namespaced (ffmpeg) or not (added by the worker)."""
+
+    if element is None:
+        return None
+    for child in element:
+        if isinstance(child.tag, str) and get_local_name(child) == local_name:
+            return child
+    return None
+
+
+def iter_timeline_segments(segment_template, timescale: int, end_time: int):
+    """(start time, duration) of the segments of a SegmentTimeline, in timescale units."""
+
+    segment_timeline = find_child(segment_template, "SegmentTimeline")
+    time = 0
+    for s_element in segment_timeline:
+        if not isinstance(s_element.tag, str) or get_local_name(s_element) != "S":
+            continue
+        time = int(s_element.get("t", time))
+        duration = int(s_element.get("d"))
+        repeat = int(s_element.get("r", 0))
+        if repeat < 0:
+            # repeated until the end of the period
+            repeat = max(math.ceil((end_time - time) / duration) - 1, 0)
+        for _ in range(repeat + 1):
+            yield time, duration
+            time += duration
+
+
+class DashManifest:
+    """An MPD (lxml tree) and the segment index of its files."""
+
+    def __init__(self, root, segment_index: dict) -> None:
+        self.root = root
+        self.segment_index = segment_index
+
+    @property
+    def duration_seconds(self):
+        return self.segment_index.get("duration_seconds")
+
+    @classmethod
+    def from_ffmpeg_output(cls, manifest_path: str, output_dir: str) -> "DashManifest":
+        """Parse the MPD written by ffmpeg and index its files, DashManifestError when one is missing or empty."""
+
+        root = etree.parse(manifest_path).getroot()
+        duration_seconds = parse_iso_8601_duration(root.get("mediaPresentationDuration"))
+
+        representations = {}
+        missing_files = []
+        for adaptation_set in root.iter(f"{{{MPD_NAMESPACE}}}AdaptationSet"):
+            for representation in adaptation_set.iter(f"{{{MPD_NAMESPACE}}}Representation"):
+                representation_id = representation.get("id")
+                entry = cls.index_representation(
+                    adaptation_set, representation, duration_seconds
+                )
+
+                files = ([entry["init"]] if entry["init"] else []) + entry["media"]
+                for file in files:
+                    path = os.path.join(output_dir, file[0])
+                    size = os.path.getsize(path) if os.path.exists(path) else 0
+                    if not size:
+                        missing_files.append(file[0])
+                    file[1] = size
+                representations[representation_id] = entry
+
+        if missing_files:
+            raise DashManifestError(
+                f"{len(missing_files)} segment files of the manifest are missing or empty: {missing_files[:5]}"
+            )
+        if not representations:
+            raise DashManifestError("The manifest has no representation.")
+
+        return cls(
+            root,
+            {"duration_seconds": duration_seconds, "representations": representations},
+        )
+
+    @staticmethod
+    def index_representation(adaptation_set, representation, duration_seconds) -> dict:
+        """{content_type, bandwidth, init, media} of a Representation (sizes not known yet)."""
+
+        representation_id = representation.get("id")
+        segment_template = find_child(representation, "SegmentTemplate")
+        if segment_template is None:
+            segment_template = find_child(adaptation_set, "SegmentTemplate")
+        if segment_template is None:
+            raise DashManifestError(f"Representation {representation_id} has no SegmentTemplate.")
+
+        bandwidth = representation.get("bandwidth")
+        values = {"RepresentationID": representation_id, "Bandwidth": bandwidth}
+        timescale = int(segment_template.get("timescale", 1))
+        number = int(segment_template.get("startNumber", 1))
+
+        init = None
+        if segment_template.get("initialization"):
+            init = [format_segment_template(segment_template.get("initialization"), values), 0]
+
+        if find_child(segment_template, "SegmentTimeline") is not None:
+            timeline = iter_timeline_segments(
+                segment_template, timescale, round((duration_seconds or 0) * timescale)
+            )
+        elif segment_template.get("duration") and duration_seconds:
+            segment_duration = int(segment_template.get("duration"))
+            segment_count = math.ceil(duration_seconds * timescale / segment_duration)
+            timeline = (
+                (index * segment_duration, segment_duration) for index in range(segment_count)
+            )
+        else:
+            raise DashManifestError(
+                f"The segments of the representation {representation_id} can't be listed."
+            )
+
+        media = []
+        for time, duration in timeline:
+            path = format_segment_template(
+                segment_template.get("media"), {**values, "Number": number, "Time": time}
+            )
+            media.append([path, 0, duration / timescale])
+            number += 1
+
+        return {
+            "content_type": adaptation_set.get("contentType")
+            or (representation.get("mimeType") or adaptation_set.get("mimeType") or "").split("/")[0],
+            "bandwidth": int(bandwidth) if bandwidth else None,
+            "init": init,
+            "media": media,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DashManifest":
+        return cls(etree.fromstring(data["mpd"].encode("utf-8")), data["segment_index"])
+
+    def to_dict(self) -> dict:
+        """The manifest to pass to the next task of the chain (JSON serializable)."""
+
+        return {
+            "mpd": etree.tostring(self.root, encoding="unicode"),
+            "segment_index": self.segment_index,
+        }
+
+    def to_bytes(self) -> bytes:
+        """The final MPD."""
+
+        return etree.tostring(
+            self.root, pretty_print=True, xml_declaration=True, encoding="utf-8"
+        )
+
+    def get_period(self):
+        return find_child(self.root, "Period")
+
+    def add_subtitle(self, lang: str, base_url: str, segment_files: list = None) -> None:
+        """Add the AdaptationSet of a subtitle.
+
+        segment_files: [path, bytes, seconds] of its segmented WebVTT files (described by a SegmentTemplate
+        and indexed), None for a whole file subtitle (base_url).
+        """
+
+        # See more on the aws lamdcda code for the subtitles strucutere
+        period = self.get_period()
+        adaptation_set = etree.Element(
+            "AdaptationSet",
+            {
+                "id": str(len(period) + 1),
+                "mimeType": "text/vtt",
+                "lang": lang,
+                "contentType": "text",
+            },
+        )
+        etree.SubElement(
+            adaptation_set,
+            "Role",
+            {"schemeIdUri": "urn:mpeg:dash:role:2011", "value": "subtitle"},
+        )
+        representation = etree.SubElement(
+            adaptation_set,
+            "Representation",
+            {"id": f"subtitle-{lang}", "bandwidth": "256"},
+        )
+        etree.SubElement(representation, "BaseURL").text = base_url
+
+        if segment_files is not None:
+            add_segment_template(representation)
+            self.segment_index["representations"][f"subtitle-{lang}"] = {
+                "content_type": "text",
+                "bandwidth": 256,
+                "init": None,
+                "media": [list(segment_file) for segment_file in segment_files],
+            }
+
+        period.append(adaptation_set)
+
+    def get_files(self) -> list:
+        """[(path, bytes)] of every file of the index: the work list of the uploader."""
+
+        files = []
+        for entry in self.segment_index["representations"].values():
+            if entry["init"]:
+                files.append(tuple(entry["init"][:2]))
+            files.extend(tuple(media[:2]) for media in entry["media"])
+        return files
+
+    def get_summary(self) -> dict:
+        files = self.get_files()
+        return {
+            "representations": len(self.segment_index["representations"]),
+            "files": len(files),
+            "bytes": sum(size for _, size in files),
+            "duration_seconds": self.duration_seconds,
+        }
@@ -0,0 +1,333 @@
+import json
+import logging
+import subprocess
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from core_apps.common.metrics import observe_ffmpeg
+
+from core_apps.workers.cancellation import (
+    PipelineCancelledError,
+    get_cancellation_reason,
+)
+from core_apps.workers.pipeline_status import (
+    clear_node_encode,
+    publish_encode_progress,
+)
+from core_apps.workers.task_profiling import get_active_profile
+
+logger = logging.getLogger(__name__)
+
+
+# seconds between two checks (cancellation, stall, timeout) of a running ffmpeg process
+FFMPEG_POLL_INTERVAL_SECONDS = 1
+
+# seconds given to ffmpeg to exit after SIGTERM, before SIGKILL
+FFMPEG_TERMINATE_GRACE_SECONDS = 5
+
+
+class FFmpegStalledError(subprocess.CalledProcessError):
+    """ffmpeg made no progress for MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS and was killed."""
+
+
+class FFmpegTimeoutError(subprocess.CalledProcessError):
+    """ffmpeg ran longer than its timeout and was killed."""
+
+
+def terminate_process(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+
+    process.terminate()
+    try:
+        process.wait(timeout=FFMPEG_TERMINATE_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def probe_media_duration(input_path: str):
+    """Duration in seconds of a local file or url, None if it can't be probed."""
+
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "json",
+        input_path,
+    ]
+    try:
+        output = subprocess.run(
+            command, check=True, capture_output=True, text=True, timeout=30
+        ).stdout
+        return float(json.loads(output)["format"]["duration"])
+    except (subprocess.SubprocessError, OSError, KeyError, ValueError):
+        return None
+
+
+def get_input_path(command: list):
+    """The first input (-i) of an ffmpeg command."""
+
+    if "-i" in command:
+        index = command.index("-i")
+        if index + 1 < len(command):
+            return command[index + 1]
+    return None
+
+
+def format_ffmpeg_error(e: subprocess.CalledProcessError) -> str:
+    """Error message with the ffmpeg stderr tail, for the chain result."""
+
+    if e.stderr:
+        return f"{str(e)}\nffmpeg stderr (tail):\n{e.stderr}"
+    return str(e)
+
+
+class FFmpegProgress:
+    """Incremental parser of the ffmpeg `-progress pipe:1` output (key=value blocks ending with progress=...)."""
+
+    def __init__(self, duration_seconds: float = None) -> None:
+        self.duration_seconds = duration_seconds
+        self.lock = threading.Lock()
+        self.block = {}
+
+        self.out_time_seconds = 0.0
+        self.total_size = 0
+        self.fps = None
+        self.speed = None
+        self.finished = False
+        self.last_advanced_at = time.monotonic()
+
+    def feed_line(self, line: str) -> None:
+        key, separator, value = line.strip().partition("=")
+        if not separator:
+            return
+
+        self.block[key] = value
+        if key == "progress":
+            self.apply_block(self.block)
+            self.block = {}
+
+    def apply_block(self, block: dict) -> None:
+        with self.lock:
+            out_time_us = _parse_number(block.get("out_time_us"))
+            total_size = _parse_number(block.get("total_size"))
+
+            # progress means the output moves forward, not just a new block
+            advanced = False
+            if out_time_us is not None and out_time_us / 1_000_000 > self.out_time_seconds:
+                self.out_time_seconds = out_time_us / 1_000_000
+                advanced = True
+            if total_size is not None and total_size > self.total_size:
+                self.total_size = int(total_size)
+                advanced = True
+            if advanced:
+                self.last_advanced_at = time.monotonic()
+
+            # "N/A" while ffmpeg warms up: keep the last known values
+            fps = _parse_number(block.get("fps"))
+            speed = _parse_number((block.get("speed") or "").rstrip("x"))
+            if fps is not None:
+                self.fps = fps
+            if speed is not None:
+                self.speed = speed
+            self.finished = block.get("progress") == "end"
+
+    def seconds_since_advanced(self) -> float:
+        with self.lock:
+            return time.monotonic() - self.last_advanced_at
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            percentage = None
+            eta_seconds = None
+            if self.duration_seconds:
+                percentage = min(self.out_time_seconds / self.duration_seconds * 100, 100.0)
+                if self.speed:
+                    eta_seconds = max(
+                        (self.duration_seconds - self.out_time_seconds) / self.speed, 0.0
+                    )
+
+            return {
+                "percentage": percentage,
+                "out_time_seconds": self.out_time_seconds,
+                "duration_seconds": self.duration_seconds,
+                "fps": self.fps,
+                "speed": self.speed,
+                "eta_seconds": eta_seconds,
+                "total_size": self.total_size,
+                "finished": self.finished,
+            }
+
+
+def _parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_lines(stream, on_line) -> None:
+    for line in iter(stream.readline, ""):
+        on_line(line)
+    stream.close()
+
+
+def run_ffmpeg(
+    command: list,
+    mq_data: dict = None,
+    stage: str = "ffmpeg",
+    duration_seconds: float = None,
+    timeout_seconds: float = None,
+) -> dict:
+    """Run an ffmpeg command, as subprocess.run(command, check=True) does, and return its last progress.
+
+    - The `-progress pipe:1` output is parsed incrementally into progress percentage, encode fps and
+      speed multiplier, published to the pipeline status store every MOVIO_FFMPEG_PROGRESS_PUBLISH_INTERVAL_SECONDS.
+      The percentage needs the input duration: duration_seconds, or probed from the first input.
+    - ffmpeg is killed when its output doesn't advance for MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS (FFmpegStalledError),
+      or after timeout_seconds (default MOVIO_FFMPEG_TIMEOUT_SECONDS, FFmpegTimeoutError).
+    - ffmpeg is terminated as soon as the pipeline (mq_data) is cancelled or past its deadline (PipelineCancelledError).
+    - The stderr tail (MOVIO_FFMPEG_STDERR_TAIL_LINES) is kept in the raised errors.
+    - When the task is profiled (task_profiling), ffmpeg runs with `-benchmark` and its report is added to the profile.
+
+    Raises subprocess.CalledProcessError (or a subclass) on failure. FFmpegStalledError and
+    FFmpegTimeoutError are not worth a retry: catch them first.
+    """
+
+    if duration_seconds is None:
+        input_path = get_input_path(command)
+        duration_seconds = probe_media_duration(input_path) if input_path else None
+
+    if timeout_seconds is None:
+        timeout_seconds = settings.MOVIO_FFMPEG_TIMEOUT_SECONDS
+
+    progress = FFmpegProgress(duration_seconds=duration_seconds)
+    stderr_tail = deque(maxlen=settings.MOVIO_FFMPEG_STDERR_TAIL_LINES)
+
+    profile = get_active_profile()
+    bench_lines = []
+
+    def read_stderr_line(line):
+        line = line.rstrip()
+        stderr_tail.append(line)
+        if line.startswith("bench:"):
+            bench_lines.append(line)
+
+    process = subprocess.Popen(
+        [
+            command[0],
+            "-progress",
+            "pipe:1",
+            "-nostats",
+            *(["-benchmark"] if profile is not None else []),
+            *command[1:],
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+    )
+    readers = [
+        threading.Thread(
+            target=_read_lines, args=(process.stdout, progress.feed_line), daemon=True
+        ),
+        threading.Thread(
+            target=_read_lines,
+            args=(process.stderr, read_stderr_line),
+            daemon=True,
+        ),
+    ]
+    for reader in readers:
+        reader.start()
+
+    started_at = time.monotonic()
+    last_published_at = 0.0
+    # unexpected errors, worker shutdown: "error"
+    outcome = "error"
+
+    try:
+        while True:
+            try:
+                return_code = process.wait(timeout=FFMPEG_POLL_INTERVAL_SECONDS)
+                outcome = "success" if return_code == 0 else "failed"
+                break
+            except subprocess.TimeoutExpired:
+                pass
+
+            reason = get_cancellation_reason(mq_data) if mq_data else None
+            if reason is not None:
+                logger.warning(
+                    f"\n[## FFMPEG RUNNER WARNING]: Pipeline {reason}, Terminating FFmpeg (pid: {process.pid})."
+                )
+                outcome = "cancelled"
+                terminate_process(process)
+                raise PipelineCancelledError(reason)
+
+            if progress.seconds_since_advanced() > settings.MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS:
+                logger.error(
+                    f"\n[XX FFMPEG RUNNER ERROR XX]: FFmpeg Stalled for {settings.MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS} seconds, Killing (pid: {process.pid})."
+                )
+                outcome = "stalled"
+                terminate_process(process)
+                _join_readers(readers)
+                raise FFmpegStalledError(
+                    process.returncode, command, stderr="\n".join(stderr_tail)
+                )
+
+            if time.monotonic() - started_at > timeout_seconds:
+                logger.error(
+                    f"\n[XX FFMPEG RUNNER ERROR XX]: FFmpeg Timed Out after {timeout_seconds} seconds, Killing (pid: {process.pid})."
+                )
+                outcome = "timeout"
+                terminate_process(process)
+                _join_readers(readers)
+                raise FFmpegTimeoutError(
+                    process.returncode, command, stderr="\n".join(stderr_tail)
+                )
+
+            if (
+                time.monotonic() - last_published_at
+                >= settings.MOVIO_FFMPEG_PROGRESS_PUBLISH_INTERVAL_SECONDS
+            ):
+                last_published_at = time.monotonic()
+                publish_encode_progress(mq_data, stage, progress.snapshot())
+    finally:
+        # worker shutdown, unexpected errors: never leave an orphan ffmpeg behind.
+        terminate_process(process)
+        clear_node_encode(mq_data, stage)
+        observe_ffmpeg(
+            stage,
+            outcome,
+            time.monotonic() - started_at,
+            speed=progress.snapshot()["speed"] if outcome == "success" else None,
+        )
+        if profile is not None:
+            _join_readers(readers)
+            profile.record_ffmpeg(
+                stage, command, outcome, time.monotonic() - started_at, bench_lines
+            )
+
+    _join_readers(readers)
+
+    if return_code != 0:
+        raise subprocess.CalledProcessError(
+            return_code, command, stderr="\n".join(stderr_tail)
+        )
+
+    final_progress = progress.snapshot()
+    final_progress["wall_seconds"] = time.monotonic() - started_at
+    publish_encode_progress(mq_data, stage, final_progress)
+    return final_progress
+
+
+def _join_readers(readers: list) -> None:
+    for reader in readers:
+        reader.join(timeout=FFMPEG_TERMINATE_GRACE_SECONDS)
@@ -0,0 +1,15 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core_apps.workers.pipeline_status import get_nodes_encode_progress
+
+
+class Command(BaseCommand):
+    """Reports the Running FFmpeg Encodes with their Progress, per Worker Node
+    """
+
+    help = "Reports the running ffmpeg encodes (progress, fps, speed) of every worker node"
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(get_nodes_encode_progress(), indent=4))
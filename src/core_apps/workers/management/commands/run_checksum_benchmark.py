@@ -0,0 +1,61 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core_apps.workers.checksum_benchmark import run_checksum_benchmark
+
+
+class Command(BaseCommand):
+    """S3 Transfer Checksum Benchmark: Plain vs Checksummed Uploads (Local S3), and the Hash Throughputs
+
+    e.g. python manage.py run_checksum_benchmark --segments 200 --large-file-mb 512 --repeats 5
+    """
+
+    help = "Uploads synthetic segments and a large file to a local S3, plain and checksummed as they stream (per algorithm), and reports the wall times, the overhead and the hash throughputs (JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--segments", type=int, default=200, help="number of segment files")
+        parser.add_argument(
+            "--segment-kb", type=int, default=1024, help="size of a segment file (KiB)"
+        )
+        parser.add_argument(
+            "--large-file-mb",
+            type=int,
+            default=256,
+            help="size of the large (multipart) file (MiB), 0 for none",
+        )
+        parser.add_argument("--repeats", type=int, default=5, help="the median is reported")
+        parser.add_argument(
+            "--bandwidth-mbps",
+            type=float,
+            default=0,
+            help="simulated bandwidth of the local S3 per request (MiB/s), 0: a local file copy",
+        )
+        parser.add_argument(
+            "--inputs-dir",
+            default=str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT / "checksum-benchmark-inputs"),
+            help="synthetic inputs, generated once and reused",
+        )
+        parser.add_argument(
+            "--output-dir",
+            default=str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT / "checksum-benchmark-outputs"),
+        )
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        report = run_checksum_benchmark(
+            inputs_dir=options["inputs_dir"],
+            output_dir=options["output_dir"],
+            segment_count=options["segments"],
+            segment_bytes=options["segment_kb"] * 1024,
+            large_file_bytes=options["large_file_mb"] * 1024 * 1024,
+            repeats=options["repeats"],
+            bandwidth_bytes_per_second=int(options["bandwidth_mbps"] * 1024 * 1024),
+        )
+
+        encoded_report = json.dumps(report, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as report_file:
+                report_file.write(encoded_report)
+        self.stdout.write(encoded_report)
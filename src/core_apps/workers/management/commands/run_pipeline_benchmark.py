@@ -0,0 +1,106 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core_apps.workers.benchmark import (
+    compare_with_baseline,
+    get_benchmark_cases,
+    run_benchmark,
+)
+
+
+class Command(BaseCommand):
+    """End to End Pipeline Benchmark with Synthetic Videos, against the Local S3 and AMQP Stand-ins
+
+    Run with MOVIO_S3_BACKEND=local MOVIO_AMQP_BACKEND=local. In worker mode, the celery workers
+    must run with MOVIO_S3_BACKEND=local and the same MOVIO_LOCAL_S3_ROOT.
+    """
+
+    help = "Runs synthetic videos through the whole pipeline and reports per stage wall time, cpu time, peak RSS, peak disk and bytes transferred, disk vs RAM scratch (JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["eager", "worker"], default="eager")
+        parser.add_argument(
+            "--durations", default="10,60", help="comma separated durations in seconds"
+        )
+        parser.add_argument(
+            "--resolutions", default="640x360,1280x720", help="comma separated WxH"
+        )
+        parser.add_argument(
+            "--subtitles", choices=["with", "without", "both"], default="both"
+        )
+        parser.add_argument(
+            "--scratch",
+            choices=["disk", "ram", "both"],
+            default="disk",
+            help="tier of the segment output, both: every case on the disk and in the RAM scratch",
+        )
+        parser.add_argument("--repeat", type=int, default=1)
+        parser.add_argument("--timeout", type=float, default=1800, help="seconds per run")
+        parser.add_argument(
+            "--inputs-dir",
+            default=str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT / "benchmark-inputs"),
+            help="synthetic inputs, generated once and reused",
+        )
+        parser.add_argument("--output", help="write the JSON report to this file")
+        parser.add_argument("--baseline", help="JSON report to compare against")
+        parser.add_argument(
+            "--save-baseline", help="also write the report as the new baseline to this file"
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.15, help="relative slowdown flagged as a regression"
+        )
+        parser.add_argument(
+            "--min-delta-seconds", type=float, default=0.5, help="absolute noise floor of a regression"
+        )
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **options):
+        if settings.MOVIO_S3_BACKEND != "local" or settings.MOVIO_AMQP_BACKEND != "local":
+            raise CommandError(
+                "The benchmark runs against the local stand-ins only: set MOVIO_S3_BACKEND=local and MOVIO_AMQP_BACKEND=local."
+            )
+
+        subtitles = {"with": [True], "without": [False], "both": [True, False]}[
+            options["subtitles"]
+        ]
+        scratch_tiers = {"disk": ["disk"], "ram": ["ram"], "both": ["disk", "ram"]}[
+            options["scratch"]
+        ]
+        cases = get_benchmark_cases(
+            durations=[int(duration) for duration in options["durations"].split(",")],
+            resolutions=options["resolutions"].split(","),
+            subtitles=subtitles,
+            scratch_tiers=scratch_tiers,
+        )
+
+        report = run_benchmark(
+            cases,
+            mode=options["mode"],
+            repeat=options["repeat"],
+            inputs_dir=options["inputs_dir"],
+            timeout_seconds=options["timeout"],
+        )
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+            report["baseline"] = os.path.abspath(options["baseline"])
+            report["regressions"] = compare_with_baseline(
+                report,
+                baseline,
+                threshold=options["threshold"],
+                min_delta_seconds=options["min_delta_seconds"],
+            )
+
+        encoded_report = json.dumps(report, indent=4)
+        for path in (options["output"], options["save_baseline"]):
+            if path:
+                with open(path, "w") as report_file:
+                    report_file.write(encoded_report)
+        self.stdout.write(encoded_report)
+
+        if options["fail_on_regression"] and report.get("regressions"):
+            raise CommandError(f"{len(report['regressions'])} regressions against the baseline.")
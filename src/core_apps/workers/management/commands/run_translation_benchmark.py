@@ -0,0 +1,88 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core_apps.workers.translation_benchmark import run_translation_benchmark
+
+
+class Command(BaseCommand):
+    """Subtitle Translation Benchmark with the Stub Translator: Sequential vs Concurrent Batches vs Translation Memory
+
+    e.g. python manage.py run_translation_benchmark --vtt ../popey_president.vtt --synthetic-cues 2000,20000
+    """
+
+    help = "Translates WebVTT files with the stub translator (simulated latency) sequentially, concurrently and behind the translation memory, and reports the wall time, requests, speedup and memory hit rate (JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vtt", action="append", default=[], help="WebVTT file to translate (repeatable)"
+        )
+        parser.add_argument(
+            "--synthetic-cues",
+            default="2000,20000",
+            help="comma separated cue counts of synthetic subtitles, empty for none",
+        )
+        parser.add_argument(
+            "--languages",
+            default=",".join(
+                language
+                for language in settings.MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES
+                if language != settings.MOVIO_SUBTITLE_SOURCE_LANGUAGE
+            ),
+            help="comma separated target languages",
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.1, help="simulated seconds per request"
+        )
+        parser.add_argument(
+            "--max-request-bytes",
+            type=int,
+            default=settings.MOVIO_AWS_TRANSLATE_MAX_REQUEST_BYTES,
+        )
+        parser.add_argument(
+            "--batch-cues", type=int, default=settings.MOVIO_SUBTITLE_TRANSLATE_BATCH_CUES
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.MOVIO_SUBTITLE_TRANSLATE_CONCURRENCY
+        )
+        parser.add_argument(
+            "--inputs-dir",
+            default=str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT / "translation-benchmark-inputs"),
+            help="synthetic inputs, generated once and reused",
+        )
+        parser.add_argument(
+            "--output-dir",
+            default=str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT / "translation-benchmark-outputs"),
+        )
+        parser.add_argument(
+            "--memory-backend",
+            choices=["none", "sqlite"],
+            default="none",
+            help="store of the translation memory run, shared by the inputs (none: the in-process LRU only)",
+        )
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        report = run_translation_benchmark(
+            vtt_paths=options["vtt"],
+            synthetic_cue_counts=[
+                int(cue_count)
+                for cue_count in options["synthetic_cues"].split(",")
+                if cue_count
+            ],
+            languages=options["languages"].split(","),
+            latency_seconds=options["latency"],
+            max_request_bytes=options["max_request_bytes"],
+            batch_cues=options["batch_cues"],
+            concurrency=options["concurrency"],
+            inputs_dir=options["inputs_dir"],
+            output_dir=options["output_dir"],
+            memory_backend=options["memory_backend"],
+        )
+
+        encoded_report = json.dumps(report, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as report_file:
+                report_file.write(encoded_report)
+        self.stdout.write(encoded_report)
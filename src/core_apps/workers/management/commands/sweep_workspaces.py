@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core_apps.workers.workspace_sweeper import sweep_orphaned_workspaces
+
+
+class Command(BaseCommand):
+    """Reclaims the Orphaned Local Workspaces (crashed workers, lost chains), Oldest First
+    """
+
+    help = "Reclaims the stale local workspaces oldest-first until the disk usage is under the target, reports the bytes reclaimed (JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-usage",
+            type=float,
+            help="disk usage ratio to reach, defaults to MOVIO_WORKSPACE_SWEEP_TARGET_USAGE_RATIO",
+        )
+        parser.add_argument(
+            "--all", action="store_true", help="reclaim every stale workspace, whatever the disk usage"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only report what would be reclaimed"
+        )
+
+    def handle(self, *args, **options):
+        report = sweep_orphaned_workspaces(
+            target_usage_ratio=options["target_usage"],
+            reclaim_all=options["all"],
+            dry_run=options["dry_run"],
+        )
+        self.stdout.write(json.dumps(report, indent=4))
@@ -0,0 +1,310 @@
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+from core_apps.common.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+# status of a video: redis hash {field: json}
+VIDEO_STATUS_KEY = "movio:video-status:{video_id}"
+
+# running encodes of a node: redis hash {"<video_id>:<stage>": json}
+NODE_ENCODES_KEY = "movio:node-encodes:{hostname}"
+
+NODE_HOSTNAME = socket.gethostname()
+
+# pipeline states
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class PipelineStatusWriter:
+    """Fire and forget writes to the pipeline status store.
+
+    The tasks only enqueue their updates (never blocks, dropped when the queue is full),
+    a background thread batches them into redis pipelines. The thread is (re)started lazily,
+    per process, as the celery prefork pool forks after the import.
+    """
+
+    def __init__(self, max_queue_size: int) -> None:
+        self.updates = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.dropped = 0
+
+    def submit(self, update) -> None:
+        """update: callable(redis_pipeline) adding the writes to a redis pipeline."""
+
+        self.ensure_started()
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(
+                    f"\n[## PIPELINE STATUS WARNING]: Status Update Queue Full, Dropped Updates: {self.dropped}"
+                )
+
+    def ensure_started(self) -> None:
+        if self.pid == os.getpid() and self.thread is not None and self.thread.is_alive():
+            return
+
+        with self.lock:
+            if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+                if self.pid != os.getpid():
+                    # forked: the parent updates belong to the parent.
+                    self.updates = queue.Queue(maxsize=self.updates.maxsize)
+                self.pid = os.getpid()
+                self.thread = threading.Thread(
+                    target=self.run, name="pipeline-status-writer", daemon=True
+                )
+                self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            updates = [self.updates.get()]
+            while len(updates) < 500:
+                try:
+                    updates.append(self.updates.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                pipeline = get_redis_client().pipeline(transaction=False)
+                for update in updates:
+                    update(pipeline)
+                pipeline.execute()
+            except Exception as e:
+                logger.warning(
+                    f"\n[## PIPELINE STATUS WARNING]: {len(updates)} Status Updates Could Not Be Written.\nException: {str(e)}"
+                )
+
+
+status_writer = PipelineStatusWriter(
+    max_queue_size=settings.MOVIO_PIPELINE_STATUS_QUEUE_SIZE
+)
+
+
+def _update_video_status(video_id, fields: dict, increments: dict = None, sync: bool = False) -> None:
+    """Through the status writer, or written before returning (sync) for the updates the others build on."""
+
+    if video_id is None:
+        return
+
+    key = VIDEO_STATUS_KEY.format(video_id=video_id)
+    fields = {**fields, "updated_at": time.time()}
+
+    def update(pipeline):
+        pipeline.hset(key, mapping=fields)
+        for field, amount in (increments or {}).items():
+            pipeline.hincrby(key, field, amount)
+        pipeline.expire(key, settings.MOVIO_PIPELINE_STATUS_TTL_SECONDS)
+
+    if not sync:
+        status_writer.submit(update)
+        return
+
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        update(pipeline)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(
+            f"\n[## PIPELINE STATUS WARNING]: Status Update Could Not Be Written.\nException: {str(e)}"
+        )
+
+
+def record_pipeline_state(mq_data: dict, state: str) -> None:
+    """State of the whole pipeline: queued, running, finished, failed or cancelled."""
+
+    fields = {"state": state}
+    if state == QUEUED:
+        fields["queued_at"] = time.time()
+    elif state in (FINISHED, FAILED, CANCELLED):
+        fields["finished_at"] = time.time()
+    _update_video_status((mq_data or {}).get("video_id"), fields)
+
+
+def record_stage_started(mq_data: dict, stage: str) -> None:
+    started_at = time.time()
+    _update_video_status(
+        (mq_data or {}).get("video_id"),
+        {
+            "state": RUNNING,
+            "current_stage": stage,
+            f"stage:{stage}": json.dumps(
+                {"status": RUNNING, "started_at": started_at, "node": NODE_HOSTNAME}
+            ),
+        },
+    )
+
+
+def record_stage_finished(
+    mq_data: dict, stage: str, status: str, started_at: float = None
+) -> None:
+    """status: succeeded, failed, cancelled or retrying."""
+
+    finished_at = time.time()
+    _update_video_status(
+        (mq_data or {}).get("video_id"),
+        {
+            f"stage:{stage}": json.dumps(
+                {
+                    "status": status,
+                    "started_at": started_at,
+                    "finished_at": finished_at,
+                    "duration_seconds": (
+                        finished_at - started_at if started_at is not None else None
+                    ),
+                    "node": NODE_HOSTNAME,
+                }
+            ),
+        },
+    )
+
+
+def record_upload_total(mq_data: dict, total_segments: int) -> None:
+    """Called before the upload chord is applied. Written right away: queued in the status writer, the reset
+    of the uploaded segments could land after the increments of the upload tasks (other workers).
+    """
+
+    _update_video_status(
+        (mq_data or {}).get("video_id"),
+        {"upload_total_segments": total_segments, "upload_uploaded_segments": 0},
+        sync=True,
+    )
+
+
+def record_segments_uploaded(mq_data: dict, count: int = 1) -> None:
+    _update_video_status(
+        (mq_data or {}).get("video_id"), {}, increments={"upload_uploaded_segments": count}
+    )
+
+
+def record_text_asset_compressed(mq_data: dict, original_bytes: int, stored_bytes: int) -> None:
+    """A text asset (manifest, subtitle) uploaded compressed: the bytes saved report of the video."""
+
+    _update_video_status(
+        (mq_data or {}).get("video_id"),
+        {},
+        increments={
+            "compression_files": 1,
+            "compression_original_bytes": original_bytes,
+            "compression_stored_bytes": stored_bytes,
+        },
+    )
+
+
+def publish_encode_progress(mq_data: dict, stage: str, progress: dict) -> None:
+    """Publish the ffmpeg progress of a stage, per video and per node (fire and forget)."""
+
+    video_id = (mq_data or {}).get("video_id")
+    progress = {**progress, "stage": stage, "node": NODE_HOSTNAME, "updated_at": time.time()}
+    encoded_progress = json.dumps(progress)
+
+    _update_video_status(video_id, {"encode_progress": encoded_progress})
+
+    node_encodes_key = NODE_ENCODES_KEY.format(hostname=NODE_HOSTNAME)
+
+    def update(pipeline):
+        pipeline.hset(node_encodes_key, f"{video_id}:{stage}", encoded_progress)
+        pipeline.expire(node_encodes_key, settings.MOVIO_PIPELINE_STATUS_TTL_SECONDS)
+
+    status_writer.submit(update)
+
+
+def clear_node_encode(mq_data: dict, stage: str) -> None:
+    """Remove a finished encode from the running encodes of the node."""
+
+    video_id = (mq_data or {}).get("video_id")
+    node_encodes_key = NODE_ENCODES_KEY.format(hostname=NODE_HOSTNAME)
+    status_writer.submit(
+        lambda pipeline: pipeline.hdel(node_encodes_key, f"{video_id}:{stage}")
+    )
+
+
+def get_nodes_encode_progress() -> dict:
+    """Running encodes with their progress, per node: {hostname: {"<video_id>:<stage>": progress}}."""
+
+    redis_client = get_redis_client()
+    nodes = {}
+    for key in redis_client.scan_iter(match=NODE_ENCODES_KEY.format(hostname="*")):
+        hostname = key.split(":", 2)[-1]
+        nodes[hostname] = {
+            encode: json.loads(progress)
+            for encode, progress in redis_client.hgetall(key).items()
+        }
+    return nodes
+
+
+def get_pipeline_status(video_id: str):
+    """Current status of the pipeline of a video, None if unknown (or expired)."""
+
+    fields = get_redis_client().hgetall(VIDEO_STATUS_KEY.format(video_id=video_id))
+    if not fields:
+        return None
+
+    stages = {
+        field.split(":", 1)[1]: json.loads(value)
+        for field, value in fields.items()
+        if field.startswith("stage:")
+    }
+
+    upload_progress = None
+    if "upload_total_segments" in fields:
+        total_segments = int(fields["upload_total_segments"])
+        uploaded_segments = int(fields.get("upload_uploaded_segments") or 0)
+        upload_progress = {
+            "total_segments": total_segments,
+            "uploaded_segments": uploaded_segments,
+            "percentage": (
+                min(uploaded_segments / total_segments * 100, 100.0)
+                if total_segments
+                else None
+            ),
+        }
+
+    compression = None
+    if "compression_files" in fields:
+        original_bytes = int(fields.get("compression_original_bytes") or 0)
+        stored_bytes = int(fields.get("compression_stored_bytes") or 0)
+        compression = {
+            "files": int(fields["compression_files"]),
+            "original_bytes": original_bytes,
+            "stored_bytes": stored_bytes,
+            "saved_bytes": original_bytes - stored_bytes,
+            "ratio": round(stored_bytes / original_bytes, 4) if original_bytes else None,
+        }
+
+    return {
+        "video_id": video_id,
+        "state": fields.get("state"),
+        "current_stage": fields.get("current_stage"),
+        "queued_at": _parse_float(fields.get("queued_at")),
+        "finished_at": _parse_float(fields.get("finished_at")),
+        "updated_at": _parse_float(fields.get("updated_at")),
+        "stages": dict(
+            sorted(stages.items(), key=lambda item: item[1].get("started_at") or 0)
+        ),
+        "encode_progress": (
+            json.loads(fields["encode_progress"]) if "encode_progress" in fields else None
+        ),
+        "upload_progress": upload_progress,
+        "compression": compression,
+    }
+
+
+def _parse_float(value):
+    return float(value) if value is not None else None
@@ -0,0 +1,116 @@
+"""
+Payload size policy of the extracted subtitle in the video process result message.
+
+A feature length subtitle is hundreds of KB: inlined in every message it weighs on the broker memory
+and on every consumer of the API Service. settings.MOVIO_RESULT_SUBTITLE_INLINE_MAX_BYTES (opt-in,
+None: always inlined):
+- above it, the subtitle is referenced by the S3 object already uploaded by the pipeline (the
+  translate_subtitles upload, or the raw cc one for the Lambda) in subtitle_en_vtt_s3:
+  {"bucket", "key", "content_encoding" (of the object, None: as is), "sha256" and "size_bytes" (of the plain text)}
+  and subtitle_en_vtt_data is None
+- under it (or with no S3 object known), the subtitle is inlined in subtitle_en_vtt_data, encoded by
+  MOVIO_RESULT_SUBTITLE_ENCODING, with subtitle_en_vtt_content_encoding: "identity" (the plain text,
+  the default), or opt-in "gzip" or "zstd" (base64 of the compressed text)
+"""
+
+import base64
+import gzip
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from core_apps.common.metrics import record_result_subtitle_payload
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_CHUNK_BYTES = 1024 * 1024
+
+
+def get_file_checksum(path: str) -> tuple:
+    """(sha256 hex digest, bytes) of a file, read by chunks."""
+
+    checksum = hashlib.sha256()
+    size_bytes = 0
+    with open(path, "rb") as checksum_file:
+        while chunk := checksum_file.read(CHECKSUM_CHUNK_BYTES):
+            checksum.update(chunk)
+            size_bytes += len(chunk)
+    return checksum.hexdigest(), size_bytes
+
+
+def get_subtitle_encoding() -> str:
+    encoding = settings.MOVIO_RESULT_SUBTITLE_ENCODING
+    if encoding == "zstd" and zstandard is None:
+        return "gzip"
+    return encoding
+
+
+def encode_inline_subtitle(data: bytes, encoding: str) -> str:
+    """The subtitle as inlined in the message: the text itself ("identity") or the base64 of its compression."""
+
+    if encoding == "identity":
+        return data.decode("utf-8")
+    if encoding == "zstd":
+        compressed = zstandard.ZstdCompressor(level=19).compress(data)
+    else:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    return base64.b64encode(compressed).decode("ascii")
+
+
+def build_subtitle_payload(local_cc_file_path: str, s3_location: dict = None) -> dict:
+    """The subtitle fields of the result message.
+
+    s3_location: {"bucket", "key", "content_encoding"} of the uploaded subtitle (mq_data["source_subtitle_s3"]), if any.
+    """
+
+    if not local_cc_file_path or not os.path.exists(local_cc_file_path):
+        record_result_subtitle_payload("none", "none")
+        return {"subtitle_en_vtt_data": None}
+
+    inline_max_bytes = settings.MOVIO_RESULT_SUBTITLE_INLINE_MAX_BYTES
+
+    if (
+        s3_location is not None
+        and inline_max_bytes is not None
+        and os.path.getsize(local_cc_file_path) > inline_max_bytes
+    ):
+        checksum, size_bytes = get_file_checksum(local_cc_file_path)
+        record_result_subtitle_payload("reference", s3_location.get("content_encoding") or "identity")
+        return {
+            "subtitle_en_vtt_data": None,
+            "subtitle_en_vtt_s3": {
+                "bucket": s3_location["bucket"],
+                "key": s3_location["key"],
+                "content_encoding": s3_location.get("content_encoding"),
+                "sha256": checksum,
+                "size_bytes": size_bytes,
+            },
+        }
+
+    with open(local_cc_file_path, "rb") as subtitle_file:
+        data = subtitle_file.read()
+
+    if inline_max_bytes is not None and len(data) > inline_max_bytes:
+        logger.warning(
+            f"\n[## RESULT PAYLOAD WARNING]: No S3 Object of the Subtitle, {len(data)} Bytes Inlined: {local_cc_file_path}"
+        )
+
+    encoding = get_subtitle_encoding()
+    record_result_subtitle_payload("inline", encoding)
+    return {
+        "subtitle_en_vtt_data": encode_inline_subtitle(data, encoding),
+        "subtitle_en_vtt_content_encoding": encoding,
+    }
+
+
+if settings.MOVIO_RESULT_SUBTITLE_ENCODING == "zstd" and zstandard is None:
+    logger.warning(
+        "\n[## RESULT PAYLOAD WARNING]: MOVIO_RESULT_SUBTITLE_ENCODING is zstd but the zstandard package is not installed, gzip is used."
+    )
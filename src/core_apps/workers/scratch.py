@@ -0,0 +1,208 @@
+"""
+RAM scratch tier of the segment output.
+
+dash_segment_video writes thousands of small .m4s files that the uploader reads back right away.
+When the estimated output of a video fits the memory budget of the node
+(settings.MOVIO_SCRATCH_RAM_BUDGET_BYTES, reserved in redis, and the free space of the tmpfs),
+the segments (and with MOVIO_SCRATCH_RAM_MP4 the intermediate mp4) are written to
+MOVIO_SCRATCH_RAM_DIR (/dev/shm) instead of the disk, the disk is the fallback.
+
+The choice is recorded in the mq data ("scratch"): get_local_video_paths, the uploader and the
+cleanup all follow it. A RAM scratch is local to the worker host: the rest of the chain, the segment
+uploads and their callbacks are routed to the worker direct queue of the worker that placed it
+(settings.CELERY_WORKER_DIRECT).
+
+A submission can force the tier with "scratch_tier": "ram" or "disk" (the pipeline benchmark does).
+"""
+
+import logging
+import os
+import shutil
+
+from django.conf import settings
+
+from celery.utils import worker_direct
+
+from core_apps.mq_manager.priority_lanes import get_lane_routing_options
+from core_apps.workers.ffmpeg_runner import probe_media_duration
+from core_apps.workers.pipeline_status import NODE_HOSTNAME
+from core_apps.workers.workspace import (
+    SCRATCH_BUDGET_KEY,
+    get_local_video_paths,
+    release_scratch_budget,
+    reserve_node_budget,
+)
+
+logger = logging.getLogger(__name__)
+
+RAM = "ram"
+DISK = "disk"
+
+# output bitrates in bits per second (video + 128k aac audio) of the transcode and of the DASH ladder, see tasks
+MP4_OUTPUT_BITRATE = (800 + 128) * 1000
+SEGMENTS_OUTPUT_BITRATE = (2400 + 1200 + 800 + 128) * 1000
+
+
+def is_ram_scratch_requested(mq_data: dict) -> bool:
+    scratch_tier = mq_data.get("scratch_tier")
+    if scratch_tier is not None:
+        return scratch_tier == RAM
+    return settings.MOVIO_SCRATCH_RAM_ENABLED
+
+
+def estimate_output_bytes(duration_seconds: float, bitrate: int) -> int:
+    return int(
+        duration_seconds * bitrate / 8 * settings.MOVIO_SCRATCH_RAM_ESTIMATE_FACTOR
+    )
+
+
+def reserve_ram_scratch(mq_data: dict, estimated_bytes: int) -> bool:
+    """Reserve estimated_bytes of the memory budget of this node, False when it doesn't fit (or the tmpfs is unusable)."""
+
+    try:
+        os.makedirs(settings.MOVIO_SCRATCH_RAM_DIR, exist_ok=True)
+        if shutil.disk_usage(settings.MOVIO_SCRATCH_RAM_DIR).free < estimated_bytes:
+            return False
+
+        return reserve_node_budget(
+            SCRATCH_BUDGET_KEY.format(hostname=NODE_HOSTNAME),
+            settings.MOVIO_SCRATCH_RAM_BUDGET_BYTES,
+            mq_data["video_id"],
+            estimated_bytes,
+        )
+    except Exception as e:
+        logger.warning(
+            f"\n[## SCRATCH WARNING]: RAM Scratch Could Not Be Reserved, Using the Disk.\nException: {str(e)}"
+        )
+        return False
+
+
+def route_chain(task, queue: str) -> None:
+    # the chain is sent one task at a time, from these signatures (last task first)
+    for signature in task.request.chain or []:
+        signature.setdefault("options", {})["queue"] = queue
+
+
+def pin_chain_to_worker(task):
+    """Route the next tasks of the chain to the worker direct queue of the worker running task, returns the queue name.
+
+    Only called once the RAM scratch is reserved. None when the task doesn't run on a worker
+    (eager mode): there is nothing to pin.
+    """
+
+    if task.request.is_eager or not task.request.hostname:
+        return None
+
+    queue = worker_direct(task.request.hostname).name
+    route_chain(task, queue)
+    return queue
+
+
+def unpin_chain_from_worker(task, mq_data: dict) -> None:
+    """Route the next tasks of the chain back to the priority lane queue of the submission."""
+
+    if task.request.is_eager:
+        return
+    route_chain(task, get_lane_routing_options(mq_data)["queue"])
+
+
+def get_scratch_routing_options(mq_data: dict, routing_options: dict) -> dict:
+    """routing_options, with the worker direct queue of the RAM scratch of the video if any."""
+
+    worker_queue = (mq_data.get("scratch") or {}).get("worker_queue")
+    if worker_queue is None:
+        return routing_options
+    return {**routing_options, "queue": worker_queue}
+
+
+def fall_back_to_disk(task, mq_data: dict) -> None:
+    """Move the outputs of a video back to the disk: the reservation is released and the chain,
+    pinned by the attempt that chose the RAM scratch (the retry carries its signatures), goes back
+    to its lane.
+    """
+
+    scratch = mq_data.get("scratch") or {}
+    if scratch.get("node"):
+        try:
+            release_scratch_budget(scratch["node"], mq_data["video_id"])
+        except Exception as e:
+            # the reservation expires after MOVIO_WORKSPACE_RESERVATION_TTL_SECONDS anyway
+            logger.warning(
+                f"\n[## SCRATCH WARNING]: RAM Scratch Reservation Could Not Be Released.\nException: {str(e)}"
+            )
+    # the lane queue is what the chain was built with: harmless when it was never pinned
+    unpin_chain_from_worker(task, mq_data)
+    if scratch:
+        mq_data["scratch"] = {
+            **scratch,
+            "mp4": DISK,
+            "segments": DISK,
+            "node": None,
+            "worker_queue": None,
+        }
+
+
+def place_transcode_output(task, mq_data: dict, local_video_file_path: str) -> str:
+    """Path of the transcoded mp4.
+
+    With MOVIO_SCRATCH_RAM_MP4, the mp4 and the segments go to the RAM scratch when both fit the
+    memory budget (reserved together: the peak is mp4 + segments during the segmentation).
+    A retried transcode falls back to the disk (e.g. the tmpfs filled up).
+    """
+
+    if task.request.retries > 0:
+        fall_back_to_disk(task, mq_data)
+
+    elif settings.MOVIO_SCRATCH_RAM_MP4 and is_ram_scratch_requested(mq_data):
+        duration_seconds = probe_media_duration(local_video_file_path)
+        if duration_seconds is not None:
+            estimated_bytes = estimate_output_bytes(
+                duration_seconds, MP4_OUTPUT_BITRATE
+            ) + estimate_output_bytes(duration_seconds, SEGMENTS_OUTPUT_BITRATE)
+
+            if reserve_ram_scratch(mq_data, estimated_bytes):
+                mq_data["scratch"] = {
+                    "mp4": RAM,
+                    "segments": RAM,
+                    "node": NODE_HOSTNAME,
+                    "reserved_bytes": estimated_bytes,
+                    "worker_queue": pin_chain_to_worker(task),
+                }
+                logger.info(
+                    f"\n[=> SCRATCH]: MP4 and Segments in the RAM Scratch.\nVideo ID: {mq_data['video_id']}, Estimated: {estimated_bytes} bytes."
+                )
+
+    local_mp4_video_file_path = get_local_video_paths(mq_data)["local_mp4_video_file_path"]
+    os.makedirs(os.path.dirname(local_mp4_video_file_path), exist_ok=True)
+    return local_mp4_video_file_path
+
+
+def place_segments_output(task, mq_data: dict, local_mp4_video_file_path: str) -> str:
+    """Directory of the DASH segments: the RAM scratch when they fit the memory budget, the disk otherwise."""
+
+    scratch = mq_data.get("scratch") or {}
+
+    if scratch.get("segments") != RAM and is_ram_scratch_requested(mq_data):
+        duration_seconds = probe_media_duration(local_mp4_video_file_path)
+        if duration_seconds is not None:
+            estimated_bytes = estimate_output_bytes(
+                duration_seconds, SEGMENTS_OUTPUT_BITRATE
+            )
+
+            if reserve_ram_scratch(mq_data, estimated_bytes):
+                mq_data["scratch"] = {
+                    "mp4": scratch.get("mp4", DISK),
+                    "segments": RAM,
+                    "node": NODE_HOSTNAME,
+                    "reserved_bytes": estimated_bytes,
+                    "worker_queue": pin_chain_to_worker(task),
+                }
+                logger.info(
+                    f"\n[=> SCRATCH]: Segments in the RAM Scratch.\nVideo ID: {mq_data['video_id']}, Estimated: {estimated_bytes} bytes."
+                )
+
+    mp4_segment_files_output_dir = get_local_video_paths(mq_data)[
+        "mp4_segment_files_output_dir"
+    ]
+    os.makedirs(mp4_segment_files_output_dir, exist_ok=True)
+    return mp4_segment_files_output_dir
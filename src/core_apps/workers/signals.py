@@ -0,0 +1,143 @@
+import logging
+import os
+import time
+
+from celery.signals import (
+    task_failure,
+    task_postrun,
+    task_prerun,
+    worker_process_shutdown,
+)
+
+from core_apps.common.metrics import mark_metrics_process_dead, observe_stage
+
+from core_apps.workers.pipeline_status import (
+    record_stage_finished,
+    record_stage_started,
+)
+from core_apps.workers.task_profiling import finish_task_profile, start_task_profile
+from core_apps.workers.tasks import finish_video_pipeline
+from core_apps.workers.workspace import touch_workspace_index
+
+logger = logging.getLogger(__name__)
+
+
+# pipeline stage of every task of the chain (the segment batch uploads report upload progress instead)
+TASK_STAGES = {
+    "core_apps.workers.tasks.download_video_from_s3": "download",
+    "core_apps.workers.tasks.delete_video_file_from_s3": "delete-raw-video",
+    "core_apps.workers.tasks.extract_cc_from_video": "extract-subtitle",
+    "core_apps.workers.tasks.upload_subtitle_to_translate_lambda": "translate-subtitle",
+    "core_apps.workers.tasks.translate_subtitles": "translate-subtitle",
+    "core_apps.workers.tasks.transcode_video_to_mp4": "transcode",
+    "core_apps.workers.tasks.dash_segment_video": "dash-segment",
+    "core_apps.workers.tasks.edit_manifest_to_add_subtitle_information": "edit-manifest",
+    "core_apps.workers.tasks.upload_dash_segments_to_s3_and_publish_message_callback": "upload-segments",
+    "core_apps.workers.tasks.publish_video_process_message_mq": "publish-result",
+    "core_apps.workers.tasks.local_file_cleanup_callback": "local-cleanup",
+    "core_apps.workers.tasks.generate_video_preview_clip": "preview-clip",
+}
+
+# tasks whose failure ends the pipeline: the chain, the segment batch uploads of its chord
+# (a failed batch fails the chord, its callbacks never run). Not the preview clip, out of the chain.
+PIPELINE_TASKS = {
+    *(task_name for task_name, stage in TASK_STAGES.items() if stage != "preview-clip"),
+    "core_apps.workers.tasks.upload_segment_batch_to_s3_sub_task",
+}
+
+# task_id: start time of the tracked stages running in this process
+_stage_started_at = {}
+
+
+def get_task_pipeline_data(args, kwargs):
+    """Return (mq_data, upstream_failed) from the arguments of a pipeline task.
+
+    The tasks get either the mq_data, or the chain result of the previous task
+    (the chord callbacks get the results of the group first).
+    """
+
+    for value in reversed([*(args or ()), *(kwargs or {}).values()]):
+        if not isinstance(value, dict):
+            continue
+        if "mq_data" in value:
+            return value["mq_data"], value.get("success") == False
+        if "video_id" in value:
+            return value, False
+
+    return None, False
+
+
+@task_prerun.connect
+def record_task_stage_started(task_id=None, task=None, args=None, kwargs=None, **extra):
+    stage = TASK_STAGES.get(getattr(task, "name", None))
+    if stage is None:
+        return
+
+    mq_data, upstream_failed = get_task_pipeline_data(args, kwargs)
+    # a failed pipeline only passes through the next tasks
+    if mq_data is None or upstream_failed:
+        return
+
+    _stage_started_at[task_id] = time.time()
+    record_stage_started(mq_data, stage)
+    # the preview clip has its own workspace (tmp-previews), out of the sweeper
+    if stage != "preview-clip":
+        touch_workspace_index(mq_data)
+    # opt-in, per video (task_profiling.is_profiling_enabled)
+    start_task_profile(task_id, task.name, stage, mq_data)
+
+
+@task_postrun.connect
+def record_task_stage_finished(
+    task_id=None, task=None, args=None, kwargs=None, retval=None, state=None, **extra
+):
+    started_at = _stage_started_at.pop(task_id, None)
+    if started_at is None:
+        return
+
+    mq_data, _ = get_task_pipeline_data(args, kwargs)
+
+    exception = None
+    if state == "RETRY":
+        status = "retrying"
+    elif state != "SUCCESS":
+        status = "failed"
+        # retval is the raised exception
+        exception = type(retval).__name__
+    elif isinstance(retval, dict) and retval.get("cancelled_reason"):
+        status = "cancelled"
+    elif isinstance(retval, dict) and retval.get("success") == False:
+        status = "failed"
+        exception = retval.get("exception") or "Exception"
+    else:
+        status = "succeeded"
+
+    finish_task_profile(task_id, status)
+
+    stage = TASK_STAGES[task.name]
+    observe_stage(stage, status, time.time() - started_at, exception=exception)
+    record_stage_finished(mq_data, stage, status, started_at=started_at)
+
+
+@task_failure.connect
+def finish_failed_video_pipeline(sender=None, args=None, kwargs=None, exception=None, **extra):
+    """A pipeline task raised out of its own error handling, or its worker was lost: the terminal tasks
+    will never run, the pipeline is finished here (workspace budget, in flight slot, dedupe key).
+    """
+
+    if getattr(sender, "name", None) not in PIPELINE_TASKS:
+        return
+
+    mq_data, _ = get_task_pipeline_data(args, kwargs)
+    if mq_data is None:
+        return
+
+    logger.error(
+        f"\n[XX PIPELINE TASK FAILURE XX]: Task {sender.name} Failed, Pipeline Finished as Failed.\nVideo: {mq_data.get('video_id')}, Exception: {exception!r}"
+    )
+    finish_video_pipeline(mq_data, success=False)
+
+
+@worker_process_shutdown.connect
+def mark_pool_process_dead(pid=None, **extra):
+    mark_metrics_process_dead(pid or os.getpid())
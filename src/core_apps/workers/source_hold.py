@@ -0,0 +1,76 @@
+"""
+Hold of the raw S3 object of a video while the preview clip reads it.
+
+The preview task (fast lane) reads the raw object through a presigned url, the main chain deletes
+that object right after its download. The consumer holds the object before it applies the chain and the preview:
+
+    - delete_video_file_from_s3 finds the hold: it marks it deferred and leaves the object alone,
+    - the preview task releases the hold as it ends, and deletes the object if the delete was deferred.
+
+Both transitions are single redis commands (SET XX, GETDEL), so exactly one of the two deletes the
+object. The hold expires after MOVIO_PREVIEW_SOURCE_HOLD_TTL_SECONDS: a preview worker lost mid task
+leaves the raw object behind (the bucket lifecycle rule reclaims it) rather than blocking the chain.
+"""
+
+import logging
+
+from django.conf import settings
+
+from core_apps.common.redis_utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+SOURCE_HOLD_KEY = "movio:preview-source-hold:{video_id}"
+
+HELD = "held"
+DELETE_DEFERRED = "delete-deferred"
+
+
+def hold_source_video(video_id: str) -> bool:
+    """Hold the raw object for the preview, False if the hold could not be set."""
+
+    try:
+        get_redis_client().set(
+            SOURCE_HOLD_KEY.format(video_id=video_id),
+            HELD,
+            ex=settings.MOVIO_PREVIEW_SOURCE_HOLD_TTL_SECONDS,
+        )
+        return True
+    except Exception as e:
+        # the chain deletes the object as usual, the preview might find it gone (not retried)
+        logger.warning(
+            f"\n[## PREVIEW SOURCE HOLD WARNING]: Raw Video of {video_id} Could Not Be Held for the Preview.\nException: {str(e)}"
+        )
+        return False
+
+
+def defer_source_video_delete(video_id: str) -> bool:
+    """Called by the chain before the delete: True if the preview holds the object (it deletes it)."""
+
+    try:
+        return bool(
+            get_redis_client().set(
+                SOURCE_HOLD_KEY.format(video_id=video_id),
+                DELETE_DEFERRED,
+                xx=True,
+                keepttl=True,
+            )
+        )
+    except Exception as e:
+        logger.warning(
+            f"\n[## PREVIEW SOURCE HOLD WARNING]: Preview Hold of {video_id} Could Not Be Read, Deleting Now.\nException: {str(e)}"
+        )
+        return False
+
+
+def release_source_video(video_id: str) -> bool:
+    """Called by the preview as it ends: True if the delete was deferred to it (the caller deletes)."""
+
+    try:
+        return get_redis_client().getdel(SOURCE_HOLD_KEY.format(video_id=video_id)) == DELETE_DEFERRED
+    except Exception as e:
+        # the hold expires: a chain not yet at its delete deletes the object, else the lifecycle rule does
+        logger.warning(
+            f"\n[## PREVIEW SOURCE HOLD WARNING]: Preview Hold of {video_id} Could Not Be Released.\nException: {str(e)}"
+        )
+        return False
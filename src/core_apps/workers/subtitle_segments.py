@@ -0,0 +1,99 @@
+"""
+Time segmented subtitle delivery (settings.MOVIO_SUBTITLE_SEGMENTED_DELIVERY).
+
+A subtitle available locally (the extracted one, and the ones translated in the worker) is split
+into segmented WebVTT files of the video segment duration (MOVIO_DASH_SEGMENT_DURATION_SECONDS),
+written next to the video segments and uploaded with them:
+
+    segments/uuid__name/subtitles/lang_bn/seg-00001.vtt, seg-00002.vtt, ...
+
+and described in the MPD with a SegmentTemplate: the players fetch the cues of the segments they
+play, the startup and the seeking don't depend on the size of the subtitle. A segment holds the cues
+overlapping its time range, clipped to it (timestamps on the media timeline), the empty segments are
+written too. The other languages (translated by the Lambda) keep their whole file BaseURL.
+"""
+
+import math
+import os
+import re
+import shutil
+
+from django.conf import settings
+from lxml import etree
+
+from core_apps.common.vtt import WebVTTWriter, iter_cue_segments, read_cues
+
+SEGMENT_FILE_NAME = "seg-{number:05d}.vtt"
+SEGMENT_TEMPLATE_MEDIA = "seg-$Number%05d$.vtt"
+
+# ISO 8601 duration of the MPD, e.g. PT1H2M3.5S (as ffmpeg writes it: PT0H0M10.000S)
+ISO_8601_DURATION_PATTERN = re.compile(
+    r"^P(?:(?P<days>[\d.]+)D)?(?:T(?:(?P<hours>[\d.]+)H)?(?:(?P<minutes>[\d.]+)M)?(?:(?P<seconds>[\d.]+)S)?)?$"
+)
+
+
+def parse_iso_8601_duration(duration: str):
+    """Seconds of an ISO 8601 duration, None when it can't be parsed."""
+
+    match = ISO_8601_DURATION_PATTERN.match(duration or "")
+    if match is None:
+        return None
+    parts = {name: float(value or 0) for name, value in match.groupdict().items()}
+    return (
+        parts["days"] * 86400
+        + parts["hours"] * 3600
+        + parts["minutes"] * 60
+        + parts["seconds"]
+    )
+
+
+def get_subtitle_segments_dir(mp4_segment_files_output_dir: str, lang: str) -> str:
+    """tmp-segments/uuid__name/subtitles/lang_bn: uploaded with the video segments."""
+
+    return os.path.join(mp4_segment_files_output_dir, "subtitles", f"lang_{lang}")
+
+
+def write_subtitle_segments(vtt_path: str, output_dir: str, duration_seconds: float) -> list:
+    """Write the segmented WebVTT files of a subtitle, returns their [path, bytes, seconds], in order."""
+
+    segment_duration = settings.MOVIO_DASH_SEGMENT_DURATION_SECONDS
+    segment_count = max(1, math.ceil(duration_seconds / segment_duration))
+    os.makedirs(output_dir, exist_ok=True)
+
+    segment_files = []
+    try:
+        for index, segment_cues in enumerate(
+            iter_cue_segments(read_cues(vtt_path), segment_duration, segment_count)
+        ):
+            segment_path = os.path.join(output_dir, SEGMENT_FILE_NAME.format(number=index + 1))
+            with open(segment_path, "w", encoding="utf-8") as segment_file:
+                WebVTTWriter(segment_file).write_cues(segment_cues)
+            segment_files.append(
+                [
+                    segment_path,
+                    os.path.getsize(segment_path),
+                    min(segment_duration, duration_seconds - index * segment_duration),
+                ]
+            )
+    except Exception:
+        # no partial track is uploaded with the segments
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+    return segment_files
+
+
+def add_segment_template(representation) -> None:
+    """The SegmentTemplate of the segmented WebVTT files of a subtitle Representation (after its BaseURL)."""
+
+    segment_duration = settings.MOVIO_DASH_SEGMENT_DURATION_SECONDS
+    etree.SubElement(
+        representation,
+        "SegmentTemplate",
+        {
+            "timescale": "1000",
+            "duration": str(round(segment_duration * 1000)),
+            "startNumber": "1",
+            "media": SEGMENT_TEMPLATE_MEDIA,
+        },
+    )
@@ -0,0 +1,273 @@
+"""
+Opt-in profiling of the pipeline tasks of a video.
+
+A video is profiled when its submission message has "profile": true, when its video_id is in
+settings.MOVIO_TASK_PROFILING_VIDEO_IDS, or for every video with MOVIO_TASK_PROFILING_ENABLED.
+Otherwise the cost is a dict lookup per task.
+
+For every task of a profiled video (started and stopped by the celery task signals):
+- a profile of the python side, settings.MOVIO_TASK_PROFILING_MODE:
+  "cprofile": <stage>-<task_id>.prof (pstats, snakeviz), "sampling": <stage>-<task_id>.folded
+  (collapsed stacks of the task thread, for flamegraph.pl / speedscope), lower overhead
+- the `-benchmark` output (utime, stime, rtime, maxrss) of every ffmpeg command of the task
+- the resource usage (getrusage) of the worker process and of its finished child processes
+  (ffmpeg, ffprobe) during the task: <stage>-<task_id>.json
+
+The artifacts are written to MOVIO_TASK_PROFILING_DIR/<video_id>/, and moved to
+MOVIO_TASK_PROFILING_S3_BUCKET (under MOVIO_TASK_PROFILING_S3_PREFIX/<video_id>/) when set.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# top functions (cumulative time) of a cProfile profile kept in the JSON summary
+TOP_FUNCTIONS_COUNT = 25
+
+RUSAGE_FIELDS = (
+    "ru_utime",
+    "ru_stime",
+    "ru_minflt",
+    "ru_majflt",
+    "ru_inblock",
+    "ru_oublock",
+    "ru_nvcsw",
+    "ru_nivcsw",
+)
+
+_profiled_video_ids = frozenset(settings.MOVIO_TASK_PROFILING_VIDEO_IDS)
+
+# the profile of the task running in this thread (ffmpeg_runner adds its ffmpeg commands)
+_local = threading.local()
+
+# task_id: TaskProfile, of the tasks running in this process
+_task_profiles = {}
+
+
+def is_profiling_enabled(mq_data: dict) -> bool:
+    return bool(
+        settings.MOVIO_TASK_PROFILING_ENABLED
+        or mq_data.get("profile")
+        or mq_data.get("video_id") in _profiled_video_ids
+    )
+
+
+def get_active_profile():
+    """The TaskProfile of the task running in this thread, None when it's not profiled."""
+
+    return getattr(_local, "profile", None)
+
+
+def get_rusage_delta(before, after) -> dict:
+    delta = {field[3:]: getattr(after, field) - getattr(before, field) for field in RUSAGE_FIELDS}
+    # a high water mark, not a counter: peak of the process / of the largest child (KB on linux)
+    delta["maxrss_kb"] = after.ru_maxrss
+    return delta
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread every interval seconds (sys._current_frames), counted as collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval_seconds: float) -> None:
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="movio-task-sampling-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as folded_file:
+            for stack, count in self.stacks.most_common():
+                folded_file.write(f"{stack} {count}\n")
+
+
+class TaskProfile:
+    def __init__(self, task_id: str, task_name: str, stage: str, video_id: str) -> None:
+        self.task_id = task_id
+        self.task_name = task_name
+        self.stage = stage
+        self.video_id = video_id
+        self.mode = settings.MOVIO_TASK_PROFILING_MODE
+        self.ffmpeg_commands = []
+
+    def start(self) -> None:
+        if self.mode == "sampling":
+            self.profiler = SamplingProfiler(
+                threading.get_ident(), settings.MOVIO_TASK_PROFILING_SAMPLE_INTERVAL_SECONDS
+            )
+        else:
+            self.profiler = cProfile.Profile()
+
+        self.started_at = time.time()
+        self.rusage_self = resource.getrusage(resource.RUSAGE_SELF)
+        self.rusage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.started_perf_counter = time.perf_counter()
+
+        if self.mode == "sampling":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self) -> None:
+        if self.mode == "sampling":
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+        self.wall_seconds = time.perf_counter() - self.started_perf_counter
+        self.rusage_self = get_rusage_delta(
+            self.rusage_self, resource.getrusage(resource.RUSAGE_SELF)
+        )
+        self.rusage_children = get_rusage_delta(
+            self.rusage_children, resource.getrusage(resource.RUSAGE_CHILDREN)
+        )
+
+    def record_ffmpeg(self, stage: str, command: list, outcome: str, wall_seconds: float, bench_lines: list) -> None:
+        self.ffmpeg_commands.append(
+            {
+                "stage": stage,
+                "command": command,
+                "outcome": outcome,
+                "wall_seconds": wall_seconds,
+                # e.g. "bench: utime=12.345s stime=0.456s rtime=6.789s", "bench: maxrss=123456KiB"
+                "benchmark": bench_lines,
+            }
+        )
+
+    def get_top_functions(self) -> list:
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        stats.sort_stats("cumulative")
+        top_functions = []
+        for function in stats.fcn_list[:TOP_FUNCTIONS_COUNT]:
+            primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[function]
+            filename, line, name = function
+            top_functions.append(
+                {
+                    "function": f"{os.path.basename(filename)}:{line}({name})",
+                    "calls": calls,
+                    "total_seconds": total_time,
+                    "cumulative_seconds": cumulative_time,
+                }
+            )
+        return top_functions
+
+    def write_artifacts(self, status: str) -> list:
+        """Write the profile and the JSON summary, returns their paths."""
+
+        profile_dir = os.path.join(str(settings.MOVIO_TASK_PROFILING_DIR), self.video_id)
+        os.makedirs(profile_dir, exist_ok=True)
+        base_path = os.path.join(profile_dir, f"{self.stage}-{self.task_id}")
+
+        summary = {
+            "video_id": self.video_id,
+            "task_id": self.task_id,
+            "task": self.task_name,
+            "stage": self.stage,
+            "status": status,
+            "mode": self.mode,
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "wall_seconds": self.wall_seconds,
+            "rusage_self": self.rusage_self,
+            "rusage_children": self.rusage_children,
+            "ffmpeg": self.ffmpeg_commands,
+        }
+
+        if self.mode == "sampling":
+            profile_path = base_path + ".folded"
+            self.profiler.write(profile_path)
+            summary["samples"] = sum(self.profiler.stacks.values())
+        else:
+            profile_path = base_path + ".prof"
+            self.profiler.dump_stats(profile_path)
+            summary["top_functions"] = self.get_top_functions()
+
+        summary_path = base_path + ".json"
+        with open(summary_path, "w") as summary_file:
+            json.dump(summary, summary_file, indent=4)
+
+        return [profile_path, summary_path]
+
+
+def upload_artifacts(video_id: str, paths: list) -> None:
+    from core_apps.common.s3_utils import get_s3_client
+
+    s3_client = get_s3_client()
+    for path in paths:
+        s3_client.upload_file(
+            Filename=path,
+            Bucket=settings.MOVIO_TASK_PROFILING_S3_BUCKET,
+            Key=f"{settings.MOVIO_TASK_PROFILING_S3_PREFIX}/{video_id}/{os.path.basename(path)}",
+        )
+        os.remove(path)
+
+
+def start_task_profile(task_id: str, task_name: str, stage: str, mq_data: dict) -> None:
+    if not is_profiling_enabled(mq_data):
+        return
+
+    try:
+        profile = TaskProfile(task_id, task_name, stage, mq_data.get("video_id") or "unknown")
+        profile.start()
+    except Exception as e:
+        # e.g. another profiler already active in this thread: the task runs without profiling
+        logger.warning(
+            f"\n[## TASK PROFILING WARNING]: Profiling Could Not Start.\nTask: {task_name}, Exception: {str(e)}"
+        )
+        return
+
+    _task_profiles[task_id] = profile
+    _local.profile = profile
+
+
+def finish_task_profile(task_id: str, status: str) -> None:
+    profile = _task_profiles.pop(task_id, None)
+    if profile is None:
+        return
+    _local.profile = None
+
+    # profiling must never fail the task
+    try:
+        profile.stop()
+        paths = profile.write_artifacts(status)
+        if settings.MOVIO_TASK_PROFILING_S3_BUCKET:
+            upload_artifacts(profile.video_id, paths)
+        logger.info(
+            f"\n[=> TASK PROFILING SUCCESS]: Task Profile Written.\nVideo ID: {profile.video_id}, Stage: {profile.stage}, Wall: {profile.wall_seconds:.2f} seconds."
+        )
+    except Exception as e:
+        logger.warning(
+            f"\n[## TASK PROFILING WARNING]: Task Profile Could Not Be Written.\nVideo ID: {profile.video_id}, Stage: {profile.stage}, Exception: {str(e)}"
+        )
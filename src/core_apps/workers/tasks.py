@@ -1,7 +1,7 @@
 import os
 import json
+import shutil
 import subprocess
-from lxml import etree
 
 import logging
 
@@ -11,10 +11,91 @@ from celery import shared_task, chain, group, chord  # noqa
 
 from botocore.exceptions import ClientError
 
+from core_apps.common.metrics import record_s3_bytes
+from core_apps.common.s3_checksums import (
+    S3IntegrityError,
+    download_file_with_checksum,
+    get_checksum_algorithm,
+    upload_file_with_checksum,
+)
+from core_apps.common.s3_rate_limit import get_retry_backoff_seconds
 from core_apps.common.s3_utils import get_s3_client
 from core_apps.mq_manager.to_api_service_producer import (
     video_process_result_publisher_mq,
 )
+from core_apps.mq_manager.admission_control import (
+    release_pending_download,
+    track_in_flight_encode,
+)
+from core_apps.mq_manager.dedupe import video_dedupe_window
+from core_apps.mq_manager.fair_dispatcher import mark_pipeline_finished
+from core_apps.mq_manager.priority_lanes import (
+    get_lane_routing_options,
+    record_lane_queue_delay,
+)
+from core_apps.workers.cancellation import (
+    PipelineCancelledError,
+    cleanup_cancelled_pipeline,
+    get_cancellation_reason,
+    publish_cancellation_result,
+)
+from core_apps.workers.dash_manifest import MANIFEST_FILE_NAME, DashManifest
+from core_apps.workers.ffmpeg_runner import (
+    FFmpegStalledError,
+    FFmpegTimeoutError,
+    format_ffmpeg_error,
+    run_ffmpeg,
+)
+from core_apps.workers.result_payload import build_subtitle_payload
+from core_apps.workers.scratch import (
+    get_scratch_routing_options,
+    place_segments_output,
+    place_transcode_output,
+)
+from core_apps.workers.pipeline_status import (
+    CANCELLED,
+    FAILED,
+    FINISHED,
+    record_pipeline_state,
+    record_segments_uploaded,
+    record_text_asset_compressed,
+    record_upload_total,
+)
+from core_apps.workers.source_hold import (
+    defer_source_video_delete,
+    release_source_video,
+)
+from core_apps.workers.subtitle_segments import (
+    get_subtitle_segments_dir,
+    write_subtitle_segments,
+)
+from core_apps.workers.text_assets import (
+    build_text_asset,
+    get_text_asset_type,
+    submit_text_asset_compression,
+    upload_text_asset,
+    upload_text_asset_file,
+)
+from core_apps.workers.transfer_manifest import (
+    TRANSFER_MANIFEST_FILE_NAME,
+    build_transfer_manifest,
+    record_transfers,
+)
+from core_apps.workers.translation import (
+    get_translator,
+    translate_vtt_file_to_languages,
+)
+from core_apps.workers.translation_memory import (
+    TranslationMemoryTranslator,
+    get_translation_memory,
+)
+from core_apps.workers.workspace import (
+    get_translated_cc_file_path,
+    release_video_workspace,
+    remove_workspace_file,
+    reserve_video_workspace,
+)
+from core_apps.workers.workspace_sweeper import sweep_orphaned_workspaces
 
 logger = logging.getLogger(__name__)
 
@@ -38,9 +119,17 @@ s3_client = get_s3_client()
         {
             'user_id': 'c29e7edc-fd8b-4fcc-9aa5-714a85ce75cb', 
             'email': 'iammahboob.a@gmail.com'
-        }
+        },
+
+    # optional, UNIX timestamp: the pipeline is cancelled once past the deadline
+    'deadline_at': 1726574814.0,
+
+    # set by the consumer, UNIX timestamp: a cancel of the video only applies to the submissions consumed before it
+    'consumed_at': 1726571214.0
 }
 
+Cancel Message (same exchange): {'message_type': 'cancel', 'video_id': '637b3737-ecf5-4b7d-b705-9d72b5a9a0f8'}
+
 
 """
 
@@ -76,9 +165,92 @@ def generate_chain_result(
     }
 
 
-@shared_task
-def download_video_from_s3(mq_data: dict):
-    """Download the User Uploaded video file from S3 Bucket"""
+def generate_cancelled_chain_result(mq_data: dict, cancelled_reason: str):
+    """Chain result of a cancelled pipeline, the next tasks skip it as any failure."""
+
+    logger.warning(
+        f"\n[## PIPELINE CANCELLED]: Video: {mq_data.get('video_id')}, Reason: {cancelled_reason}"
+    )
+    return generate_chain_result(
+        success=False,
+        exception="PipelineCancelledError",
+        error_message=f"video-process-{cancelled_reason}",
+        mq_data=mq_data,
+        cancelled_reason=cancelled_reason,
+    )
+
+
+def finish_video_pipeline(
+    mq_data: dict, success: bool, cancelled_reason: str = None
+) -> None:
+    """Called by the terminal tasks of the chain once a pipeline ends, successfully or not.
+
+    A cancelled pipeline is cleaned up (local files and S3 objects) and a cancellation result is published.
+    Whatever is left of the local workspace is removed and its disk budget released, on every path.
+    """
+
+    if cancelled_reason is not None:
+        try:
+            cleanup_cancelled_pipeline(mq_data)
+            publish_cancellation_result(mq_data, cancelled_reason)
+        except Exception as e:
+            logger.error(
+                f"\n[XX PIPELINE FINISH ERROR XX]: Cancelled Pipeline Cleanup Failed.\nException: {str(e)}"
+            )
+
+    if cancelled_reason is not None:
+        record_pipeline_state(mq_data, CANCELLED)
+    else:
+        record_pipeline_state(mq_data, FINISHED if success else FAILED)
+
+    release_video_workspace(mq_data)
+
+    mark_pipeline_finished(mq_data)
+
+    try:
+        video_dedupe_window.finish(mq_data, success=success)
+    except Exception as e:
+        logger.warning(
+            f"\n[## PIPELINE FINISH WARNING]: Dedupe Window Could Not Be Updated.\nException: {str(e)}"
+        )
+
+
+@shared_task(bind=True)
+def download_video_from_s3(self, mq_data: dict):
+    """Download the User Uploaded video file from S3 Bucket
+
+    The workspace of the video is reserved first, the download waits (task retried) while the disk budget of the node is full.
+    """
+
+    # first task of the chain: the time since the consumer dispatch is the lane queue delay
+    if self.request.retries == 0:
+        record_lane_queue_delay(mq_data)
+
+    cancelled_reason = get_cancellation_reason(mq_data)
+    if cancelled_reason is not None:
+        release_pending_download(mq_data.get("video_id"))
+        return generate_cancelled_chain_result(mq_data, cancelled_reason)
+
+    if not reserve_video_workspace(mq_data):
+        if self.request.retries < settings.MOVIO_WORKSPACE_RESERVE_MAX_RETRIES:
+            logger.warning(
+                f"\n[## Video Download Task WARNING]: Workspace Disk Budget Full.\nVideo ID: {mq_data.get('video_id')}, Retrying in: {settings.MOVIO_WORKSPACE_RESERVE_RETRY_SECONDS}."
+            )
+            raise self.retry(
+                countdown=settings.MOVIO_WORKSPACE_RESERVE_RETRY_SECONDS,
+                max_retries=settings.MOVIO_WORKSPACE_RESERVE_MAX_RETRIES,
+            )
+
+        release_pending_download(mq_data.get("video_id"))
+        logger.error(
+            f"\n\n[XX Video Download Task ERROR XX]: Workspace Disk Budget Still Full, Video Not Downloaded.\nVideo ID: {mq_data.get('video_id')}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="WorkspaceBudgetExceeded",
+            error_message="workspace-disk-budget-unavailable",
+            mq_data=mq_data,
+        )
 
     # video_filename_with_extention: 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2.mkv
     video_filename_with_extention = mq_data["video_filename_with_extention"]
@@ -93,11 +265,21 @@ def download_video_from_s3(mq_data: dict):
     )
 
     try:
-        s3_client.download_file(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME,  # movio-api-service uploads the user submitted videos to this bucket
-            Key=mq_data["s3_file_key"],
-            Filename=local_video_file_path,
-        )
+        if settings.MOVIO_S3_VERIFY_DOWNLOADS:
+            # checksummed as it streams, verified against the object: the source of the transfer manifest
+            mq_data["source_video_transfer"] = download_file_with_checksum(
+                s3_client,
+                settings.AWS_STORAGE_BUCKET_NAME,
+                mq_data["s3_file_key"],
+                local_video_file_path,
+            )
+        else:
+            s3_client.download_file(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,  # movio-api-service uploads the user submitted videos to this bucket
+                Key=mq_data["s3_file_key"],
+                Filename=local_video_file_path,
+            )
+        record_s3_bytes("download", os.path.getsize(local_video_file_path))
         logger.info(
             f"\n\n[=> Video Download Task SUCCESS]: Video Downloaded Successfully from S3.\nFile Name: {video_filename_with_extention}\nFile Path: {local_video_file_path}\n"
         )
@@ -121,6 +303,17 @@ def download_video_from_s3(mq_data: dict):
             mq_data=mq_data,
         )
 
+    except S3IntegrityError as e:
+        logger.error(
+            f"\n\n[XX Video Download Task ERROR XX]: Downloaded Video Doesn't Match the S3 Object.\nException: {str(e)}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="S3IntegrityError",
+            error_message=str(e),
+            mq_data=mq_data,
+        )
+
     except Exception as e:
         logger.error(
             f"\n\n[XX Video Download Task ERROR XX]: Video Could Not Be Downloaded from S3.\nGeneral Exception: {str(e)}\n"
@@ -132,6 +325,10 @@ def download_video_from_s3(mq_data: dict):
             mq_data=mq_data,
         )
 
+    finally:
+        # the file is on disk now (or failed), the admission control reservation is no longer needed
+        release_pending_download(mq_data.get("video_id"))
+
 
 @shared_task
 def delete_video_file_from_s3(preprocessed_data: dict):
@@ -141,6 +338,23 @@ def delete_video_file_from_s3(preprocessed_data: dict):
         return preprocessed_data
 
     try:
+        # the preview clip still reads the object: it deletes it as it ends
+        if defer_source_video_delete(preprocessed_data["mq_data"].get("video_id")):
+            logger.info(
+                f"\n\n[=> Video Deletion Task SUCCESS]: Video Deletion Deferred to the Preview Clip Task.\nFile Name: {preprocessed_data['video_filename_with_extention']}\n"
+            )
+            return generate_chain_result(
+                success=True,
+                success_message="video-file-delete-deferred",
+                delete_success=True,
+                delete_success_message="video-file-delete-deferred",
+                mq_data=preprocessed_data["mq_data"],
+                video_filename_with_extention=preprocessed_data[
+                    "video_filename_with_extention"
+                ],
+                local_video_file_path=preprocessed_data["local_video_file_path"],
+            )
+
         s3_client.delete_object(
             Bucket=settings.AWS_STORAGE_BUCKET_NAME,
             Key=preprocessed_data.get("mq_data").get("s3_file_key"),  # dict of dict
@@ -196,6 +410,12 @@ def extract_cc_from_video(self, preprocessed_data: dict):
     if preprocessed_data["success"] == False:
         return preprocessed_data
 
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
     # video_filename_with_extention: 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2.mkv
     video_filename_with_extention = preprocessed_data.get("mq_data").get(
         "video_filename_with_extention"
@@ -222,7 +442,7 @@ def extract_cc_from_video(self, preprocessed_data: dict):
     ]
 
     try:
-        subprocess.run(command, check=True)
+        run_ffmpeg(command, preprocessed_data["mq_data"], stage="extract-subtitle")
         logger.info(
             f"\n\n[=> SUBTITLE EXTRACTION SUCCESS]: Subtitle from Video Extraction Success of file: {video_filename_with_extention}\n"
         )
@@ -235,6 +455,21 @@ def extract_cc_from_video(self, preprocessed_data: dict):
             local_cc_file_path=local_cc_file_path,
         )
 
+    except PipelineCancelledError as e:
+        return generate_cancelled_chain_result(preprocessed_data["mq_data"], e.reason)
+
+    except (FFmpegStalledError, FFmpegTimeoutError) as e:
+        # killed by the watchdog: a retry would stall (or time out) the same way
+        logger.error(
+            f"\n\n[XX SUBTITLE EXTRACTION ERROR XX]: Subtitle from Video Extraction Killed, Not Retried.\nException: {str(e)}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception=type(e).__name__,
+            error_message=format_ffmpeg_error(e),
+            mq_data=preprocessed_data["mq_data"],
+        )
+
     except subprocess.CalledProcessError as e:
         logger.error(
             f"\n\n[XX SUBTITLE EXTRACTION ERROR XX]: Subtitle from Video Extraction Failed.\nException: {str(e)}\nRetrying...\n"
@@ -249,7 +484,7 @@ def extract_cc_from_video(self, preprocessed_data: dict):
         return generate_chain_result(
             success=False,
             exception="subprocess.CalledProcessError",
-            error_message=str(e),
+            error_message=format_ffmpeg_error(e),
             mq_data=preprocessed_data["mq_data"],
         )
     except Exception as e:
@@ -282,6 +517,12 @@ def upload_subtitle_to_translate_lambda(self, preprocessed_data: dict):
     if preprocessed_data["success"] == False:
         return preprocessed_data
 
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
     local_video_file_path = preprocessed_data["local_video_file_path"]
     local_cc_file_path = preprocessed_data["local_cc_file_path"]
     video_filename_with_extention = preprocessed_data.get("mq_data").get(
@@ -292,14 +533,23 @@ def upload_subtitle_to_translate_lambda(self, preprocessed_data: dict):
     cc_s3_file_key = video_filename_with_extention.split(".")[0] + ".vtt"
 
     try:
-        s3_client.upload_file(
-            Filename=local_cc_file_path,
-            Bucket=settings.AWS_MOVIO_S3_RAW_CC_SUBTITLE_BUCKET_NAME,  # subtitle bucket
-            Key=cc_s3_file_key,
-            ExtraArgs={
+        transfer_record = upload_file_with_checksum(
+            s3_client,
+            local_cc_file_path,
+            settings.AWS_MOVIO_S3_RAW_CC_SUBTITLE_BUCKET_NAME,  # subtitle bucket
+            cc_s3_file_key,
+            extra_args={
                 "ContentType": "text/vtt",
             },
         )
+        record_s3_bytes("upload", os.path.getsize(local_cc_file_path))
+        record_transfers(preprocessed_data["mq_data"], {cc_s3_file_key: transfer_record})
+        # referenced by the result message when too large to inline (result_payload)
+        preprocessed_data["mq_data"]["source_subtitle_s3"] = {
+            "bucket": settings.AWS_MOVIO_S3_RAW_CC_SUBTITLE_BUCKET_NAME,
+            "key": cc_s3_file_key,
+            "content_encoding": None,
+        }
         logger.info(
             f"\n\n[=>  SUBTITLE UPLOAD TO TRANSLATE LAMBDA SUCCESS]: Subtitle Upload to S3 Successful: {cc_s3_file_key}"
         )
@@ -315,9 +565,10 @@ def upload_subtitle_to_translate_lambda(self, preprocessed_data: dict):
             f"\n\n[XX SUBTITLE UPLOAD TO TRANSLATE LAMBDA ERROR XX]: Subtitle Could Not Be Uploaded to S3.\nException: {str(e)}\n"
         )
         if self.request.retries < self.max_retries:
-            retry_in = 2**self.request.retries
+            # jittered: the retries of the throttled uploads don't come back together
+            retry_in = get_retry_backoff_seconds(self.request.retries)
             logger.warning(
-                f"\n\n[## SUBTITLE UPLOAD TO TRANSLATE LAMBDA WARNING ]: ClientError: The Local Subtitle {cc_s3_file_key} Couldn't be Uploaded To S3.\nRetrying in: {retry_in}.\n"
+                f"\n\n[## SUBTITLE UPLOAD TO TRANSLATE LAMBDA WARNING ]: ClientError: The Local Subtitle {cc_s3_file_key} Couldn't be Uploaded To S3.\nRetrying in: {retry_in:.1f}.\n"
             )
             raise self.retry(exc=e, countdown=retry_in)
         else:
@@ -339,6 +590,160 @@ def upload_subtitle_to_translate_lambda(self, preprocessed_data: dict):
         )
 
 
+@shared_task
+def translate_subtitles(preprocessed_data: dict):
+    """Translate the Subtitles in the worker (settings.MOVIO_SUBTITLE_TRANSLATION_MODE = "worker").
+
+    The replacement of upload_subtitle_to_translate_lambda: the "en" vtt file is translated here
+    (see translation), no S3 event nor Lambda cold start. The vtt files are uploaded to the
+    same location as the Lambda's:
+        - Strucure: s3-bucket-name/subtitles/uuid__name/lang_en.vtt, lang_bn.vtt, lang_hi.vtt, lang_fr.vtt, lang_es.vtt
+
+    A language that fails is skipped (warning): the languages ready are set in the mq data
+    ("subtitle_languages") for the manifest and the result message.
+    """
+
+    if preprocessed_data["success"] == False:
+        return preprocessed_data
+
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
+    mq_data = preprocessed_data["mq_data"]
+    local_video_file_path = preprocessed_data["local_video_file_path"]
+    local_cc_file_path = preprocessed_data["local_cc_file_path"]
+
+    # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
+    raw_video_filename = mq_data["video_filename_with_extention"].split(".")[0]
+    source_language = settings.MOVIO_SUBTITLE_SOURCE_LANGUAGE
+
+    try:
+        translator = get_translator()
+        if settings.MOVIO_TRANSLATION_MEMORY_ENABLED:
+            # only the cue texts not in the translation memory are sent to the translator
+            translator = TranslationMemoryTranslator(translator, get_translation_memory())
+    except Exception as e:
+        logger.error(
+            f"\n\n[XX SUBTITLE TRANSLATION ERROR XX]: Translator Could Not Be Created.\nException: {str(e)}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="Exception",
+            error_message=str(e),
+            mq_data=mq_data,
+        )
+
+    # BASE_DIR/movio-local-cc-files/video_filename.bn.vtt
+    translated_file_paths = {
+        lang: get_translated_cc_file_path(local_cc_file_path, lang)
+        for lang in settings.MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES
+        if lang != source_language
+    }
+
+    subtitle_languages = []
+    try:
+        try:
+            # every batch of cues x language concurrently, a language that fails is skipped
+            translated, failed = translate_vtt_file_to_languages(
+                local_cc_file_path, translated_file_paths, source_language, translator
+            )
+            logger.info(
+                f"\n[=> SUBTITLE TRANSLATION]: Cues Translated: {translated}, Failed: {list(failed)}: {raw_video_filename}"
+            )
+            if isinstance(translator, TranslationMemoryTranslator):
+                logger.info(
+                    f"\n[=> TRANSLATION MEMORY]: {raw_video_filename}: {translator.get_stats()}"
+                )
+        except Exception as e:
+            # e.g. an invalid source subtitle: the source language only
+            translated = {}
+            logger.warning(
+                f"\n[## SUBTITLE TRANSLATION WARNING]: Subtitle Could Not Be Translated: {raw_video_filename}\nException: {str(e)}\n"
+            )
+
+        for lang in settings.MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES:
+            if lang != source_language and lang not in translated:
+                continue
+
+            cancelled_reason = get_cancellation_reason(mq_data)
+            if cancelled_reason is not None:
+                return generate_cancelled_chain_result(mq_data, cancelled_reason)
+
+            subtitle_file_path = translated_file_paths.get(lang, local_cc_file_path)
+            try:
+                subtitle_s3_file_key = f"{settings.AWS_MOVIO_S3_SUBTITLES_BUCKET_ROOT}/{raw_video_filename}/lang_{lang}.vtt"
+                if get_text_asset_type(subtitle_file_path) is not None:
+                    text_asset = upload_text_asset_file(
+                        s3_client,
+                        subtitle_file_path,
+                        settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                        subtitle_s3_file_key,
+                    )
+                    record_text_asset_compressed(
+                        mq_data, text_asset.original_bytes, text_asset.stored_bytes
+                    )
+                    transfer_record = text_asset.transfer_record
+                    content_encoding = text_asset.content_encoding
+                else:
+                    transfer_record = upload_file_with_checksum(
+                        s3_client,
+                        subtitle_file_path,
+                        settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                        subtitle_s3_file_key,
+                        extra_args={
+                            "ContentType": "text/vtt",
+                        },
+                    )
+                    record_s3_bytes("upload", os.path.getsize(subtitle_file_path))
+                    content_encoding = None
+                record_transfers(mq_data, {subtitle_s3_file_key: transfer_record})
+                subtitle_languages.append(lang)
+
+                if lang == source_language:
+                    # referenced by the result message when too large to inline (result_payload)
+                    mq_data["source_subtitle_s3"] = {
+                        "bucket": settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                        "key": subtitle_s3_file_key,
+                        "content_encoding": content_encoding,
+                    }
+            except Exception as e:
+                logger.warning(
+                    f"\n[## SUBTITLE TRANSLATION WARNING]: Subtitle Language {lang} Skipped: {raw_video_filename}\nException: {str(e)}\n"
+                )
+    finally:
+        for lang, subtitle_file_path in translated_file_paths.items():
+            # segmented delivery: kept for edit_manifest_to_add_subtitle_information
+            if settings.MOVIO_SUBTITLE_SEGMENTED_DELIVERY and lang in subtitle_languages:
+                continue
+            remove_workspace_file(subtitle_file_path)
+
+    if not subtitle_languages:
+        logger.error(
+            f"\n\n[XX SUBTITLE TRANSLATION ERROR XX]: No Subtitle Could Be Uploaded: {raw_video_filename}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="SubtitleTranslationError",
+            error_message="No subtitle language could be translated and uploaded.",
+            mq_data=mq_data,
+        )
+
+    mq_data["subtitle_languages"] = subtitle_languages
+    logger.info(
+        f"\n\n[=> SUBTITLE TRANSLATION SUCCESS]: Subtitles Translated and Uploaded: {raw_video_filename}, Languages: {subtitle_languages}"
+    )
+    return generate_chain_result(
+        success=True,
+        success_message="subtitle-translation-success",
+        mq_data=mq_data,
+        local_video_file_path=local_video_file_path,
+        local_cc_file_path=local_cc_file_path,
+    )
+
+
 @shared_task(bind=True, max_retries=3)
 def transcode_video_to_mp4(self, preprocessed_data: dict):
     """Transcode the video into mp4 for dash segmentation.
@@ -348,12 +753,19 @@ def transcode_video_to_mp4(self, preprocessed_data: dict):
     if preprocessed_data["success"] == False:
         return preprocessed_data
 
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
     local_video_file_path = preprocessed_data[
         "local_video_file_path"
     ]  # local video file path is the .mkv file path
-    local_mp4_video_file_path = (
-        local_video_file_path.split(".")[0] + ".mp4"
-    )  # discard .mkv and add .mp4
+    # .mp4 next to the .mkv, or in the RAM scratch (MOVIO_SCRATCH_RAM_MP4)
+    local_mp4_video_file_path = place_transcode_output(
+        self, preprocessed_data["mq_data"], local_video_file_path
+    )
 
     command = [
         "ffmpeg",
@@ -375,7 +787,12 @@ def transcode_video_to_mp4(self, preprocessed_data: dict):
     ]
 
     try:
-        subprocess.run(command, check=True)
+        with track_in_flight_encode(self.request.id):
+            run_ffmpeg(command, preprocessed_data["mq_data"], stage="transcode")
+
+        # the transcode is the last stage reading the source
+        remove_workspace_file(local_video_file_path)
+
         logger.info(
             f"\n[=> DASH TRANSCODE VIDEO SUCCESS]: Task {transcode_video_to_mp4.name}: FFmpeg command to transcode file - {local_video_file_path} executed successfully"
         )
@@ -387,6 +804,21 @@ def transcode_video_to_mp4(self, preprocessed_data: dict):
             local_mp4_video_file_path=local_mp4_video_file_path,
             local_cc_file_path=preprocessed_data["local_cc_file_path"],
         )
+    except PipelineCancelledError as e:
+        return generate_cancelled_chain_result(preprocessed_data["mq_data"], e.reason)
+
+    except (FFmpegStalledError, FFmpegTimeoutError) as e:
+        # killed by the watchdog: a retry would stall (or time out) the same way
+        logger.error(
+            f"\n[XX DASH TRANSCODE VIDEO ERROR XX]: Task {transcode_video_to_mp4.name}: FFmpeg command to transcode file - {local_video_file_path} killed, not retried\n[Exception]: {str(e)}"
+        )
+        return generate_chain_result(
+            success=False,
+            exception=type(e).__name__,
+            error_message=format_ffmpeg_error(e),
+            mq_data=preprocessed_data["mq_data"],
+        )
+
     except subprocess.CalledProcessError as e:
         logger.error(
             f"\n[XX DASH TRANSCODE VIDEO ERROR XX]: Task {transcode_video_to_mp4.name}: FFmpeg command to transcode file - {local_video_file_path}  failed\n[Exception]: {str(e)}"
@@ -401,7 +833,7 @@ def transcode_video_to_mp4(self, preprocessed_data: dict):
             return generate_chain_result(
                 success=False,
                 exception="subprocess.CalledProcessError",
-                error_message=str(e),
+                error_message=format_ffmpeg_error(e),
                 mq_data=preprocessed_data["mq_data"],
             )
     except Exception as e:
@@ -423,23 +855,19 @@ def dash_segment_video(self, preprocessed_data: dict):
     if preprocessed_data["success"] == False:
         return preprocessed_data
 
-    # video_filename_with_extention: 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2.mkv
-    video_filename_with_extention = preprocessed_data.get("mq_data").get(
-        "video_filename_with_extention"
-    )
-
-    # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
-    raw_video_filename = video_filename_with_extention.split(".")[0]
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
 
     local_mp4_video_file_path = preprocessed_data["local_mp4_video_file_path"]
 
-    # BASE_DIR / movio-local-video-files / tmp-segments / 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2 / manifest.mpd
-    mp4_segment_files_output_dir = os.path.join(
-        settings.MOVIO_LOCAL_VIDEO_STORAGE_SEGMENTS_ROOT_DIR, raw_video_filename
-    )
-
     # BASE_DIR / movio-local-video-files / tmp-segments / 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
-    os.makedirs(mp4_segment_files_output_dir, exist_ok=True)
+    # or MOVIO_SCRATCH_RAM_DIR / segments / 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2 when it fits the memory budget
+    mp4_segment_files_output_dir = place_segments_output(
+        self, preprocessed_data["mq_data"], local_mp4_video_file_path
+    )
 
     logger.info(
         f"\n\n[=> DASH SEGMENT VIDEO STARTED]: DASH Segmentation Started for Video File: {local_mp4_video_file_path}"
@@ -478,16 +906,31 @@ def dash_segment_video(self, preprocessed_data: dict):
         "-use_template",
         "1",
         "-seg_duration",
-        "4",
+        str(settings.MOVIO_DASH_SEGMENT_DURATION_SECONDS),
         "-adaptation_sets",
         "id=0,streams=v id=1,streams=a",
         "-f",
         "dash",
-        os.path.join(mp4_segment_files_output_dir, "manifest.mpd"),
+        os.path.join(mp4_segment_files_output_dir, MANIFEST_FILE_NAME),
     ]
 
     try:
-        subprocess.run(command, check=True)
+        with track_in_flight_encode(self.request.id):
+            run_ffmpeg(command, preprocessed_data["mq_data"], stage="dash-segment")
+
+        # the only parse of the MPD: the next stages get the manifest and its segment index in memory
+        ffmpeg_manifest_path = os.path.join(mp4_segment_files_output_dir, MANIFEST_FILE_NAME)
+        dash_manifest = DashManifest.from_ffmpeg_output(
+            ffmpeg_manifest_path, mp4_segment_files_output_dir
+        )
+        remove_workspace_file(ffmpeg_manifest_path)
+
+        # the segments are the only input of the next stages
+        remove_workspace_file(local_mp4_video_file_path)
+
+        logger.info(
+            f"\n[=> DASH SEGMENT VIDEO]: Segment Index: {dash_manifest.get_summary()}"
+        )
 
         logger.info(
             f"\n[=> DASH SEGMENT VIDEO SUCCESS]: Task {dash_segment_video.name}: FFmpeg command executed successfully"
@@ -500,8 +943,12 @@ def dash_segment_video(self, preprocessed_data: dict):
             local_mp4_video_file_path=local_mp4_video_file_path,
             mp4_segment_files_output_dir=mp4_segment_files_output_dir,
             local_cc_file_path=preprocessed_data["local_cc_file_path"],
+            dash_manifest=dash_manifest.to_dict(),
         )
 
+    except PipelineCancelledError as e:
+        return generate_cancelled_chain_result(preprocessed_data["mq_data"], e.reason)
+
     except subprocess.CalledProcessError as e:
         logger.error(
             f"\n[XX DASH SEGMENT VIDEO CalledProcessError ERROR XX]: Task {dash_segment_video.name}: FFmpeg command failed\n[Exception]: {e}"
@@ -509,7 +956,7 @@ def dash_segment_video(self, preprocessed_data: dict):
         return generate_chain_result(
             success=False,
             exception="subprocess.CalledProcessError",
-            error_message=str(e),
+            error_message=format_ffmpeg_error(e),
             mq_data=preprocessed_data["mq_data"],
         )
 
@@ -527,71 +974,88 @@ def dash_segment_video(self, preprocessed_data: dict):
 
 @shared_task
 def edit_manifest_to_add_subtitle_information(preprocessed_data: dict):
-    """Edit manifest file to add subtitle information."""
+    """Edit manifest file to add subtitle information.
+
+    The manifest is the in-memory one of dash_segment_video (dash_manifest), the final MPD is generated and uploaded after the segments.
+    """
 
     if preprocessed_data["success"] == False:
         return preprocessed_data
 
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
     mp4_segment_files_output_dir = preprocessed_data["mp4_segment_files_output_dir"]
-    manifest_path = os.path.join(mp4_segment_files_output_dir, "manifest.mpd")
     local_video_file_path = preprocessed_data["local_video_file_path"]
 
     # BASE_DIR / movio-local-video-files / tmp-segments / 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2 / manifest.mpd
     # get uuid_name: 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2 part
     local_video_file_name = os.path.basename(local_video_file_path).split(".")[0]
 
-    def add_subtitle_information(manifest_path):
-        """Add subtitle information to manifest file."""
+    def add_subtitle_information(dash_manifest: DashManifest):
+        """Add subtitle information to the manifest (in memory, with the subtitle segments in its index)."""
 
-        # See more on the aws lamdcda code for the subtitles strucutere
-        tree = etree.parse(manifest_path)
-        root = tree.getroot()
+        # the number of subtitle segments (segmented delivery)
+        duration_seconds = dash_manifest.duration_seconds
+        segmented_languages = []
 
-        ns = {"mpd": "urn:mpeg:dash:schema:mpd:2011"}
-
-        period = root.find(".//mpd:Period", namespaces=ns)
-
-        for lang in settings.MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES:
-
-            adaptation_set = etree.Element(
-                "AdaptationSet",
-                {
-                    "id": str(len(period) + 1),
-                    "mimeType": "text/vtt",
-                    "lang": lang,
-                    "contentType": "text",
-                },
-            )
-
-            role = etree.SubElement(
-                adaptation_set,
-                "Role",
-                {"schemeIdUri": "urn:mpeg:dash:role:2011", "value": "subtitle"},
-            )
-
-            representation = etree.SubElement(
-                adaptation_set,
-                "Representation",
-                {
-                    "id": f"subtitle-{lang}",
-                    "bandwidth": "256",
-                },
-            )
-
-            base_url = etree.SubElement(representation, "BaseURL")
+        # the languages translated in the worker, all the target languages for the Lambda
+        subtitle_languages = preprocessed_data["mq_data"].get("subtitle_languages")
+        if subtitle_languages is None:
+            subtitle_languages = settings.MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES
 
+        for lang in subtitle_languages:
             # s3 bucket mpd location: bucket_name/segments/uuid_videoname/manifest.mpd
             #  s3 bucket subtitle location: bucket_name/subtitles/uuid_videoname/lang_en.vtt
-            base_url.text = f"../../subtitles/{local_video_file_name}/lang_{lang}.vtt"
-
-            period.append(adaptation_set)
+            base_url = f"../../subtitles/{local_video_file_name}/lang_{lang}.vtt"
+            segment_files = None
+
+            # the subtitles available locally: the extracted one, the ones translated in the worker
+            if lang == settings.MOVIO_SUBTITLE_SOURCE_LANGUAGE:
+                subtitle_file_path = preprocessed_data["local_cc_file_path"]
+            else:
+                subtitle_file_path = get_translated_cc_file_path(
+                    preprocessed_data["local_cc_file_path"], lang
+                )
 
-        tree.write(
-            manifest_path, pretty_print=True, xml_declaration=True, encoding="utf-8"
-        )
+            if (
+                settings.MOVIO_SUBTITLE_SEGMENTED_DELIVERY
+                and duration_seconds
+                and os.path.exists(subtitle_file_path)
+            ):
+                try:
+                    segment_files = [
+                        [os.path.relpath(path, mp4_segment_files_output_dir), size, seconds]
+                        for path, size, seconds in write_subtitle_segments(
+                            subtitle_file_path,
+                            get_subtitle_segments_dir(mp4_segment_files_output_dir, lang),
+                            duration_seconds,
+                        )
+                    ]
+                    # uploaded with the segments: bucket_name/segments/uuid_videoname/subtitles/lang_en/seg-00001.vtt
+                    base_url = f"subtitles/lang_{lang}/"
+                    segmented_languages.append(lang)
+                except Exception as e:
+                    logger.warning(
+                        f"\n[## EDIT MANIFEST TO ADD SUBTITLE INFORMATION WARNING]: Subtitle {lang} Not Segmented, Whole File Kept.\nException: {str(e)}"
+                    )
+
+                if lang != settings.MOVIO_SUBTITLE_SOURCE_LANGUAGE:
+                    remove_workspace_file(subtitle_file_path)
+
+            dash_manifest.add_subtitle(lang, base_url, segment_files)
+
+        if segmented_languages:
+            logger.info(
+                f"\n[=> EDIT MANIFEST TO ADD SUBTITLE INFORMATION]: Segmented Subtitles: {segmented_languages}"
+            )
 
     try:
-        add_subtitle_information(manifest_path)
+        dash_manifest = DashManifest.from_dict(preprocessed_data["dash_manifest"])
+        add_subtitle_information(dash_manifest)
 
         logger.info(
             f"\n[=> EDIT MANIFEST TO ADD SUBTITLE INFORMATION SUCCESS]: Task {edit_manifest_to_add_subtitle_information.name}: Edit and Add Subtitle Information is Success"
@@ -604,6 +1068,7 @@ def edit_manifest_to_add_subtitle_information(preprocessed_data: dict):
             local_mp4_video_file_path=preprocessed_data["local_mp4_video_file_path"],
             mp4_segment_files_output_dir=mp4_segment_files_output_dir,
             local_cc_file_path=preprocessed_data["local_cc_file_path"],
+            dash_manifest=dash_manifest.to_dict(),
         )
     except Exception as e:
         logger.error(
@@ -619,53 +1084,124 @@ def edit_manifest_to_add_subtitle_information(preprocessed_data: dict):
 
 # Sub Task to upload segments as batch upload to S3 (created by: upload_dash_segments_to_s3_and_publish_message_callback task)
 @shared_task(bind=True, max_retries=5)
-def upload_segment_batch_to_s3_sub_task(self, segment_batch: list):
-    """Batch upload of segments in S3."""
+def upload_segment_batch_to_s3_sub_task(
+    self, segment_batch: list, mq_data: dict = None
+):
+    """Batch upload of segments in S3.
+
+    mq_data: the batch stops as soon as the pipeline is cancelled.
+    Each local segment is removed once its upload is confirmed, a retry uploads the rest of the batch only:
+    a batch with a segment failed for good is not retried, it fails.
+    The text assets (manifest, subtitle segments) are stored compressed (text_assets), the .m4s segments as they are.
+    The segments are checksummed as they upload (s3_checksums) and checked against their size in the segment
+    index, the checksums of the batch are recorded in the transfer manifest of the video as it ends.
+    """
 
     failed_segment_uploads = {}
+    transfer_records = {}
 
     total_segments = len(segment_batch)
     uploaded_segments = 0
 
-    for local_single_segment_path, s3_file_path in segment_batch:
-        try:
-            s3_client.upload_file(
-                Filename=local_single_segment_path,
-                Bucket=settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
-                Key=s3_file_path,
-            )
-            uploaded_segments += 1
-            upload_progress = (uploaded_segments / total_segments) * 100
-
-            logger.info(
-                f"[=> SEGMENT S3 BATCH UPLOAD PROGRESS]: {upload_progress:.2f}% ({uploaded_segments}/{total_segments}).\nUploaded Chunk: {os.path.basename(s3_file_path)}"
-            )
+    # the text assets (manifest, subtitle segments) are compressed in the pool while the binary
+    # segments upload: they go last (a retry keeps the order, the rest of the batch is a suffix).
+    segment_batch = sorted(
+        segment_batch, key=lambda segment: get_text_asset_type(segment[0]) is not None
+    )
+    compressed_text_assets = submit_text_asset_compression(
+        segment[0] for segment in segment_batch
+    )
 
-        except FileNotFoundError as e:
-            failed_segment_uploads[s3_file_path] = str(e)
-            logger.exception(
-                f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: The Local Segment File: {local_single_segment_path} was not Found.\nException: {str(e)}"
-            )
+    try:
+        for segment_index, segment in enumerate(segment_batch):
+            # (local path, s3 key, bytes in the segment index)
+            local_single_segment_path, s3_file_path = segment[:2]
+            expected_size = segment[2] if len(segment) > 2 else None
 
-        except ClientError as e:
-            logger.warning(
-                f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: S3 Client Error.\nException: {str(e)}\nRetrying to upload: {local_single_segment_path}"
-            )
-            if self.request.retries < self.max_retries:
-                retry_in = 2**self.request.retries
+            if mq_data is not None and get_cancellation_reason(mq_data) is not None:
                 logger.warning(
-                    f"\n[## SEGMENT S3 BATCH UPLOAD WARNING ]: Chunk {os.path.basename(s3_file_path)} Couldn't be Uploaded.\nRetrying in: {retry_in}."
+                    f"\n[## SEGMENT S3 BATCH UPLOAD WARNING ]: Pipeline Cancelled, Batch Upload Stopped at ({uploaded_segments}/{total_segments})."
+                )
+                return "cancelled"
+
+            try:
+                if local_single_segment_path in compressed_text_assets:
+                    text_asset = compressed_text_assets[local_single_segment_path].result()
+                    upload_text_asset(
+                        s3_client,
+                        text_asset,
+                        settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                        s3_file_path,
+                    )
+                    transfer_records[s3_file_path] = text_asset.transfer_record
+                    remove_workspace_file(local_single_segment_path)
+                    if mq_data is not None:
+                        record_text_asset_compressed(
+                            mq_data, text_asset.original_bytes, text_asset.stored_bytes
+                        )
+                else:
+                    transfer_records[s3_file_path] = upload_file_with_checksum(
+                        s3_client,
+                        local_single_segment_path,
+                        settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+                        s3_file_path,
+                        expected_size=expected_size,
+                    )
+                    record_s3_bytes("upload", remove_workspace_file(local_single_segment_path))
+                uploaded_segments += 1
+                if mq_data is not None:
+                    record_segments_uploaded(mq_data)
+                upload_progress = (uploaded_segments / total_segments) * 100
+
+                logger.info(
+                    f"[=> SEGMENT S3 BATCH UPLOAD PROGRESS]: {upload_progress:.2f}% ({uploaded_segments}/{total_segments}).\nUploaded Chunk: {os.path.basename(s3_file_path)}"
                 )
-                raise self.retry(exc=e, countdown=retry_in)
 
-            # only count as failed segment when the max retries is exceeded.
-            failed_segment_uploads[s3_file_path] = str(e)
+            except FileNotFoundError as e:
+                failed_segment_uploads[s3_file_path] = str(e)
+                logger.exception(
+                    f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: The Local Segment File: {local_single_segment_path} was not Found.\nException: {str(e)}"
+                )
 
-        except Exception as e:
-            failed_segment_uploads[s3_file_path] = str(e)
-            logger.exception(
-                f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: Unexpected Error Occurred. Segments couldn't be uploaded to S3.\nException: {str(e)}"
-            )
+            except S3IntegrityError as e:
+                # a segment truncated or rewritten on the disk: a retry would upload the same bytes
+                failed_segment_uploads[s3_file_path] = str(e)
+                logger.error(
+                    f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: Uploaded Segment Doesn't Match the Segment Index.\nException: {str(e)}"
+                )
+
+            except ClientError as e:
+                if failed_segment_uploads:
+                    # the batch already failed (missing or corrupt segment): a retry of the rest can't make it whole
+                    failed_segment_uploads[s3_file_path] = str(e)
+                    break
+
+                logger.warning(
+                    f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: S3 Client Error.\nException: {str(e)}\nRetrying to upload: {local_single_segment_path}"
+                )
+                if self.request.retries < self.max_retries:
+                    # jittered: the batches throttled by the same SlowDown storm don't retry together
+                    retry_in = get_retry_backoff_seconds(self.request.retries)
+                    logger.warning(
+                        f"\n[## SEGMENT S3 BATCH UPLOAD WARNING ]: Chunk {os.path.basename(s3_file_path)} Couldn't be Uploaded.\nRetrying in: {retry_in:.1f}."
+                    )
+                    raise self.retry(
+                        args=(segment_batch[segment_index:], mq_data),
+                        exc=e,
+                        countdown=retry_in,
+                    )
+
+                # only count as failed segment when the max retries is exceeded.
+                failed_segment_uploads[s3_file_path] = str(e)
+
+            except Exception as e:
+                failed_segment_uploads[s3_file_path] = str(e)
+                logger.exception(
+                    f"\n[XX SEGMENT S3 BATCH UPLOAD ERROR XX]: Unexpected Error Occurred. Segments couldn't be uploaded to S3.\nException: {str(e)}"
+                )
+    finally:
+        # the uploads confirmed, also when the batch stops (retried or cancelled)
+        record_transfers(mq_data, transfer_records)
 
     # Result of batch upload.
     if failed_segment_uploads:
@@ -686,14 +1222,31 @@ def upload_dash_segments_to_s3_and_publish_message_callback(preprocessed_data: d
     """
     upload_dash_segments_to_s3_and_publish_message_callback: Main Entrypoint function to upload local single segment file by batch processing in S3 Bucket.
 
-    The task create batches of 10 segments and creates task as group.
+    The task create batches of 10 segments (the files of the segment index of the manifest) and creates task as group.
     The task uses a chord to upload the segments batches, and a chain of tasks as the callback of the chord.
     The callback chain of tasks includes: publish message to mq and delete local files tasks.
     """
 
     if preprocessed_data["success"] == False:
+        # last task of the chain: a failed (or cancelled) pipeline ends here
+        finish_video_pipeline(
+            preprocessed_data["mq_data"],
+            success=False,
+            cancelled_reason=preprocessed_data.get("cancelled_reason"),
+        )
         return preprocessed_data
 
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        finish_video_pipeline(
+            preprocessed_data["mq_data"],
+            success=False,
+            cancelled_reason=cancelled_reason,
+        )
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
     local_video_file_path = preprocessed_data["local_video_file_path"]
     local_mp4_video_file_path = preprocessed_data["local_mp4_video_file_path"]
     mp4_segment_files_output_dir = preprocessed_data["mp4_segment_files_output_dir"]
@@ -717,18 +1270,23 @@ def upload_dash_segments_to_s3_and_publish_message_callback(preprocessed_data: d
         current_batch = []
         segment_batch_size = 10
 
-        for root, dirs, files in os.walk(mp4_segment_files_output_dir):
-            for file in files:
-                local_single_segment_path = os.path.join(root, file)
-                s3_file_key = os.path.join(s3_main_file_path, file)
+        # the work list is the segment index of the manifest (the MPD itself is uploaded last, by the publish task)
+        dash_manifest = DashManifest.from_dict(preprocessed_data["dash_manifest"])
+        for relative_segment_path, size_bytes in dash_manifest.get_files():
+            local_single_segment_path = os.path.join(
+                mp4_segment_files_output_dir, relative_segment_path
+            )
+            # the subtitle segments are in subdirectories: subtitles/lang_bn/seg-00001.vtt
+            s3_file_key = os.path.join(s3_main_file_path, relative_segment_path)
 
-                # Tuple[0]: local single segment file path.
-                # Tuple[1]: s3 file path for s3 bucket
-                current_batch.append((local_single_segment_path, s3_file_key))
+            # Tuple[0]: local single segment file path.
+            # Tuple[1]: s3 file path for s3 bucket
+            # Tuple[2]: bytes of the file in the segment index (checked by the upload)
+            current_batch.append((local_single_segment_path, s3_file_key, size_bytes))
 
-                if len(current_batch) >= segment_batch_size:
-                    segment_batchs.append(current_batch)
-                    current_batch = []
+            if len(current_batch) >= segment_batch_size:
+                segment_batchs.append(current_batch)
+                current_batch = []
 
         # If the segment_batch size is < 10
         if current_batch:
@@ -742,18 +1300,34 @@ def upload_dash_segments_to_s3_and_publish_message_callback(preprocessed_data: d
             local_mp4_video_file_path=local_mp4_video_file_path,
             mp4_segment_files_output_dir=mp4_segment_files_output_dir,
             local_cc_file_path=local_cc_file_path,
+            dash_manifest=preprocessed_data["dash_manifest"],
+            upload_batch_count=len(segment_batchs),
+        )
+
+        # the segments and the manifest
+        record_upload_total(
+            preprocessed_data["mq_data"],
+            sum(len(single_batch) for single_batch in segment_batchs) + 1,
+        )
+
+        # the upload tasks stay in the priority lane of the submission (on the worker of a RAM scratch)
+        lane_routing_options = get_scratch_routing_options(
+            preprocessed_data["mq_data"],
+            get_lane_routing_options(preprocessed_data["mq_data"]),
         )
 
         # using group to upload all the segments parallely
         segment_upload_group = group(
-            upload_segment_batch_to_s3_sub_task.s(single_batch)
+            upload_segment_batch_to_s3_sub_task.s(
+                single_batch, preprocessed_data["mq_data"]
+            ).set(**lane_routing_options)
             for single_batch in segment_batchs
         )
 
         # Callback chain for the chord: publish mq message, and dlete local files.
         callback_chain = chain(
-            publish_video_process_message_mq.s(data),
-            local_file_cleanup_callback.s(data),
+            publish_video_process_message_mq.s(data).set(**lane_routing_options),
+            local_file_cleanup_callback.s(data).set(**lane_routing_options),
         )
 
         # using chord so that cleanup task is only executed when all the upload tasks are completed.
@@ -772,6 +1346,7 @@ def upload_dash_segments_to_s3_and_publish_message_callback(preprocessed_data: d
         logger.error(
             f"\n[XX MAIN DASH SEGMENTS BATCH S3 UPLOAD ERROR XX]: Unexpected Error Occurred.\nException: {str(e)}"
         )
+        finish_video_pipeline(preprocessed_data["mq_data"], success=False)
         return generate_chain_result(
             success=False,
             success_message="DASH Segments Batch Creation for S3 Upload Failed.",
@@ -783,10 +1358,36 @@ def upload_dash_segments_to_s3_and_publish_message_callback(preprocessed_data: d
         )
 
 
+def upload_transfer_manifest(mq_data: dict, s3_key: str, extra_records: dict) -> None:
+    """Upload the checksums of the transfers of the video (transfer_manifest), next to the MPD.
+
+    Not part of the delivery: a failure is logged, the result is published.
+    """
+
+    if get_checksum_algorithm() is None:
+        return
+
+    try:
+        body = json.dumps(build_transfer_manifest(mq_data, extra_records)).encode("utf-8")
+        s3_client.put_object(
+            Bucket=settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+            Key=s3_key,
+            Body=body,
+            ContentType="application/json",
+        )
+        record_s3_bytes("upload", len(body))
+    except Exception as e:
+        logger.warning(
+            f"\n[## TRANSFER MANIFEST WARNING]: Transfer Manifest Not Uploaded: {s3_key}\nException: {str(e)}"
+        )
+
+
 @shared_task
 def publish_video_process_message_mq(results, preprocessed_data: dict):
     """Publish Video Process Message to MQ to be Consumed by Movio-API-Service
 
+    Once every segment batch is uploaded, the manifest is uploaded (last), then the message is published.
+
     Callback Chain:
         The first task of the callback chain: publish_video_process_message_mq
         The second task of the callback chain:  local_file_cleanup_callback
@@ -796,40 +1397,108 @@ def publish_video_process_message_mq(results, preprocessed_data: dict):
     if preprocessed_data["success"] == False:
         return preprocessed_data
 
+    cancelled_reason = get_cancellation_reason(preprocessed_data["mq_data"])
+    if cancelled_reason is not None:
+        return generate_cancelled_chain_result(
+            preprocessed_data["mq_data"], cancelled_reason
+        )
+
     local_video_file_path = preprocessed_data["local_video_file_path"]
     video_filename_wothout_extention = os.path.basename(local_video_file_path).split(
         "."
     )[0]
     local_cc_file_path = preprocessed_data["local_cc_file_path"]
 
-    if os.path.exists(local_cc_file_path):
-        with open(local_cc_file_path, "r") as subtitle_file:
-            subtitle_en_vtt_data = subtitle_file.read()
-    else:
-        subtitle_en_vtt_data = None
+    # completeness: every file of the segment index uploaded (the work list of the batches), before the manifest is
+    failed_batches = [result for result in results if result != "success"]
+    if failed_batches or len(results) != preprocessed_data.get("upload_batch_count"):
+        logger.error(
+            f"\n\n[XX MESSAGE PUBLISH TO MQ ERROR XX]: Segment Upload Incomplete, Manifest Not Uploaded and Result Not Published.\nBatches: {len(results)}/{preprocessed_data.get('upload_batch_count')}, Not Successful: {failed_batches}"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="IncompleteSegmentUploadError",
+            error_message="Some segments of the manifest couldn't be uploaded.",
+            mq_data=preprocessed_data["mq_data"],
+            local_video_file_path=local_video_file_path,
+            local_mp4_video_file_path=preprocessed_data["local_mp4_video_file_path"],
+            mp4_segment_files_output_dir=preprocessed_data[
+                "mp4_segment_files_output_dir"
+            ],
+            local_cc_file_path=local_cc_file_path,
+        )
 
     # s3 manifest.mpd file location:
+    s3_manifest_file_key = f"{settings.AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT}/{video_filename_wothout_extention}/{MANIFEST_FILE_NAME}"
     s3_manifest_file_url = (
         f"https://{settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME}.s3.amazonaws.com/"
-        f"{settings.AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT}/{video_filename_wothout_extention}/manifest.mpd"
+        f"{s3_manifest_file_key}"
     )
 
     mq_data_to_publish = {
+        "message_type": "video-process-result",
         "video_id": preprocessed_data.get("mq_data").get("video_id"),
         "user_id": preprocessed_data.get("mq_data").get("user_data").get("user_id"),
         "email": preprocessed_data.get("mq_data").get("user_data").get("email"),
         "video_filename_wothout_extention": video_filename_wothout_extention, 
         "s3_manifest_file_url": s3_manifest_file_url,
-        "subtitle_en_vtt_data": subtitle_en_vtt_data,
+        # inlined (encoded) or referenced by its S3 object, by size: result_payload
+        **build_subtitle_payload(
+            local_cc_file_path,
+            preprocessed_data.get("mq_data").get("source_subtitle_s3"),
+        ),
+        # None when translated by the Lambda (not known here)
+        "subtitle_languages": preprocessed_data.get("mq_data").get("subtitle_languages"),
     }
 
     try:
+        # the final MPD, generated from the in-memory manifest: players never get a manifest before its segments
+        manifest_asset = build_text_asset(
+            MANIFEST_FILE_NAME,
+            DashManifest.from_dict(preprocessed_data["dash_manifest"]).to_bytes(),
+        )
+        upload_text_asset(
+            s3_client,
+            manifest_asset,
+            settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+            s3_manifest_file_key,
+        )
+        record_segments_uploaded(preprocessed_data["mq_data"])
+        record_text_asset_compressed(
+            preprocessed_data["mq_data"],
+            manifest_asset.original_bytes,
+            manifest_asset.stored_bytes,
+        )
+        upload_transfer_manifest(
+            preprocessed_data["mq_data"],
+            f"{settings.AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT}/{video_filename_wothout_extention}/{TRANSFER_MANIFEST_FILE_NAME}",
+            {s3_manifest_file_key: manifest_asset.transfer_record},
+        )
+
         # dict to json
         mq_data_to_publish = json.dumps(mq_data_to_publish)
 
-        video_process_result_publisher_mq.publish_data(
-            video_process_data=mq_data_to_publish
+        is_published, message = video_process_result_publisher_mq.publish_data(
+            video_process_data=mq_data_to_publish,
+            message_type="video-process-result",
         )
+        if not is_published:
+            # a failed pipeline: the dedupe key is released, a resubmission of the video is processed again
+            logger.error(
+                f"\n\n[XX MESSAGE PUBLISH TO MQ ERROR XX]: Video Process Message Not Published: {message}"
+            )
+            return generate_chain_result(
+                success=False,
+                exception="MQPublishError",
+                error_message=message,
+                mq_data=preprocessed_data["mq_data"],
+                local_video_file_path=local_video_file_path,
+                local_mp4_video_file_path=preprocessed_data["local_mp4_video_file_path"],
+                mp4_segment_files_output_dir=preprocessed_data[
+                    "mp4_segment_files_output_dir"
+                ],
+                local_cc_file_path=local_cc_file_path,
+            )
 
         logger.info(
             f"\n\n[=> MESSAGE PUBLISH TO MQ SUCCESS]: Video Process Message Published to MQ Success.\n"
@@ -921,10 +1590,8 @@ def local_file_cleanup_callback(results, preprocessed_data):
         )
 
     try:
-        for root, dirs, files in os.walk(mp4_segment_files_output_dir):
-            for file in files:
-                os.remove(os.path.join(root, file))
-        os.rmdir(mp4_segment_files_output_dir)
+        # the subtitle segments are in subdirectories
+        shutil.rmtree(mp4_segment_files_output_dir)
 
         local_segments_cleanup_success = True
         logger.info(
@@ -938,6 +1605,15 @@ def local_file_cleanup_callback(results, preprocessed_data):
             """
         )
 
+    # the pipeline is done: results is the return of publish_video_process_message_mq
+    finish_video_pipeline(
+        preprocessed_data["mq_data"],
+        success=isinstance(results, dict) and results.get("success", False),
+        cancelled_reason=(
+            results.get("cancelled_reason") if isinstance(results, dict) else None
+        ),
+    )
+
     return generate_chain_result(
         success=True,
         success_message="Local File Cleanup Success.",
@@ -951,4 +1627,238 @@ def local_file_cleanup_callback(results, preprocessed_data):
     )
 
 
+# Fast lane task: dispatched with the main chain (mq_callback.dispatch_video_pipeline), in parallel with it.
+@shared_task(bind=True, max_retries=2)
+def generate_video_preview_clip(self, mq_data: dict):
+    """Generate a short, low resolution preview clip ahead of the full pipeline.
+
+    Only the first MOVIO_PREVIEW_CLIP_DURATION_SECONDS of the video are encoded with a fast preset.
+    ffmpeg reads the S3 object through a presigned url, so the task doesn't wait for the full download.
+    The consumer holds the object for the task (source_hold): the chain defers its delete, and the task
+    deletes the object as it ends. A missing object (404 / NoSuchKey) is a failure, not retried.
+
+    Once uploaded to S3, a "video-preview" message is published on the video process result exchange.
+    The task is routed to the dedicated MOVIO_PREVIEW_CELERY_QUEUE queue.
+    """
+
+    # video_filename_with_extention: 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2.mkv
+    video_filename_with_extention = mq_data["video_filename_with_extention"]
+
+    # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
+    raw_video_filename = video_filename_with_extention.split(".")[0]
+
+    # BASE_DIR / movio-local-video-files / tmp-previews
+    os.makedirs(settings.MOVIO_LOCAL_VIDEO_STORAGE_PREVIEW_DIR, exist_ok=True)
+
+    # BASE_DIR / movio-local-video-files / tmp-previews / 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2.mp4
+    local_preview_file_path = os.path.join(
+        settings.MOVIO_LOCAL_VIDEO_STORAGE_PREVIEW_DIR, f"{raw_video_filename}.mp4"
+    )
+
+    # bucket/previews/uuid__videoname/preview.mp4
+    s3_preview_file_key = f"{settings.AWS_MOVIO_S3_PREVIEWS_BUCKET_ROOT}/{raw_video_filename}/preview.mp4"
+
+    # the hold is kept for the retries, released (and the deferred delete done) once the task ends
+    is_retrying = False
+
+    try:
+        # the object is gone if the hold could not be set: a ClientError (404), not an ffmpeg retry
+        s3_client.head_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=mq_data["s3_file_key"]
+        )
+
+        # a fresh presigned url, the one in the mq data might already be expired.
+        s3_presigned_url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": settings.AWS_STORAGE_BUCKET_NAME,
+                "Key": mq_data["s3_file_key"],
+            },
+            ExpiresIn=600,
+        )
+
+        command = [
+            "ffmpeg",
+            "-t",
+            str(settings.MOVIO_PREVIEW_CLIP_DURATION_SECONDS),
+            "-i",
+            s3_presigned_url,
+            "-map",
+            "0:v:0",
+            "-map",
+            "0:a:0?",
+            "-s:v",
+            settings.MOVIO_PREVIEW_CLIP_RESOLUTION,
+            "-c:v",
+            "libx264",
+            "-preset",
+            settings.MOVIO_PREVIEW_CLIP_FFMPEG_PRESET,
+            "-crf",
+            "30",
+            "-c:a",
+            "aac",
+            "-b:a",
+            "64k",
+            "-movflags",
+            "+faststart",
+            "-y",
+            local_preview_file_path,
+        ]
+
+        run_ffmpeg(
+            command,
+            mq_data,
+            stage="preview-clip",
+            duration_seconds=settings.MOVIO_PREVIEW_CLIP_DURATION_SECONDS,
+        )
+
+        transfer_record = upload_file_with_checksum(
+            s3_client,
+            local_preview_file_path,
+            settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME,
+            s3_preview_file_key,
+            extra_args={
+                "ContentType": "video/mp4",
+            },
+        )
+        record_s3_bytes("upload", os.path.getsize(local_preview_file_path))
+        record_transfers(mq_data, {s3_preview_file_key: transfer_record})
+
+        s3_preview_file_url = (
+            f"https://{settings.AWS_MOVIO_S3_SEGMENTS_SUBTITLES_BUCKET_NAME}.s3.amazonaws.com/"
+            f"{s3_preview_file_key}"
+        )
+
+        mq_data_to_publish = {
+            "message_type": "video-preview",
+            "video_id": mq_data.get("video_id"),
+            "user_id": mq_data.get("user_data").get("user_id"),
+            "email": mq_data.get("user_data").get("email"),
+            "video_filename_wothout_extention": raw_video_filename,
+            "s3_preview_file_url": s3_preview_file_url,
+            "preview_duration_seconds": settings.MOVIO_PREVIEW_CLIP_DURATION_SECONDS,
+        }
+
+        video_process_result_publisher_mq.publish_data(
+            video_process_data=json.dumps(mq_data_to_publish),
+            message_type=mq_data_to_publish["message_type"],
+        )
+
+        logger.info(
+            f"\n\n[=> VIDEO PREVIEW CLIP SUCCESS]: Preview Clip Generated and Published for file: {video_filename_with_extention}\n"
+        )
+        return generate_chain_result(
+            success=True,
+            success_message="video-preview-clip-success",
+            mq_data=mq_data,
+            s3_preview_file_key=s3_preview_file_key,
+        )
+
+    except PipelineCancelledError as e:
+        logger.warning(
+            f"\n[## VIDEO PREVIEW CLIP WARNING]: Preview Clip Generation Stopped: {e.reason}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="PipelineCancelledError",
+            error_message=str(e),
+            mq_data=mq_data,
+        )
+
+    except (FFmpegStalledError, FFmpegTimeoutError) as e:
+        # killed by the watchdog: a retry would stall (or time out) the same way
+        logger.error(
+            f"\n\n[XX VIDEO PREVIEW CLIP ERROR XX]: FFmpeg command to generate preview clip killed, not retried, for file: {video_filename_with_extention}\nException: {str(e)}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception=type(e).__name__,
+            error_message=format_ffmpeg_error(e),
+            mq_data=mq_data,
+        )
+
+    except subprocess.CalledProcessError as e:
+        logger.error(
+            f"\n\n[XX VIDEO PREVIEW CLIP ERROR XX]: FFmpeg command to generate preview clip failed for file: {video_filename_with_extention}\nException: {str(e)}\n"
+        )
+        # the object was deleted while ffmpeg read it: retrying can't bring it back
+        is_source_missing = "404 Not Found" in (e.stderr or "")
+        if not is_source_missing and self.request.retries < self.max_retries:
+            retry_in = 2**self.request.retries
+            logger.warning(
+                f"\n[## VIDEO PREVIEW CLIP WARNING]: Ffmpeg Command to Generate Preview Clip Rerying in: {retry_in}\n"
+            )
+            is_retrying = True
+            raise self.retry(exc=e, countdown=retry_in)
+
+        return generate_chain_result(
+            success=False,
+            exception="NoSuchKey" if is_source_missing else "subprocess.CalledProcessError",
+            error_message=format_ffmpeg_error(e),
+            mq_data=mq_data,
+        )
+
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            logger.error(
+                f"\n\n[XX VIDEO PREVIEW CLIP ERROR XX]: Raw Video No Longer in S3, Preview Clip Skipped for file: {video_filename_with_extention}\n"
+            )
+            return generate_chain_result(
+                success=False,
+                exception="NoSuchKey",
+                error_message=str(e),
+                mq_data=mq_data,
+            )
+
+        logger.error(
+            f"\n\n[XX VIDEO PREVIEW CLIP ERROR XX]: Preview Clip Could Not Be Uploaded to S3.\nException: {str(e)}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="ClientError",
+            error_message=str(e),
+            mq_data=mq_data,
+        )
+
+    except Exception as e:
+        logger.error(
+            f"\n\n[XX VIDEO PREVIEW CLIP ERROR XX]: Preview Clip Generation Failed.\nGeneral Exception: {str(e)}\n"
+        )
+        return generate_chain_result(
+            success=False,
+            exception="Exception",
+            error_message=str(e),
+            mq_data=mq_data,
+        )
+
+    finally:
+        if os.path.exists(local_preview_file_path):
+            os.remove(local_preview_file_path)
+
+        if not is_retrying and release_source_video(mq_data.get("video_id")):
+            try:
+                s3_client.delete_object(
+                    Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=mq_data["s3_file_key"]
+                )
+                logger.info(
+                    f"\n\n[=> Video Deletion Task SUCCESS]: Deferred Video Deletion Done by the Preview Clip Task.\nFile Name: {video_filename_with_extention}\n"
+                )
+            except ClientError as e:
+                logger.error(
+                    f"\n\n[XX Video Deletion Task ERROR XX]: Video Could Not Be Deleted from S3.\nException: {str(e)}\n"
+                )
+
+
+# Periodic task (celery beat): settings.CELERY_BEAT_SCHEDULE, broadcast to a worker of every node
+@shared_task
+def sweep_orphaned_workspaces_periodic_task():
+    """Reclaim the local workspaces left behind by crashed workers and lost chains, see workspace_sweeper."""
+
+    report = sweep_orphaned_workspaces()
+    return {
+        key: report[key]
+        for key in ("workspaces", "stale", "reclaimed_bytes", "usage_ratio_after")
+    }
+
+
 # Ennd Of Tasks.
@@ -1,3 +1,1416 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import ClientError
+from celery.exceptions import Retry
+from celery.signals import task_failure
+from celery.utils import worker_direct
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core_apps.common.s3_checksums import S3IntegrityError
+from core_apps.common.vtt import read_cues
+from core_apps.mq_manager.priority_lanes import get_lane_routing_options
+from core_apps.workers import pipeline_status
+from core_apps.workers.cancellation import (
+    CANCELLED,
+    DEADLINE_EXCEEDED,
+    get_cancellation_reason,
+    request_cancellation,
+)
+from core_apps.workers.dash_manifest import DashManifest, DashManifestError
+from core_apps.workers.ffmpeg_runner import (
+    FFmpegProgress,
+    FFmpegStalledError,
+    FFmpegTimeoutError,
+    run_ffmpeg,
+)
+from core_apps.workers.result_payload import build_subtitle_payload
+from core_apps.workers.subtitle_segments import write_subtitle_segments
+from core_apps.workers.tasks import (
+    dash_segment_video,
+    extract_cc_from_video,
+    generate_video_preview_clip,
+    local_file_cleanup_callback,
+    publish_video_process_message_mq,
+    transcode_video_to_mp4,
+    upload_dash_segments_to_s3_and_publish_message_callback,
+    upload_segment_batch_to_s3_sub_task,
+)
+from core_apps.workers.translation import (
+    CountingTranslator,
+    LocalStubTranslator,
+    TranslationError,
+    translate_vtt_file,
+    translate_vtt_file_to_languages,
+)
+from core_apps.workers.translation_memory import (
+    SQLiteTranslationStore,
+    TranslationMemory,
+    TranslationMemoryTranslator,
+)
+from core_apps.workers import scratch, text_assets, workspace_sweeper
+from core_apps.workers.workspace import (
+    get_local_video_paths,
+    get_translated_cc_file_path,
+    read_workspace_node_id,
+    release_video_workspace,
+    reserve_node_budget,
+    reserve_video_workspace,
+)
+
+# the sample subtitle at the root of the repository
+SAMPLE_VTT_PATH = settings.BASE_DIR.parent / "popey_president.vtt"
+
+
+def get_cue_tuples(path: str) -> list:
+    return [
+        (cue.identifier, cue.start, cue.end, cue.settings, cue.text)
+        for cue in read_cues(path)
+    ]
+
+
+class JitterTranslator(LocalStubTranslator):
+    """The stub translator, with the later requests answered first: the batches complete out of order."""
+
+    def __init__(self, max_request_bytes: int = None) -> None:
+        super().__init__(latency_seconds=0, max_request_bytes=max_request_bytes)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        with self.lock:
+            self.requests += 1
+            delay = 0.02 if self.requests % 3 == 1 else 0
+        time.sleep(delay)
+        return super().translate_texts(texts, source_language, target_language)
+
+
+class TranslateVTTFileTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.target_path = os.path.join(self.tmp_dir.name, "bn.vtt")
+
+    def test_only_the_texts_are_translated(self):
+        source_cues = get_cue_tuples(SAMPLE_VTT_PATH)
+
+        cue_count = translate_vtt_file(
+            SAMPLE_VTT_PATH, self.target_path, "en", "bn", LocalStubTranslator(), batch_cues=2
+        )
+
+        self.assertEqual(cue_count, len(source_cues))
+        self.assertEqual(
+            get_cue_tuples(self.target_path),
+            [
+                (
+                    identifier,
+                    start,
+                    end,
+                    cue_settings,
+                    "\n".join("[bn] " + line for line in text.split("\n")),
+                )
+                for identifier, start, end, cue_settings, text in source_cues
+            ],
+        )
+
+    def test_lost_cue_fails_the_translation(self):
+        class LossyTranslator(LocalStubTranslator):
+            def translate_texts(self, texts, source_language, target_language):
+                return super().translate_texts(texts, source_language, target_language)[:-1]
+
+        with self.assertRaises(TranslationError):
+            translate_vtt_file(
+                SAMPLE_VTT_PATH, self.target_path, "en", "bn", LossyTranslator(), batch_cues=2
+            )
+
+
+class TranslateVTTFileToLanguagesTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def get_target_paths(self, languages: list) -> dict:
+        return {
+            language: os.path.join(self.tmp_dir.name, f"{language}.vtt")
+            for language in languages
+        }
+
+    def test_cue_order_is_kept_across_batches(self):
+        source_cues = get_cue_tuples(SAMPLE_VTT_PATH)
+        target_paths = self.get_target_paths(["fr", "es", "de"])
+        translator = JitterTranslator()
+
+        translated, failed = translate_vtt_file_to_languages(
+            SAMPLE_VTT_PATH,
+            target_paths,
+            "en",
+            translator,
+            batch_cues=2,
+            concurrency=4,
+        )
+
+        self.assertEqual(failed, {})
+        self.assertEqual(translated, {language: len(source_cues) for language in target_paths})
+        self.assertGreater(translator.requests, len(target_paths))
+        for language, path in target_paths.items():
+            prefix = f"[{language}] "
+            self.assertEqual(
+                get_cue_tuples(path),
+                [
+                    (
+                        identifier,
+                        start,
+                        end,
+                        cue_settings,
+                        "\n".join(prefix + line for line in text.split("\n")),
+                    )
+                    for identifier, start, end, cue_settings, text in source_cues
+                ],
+            )
+
+    def test_request_size_bound_splits_the_batches(self):
+        target_paths = self.get_target_paths(["fr"])
+        translator = JitterTranslator(max_request_bytes=64)
+
+        translated, failed = translate_vtt_file_to_languages(
+            SAMPLE_VTT_PATH, target_paths, "en", translator, batch_cues=50, concurrency=2
+        )
+
+        self.assertEqual(failed, {})
+        self.assertEqual(translated["fr"], len(get_cue_tuples(SAMPLE_VTT_PATH)))
+        self.assertGreater(translator.requests, 1)
+
+    def test_no_target_language(self):
+        translator = JitterTranslator()
+
+        self.assertEqual(
+            translate_vtt_file_to_languages(SAMPLE_VTT_PATH, {}, "en", translator),
+            ({}, {}),
+        )
+        self.assertEqual(translator.requests, 0)
+
+
+class UpperCaseTranslator(LocalStubTranslator):
+    """Another backend: the stub translation in upper case."""
+
+    name = "upper"
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        translated_texts = super().translate_texts(texts, source_language, target_language)
+        return [text.upper() for text in translated_texts]
+
+
+class TranslationMemoryTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.store = SQLiteTranslationStore(os.path.join(self.tmp_dir.name, "memory.sqlite3"))
+
+    def translate(self, translator, texts: list) -> tuple:
+        """Translate through a cold LRU over the shared store: (translations, translator requests)."""
+
+        counting_translator = CountingTranslator(translator)
+        memory_translator = TranslationMemoryTranslator(
+            counting_translator, TranslationMemory(self.store)
+        )
+        return memory_translator.translate_texts(texts, "en", "fr"), counting_translator.requests
+
+    def test_translations_are_reused(self):
+        self.assertEqual(
+            self.translate(LocalStubTranslator(latency_seconds=0), ["Hello", "Hello"]),
+            (["[fr] Hello", "[fr] Hello"], 1),
+        )
+        self.assertEqual(
+            self.translate(LocalStubTranslator(latency_seconds=0), ["Hello"]),
+            (["[fr] Hello"], 0),
+        )
+
+    def test_translations_are_kept_per_translator(self):
+        self.translate(LocalStubTranslator(latency_seconds=0), ["Hello"])
+
+        self.assertEqual(
+            self.translate(UpperCaseTranslator(latency_seconds=0), ["Hello"]),
+            (["[FR] HELLO"], 1),
+        )
+
+        # a new version of the backend doesn't reuse the translations of the previous one
+        translator = LocalStubTranslator(latency_seconds=0)
+        translator.version = 2
+        self.assertEqual(self.translate(translator, ["Hello"]), (["[fr] Hello"], 1))
+
+
+class SubtitlePayloadTests(SimpleTestCase):
+    s3_location = {"bucket": "movio", "key": "subtitles/video.vtt", "content_encoding": None}
+
+    def test_subtitle_is_inlined_by_default(self):
+        payload = build_subtitle_payload(str(SAMPLE_VTT_PATH), self.s3_location)
+
+        self.assertEqual(payload["subtitle_en_vtt_content_encoding"], "identity")
+        self.assertEqual(payload["subtitle_en_vtt_data"], SAMPLE_VTT_PATH.read_text(encoding="utf-8"))
+        self.assertNotIn("subtitle_en_vtt_s3", payload)
+
+    @override_settings(MOVIO_RESULT_SUBTITLE_INLINE_MAX_BYTES=16)
+    def test_large_subtitle_is_referenced_once_enabled(self):
+        payload = build_subtitle_payload(str(SAMPLE_VTT_PATH), self.s3_location)
+
+        self.assertIsNone(payload["subtitle_en_vtt_data"])
+        self.assertEqual(payload["subtitle_en_vtt_s3"]["key"], "subtitles/video.vtt")
+        self.assertEqual(payload["subtitle_en_vtt_s3"]["size_bytes"], os.path.getsize(SAMPLE_VTT_PATH))
+
+
+@override_settings(MOVIO_DASH_SEGMENT_DURATION_SECONDS=4)
+class WriteSubtitleSegmentsTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.output_dir = os.path.join(self.tmp_dir.name, "subtitles", "lang_en")
+
+    def write_vtt(self, content: str) -> str:
+        vtt_path = os.path.join(self.tmp_dir.name, "en.vtt")
+        with open(vtt_path, "w", encoding="utf-8") as vtt_file:
+            vtt_file.write(content)
+        return vtt_path
+
+    def test_cues_are_clipped_to_their_segments(self):
+        vtt_path = self.write_vtt(
+            "WEBVTT\n\n"
+            "00:00:00.500 --> 00:00:01.000\nfirst\n\n"
+            "00:00:03.000 --> 00:00:05.000\nacross\n\n"
+            "00:00:09.000 --> 00:00:11.000\nlast\n"
+        )
+
+        segment_files = write_subtitle_segments(vtt_path, self.output_dir, duration_seconds=10)
+
+        self.assertEqual(
+            segment_files,
+            [
+                [path, os.path.getsize(path), seconds]
+                for path, seconds in (
+                    (os.path.join(self.output_dir, "seg-00001.vtt"), 4),
+                    (os.path.join(self.output_dir, "seg-00002.vtt"), 4),
+                    (os.path.join(self.output_dir, "seg-00003.vtt"), 2),
+                )
+            ],
+        )
+        self.assertEqual(
+            [
+                [(start, end, text) for _, start, end, _, text in get_cue_tuples(
+                    os.path.join(self.output_dir, f"seg-{number:05d}.vtt")
+                )]
+                for number in (1, 2, 3)
+            ],
+            [
+                [("00:00:00.500", "00:00:01.000", "first"), ("00:00:03.000", "00:00:04.000", "across")],
+                [("00:00:04.000", "00:00:05.000", "across")],
+                # the cues after the last segment are kept in it
+                [("00:00:09.000", "00:00:11.000", "last")],
+            ],
+        )
+
+    def test_empty_segments_are_written(self):
+        vtt_path = self.write_vtt("WEBVTT\n\n00:00:09.000 --> 00:00:10.000\nlate\n")
+
+        self.assertEqual(len(write_subtitle_segments(vtt_path, self.output_dir, duration_seconds=10)), 3)
+        self.assertEqual(
+            sorted(os.listdir(self.output_dir)), ["seg-00001.vtt", "seg-00002.vtt", "seg-00003.vtt"]
+        )
+        self.assertEqual(get_cue_tuples(os.path.join(self.output_dir, "seg-00001.vtt")), [])
+
+
+FFMPEG_MPD = """<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" profiles="urn:mpeg:dash:profile:isoff-live:2011" type="static" mediaPresentationDuration="PT0H0M10.000S" minBufferTime="PT8.0S">
+    <Period id="0" start="PT0.0S">
+        <AdaptationSet id="0" contentType="video" segmentAlignment="true">
+            <Representation id="0" mimeType="video/mp4" codecs="avc1.64001f" bandwidth="2400000" width="1280" height="720">
+                <SegmentTemplate timescale="12800" initialization="init-stream$RepresentationID$.m4s" media="chunk-stream$RepresentationID$-$Number%05d$.m4s" startNumber="1">
+                    <SegmentTimeline>
+                        <S t="0" d="51200" r="1" />
+                        <S d="25600" />
+                    </SegmentTimeline>
+                </SegmentTemplate>
+            </Representation>
+        </AdaptationSet>
+        <AdaptationSet id="1" contentType="audio" segmentAlignment="true">
+            <Representation id="1" mimeType="audio/mp4" codecs="mp4a.40.2" bandwidth="128000">
+                <SegmentTemplate timescale="48000" duration="192000" initialization="init-stream$RepresentationID$.m4s" media="chunk-stream$RepresentationID$-$Number%05d$.m4s" startNumber="1" />
+            </Representation>
+        </AdaptationSet>
+    </Period>
+</MPD>
+"""
+
+
+class DashManifestTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.output_dir = self.tmp_dir.name
+        self.manifest_path = os.path.join(self.output_dir, "manifest.mpd")
+        with open(self.manifest_path, "w", encoding="utf-8") as manifest_file:
+            manifest_file.write(FFMPEG_MPD)
+
+        for stream in ("0", "1"):
+            self.write_segment(f"init-stream{stream}.m4s", 10)
+            for number in (1, 2, 3):
+                self.write_segment(f"chunk-stream{stream}-{number:05d}.m4s", 100 * number)
+
+    def write_segment(self, name: str, size_bytes: int) -> None:
+        with open(os.path.join(self.output_dir, name), "wb") as segment_file:
+            segment_file.write(b"\0" * size_bytes)
+
+    def test_segment_index_of_the_templates(self):
+        manifest = DashManifest.from_ffmpeg_output(self.manifest_path, self.output_dir)
+
+        self.assertEqual(manifest.duration_seconds, 10.0)
+        # the last segment of a duration template is counted whole
+        for representation_id, content_type, last_seconds in (("0", "video", 2.0), ("1", "audio", 4.0)):
+            entry = manifest.segment_index["representations"][representation_id]
+            self.assertEqual(entry["content_type"], content_type)
+            self.assertEqual(entry["init"], [f"init-stream{representation_id}.m4s", 10])
+            self.assertEqual(
+                entry["media"],
+                [
+                    [f"chunk-stream{representation_id}-00001.m4s", 100, 4.0],
+                    [f"chunk-stream{representation_id}-00002.m4s", 200, 4.0],
+                    [f"chunk-stream{representation_id}-00003.m4s", 300, last_seconds],
+                ],
+            )
+        self.assertEqual(manifest.get_summary()["files"], 8)
+        self.assertEqual(manifest.get_summary()["bytes"], 2 * (10 + 600))
+
+    def test_missing_or_empty_segment_fails(self):
+        os.remove(os.path.join(self.output_dir, "chunk-stream1-00003.m4s"))
+        self.write_segment("chunk-stream0-00002.m4s", 0)
+
+        with self.assertRaises(DashManifestError) as context:
+            DashManifest.from_ffmpeg_output(self.manifest_path, self.output_dir)
+        self.assertIn("2 segment files", str(context.exception))
+
+    def test_subtitles_travel_with_the_manifest(self):
+        manifest = DashManifest.from_ffmpeg_output(self.manifest_path, self.output_dir)
+        manifest.add_subtitle("bn", "subtitles/bn.vtt")
+        manifest.add_subtitle(
+            "en",
+            "subtitles/lang_en/",
+            segment_files=[["subtitles/lang_en/seg-00001.vtt", 42, 4.0]],
+        )
+
+        manifest = DashManifest.from_dict(json.loads(json.dumps(manifest.to_dict())))
+
+        self.assertIn(("subtitles/lang_en/seg-00001.vtt", 42), manifest.get_files())
+        self.assertEqual(manifest.get_summary()["representations"], 3)
+        mpd = manifest.to_bytes().decode("utf-8")
+        self.assertIn('lang="bn"', mpd)
+        self.assertIn("<BaseURL>subtitles/bn.vtt</BaseURL>", mpd)
+        self.assertIn('media="seg-$Number%05d$.vtt"', mpd)
+
+
+class FFmpegFailureRetryTests(SimpleTestCase):
+    """A failed ffmpeg command is retried, a killed (stalled or timed out) one fails the video."""
+
+    def setUp(self):
+        patcher = mock.patch(
+            "core_apps.workers.tasks.get_cancellation_reason", return_value=None
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(extract_cc_from_video, "retry")
+        self.retry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.preprocessed_data = {
+            "success": True,
+            "mq_data": {"video_id": "video", "video_filename_with_extention": "video.mkv"},
+            "local_video_file_path": "video.mkv",
+        }
+
+    def extract_subtitle(self, error: Exception) -> dict:
+        with mock.patch("core_apps.workers.tasks.run_ffmpeg", side_effect=error):
+            return extract_cc_from_video(self.preprocessed_data)
+
+    def test_failed_ffmpeg_is_retried(self):
+        result = self.extract_subtitle(subprocess.CalledProcessError(1, ["ffmpeg"]))
+
+        self.assertEqual(self.retry.call_count, 1)
+        self.assertFalse(result["success"])
+
+    def test_killed_ffmpeg_is_not_retried(self):
+        for error_class in (FFmpegStalledError, FFmpegTimeoutError):
+            result = self.extract_subtitle(error_class(-15, ["ffmpeg"], stderr="frame=1"))
+
+            self.assertEqual(result["exception"], error_class.__name__)
+            self.assertIn("frame=1", result["error_message"])
+        self.retry.assert_not_called()
+
+
+PROGRESS_BLOCKS = """frame=0
+fps=N/A
+total_size=N/A
+out_time_us=N/A
+speed=N/A
+progress=continue
+frame=250
+fps=50.0
+total_size=262144
+out_time_us=2500000
+speed=2.5x
+progress=continue
+frame=500
+fps=N/A
+total_size=524288
+out_time_us=10000000
+speed=N/A
+progress=end
+"""
+
+
+class FFmpegProgressTests(SimpleTestCase):
+    def test_progress_of_the_blocks(self):
+        progress = FFmpegProgress(duration_seconds=10)
+        lines = PROGRESS_BLOCKS.splitlines(keepends=True)
+
+        # warming up: no value yet
+        for line in lines[:6]:
+            progress.feed_line(line)
+        self.assertEqual(progress.snapshot()["percentage"], 0.0)
+        self.assertIsNone(progress.snapshot()["fps"])
+
+        for line in lines[6:12]:
+            progress.feed_line(line)
+        snapshot = progress.snapshot()
+        self.assertEqual(snapshot["percentage"], 25.0)
+        self.assertEqual(snapshot["fps"], 50.0)
+        self.assertEqual(snapshot["speed"], 2.5)
+        self.assertEqual(snapshot["eta_seconds"], 3.0)
+        self.assertFalse(snapshot["finished"])
+
+        # a block is applied on its progress= line only
+        progress.feed_line(lines[12])
+        self.assertEqual(progress.snapshot()["fps"], 50.0)
+
+        for line in lines[13:]:
+            progress.feed_line(line)
+        snapshot = progress.snapshot()
+        self.assertEqual(snapshot["percentage"], 100.0)
+        self.assertEqual(snapshot["total_size"], 524288)
+        # "N/A": the last known values are kept
+        self.assertEqual(snapshot["fps"], 50.0)
+        self.assertEqual(snapshot["speed"], 2.5)
+        self.assertTrue(snapshot["finished"])
+
+    def test_unknown_duration_has_no_percentage(self):
+        progress = FFmpegProgress()
+        for line in PROGRESS_BLOCKS.splitlines():
+            progress.feed_line(line)
+
+        self.assertIsNone(progress.snapshot()["percentage"])
+        self.assertEqual(progress.snapshot()["out_time_seconds"], 10.0)
+
+
+class FakeFFmpegProcess:
+    """An ffmpeg process that writes its output and then hangs, until it is terminated."""
+
+    pid = 1
+
+    def __init__(self, stdout: str, stderr: str):
+        self.stdout = io.StringIO(stdout)
+        self.stderr = io.StringIO(stderr)
+        self.returncode = None
+        self.terminated = threading.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self.terminated.wait(timeout):
+            raise subprocess.TimeoutExpired("ffmpeg", timeout)
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -15
+        self.terminated.set()
+
+    kill = terminate
+
+
+@override_settings(MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS=0.2)
+class RunFFmpegTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            "core_apps.workers.ffmpeg_runner",
+            FFMPEG_POLL_INTERVAL_SECONDS=0.05,
+            publish_encode_progress=mock.DEFAULT,
+            clear_node_encode=mock.DEFAULT,
+            observe_ffmpeg=mock.DEFAULT,
+        )
+        self.mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stalled_ffmpeg_is_killed(self):
+        process = FakeFFmpegProcess(
+            stdout=PROGRESS_BLOCKS.split("frame=500")[0],
+            stderr="Input #0, matroska\nframe=  250 fps=50\n",
+        )
+        command = ["ffmpeg", "-i", "video.mkv", "video.mp4"]
+
+        with mock.patch(
+            "core_apps.workers.ffmpeg_runner.subprocess.Popen", return_value=process
+        ) as popen:
+            with self.assertRaises(FFmpegStalledError) as raised:
+                run_ffmpeg(command, stage="transcode", duration_seconds=10)
+
+        self.assertEqual(
+            popen.call_args.args[0],
+            ["ffmpeg", "-progress", "pipe:1", "-nostats", "-i", "video.mkv", "video.mp4"],
+        )
+        self.assertTrue(process.terminated.is_set())
+        self.assertEqual(raised.exception.cmd, command)
+        self.assertIn("frame=  250 fps=50", raised.exception.stderr)
+        self.assertEqual(self.mocks["observe_ffmpeg"].call_args.args[:2], ("transcode", "stalled"))
+        self.mocks["clear_node_encode"].assert_called_once_with(None, "transcode")
+
+
+class FakeBudgetRedis:
+    """The redis hashes of the node budgets. transaction() runs the callable as redis-py does: its
+    writes are applied at the EXEC, and it runs again when a watched key changed meanwhile.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+        # a write of another worker between the WATCH and the EXEC, run once
+        self.concurrent_write = None
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        while True:
+            watched = {key: self.hgetall(key) for key in watches}
+            pipe = FakeBudgetPipeline(self)
+            value = func(pipe)
+
+            if self.concurrent_write is not None:
+                concurrent_write, self.concurrent_write = self.concurrent_write, None
+                concurrent_write()
+            if any(self.hgetall(key) != hash_value for key, hash_value in watched.items()):
+                # WatchError
+                continue
+
+            for command, args in pipe.commands:
+                getattr(self, command)(*args)
+            return value
+
+
+class FakeBudgetPipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def hgetall(self, key):
+        return self.redis_client.hgetall(key)
+
+    def multi(self):
+        pass
+
+    def hset(self, *args):
+        self.commands.append(("hset", args))
+
+    def hdel(self, *args):
+        self.commands.append(("hdel", args))
+
+
+class WorkspaceTests(SimpleTestCase):
+    """The disk budget and the local files of the workspaces, on a temporary storage root."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.storage_root = os.path.join(self.tmp_dir.name, "movio-local-video-files")
+
+        settings_override = self.settings(
+            MOVIO_LOCAL_VIDEO_STORAGE_ROOT=Path(self.storage_root),
+            MOVIO_LOCAL_VIDEO_STORAGE_S3_DOWNLOAD_DIR=Path(self.storage_root) / "tmp-s3-downloads",
+            MOVIO_LOCAL_VIDEO_STORAGE_SEGMENTS_ROOT_DIR=Path(self.storage_root) / "tmp-segments",
+            MOVIO_LOCAL_CC_STORAGE_ROOT=Path(self.tmp_dir.name) / "movio-local-cc-files",
+            MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES=["bn"],
+            MOVIO_WORKSPACE_DISK_BUDGET_BYTES=100,
+            MOVIO_WORKSPACE_BUDGET_FACTOR=1,
+            MOVIO_WORKSPACE_NODE_ID=None,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.redis_client = FakeBudgetRedis()
+        patcher = mock.patch.multiple(
+            "core_apps.workers.workspace",
+            get_redis_client=mock.Mock(return_value=self.redis_client),
+            status_writer=mock.DEFAULT,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_mq_data(self, video_id: str, size_bytes: int) -> dict:
+        return {
+            "video_id": video_id,
+            "video_filename_with_extention": f"{video_id}.mkv",
+            "s3_file_size_bytes": size_bytes,
+        }
+
+    def create_workspace_files(self, mq_data: dict) -> dict:
+        """The local files of every stage of a video: {key of get_local_video_paths: path}."""
+
+        local_video_paths = get_local_video_paths(mq_data)
+        for key, path in local_video_paths.items():
+            if key == "mp4_segment_files_output_dir":
+                path = os.path.join(path, "segment_1.m4s")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as workspace_file:
+                workspace_file.write(b"0" * 10)
+
+        local_video_paths["translated_cc_file_path"] = get_translated_cc_file_path(
+            local_video_paths["local_cc_file_path"], "bn"
+        )
+        with open(local_video_paths["translated_cc_file_path"], "w") as workspace_file:
+            workspace_file.write("WEBVTT")
+        return local_video_paths
+
+    def test_reservations_fit_the_budget(self):
+        self.assertTrue(reserve_node_budget("budget", 100, "first", 60))
+        self.assertFalse(reserve_node_budget("budget", 100, "second", 60))
+        self.assertTrue(reserve_node_budget("budget", 100, "second", 40))
+        # a retried download doesn't count its own reservation twice
+        self.assertTrue(reserve_node_budget("budget", 100, "first", 60))
+
+        self.assertEqual(set(self.redis_client.hashes["budget"]), {"first", "second"})
+
+    def test_video_alone_is_admitted_over_the_budget(self):
+        self.assertFalse(reserve_node_budget("budget", 100, "large", 500))
+        self.assertTrue(reserve_node_budget("budget", 100, "large", 500, admit_alone=True))
+        self.assertFalse(reserve_node_budget("budget", 100, "other", 500, admit_alone=True))
+
+    def test_concurrent_reservation_is_counted(self):
+        # another worker reserves between the read of the reservations and the write
+        self.redis_client.concurrent_write = lambda: self.redis_client.hset(
+            "budget", "other", f"60:{time.time()}"
+        )
+
+        self.assertFalse(reserve_node_budget("budget", 100, "video", 60))
+        self.assertEqual(set(self.redis_client.hashes["budget"]), {"other"})
+
+    def test_stale_reservations_are_dropped(self):
+        reserved_at = time.time() - settings.MOVIO_WORKSPACE_RESERVATION_TTL_SECONDS - 1
+        self.redis_client.hset("budget", "crashed", f"100:{reserved_at}")
+
+        self.assertTrue(reserve_node_budget("budget", 100, "video", 60))
+        self.assertEqual(set(self.redis_client.hashes["budget"]), {"video"})
+
+    def test_worker_containers_of_a_volume_share_its_budget(self):
+        first_mq_data = self.get_mq_data("first", 60)
+        second_mq_data = self.get_mq_data("second", 60)
+
+        self.assertTrue(reserve_video_workspace(first_mq_data))
+        # another container (another hostname) mounting the same volume
+        with mock.patch("core_apps.workers.workspace.NODE_HOSTNAME", "other-container"):
+            read_workspace_node_id.cache_clear()
+            self.assertFalse(reserve_video_workspace(second_mq_data))
+
+        self.assertEqual(
+            first_mq_data["workspace_node"], read_workspace_node_id(self.storage_root)
+        )
+        self.assertEqual(len(self.redis_client.hashes), 1)
+
+    def test_configured_node_id(self):
+        mq_data = self.get_mq_data("video", 60)
+
+        with self.settings(MOVIO_WORKSPACE_NODE_ID="node-1"):
+            self.assertTrue(reserve_video_workspace(mq_data))
+
+        self.assertEqual(mq_data["workspace_node"], "node-1")
+        self.assertIn("video", self.redis_client.hashes["movio:workspace-budget:node-1"])
+
+    def test_release_removes_the_workspace_and_its_reservation(self):
+        mq_data = self.get_mq_data("video", 60)
+        self.assertTrue(reserve_video_workspace(mq_data))
+        local_video_paths = self.create_workspace_files(mq_data)
+
+        release_video_workspace(mq_data)
+
+        for path in local_video_paths.values():
+            self.assertFalse(os.path.exists(path), path)
+        self.assertEqual(
+            self.redis_client.hgetall(f"movio:workspace-budget:{mq_data['workspace_node']}"), {}
+        )
+
+    def test_source_is_removed_once_transcoded(self):
+        mq_data = self.get_mq_data("video", 60)
+        local_video_paths = self.create_workspace_files(mq_data)
+        preprocessed_data = {
+            "success": True,
+            "mq_data": mq_data,
+            "local_video_file_path": local_video_paths["local_video_file_path"],
+            "local_cc_file_path": local_video_paths["local_cc_file_path"],
+        }
+
+        with mock.patch.multiple(
+            "core_apps.workers.tasks",
+            get_cancellation_reason=mock.Mock(return_value=None),
+            track_in_flight_encode=mock.Mock(
+                side_effect=lambda task_id: contextlib.nullcontext()
+            ),
+            place_transcode_output=mock.Mock(
+                return_value=local_video_paths["local_mp4_video_file_path"]
+            ),
+            run_ffmpeg=mock.DEFAULT,
+        ) as mocks:
+            # a failed transcode keeps the source for its retry
+            mocks["run_ffmpeg"].side_effect = OSError("No space left on device")
+            self.assertFalse(transcode_video_to_mp4(preprocessed_data)["success"])
+            self.assertTrue(os.path.exists(local_video_paths["local_video_file_path"]))
+
+            mocks["run_ffmpeg"].side_effect = None
+            self.assertTrue(transcode_video_to_mp4(preprocessed_data)["success"])
+
+        # the mp4 and the subtitle stay for the next stages
+        self.assertFalse(os.path.exists(local_video_paths["local_video_file_path"]))
+        self.assertTrue(os.path.exists(local_video_paths["local_mp4_video_file_path"]))
+        self.assertTrue(os.path.exists(local_video_paths["local_cc_file_path"]))
+
+    def test_failed_pipeline_is_cleaned_up(self):
+        mq_data = self.get_mq_data("video", 60)
+        self.assertTrue(reserve_video_workspace(mq_data))
+        local_video_paths = self.create_workspace_files(mq_data)
+
+        with mock.patch.multiple(
+            "core_apps.workers.tasks",
+            record_pipeline_state=mock.DEFAULT,
+            mark_pipeline_finished=mock.DEFAULT,
+            video_dedupe_window=mock.DEFAULT,
+        ) as mocks:
+            # a stage failed: the last task of the chain gets its failed result
+            upload_dash_segments_to_s3_and_publish_message_callback(
+                {"success": False, "mq_data": mq_data}
+            )
+
+        mocks["record_pipeline_state"].assert_called_once_with(mq_data, "failed")
+        mocks["video_dedupe_window"].finish.assert_called_once_with(mq_data, success=False)
+        for path in local_video_paths.values():
+            self.assertFalse(os.path.exists(path), path)
+        self.assertEqual(
+            self.redis_client.hgetall(f"movio:workspace-budget:{mq_data['workspace_node']}"), {}
+        )
+
+
+@override_settings(
+    MOVIO_WORKSPACE_SWEEP_GRACE_SECONDS=100,
+    MOVIO_WORKSPACE_SWEEP_STALE_SECONDS=1000,
+    MOVIO_WORKSPACE_SWEEP_TARGET_USAGE_RATIO=0.6,
+    MOVIO_PIPELINE_STATUS_TTL_SECONDS=500,
+)
+class WorkspaceSweeperTests(SimpleTestCase):
+    """Workspace files in a temp dir, the disk usage is the size of the files left (of 400 bytes)."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.download_dir = os.path.join(self.tmp_dir.name, "tmp-s3-downloads")
+        os.makedirs(self.download_dir)
+
+        settings_override = self.settings(
+            MOVIO_LOCAL_VIDEO_STORAGE_S3_DOWNLOAD_DIR=Path(self.download_dir),
+            MOVIO_LOCAL_VIDEO_STORAGE_SEGMENTS_ROOT_DIR=Path(self.tmp_dir.name) / "tmp-segments",
+            MOVIO_LOCAL_CC_STORAGE_ROOT=Path(self.tmp_dir.name) / "movio-local-cc-files",
+            MOVIO_SCRATCH_RAM_DIR=os.path.join(self.tmp_dir.name, "ram"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.now = time.time()
+        self.index = {}
+        self.statuses = {}
+        patcher = mock.patch.multiple(
+            workspace_sweeper,
+            get_redis_client=mock.DEFAULT,
+            get_workspace_index=mock.Mock(side_effect=lambda: self.index),
+            get_pipeline_status=mock.Mock(side_effect=self.statuses.get),
+            get_disk_usage=mock.Mock(side_effect=self.get_disk_usage),
+            release_workspace_budget=mock.DEFAULT,
+            record_workspace_reclaimed=mock.DEFAULT,
+        )
+        self.mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_disk_usage(self) -> tuple:
+        used_bytes, _ = workspace_sweeper.get_path_usage(self.tmp_dir.name)
+        return used_bytes, 400
+
+    def create_workspace(
+        self, name: str, idle_seconds: float, video_id: str = None, state: str = None
+    ) -> str:
+        path = os.path.join(self.download_dir, f"{name}.mkv")
+        with open(path, "wb") as workspace_file:
+            workspace_file.write(b"0" * 100)
+        os.utime(path, (self.now - idle_seconds, self.now - idle_seconds))
+
+        if video_id is not None:
+            self.index[name] = {"video_id": video_id, "node": "node", "last_activity_at": 0}
+        if state is not None:
+            self.statuses[video_id] = {"state": state}
+        return path
+
+    def get_stale_workspace_names(self) -> tuple:
+        stale_workspaces, in_flight = workspace_sweeper.get_stale_workspaces(
+            workspace_sweeper.scan_workspaces(), self.index, self.now
+        )
+        return [workspace["workspace"] for workspace in stale_workspaces], in_flight
+
+    def test_grace_delay_of_the_terminal_pipelines(self):
+        self.create_workspace("finished", 200, "finished", pipeline_status.FINISHED)
+        self.create_workspace("failed-recently", 50, "failed-recently", pipeline_status.FAILED)
+        # the worker died: only the long stale delay applies
+        self.create_workspace("running", 200, "running", "running")
+        self.create_workspace("unknown", 200)
+        self.create_workspace("unknown-stale", 2000)
+
+        self.assertEqual(self.get_stale_workspace_names(), (["unknown-stale", "finished"], 3))
+
+    def test_index_activity_keeps_the_workspace(self):
+        self.create_workspace("video", 2000, "video")
+        self.index["video"]["last_activity_at"] = self.now - 10
+
+        self.assertEqual(self.get_stale_workspace_names(), ([], 1))
+
+    def test_oldest_first_down_to_the_target(self):
+        oldest_path = self.create_workspace("oldest", 3000, "oldest")
+        older_path = self.create_workspace("older", 2000, "older")
+        old_path = self.create_workspace("old", 1500)
+        recent_path = self.create_workspace("recent", 10)
+
+        report = workspace_sweeper.sweep_orphaned_workspaces()
+
+        # 400/400, 300/400, then 200/400 is under 0.6
+        self.assertEqual(
+            [workspace["workspace"] for workspace in report["reclaimed"]], ["oldest", "older"]
+        )
+        self.assertEqual(report["reclaimed_bytes"], 200)
+        self.assertEqual((report["usage_ratio_before"], report["usage_ratio_after"]), (1.0, 0.5))
+        self.assertEqual((report["stale"], report["in_flight"]), (3, 1))
+        self.assertFalse(os.path.exists(oldest_path) or os.path.exists(older_path))
+        self.assertTrue(os.path.exists(old_path) and os.path.exists(recent_path))
+
+        self.mocks["release_workspace_budget"].assert_has_calls(
+            [mock.call("node", "oldest"), mock.call("node", "older")]
+        )
+
+    def test_dry_run_reclaims_nothing(self):
+        paths = [
+            self.create_workspace("oldest", 3000, "oldest"),
+            self.create_workspace("older", 2000),
+        ]
+        self.index["gone"] = {"video_id": "gone", "last_activity_at": 0}
+
+        report = workspace_sweeper.sweep_orphaned_workspaces(reclaim_all=True, dry_run=True)
+
+        self.assertEqual(
+            [workspace["workspace"] for workspace in report["reclaimed"]], ["oldest", "older"]
+        )
+        self.assertEqual(report["usage_ratio_after"], 0.0)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        self.mocks["get_redis_client"].assert_not_called()
+        self.mocks["release_workspace_budget"].assert_not_called()
+
+    def test_prune_drops_the_expired_entries_without_files(self):
+        self.create_workspace("on-disk", 10, "on-disk")
+        self.index["gone"] = {"video_id": "gone", "last_activity_at": self.now - 600}
+        self.index["gone-recently"] = {
+            "video_id": "gone-recently",
+            "last_activity_at": self.now - 10,
+        }
+
+        pruned = workspace_sweeper.prune_workspace_index(
+            self.index, workspace_sweeper.scan_workspaces(), self.now
+        )
+
+        self.assertEqual(pruned, 1)
+        self.mocks["get_redis_client"].return_value.hdel.assert_called_once_with(
+            workspace_sweeper.WORKSPACE_INDEX_KEY, "gone"
+        )
+
+
+@override_settings(
+    MOVIO_SCRATCH_RAM_ENABLED=True,
+    MOVIO_SCRATCH_RAM_BUDGET_BYTES=10**9,
+    MOVIO_SCRATCH_RAM_ESTIMATE_FACTOR=1,
+)
+class ScratchPlacementTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.ram_dir = os.path.join(self.tmp_dir.name, "ram")
+        self.disk_dir = os.path.join(self.tmp_dir.name, "disk")
+
+        settings_override = self.settings(
+            MOVIO_SCRATCH_RAM_DIR=self.ram_dir,
+            MOVIO_LOCAL_VIDEO_STORAGE_S3_DOWNLOAD_DIR=Path(self.disk_dir) / "tmp-s3-downloads",
+            MOVIO_LOCAL_VIDEO_STORAGE_SEGMENTS_ROOT_DIR=Path(self.disk_dir) / "tmp-segments",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = mock.patch.multiple(
+            scratch,
+            NODE_HOSTNAME="node",
+            probe_media_duration=mock.DEFAULT,
+            reserve_node_budget=mock.DEFAULT,
+            release_scratch_budget=mock.DEFAULT,
+        )
+        self.mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mocks["probe_media_duration"].return_value = 10
+        self.mocks["reserve_node_budget"].return_value = True
+
+        self.mq_data = {
+            "video_id": "video",
+            "video_filename_with_extention": "video.mkv",
+            "priority_lane": "short",
+        }
+        self.lane_queue = get_lane_routing_options(self.mq_data)["queue"]
+        self.worker_queue = worker_direct("celery@worker-1").name
+
+    def get_task(self, retries: int = 0, is_eager: bool = False):
+        # the signatures of the next tasks of the chain, as built by dispatch_video_pipeline
+        chain = [
+            {"task": "upload", "options": {"queue": self.lane_queue}},
+            {"task": "manifest", "options": {"queue": self.lane_queue}},
+        ]
+        return SimpleNamespace(
+            request=SimpleNamespace(
+                retries=retries, is_eager=is_eager, hostname="celery@worker-1", chain=chain
+            )
+        )
+
+    def get_chain_queues(self, task) -> list:
+        return [signature["options"]["queue"] for signature in task.request.chain]
+
+    def test_segments_fitting_the_budget_go_to_the_ram_scratch(self):
+        task = self.get_task()
+
+        output_dir = scratch.place_segments_output(task, self.mq_data, "video.mp4")
+
+        self.assertTrue(output_dir.startswith(self.ram_dir))
+        self.assertTrue(os.path.isdir(output_dir))
+        estimated_bytes = 10 * scratch.SEGMENTS_OUTPUT_BITRATE // 8
+        self.mocks["reserve_node_budget"].assert_called_once_with(
+            mock.ANY, 10**9, "video", estimated_bytes
+        )
+        self.assertEqual(
+            self.mq_data["scratch"],
+            {
+                "mp4": scratch.DISK,
+                "segments": scratch.RAM,
+                "node": "node",
+                "reserved_bytes": estimated_bytes,
+                "worker_queue": self.worker_queue,
+            },
+        )
+        # the uploads read the tmpfs of this host
+        self.assertEqual(self.get_chain_queues(task), [self.worker_queue] * 2)
+
+    def test_segments_over_the_budget_go_to_the_disk(self):
+        self.mocks["reserve_node_budget"].return_value = False
+        task = self.get_task()
+
+        output_dir = scratch.place_segments_output(task, self.mq_data, "video.mp4")
+
+        self.assertTrue(output_dir.startswith(self.disk_dir))
+        self.assertNotIn("scratch", self.mq_data)
+        self.assertEqual(self.get_chain_queues(task), [self.lane_queue] * 2)
+
+    def test_submission_can_force_the_disk(self):
+        self.mq_data["scratch_tier"] = scratch.DISK
+
+        output_dir = scratch.place_segments_output(self.get_task(), self.mq_data, "video.mp4")
+
+        self.assertTrue(output_dir.startswith(self.disk_dir))
+        self.mocks["probe_media_duration"].assert_not_called()
+
+    @override_settings(MOVIO_SCRATCH_RAM_MP4=True)
+    def test_retried_transcode_falls_back_to_the_disk(self):
+        task = self.get_task()
+        mp4_path = scratch.place_transcode_output(task, self.mq_data, "video.mkv")
+        self.assertTrue(mp4_path.startswith(self.ram_dir))
+        self.assertEqual(self.get_chain_queues(task), [self.worker_queue] * 2)
+
+        # the retry carries the signatures pinned by the first attempt
+        retried_task = self.get_task(retries=1)
+        retried_task.request.chain = task.request.chain
+        mp4_path = scratch.place_transcode_output(retried_task, self.mq_data, "video.mkv")
+
+        self.assertTrue(mp4_path.startswith(self.disk_dir))
+        self.mocks["release_scratch_budget"].assert_called_once_with("node", "video")
+        self.assertEqual(self.get_chain_queues(retried_task), [self.lane_queue] * 2)
+        self.assertEqual(
+            (self.mq_data["scratch"]["mp4"], self.mq_data["scratch"]["segments"]),
+            (scratch.DISK, scratch.DISK),
+        )
+        self.assertIsNone(self.mq_data["scratch"]["worker_queue"])
+
+    def test_eager_task_is_not_pinned(self):
+        task = self.get_task(is_eager=True)
+
+        scratch.place_segments_output(task, self.mq_data, "video.mp4")
+
+        self.assertEqual(self.mq_data["scratch"]["segments"], scratch.RAM)
+        self.assertIsNone(self.mq_data["scratch"]["worker_queue"])
+        self.assertEqual(self.get_chain_queues(task), [self.lane_queue] * 2)
+
+
+@override_settings(
+    MOVIO_S3_COMPRESS_TEXT_ASSETS=True,
+    MOVIO_S3_COMPRESSION_MIN_BYTES=512,
+    MOVIO_S3_BROTLI_VARIANTS=False,
+)
+class TextAssetTests(SimpleTestCase):
+    # a manifest compresses several times over
+    MANIFEST = b"<MPD>" + b'<SegmentURL media="segment_1.m4s"/>' * 100 + b"</MPD>"
+
+    def test_gzip_is_kept_only_when_smaller(self):
+        asset = text_assets.build_text_asset("manifest.mpd", self.MANIFEST)
+        self.assertEqual(asset.content_encoding, "gzip")
+        self.assertLess(asset.stored_bytes, asset.original_bytes)
+        self.assertEqual(gzip.decompress(asset.body), self.MANIFEST)
+        self.assertEqual(
+            asset.get_extra_args(),
+            {
+                "ContentType": "application/dash+xml",
+                "CacheControl": settings.MOVIO_S3_MANIFEST_CACHE_CONTROL,
+                "ContentEncoding": "gzip",
+            },
+        )
+
+        # random bytes don't compress: stored as they are
+        body = os.urandom(2048)
+        asset = text_assets.build_text_asset("subtitle.vtt", body)
+        self.assertIsNone(asset.content_encoding)
+        self.assertEqual(asset.body, body)
+        self.assertNotIn("ContentEncoding", asset.get_extra_args())
+
+    def test_small_assets_are_not_compressed(self):
+        self.assertIsNone(
+            text_assets.build_text_asset("subtitle.vtt", b" " * 511).content_encoding
+        )
+        self.assertEqual(
+            text_assets.build_text_asset("subtitle.vtt", b" " * 512).content_encoding, "gzip"
+        )
+
+    def test_compression_is_deterministic(self):
+        first = text_assets.build_text_asset("manifest.mpd", self.MANIFEST)
+        with mock.patch("time.time", return_value=time.time() + 3600):
+            second = text_assets.build_text_asset("manifest.mpd", self.MANIFEST)
+
+        # same bytes, same ETag: no timestamp in the gzip header
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.body[4:8], b"\x00" * 4)
+
+    @override_settings(MOVIO_S3_BROTLI_VARIANTS=True, MOVIO_S3_CHECKSUM_ALGORITHM=None)
+    def test_brotli_variant_is_stored_next_to_the_asset(self):
+        brotli = mock.Mock()
+        brotli.compress.return_value = b"brotli"
+        with mock.patch.object(text_assets, "brotli", brotli):
+            asset = text_assets.build_text_asset("manifest.mpd", self.MANIFEST)
+
+        s3_client = mock.Mock()
+        stored_bytes = text_assets.upload_text_asset(s3_client, asset, "bucket", "video/manifest.mpd")
+
+        self.assertEqual(stored_bytes, asset.stored_bytes + len(b"brotli"))
+        gzip_put, brotli_put = s3_client.put_object.call_args_list
+        self.assertEqual(
+            (gzip_put.kwargs["Key"], gzip_put.kwargs["ContentEncoding"]),
+            ("video/manifest.mpd", "gzip"),
+        )
+        self.assertEqual(
+            (brotli_put.kwargs["Key"], brotli_put.kwargs["Body"], brotli_put.kwargs["ContentEncoding"]),
+            ("video/manifest.mpd.br", b"brotli", "br"),
+        )
+        self.assertEqual(brotli_put.kwargs["ContentType"], "application/dash+xml")
+
+
+class SegmentBatchUploadTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(upload_segment_batch_to_s3_sub_task, "retry")
+        self.retry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.segment_batch = [
+            (f"segment_{index}.m4s", f"segments/video/segment_{index}.m4s", 100)
+            for index in range(3)
+        ]
+
+    def upload_batch(self, *upload_results) -> str:
+        with mock.patch(
+            "core_apps.workers.tasks.upload_file_with_checksum", side_effect=upload_results
+        ), mock.patch("core_apps.workers.tasks.remove_workspace_file", return_value=100):
+            return upload_segment_batch_to_s3_sub_task(self.segment_batch)
+
+    def test_throttled_upload_retries_the_rest_of_the_batch(self):
+        self.retry.side_effect = Retry()
+
+        with self.assertRaises(Retry):
+            self.upload_batch(None, ClientError({"Error": {"Code": "SlowDown"}}, "PutObject"))
+
+        self.assertEqual(self.retry.call_args.kwargs["args"][0], self.segment_batch[1:])
+
+    def test_text_assets_upload_last(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        subtitle_segment_path = os.path.join(tmp_dir.name, "subtitle_1.vtt")
+        with open(subtitle_segment_path, "w") as subtitle_segment_file:
+            subtitle_segment_file.write("WEBVTT\n")
+        self.segment_batch.insert(0, (subtitle_segment_path, "segments/video/subtitle_1.vtt"))
+
+        uploaded_keys = []
+        with mock.patch(
+            "core_apps.workers.tasks.upload_text_asset",
+            side_effect=lambda s3_client, asset, bucket, key: uploaded_keys.append(key),
+        ), mock.patch(
+            "core_apps.workers.tasks.upload_file_with_checksum",
+            side_effect=lambda s3_client, path, bucket, key, **kwargs: uploaded_keys.append(key),
+        ), mock.patch("core_apps.workers.tasks.remove_workspace_file", return_value=100):
+            result = upload_segment_batch_to_s3_sub_task(self.segment_batch)
+
+        self.assertEqual(result, "success")
+        # the binary segments upload while the subtitle segment is compressed
+        self.assertEqual(
+            uploaded_keys,
+            [segment[1] for segment in self.segment_batch[1:]] + ["segments/video/subtitle_1.vtt"],
+        )
+
+    def test_batch_with_a_corrupt_segment_fails_instead_of_retrying(self):
+        result = self.upload_batch(
+            S3IntegrityError("segment_0.m4s: 90 bytes uploaded, 100 in the segment index"),
+            ClientError({"Error": {"Code": "SlowDown"}}, "PutObject"),
+        )
+
+        # a retry of the rest of the batch would have reported a success without segment_0
+        self.assertEqual(result, "failure")
+        self.retry.assert_not_called()
+
+
+class PipelineTaskFailureTests(SimpleTestCase):
+    """A pipeline task that raises (or whose worker is lost) finishes the pipeline as failed."""
+
+    def setUp(self):
+        patcher = mock.patch("core_apps.workers.signals.finish_video_pipeline")
+        self.finish_video_pipeline = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.mq_data = {"video_id": "video", "user_data": {"user_id": "user"}}
+
+    def test_failed_chain_or_chord_task_finishes_the_pipeline(self):
+        task_failure.send(
+            sender=dash_segment_video,
+            args=[{"success": True, "mq_data": self.mq_data}],
+            kwargs={},
+            exception=OSError("No space left on device"),
+        )
+        task_failure.send(
+            sender=upload_segment_batch_to_s3_sub_task,
+            args=[["segment_1.m4s"], self.mq_data],
+            kwargs={},
+            exception=OSError("Worker exited prematurely"),
+        )
+
+        self.assertEqual(
+            self.finish_video_pipeline.call_args_list,
+            [mock.call(self.mq_data, success=False)] * 2,
+        )
+
+    def test_failed_preview_clip_leaves_the_pipeline_running(self):
+        task_failure.send(
+            sender=generate_video_preview_clip,
+            args=[self.mq_data],
+            kwargs={},
+            exception=OSError(),
+        )
+
+        self.finish_video_pipeline.assert_not_called()
+
+
+class ResultPublishTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            "core_apps.workers.tasks",
+            get_cancellation_reason=mock.Mock(return_value=None),
+            build_subtitle_payload=mock.Mock(return_value={}),
+            DashManifest=mock.DEFAULT,
+            build_text_asset=mock.DEFAULT,
+            upload_text_asset=mock.DEFAULT,
+            upload_transfer_manifest=mock.DEFAULT,
+            record_segments_uploaded=mock.DEFAULT,
+            record_text_asset_compressed=mock.DEFAULT,
+            video_process_result_publisher_mq=mock.DEFAULT,
+            finish_video_pipeline=mock.DEFAULT,
+        )
+        self.mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.mq_data = {
+            "video_id": "video",
+            "user_data": {"user_id": "user", "email": "user@movio.test"},
+        }
+        self.preprocessed_data = {
+            "success": True,
+            "mq_data": self.mq_data,
+            "upload_batch_count": 1,
+            "dash_manifest": {},
+            "local_video_file_path": "/nonexistent/video.mp4",
+            "local_mp4_video_file_path": "/nonexistent/video-mp4.mp4",
+            "mp4_segment_files_output_dir": "/nonexistent/segments",
+            "local_cc_file_path": "/nonexistent/video.vtt",
+        }
+
+    def test_unpublished_result_fails_the_pipeline(self):
+        publish_data = self.mocks["video_process_result_publisher_mq"].publish_data
+        publish_data.return_value = (False, "video-process-result-mq-publish-error")
+
+        result = publish_video_process_message_mq(["success"], self.preprocessed_data)
+
+        self.assertFalse(result["success"])
+        self.assertEqual(result["exception"], "MQPublishError")
+        publish_data.assert_called_once()
+
+        # failed: the dedupe key of the video is released by the finish
+        local_file_cleanup_callback(result, self.preprocessed_data)
+        self.mocks["finish_video_pipeline"].assert_called_once_with(
+            self.mq_data, success=False, cancelled_reason=None
+        )
+
+
+class UploadProgressStatusTests(SimpleTestCase):
+    def test_upload_total_is_written_before_the_upload_tasks_run(self):
+        redis_client = mock.Mock()
+        with mock.patch.multiple(
+            pipeline_status,
+            get_redis_client=mock.Mock(return_value=redis_client),
+            status_writer=mock.DEFAULT,
+        ) as mocks:
+            pipeline_status.record_upload_total({"video_id": "video"}, 12)
+
+        # not queued behind the other status updates: the upload tasks increment the count it resets
+        mocks["status_writer"].submit.assert_not_called()
+        redis_pipeline = redis_client.pipeline.return_value
+        redis_pipeline.hset.assert_called_once()
+        self.assertEqual(
+            redis_pipeline.hset.call_args.kwargs["mapping"]["upload_uploaded_segments"], 0
+        )
+        redis_pipeline.execute.assert_called_once()
+
+
+class VideoPipelineStatusAPIViewTests(SimpleTestCase):
+    def setUp(self):
+        self.fields = {}
+        redis_client = mock.Mock()
+        redis_client.hgetall.side_effect = lambda key: dict(self.fields.get(key, {}))
+
+        patcher = mock.patch.object(
+            pipeline_status, "get_redis_client", return_value=redis_client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_status(self, video_id: str):
+        return self.client.get(reverse("video-pipeline-status", args=[video_id]))
+
+    def test_unknown_video(self):
+        response = self.get_status("unknown")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "no pipeline status for this video"})
+
+    def test_status_of_a_running_pipeline(self):
+        self.fields[pipeline_status.VIDEO_STATUS_KEY.format(video_id="video")] = {
+            "state": "running",
+            "current_stage": "upload",
+            "queued_at": "100.0",
+            "updated_at": "160.0",
+            "stage:transcode": json.dumps({"started_at": 110.0, "duration_seconds": 30.0}),
+            "stage:download": json.dumps({"started_at": 101.0, "duration_seconds": 9.0}),
+            "encode_progress": json.dumps({"percentage": 100.0}),
+            "upload_total_segments": "40",
+            "upload_uploaded_segments": "10",
+        }
+
+        response = self.get_status("video")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "video_id": "video",
+                "state": "running",
+                "current_stage": "upload",
+                "queued_at": 100.0,
+                "finished_at": None,
+                "updated_at": 160.0,
+                "stages": {
+                    "download": {"started_at": 101.0, "duration_seconds": 9.0},
+                    "transcode": {"started_at": 110.0, "duration_seconds": 30.0},
+                },
+                "encode_progress": {"percentage": 100.0},
+                "upload_progress": {"total_segments": 40, "uploaded_segments": 10, "percentage": 25.0},
+                "compression": None,
+            },
+        )
+        # in the order the stages ran
+        self.assertEqual(list(response.json()["stages"]), ["download", "transcode"])
+
+
+class CancellationTests(SimpleTestCase):
+    """A cancel applies to the submissions of the video consumed before it, not to a resubmission."""
+
+    def setUp(self):
+        flags = {}
+        redis_client = mock.Mock()
+        redis_client.set.side_effect = lambda key, value, ex: flags.__setitem__(key, str(value))
+        redis_client.get.side_effect = flags.get
+
+        patcher = mock.patch(
+            "core_apps.workers.cancellation.get_redis_client", return_value=redis_client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cancel_stops_the_submission_consumed_before_it(self):
+        mq_data = {"video_id": "video", "consumed_at": time.time() - 60}
+        self.assertIsNone(get_cancellation_reason(mq_data))
+
+        request_cancellation("video")
+        self.assertEqual(get_cancellation_reason(mq_data), CANCELLED)
+
+    def test_resubmission_after_the_cancel_runs(self):
+        request_cancellation("video")
+
+        mq_data = {"video_id": "video", "consumed_at": time.time() + 1}
+        self.assertIsNone(get_cancellation_reason(mq_data))
+
+        mq_data["deadline_at"] = time.time() - 1
+        self.assertEqual(get_cancellation_reason(mq_data), DEADLINE_EXCEEDED)
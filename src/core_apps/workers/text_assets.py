@@ -0,0 +1,204 @@
+"""
+Pre-compressed text uploads (settings.MOVIO_S3_COMPRESS_TEXT_ASSETS).
+
+The manifests and the subtitles are text and compress several times over, the segments (.m4s) are
+already compressed media and are uploaded untouched. S3 can't negotiate the encoding: a text asset
+is stored once gzip compressed under its own key (Content-Encoding: gzip, every player decodes it),
+with its Content-Type and Cache-Control. With MOVIO_S3_BROTLI_VARIANTS (and the brotli package) a
+brotli variant is stored next to it at <key>.br, for a CDN selecting it by Accept-Encoding.
+
+The compression runs in a thread pool of the process (zlib and brotli release the GIL): a batch
+submits its text assets up front and uploads its binary segments meanwhile.
+
+The body is in memory: its checksum (MOVIO_S3_CHECKSUM_ALGORITHM) is sent with the PutObject
+(checked by S3) and kept on the asset (transfer_record) for the transfer manifest of the video.
+"""
+
+import gzip
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from core_apps.common.metrics import record_s3_bytes, record_text_asset_compression
+from core_apps.common.s3_checksums import (
+    StreamingChecksum,
+    get_checksum_algorithm,
+    get_transfer_record,
+)
+
+logger = logging.getLogger(__name__)
+
+# extension: (Content-Type, setting of the Cache-Control)
+TEXT_ASSET_TYPES = {
+    ".mpd": ("application/dash+xml", "MOVIO_S3_MANIFEST_CACHE_CONTROL"),
+    ".vtt": ("text/vtt", "MOVIO_S3_SUBTITLE_CACHE_CONTROL"),
+}
+
+BROTLI_VARIANT_SUFFIX = ".br"
+
+
+class CompressedTextAsset:
+    """A text asset ready to upload: its stored body and the metadata of the object."""
+
+    def __init__(
+        self,
+        path: str,
+        body: bytes,
+        original_bytes: int,
+        content_type: str,
+        cache_control: str,
+        content_encoding: str = None,
+        brotli_body: bytes = None,
+    ) -> None:
+        self.path = path
+        self.body = body
+        self.original_bytes = original_bytes
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.content_encoding = content_encoding
+        self.brotli_body = brotli_body
+        # set by upload_text_asset (s3_checksums.get_transfer_record), None with no checksum algorithm
+        self.transfer_record = None
+
+    @property
+    def stored_bytes(self) -> int:
+        return len(self.body)
+
+    def get_extra_args(self) -> dict:
+        extra_args = {"ContentType": self.content_type}
+        if self.cache_control is not None:
+            extra_args["CacheControl"] = self.cache_control
+        if self.content_encoding is not None:
+            extra_args["ContentEncoding"] = self.content_encoding
+        return extra_args
+
+
+def get_content_type_and_cache_control(name: str):
+    """(Content-Type, Cache-Control) of a text asset by its extension, None for the other files."""
+
+    asset_type = TEXT_ASSET_TYPES.get(os.path.splitext(name)[1].lower())
+    if asset_type is None:
+        return None
+    content_type, cache_control_setting = asset_type
+    return content_type, getattr(settings, cache_control_setting)
+
+
+def get_text_asset_type(path: str):
+    """(Content-Type, Cache-Control) of a text asset to compress, None for the other files (segments)."""
+
+    if not settings.MOVIO_S3_COMPRESS_TEXT_ASSETS:
+        return None
+    return get_content_type_and_cache_control(path)
+
+
+def build_text_asset(name: str, body: bytes) -> CompressedTextAsset:
+    """Compress the body of a text asset (gzip, and the brotli variant when enabled and available)."""
+
+    content_type, cache_control = get_content_type_and_cache_control(name) or ("text/plain", None)
+    asset = CompressedTextAsset(name, body, len(body), content_type, cache_control)
+    if (
+        not settings.MOVIO_S3_COMPRESS_TEXT_ASSETS
+        or len(body) < settings.MOVIO_S3_COMPRESSION_MIN_BYTES
+    ):
+        return asset
+
+    # mtime=0: the same file always compresses to the same bytes (ETag)
+    gzip_body = gzip.compress(body, compresslevel=settings.MOVIO_S3_GZIP_LEVEL, mtime=0)
+    if len(gzip_body) < len(body):
+        asset.body = gzip_body
+        asset.content_encoding = "gzip"
+
+    if settings.MOVIO_S3_BROTLI_VARIANTS and brotli is not None:
+        brotli_body = brotli.compress(body, quality=settings.MOVIO_S3_BROTLI_QUALITY)
+        if len(brotli_body) < len(body):
+            asset.brotli_body = brotli_body
+
+    return asset
+
+
+def compress_text_asset(path: str) -> CompressedTextAsset:
+    """Read and compress a text asset file."""
+
+    with open(path, "rb") as asset_file:
+        return build_text_asset(path, asset_file.read())
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_compression_executor() -> ThreadPoolExecutor:
+    """The compression pool of this process, (re)created lazily as the celery prefork pool forks after the import."""
+
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.MOVIO_S3_COMPRESSION_THREADS,
+                thread_name_prefix="movio-compress",
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit_text_asset_compression(paths) -> dict:
+    """{path: future of its CompressedTextAsset} of the text assets among paths."""
+
+    text_asset_paths = [path for path in paths if get_text_asset_type(path) is not None]
+    if not text_asset_paths:
+        return {}
+
+    executor = get_compression_executor()
+    return {path: executor.submit(compress_text_asset, path) for path in text_asset_paths}
+
+
+def upload_text_asset(s3_client, asset: CompressedTextAsset, bucket: str, key: str) -> int:
+    """Upload a compressed text asset (and its brotli variant), returns the bytes stored."""
+
+    extra_args = asset.get_extra_args()
+    algorithm = get_checksum_algorithm()
+    if algorithm is not None:
+        checksum = StreamingChecksum(algorithm)
+        checksum.update(asset.body)
+        extra_args[f"Checksum{algorithm}"] = checksum.to_s3()
+        asset.transfer_record = get_transfer_record(bucket, checksum)
+
+    s3_client.put_object(Bucket=bucket, Key=key, Body=asset.body, **extra_args)
+    stored_bytes = asset.stored_bytes
+
+    if asset.brotli_body is not None:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key + BROTLI_VARIANT_SUFFIX,
+            Body=asset.brotli_body,
+            **{**asset.get_extra_args(), "ContentEncoding": "br"},
+        )
+        stored_bytes += len(asset.brotli_body)
+
+    record_s3_bytes("upload", stored_bytes)
+    record_text_asset_compression(asset.original_bytes, asset.stored_bytes)
+    return stored_bytes
+
+
+def upload_text_asset_file(s3_client, path: str, bucket: str, key: str) -> CompressedTextAsset:
+    """Compress (in the calling thread) and upload a text asset, returns the asset uploaded."""
+
+    asset = compress_text_asset(path)
+    upload_text_asset(s3_client, asset, bucket, key)
+    return asset
+
+
+if settings.MOVIO_S3_BROTLI_VARIANTS and brotli is None:
+    logger.warning(
+        "\n[## TEXT ASSET COMPRESSION WARNING]: MOVIO_S3_BROTLI_VARIANTS is set but the brotli package is not installed, gzip only."
+    )
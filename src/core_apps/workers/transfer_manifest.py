@@ -0,0 +1,78 @@
+"""
+Per video manifest of the S3 transfers and their checksums.
+
+The upload batches run on any worker: each records the transfer records of the files it uploaded
+(s3_checksums: {"bucket", "size_bytes", "algorithm", "checksum"}) by S3 key in a redis hash of the
+video, written as the batch ends (its retries overwrite their keys). publish_video_process_message_mq
+uploads the manifest (TRANSFER_MANIFEST_FILE_NAME, next to the MPD) once every batch succeeded:
+
+    {
+        "video_id": "...",
+        "algorithm": "CRC32",
+        "generated_at": 1718000000.0,
+        "source": {"bucket", "key", "size_bytes", "algorithm", "checksum", "verified"},  # the downloaded video
+        "objects": {"<s3 key>": {"bucket", "size_bytes", "algorithm", "checksum"}, ...},
+    }
+
+A consumer (CDN origin check, audit, re-download) verifies an object against it without asking S3.
+"""
+
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.common.s3_checksums import get_checksum_algorithm
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_MANIFEST_KEY = "movio:transfer-manifest:{video_id}"
+
+# uploaded next to the MPD
+TRANSFER_MANIFEST_FILE_NAME = "checksums.json"
+
+
+def record_transfers(mq_data: dict, records: dict) -> None:
+    """records: {s3 key: transfer record}, a failure to record is logged (the upload stands)."""
+
+    video_id = (mq_data or {}).get("video_id")
+    records = {key: record for key, record in records.items() if record is not None}
+    if video_id is None or not records:
+        return
+
+    key = TRANSFER_MANIFEST_KEY.format(video_id=video_id)
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        pipeline.hset(
+            key, mapping={s3_key: json.dumps(record) for s3_key, record in records.items()}
+        )
+        pipeline.expire(key, settings.MOVIO_PIPELINE_STATUS_TTL_SECONDS)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(
+            f"\n[## TRANSFER MANIFEST WARNING]: {len(records)} Transfer Records of the Video {video_id} Not Recorded: {str(e)}"
+        )
+
+
+def get_transfers(video_id: str) -> dict:
+    return {
+        s3_key: json.loads(record)
+        for s3_key, record in get_redis_client()
+        .hgetall(TRANSFER_MANIFEST_KEY.format(video_id=video_id))
+        .items()
+    }
+
+
+def build_transfer_manifest(mq_data: dict, extra_records: dict = None) -> dict:
+    """The manifest of the video, extra_records: transfers not recorded in redis (the MPD)."""
+
+    video_id = mq_data.get("video_id")
+    return {
+        "video_id": video_id,
+        "algorithm": get_checksum_algorithm(),
+        "generated_at": time.time(),
+        "source": mq_data.get("source_video_transfer"),
+        "objects": {**get_transfers(video_id), **(extra_records or {})},
+    }
@@ -0,0 +1,354 @@
+"""
+In-worker subtitle translation (settings.MOVIO_SUBTITLE_TRANSLATION_MODE = "worker").
+
+The extracted subtitle is streamed cue by cue (core_apps.common.vtt) and packed into batches of
+consecutive cues, a batch is a single request of the translator: at most
+MOVIO_SUBTITLE_TRANSLATE_BATCH_CUES cues and under the request size limit of the translator.
+Every batch x target language is translated by a thread pool of MOVIO_SUBTITLE_TRANSLATE_CONCURRENCY
+threads, and the translated batches are written in order as they complete (a bounded window of
+batches is in flight, the file is never held whole). The timings, identifiers and cue settings are
+kept, only the texts are translated.
+
+The translator backend is pluggable, settings.MOVIO_SUBTITLE_TRANSLATOR:
+- "aws": Amazon Translate
+- "local": deterministic offline stub, "[<lang>] <text>" per line (tests, benchmarks), with an
+  optional simulated latency per request (MOVIO_SUBTITLE_LOCAL_TRANSLATOR_LATENCY_SECONDS)
+- the dotted path of a Translator subclass
+"""
+
+import collections
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+import boto3
+
+from core_apps.common.vtt import WebVTTWriter, read_cues
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationError(Exception):
+    pass
+
+
+def iter_batches(items, max_items: int = None, max_bytes: int = None, separator_bytes: int = 0, get_text=None):
+    """Consecutive items grouped in batches of at most max_items items and max_bytes of UTF-8 text.
+
+    separator_bytes: the bytes joining two texts in a request. An item larger than max_bytes goes alone.
+    """
+
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        text = get_text(item) if get_text else item
+        item_bytes = len(text.encode("utf-8"))
+        added_bytes = item_bytes + (separator_bytes if batch else 0)
+
+        if batch and (
+            (max_items and len(batch) >= max_items)
+            or (max_bytes and batch_bytes + added_bytes > max_bytes)
+        ):
+            yield batch
+            batch = []
+            batch_bytes = 0
+            added_bytes = item_bytes
+
+        batch.append(item)
+        batch_bytes += added_bytes
+    if batch:
+        yield batch
+
+
+class Translator:
+    """Backend of the in-worker translation: translates a batch of cue texts, in order.
+
+    translate_texts is called from the threads of the translation pool concurrently.
+    """
+
+    # size limit of a request (None: unbounded), and the bytes joining two texts in a request
+    max_request_bytes = None
+    separator_bytes = 0
+
+    # backend and version of the translations (translation memory): bump the version when the
+    # translations of the backend change, the remembered ones are not reused then.
+    name = None
+    version = 1
+
+    def get_id(self) -> str:
+        name = self.name or f"{type(self).__module__}.{type(self).__qualname__}"
+        return f"{name}:v{self.version}"
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        raise NotImplementedError
+
+
+class LocalStubTranslator(Translator):
+    """Deterministic and offline: every line of a text is prefixed with "[<target_language>] ".
+
+    latency_seconds: simulated round trip of every request (benchmarks).
+    """
+
+    name = "local"
+
+    def __init__(self, latency_seconds: float = None, max_request_bytes: int = None) -> None:
+        if latency_seconds is None:
+            latency_seconds = settings.MOVIO_SUBTITLE_LOCAL_TRANSLATOR_LATENCY_SECONDS
+        self.latency_seconds = latency_seconds
+        self.max_request_bytes = max_request_bytes
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        prefix = f"[{target_language}] "
+        return [
+            "\n".join(prefix + line for line in text.split("\n")) for text in texts
+        ]
+
+
+class AWSTranslateTranslator(Translator):
+    """Amazon Translate: the texts of a request are joined by DELIMITER.
+
+    The translation is split back on the delimiter, whatever spacing, case or closing tag the
+    service gave it. A request that doesn't split back into its number of texts (a delimiter got
+    dropped or merged) is halved and each half translated again, down to a text alone.
+    """
+
+    DELIMITER = "\n<span>\n"
+    # a run of span tags (e.g. "<span></span>") is a single delimiter
+    DELIMITER_PATTERN = re.compile(r"(?:\s*<\s*/?\s*span\s*/?\s*>)+\s*", re.IGNORECASE)
+
+    separator_bytes = len(DELIMITER.encode("utf-8"))
+
+    name = "aws"
+
+    def __init__(self, max_request_bytes: int = None) -> None:
+        self.max_request_bytes = (
+            max_request_bytes or settings.MOVIO_AWS_TRANSLATE_MAX_REQUEST_BYTES
+        )
+        self.client = boto3.client(
+            "translate",
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_S3_REGION_NAME,
+        )
+
+    def translate_text(self, text: str, source_language: str, target_language: str) -> str:
+        response = self.client.translate_text(
+            Text=text,
+            SourceLanguageCode=source_language,
+            TargetLanguageCode=target_language,
+        )
+        return response["TranslatedText"]
+
+    def translate_request(self, texts: list, source_language: str, target_language: str) -> list:
+        if len(texts) == 1:
+            return [self.translate_text(texts[0], source_language, target_language).strip()]
+
+        translated_text = self.translate_text(
+            self.DELIMITER.join(texts), source_language, target_language
+        )
+        translated_texts = self.DELIMITER_PATTERN.split(translated_text.strip())
+        if len(translated_texts) == len(texts):
+            return translated_texts
+
+        logger.warning(
+            f"\n[## TRANSLATION WARNING]: Delimited Translation Mismatch ({len(translated_texts)}/{len(texts)}), Translating the Halves Again."
+        )
+        half = len(texts) // 2
+        return self.translate_request(
+            texts[:half], source_language, target_language
+        ) + self.translate_request(texts[half:], source_language, target_language)
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        translated_texts = []
+        # the texts come packed under max_request_bytes from translate_vtt_file_to_languages, not always from elsewhere
+        for request in iter_batches(
+            texts, max_bytes=self.max_request_bytes, separator_bytes=self.separator_bytes
+        ):
+            translated_texts.extend(
+                self.translate_request(request, source_language, target_language)
+            )
+        return translated_texts
+
+
+class CountingTranslator(Translator):
+    """Wraps a translator and counts its requests and translated bytes (benchmarks)."""
+
+    def __init__(self, translator: Translator) -> None:
+        self.translator = translator
+        self.max_request_bytes = translator.max_request_bytes
+        self.separator_bytes = translator.separator_bytes
+        self.requests = 0
+        self.request_bytes = 0
+        self.lock = threading.Lock()
+
+    def get_id(self) -> str:
+        return self.translator.get_id()
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        with self.lock:
+            self.requests += 1
+            self.request_bytes += sum(len(text.encode("utf-8")) for text in texts)
+        return self.translator.translate_texts(texts, source_language, target_language)
+
+
+TRANSLATORS = {
+    "aws": AWSTranslateTranslator,
+    "local": LocalStubTranslator,
+}
+
+
+@lru_cache(maxsize=1)
+def get_translator() -> Translator:
+    translator = settings.MOVIO_SUBTITLE_TRANSLATOR
+    translator_class = TRANSLATORS.get(translator) or import_string(translator)
+    return translator_class()
+
+
+def translate_vtt_file_to_languages(
+    source_path: str,
+    target_paths: dict,
+    source_language: str,
+    translator: Translator,
+    batch_cues: int = None,
+    concurrency: int = None,
+) -> tuple:
+    """Translate a WebVTT file into every language of target_paths ({language: path}) concurrently.
+
+    Returns ({language: number of cues} of the languages translated, {language: error} of the
+    languages that failed). The file of a language that failed is removed, the other languages go on.
+    No target language: ({}, {}), the source is not read.
+    """
+
+    batch_cues = batch_cues or settings.MOVIO_SUBTITLE_TRANSLATE_BATCH_CUES
+    concurrency = concurrency or settings.MOVIO_SUBTITLE_TRANSLATE_CONCURRENCY
+    languages = list(target_paths)
+    if not languages:
+        return {}, {}
+
+    # batches read but not written yet: enough to keep every thread busy, the file is never held whole
+    max_pending_batches = max(2, -(-2 * concurrency // len(languages)))
+
+    batches = iter_batches(
+        read_cues(source_path),
+        max_items=batch_cues,
+        max_bytes=translator.max_request_bytes,
+        separator_bytes=translator.separator_bytes,
+        get_text=lambda cue: cue.text,
+    )
+
+    writers = {}
+    failed = {}
+    # (batch, {language: future}), in the order of the file
+    pending = collections.deque()
+
+    def fail_language(language: str, e: Exception) -> None:
+        failed[language] = str(e)
+        # the requests of this language not started yet are dropped
+        for _, futures in pending:
+            if language in futures:
+                futures[language].cancel()
+        logger.warning(
+            f"\n[## TRANSLATION WARNING]: Translation to {language} Failed.\nException: {str(e)}"
+        )
+
+    def write_next_batch() -> None:
+        batch, futures = pending.popleft()
+        for language, future in futures.items():
+            if language in failed:
+                continue
+            try:
+                translated_texts = future.result()
+                if len(translated_texts) != len(batch):
+                    raise TranslationError(
+                        f"{len(translated_texts)} texts translated for {len(batch)} cues."
+                    )
+            except Exception as e:
+                fail_language(language, e)
+                continue
+
+            writers[language].write_cues(
+                cue.with_text(text) for cue, text in zip(batch, translated_texts)
+            )
+
+    files = []
+    try:
+        for language in languages:
+            target_file = open(target_paths[language], "w", encoding="utf-8")
+            files.append(target_file)
+            writers[language] = WebVTTWriter(target_file)
+
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="movio-translate"
+        ) as executor:
+            for batch in batches:
+                if len(failed) == len(languages):
+                    break
+
+                texts = [cue.text for cue in batch]
+                pending.append(
+                    (
+                        batch,
+                        {
+                            language: executor.submit(
+                                translator.translate_texts, texts, source_language, language
+                            )
+                            for language in languages
+                            if language not in failed
+                        },
+                    )
+                )
+                if len(pending) >= max_pending_batches:
+                    write_next_batch()
+
+            while pending:
+                write_next_batch()
+    finally:
+        for target_file in files:
+            target_file.close()
+
+    for language in failed:
+        try:
+            os.remove(target_paths[language])
+        except FileNotFoundError:
+            pass
+
+    translated = {
+        language: writers[language].cue_count
+        for language in languages
+        if language not in failed
+    }
+    return translated, failed
+
+
+def translate_vtt_file(
+    source_path: str,
+    target_path: str,
+    source_language: str,
+    target_language: str,
+    translator: Translator,
+    batch_cues: int = None,
+    concurrency: int = None,
+) -> int:
+    """Translate a WebVTT file into target_path, returns the number of cues translated."""
+
+    translated, failed = translate_vtt_file_to_languages(
+        source_path,
+        {target_language: target_path},
+        source_language,
+        translator,
+        batch_cues=batch_cues,
+        concurrency=concurrency,
+    )
+    if failed:
+        raise TranslationError(failed[target_language])
+    return translated[target_language]
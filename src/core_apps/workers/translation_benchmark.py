@@ -0,0 +1,235 @@
+"""
+Subtitle translation benchmark: the stub translator (deterministic, a simulated latency per
+request, the request size limit of Amazon Translate) translates real and synthetic WebVTT files.
+
+Every input is translated into the target languages once sequentially (concurrency 1: a request
+at a time, a language after another, as the Lambda does), once with the thread pool, and once with
+the thread pool behind the translation memory (translation_memory), one memory for the whole
+benchmark: the inputs after the first reuse its translations, as the episodes of a series do. The
+outputs of the runs must be identical (the concurrent runs reassemble the cues in order).
+"""
+
+import filecmp
+import logging
+import os
+import platform
+import time
+
+from django.conf import settings
+
+from core_apps.common.vtt import Cue, WebVTTWriter, format_timestamp, read_cues
+from core_apps.workers.translation import (
+    CountingTranslator,
+    LocalStubTranslator,
+    translate_vtt_file_to_languages,
+)
+from core_apps.workers.translation_memory import (
+    SQLiteTranslationStore,
+    TranslationMemory,
+    TranslationMemoryTranslator,
+)
+
+logger = logging.getLogger(__name__)
+
+# a cue of a synthetic subtitle: 2 seconds, one or two lines
+SYNTHETIC_LINES = (
+    "Benchmark caption number {index}.",
+    "A longer benchmark caption, number {index}, to vary the size of the requests.",
+)
+
+# repeated in every synthetic subtitle: an intro shared by the "episodes", and the usual repeats
+SYNTHETIC_INTRO_LINES = tuple(f"Previously on the benchmark series, part {part}." for part in range(20))
+SYNTHETIC_REPEATED_LINES = ("[Music]", "Thank you.", "- What?\n- Nothing.")
+
+
+def write_synthetic_vtt(path: str, cue_count: int) -> None:
+    with open(path, "w", encoding="utf-8") as vtt_file:
+        writer = WebVTTWriter(vtt_file)
+        for index in range(cue_count):
+            if index < len(SYNTHETIC_INTRO_LINES):
+                lines = [SYNTHETIC_INTRO_LINES[index]]
+            elif index % 4 == 0:
+                lines = [SYNTHETIC_REPEATED_LINES[index // 4 % len(SYNTHETIC_REPEATED_LINES)]]
+            else:
+                lines = [SYNTHETIC_LINES[0].format(index=index)]
+                if index % 3 == 0:
+                    lines.append(SYNTHETIC_LINES[1].format(index=index))
+            writer.write_cue(
+                Cue(
+                    format_timestamp(index * 2),
+                    format_timestamp(index * 2 + 2),
+                    "\n".join(lines),
+                    identifier=str(index + 1),
+                )
+            )
+
+
+def get_benchmark_inputs(vtt_paths: list, synthetic_cue_counts: list, inputs_dir: str) -> list:
+    """[(name, path)] of the inputs, the synthetic ones generated once and reused."""
+
+    inputs = [(os.path.basename(path), path) for path in vtt_paths]
+
+    os.makedirs(inputs_dir, exist_ok=True)
+    for cue_count in synthetic_cue_counts:
+        path = os.path.join(inputs_dir, f"synthetic-{cue_count}.vtt")
+        if not os.path.exists(path):
+            write_synthetic_vtt(path, cue_count)
+        inputs.append((os.path.basename(path), path))
+    return inputs
+
+
+def run_translation(
+    source_path: str,
+    output_dir: str,
+    languages: list,
+    translator,
+    batch_cues: int,
+    concurrency: int,
+    memory: TranslationMemory = None,
+) -> dict:
+    """memory: translate behind this translation memory, the requests counted are the misses sent to translator."""
+
+    counting_translator = CountingTranslator(translator)
+    run_translator = counting_translator
+    if memory is not None:
+        run_translator = TranslationMemoryTranslator(counting_translator, memory)
+    os.makedirs(output_dir, exist_ok=True)
+    target_paths = {
+        language: os.path.join(output_dir, f"{language}.vtt") for language in languages
+    }
+
+    started_at = time.perf_counter()
+    if concurrency == 1:
+        # one language after another
+        translated, failed = {}, {}
+        for language, target_path in target_paths.items():
+            language_translated, language_failed = translate_vtt_file_to_languages(
+                source_path,
+                {language: target_path},
+                settings.MOVIO_SUBTITLE_SOURCE_LANGUAGE,
+                run_translator,
+                batch_cues=batch_cues,
+                concurrency=1,
+            )
+            translated.update(language_translated)
+            failed.update(language_failed)
+    else:
+        translated, failed = translate_vtt_file_to_languages(
+            source_path,
+            target_paths,
+            settings.MOVIO_SUBTITLE_SOURCE_LANGUAGE,
+            run_translator,
+            batch_cues=batch_cues,
+            concurrency=concurrency,
+        )
+    wall_seconds = time.perf_counter() - started_at
+
+    run = {
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests": counting_translator.requests,
+        "request_bytes": counting_translator.request_bytes,
+        "translated": translated,
+        "failed": failed,
+        "target_paths": target_paths,
+    }
+    if memory is not None:
+        run["memory"] = run_translator.get_stats()
+    return run
+
+
+def run_translation_benchmark(
+    vtt_paths: list,
+    synthetic_cue_counts: list,
+    languages: list,
+    latency_seconds: float,
+    max_request_bytes: int,
+    batch_cues: int,
+    concurrency: int,
+    inputs_dir: str,
+    output_dir: str,
+    memory_backend: str = "none",
+) -> dict:
+    """memory_backend: store of the translation memory, "none" (the LRU only) or "sqlite" (a fresh file in output_dir)."""
+
+    stub_translator = LocalStubTranslator(
+        latency_seconds=latency_seconds, max_request_bytes=max_request_bytes
+    )
+
+    store = None
+    if memory_backend == "sqlite":
+        store_path = os.path.join(output_dir, "translation-memory.sqlite3")
+        for path in (store_path, store_path + "-wal", store_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        store = SQLiteTranslationStore(store_path)
+    memory = TranslationMemory(store)
+
+    report = {
+        "meta": {
+            "started_at": time.time(),
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "languages": languages,
+            "latency_seconds": latency_seconds,
+            "max_request_bytes": max_request_bytes,
+            "batch_cues": batch_cues,
+            "concurrency": concurrency,
+            "memory_backend": memory_backend,
+        },
+        "inputs": [],
+    }
+
+    for name, path in get_benchmark_inputs(vtt_paths, synthetic_cue_counts, inputs_dir):
+        logger.info(f"\n[=> TRANSLATION BENCHMARK]: Input: {name}")
+
+        runs = {}
+        for run_name, run_concurrency, run_memory in (
+            ("sequential", 1, None),
+            ("concurrent", concurrency, None),
+            ("memory", concurrency, memory),
+        ):
+            runs[run_name] = run_translation(
+                path,
+                os.path.join(output_dir, name, run_name),
+                languages,
+                stub_translator,
+                batch_cues,
+                run_concurrency,
+                memory=run_memory,
+            )
+
+        sequential = runs["sequential"]
+        identical = all(
+            filecmp.cmp(
+                sequential["target_paths"][language],
+                run["target_paths"][language],
+                shallow=False,
+            )
+            for run in runs.values()
+            for language in languages
+            if language in sequential["translated"] and language in run["translated"]
+        )
+        for run in runs.values():
+            del run["target_paths"]
+
+        report["inputs"].append(
+            {
+                "name": name,
+                "input_bytes": os.path.getsize(path),
+                "cues": sum(1 for _ in read_cues(path)),
+                **runs,
+                "speedup": {
+                    run_name: round(sequential["wall_seconds"] / run["wall_seconds"], 2)
+                    if run["wall_seconds"]
+                    else None
+                    for run_name, run in runs.items()
+                    if run_name != "sequential"
+                },
+                "identical_output": identical,
+            }
+        )
+
+    report["meta"]["finished_at"] = time.time()
+    return report
@@ -0,0 +1,266 @@
+"""
+Cue level translation memory.
+
+Subtitles repeat a lot ("[Music]", "Thank you.", speaker tags, the intro of every episode) and every
+occurrence was translated for every target language. The translations are remembered by
+(translator backend and version, normalized cue text, source language, target language): an in-process LRU
+(MOVIO_TRANSLATION_MEMORY_LRU_ENTRIES) in front of a persistent store,
+settings.MOVIO_TRANSLATION_MEMORY_BACKEND:
+- "redis": shared by the workers, an entry expires MOVIO_TRANSLATION_MEMORY_TTL_SECONDS after its last write
+- "sqlite": a file of the node (MOVIO_TRANSLATION_MEMORY_SQLITE_PATH), stand-in without redis
+- "none": the LRU only
+
+TranslationMemoryTranslator wraps the translator of a subtitle: only the misses (each distinct text
+once) are sent to it. The translator cost and latency scale with the characters: the hits and the
+characters saved are counted (prometheus, and the stats of the subtitle).
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+
+from core_apps.common.metrics import record_translation_memory
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.workers.translation import TranslationError, Translator
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_MEMORY_KEY = "movio:translation-memory:{translator_id}:{source_language}:{target_language}:{text_hash}"
+
+
+def normalize_cue_text(text: str) -> str:
+    """The text of a cue with its whitespace collapsed, the line breaks kept."""
+
+    return "\n".join(
+        " ".join(line.split()) for line in text.strip().split("\n") if line.strip()
+    )
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class RedisTranslationStore:
+    """Translation memory in redis, shared by the workers: a key per entry (MGET / pipelined SET)."""
+
+    def get_key(self, text: str, translator_id: str, source_language: str, target_language: str) -> str:
+        return TRANSLATION_MEMORY_KEY.format(
+            translator_id=translator_id,
+            source_language=source_language,
+            target_language=target_language,
+            text_hash=get_text_hash(text),
+        )
+
+    def get_many(self, texts: list, translator_id: str, source_language: str, target_language: str) -> dict:
+        values = get_redis_client().mget(
+            [self.get_key(text, translator_id, source_language, target_language) for text in texts]
+        )
+        return {text: value for text, value in zip(texts, values) if value is not None}
+
+    def set_many(self, translations: dict, translator_id: str, source_language: str, target_language: str) -> None:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        for text, translation in translations.items():
+            pipeline.set(
+                self.get_key(text, translator_id, source_language, target_language),
+                translation,
+                ex=settings.MOVIO_TRANSLATION_MEMORY_TTL_SECONDS,
+            )
+        pipeline.execute()
+
+
+class SQLiteTranslationStore:
+    """Translation memory in a SQLite file of the node, a connection per thread (WAL: the worker processes share it)."""
+
+    # SQLite host parameters per query
+    MAX_QUERY_TEXTS = 500
+
+    def __init__(self, path: str = None) -> None:
+        self.path = str(path or settings.MOVIO_TRANSLATION_MEMORY_SQLITE_PATH)
+        self.local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS translation_memory ("
+                "translator_id TEXT, source_language TEXT, target_language TEXT, text_hash TEXT, "
+                "translation TEXT, updated_at REAL, "
+                "PRIMARY KEY (translator_id, source_language, target_language, text_hash))"
+            )
+            self.local.connection = connection
+        return connection
+
+    def get_many(self, texts: list, translator_id: str, source_language: str, target_language: str) -> dict:
+        texts_by_hash = {get_text_hash(text): text for text in texts}
+        text_hashes = list(texts_by_hash)
+        connection = self.get_connection()
+
+        translations = {}
+        for index in range(0, len(text_hashes), self.MAX_QUERY_TEXTS):
+            query_hashes = text_hashes[index : index + self.MAX_QUERY_TEXTS]
+            rows = connection.execute(
+                "SELECT text_hash, translation FROM translation_memory "
+                "WHERE translator_id = ? AND source_language = ? AND target_language = ? "
+                f"AND text_hash IN ({','.join('?' * len(query_hashes))})",
+                [translator_id, source_language, target_language, *query_hashes],
+            )
+            for text_hash, translation in rows:
+                translations[texts_by_hash[text_hash]] = translation
+        return translations
+
+    def set_many(self, translations: dict, translator_id: str, source_language: str, target_language: str) -> None:
+        connection = self.get_connection()
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO translation_memory VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (translator_id, source_language, target_language, get_text_hash(text), translation, now)
+                    for text, translation in translations.items()
+                ],
+            )
+
+
+class TranslationMemory:
+    """In-process LRU of the translations in front of the persistent store (None: the LRU only)."""
+
+    def __init__(self, store=None, max_entries: int = None) -> None:
+        self.store = store
+        self.max_entries = max_entries or settings.MOVIO_TRANSLATION_MEMORY_LRU_ENTRIES
+        self.entries = OrderedDict()  # (translator_id, source_language, target_language, text): translation
+        self.lock = threading.Lock()
+
+    def remember(self, translations: dict, translator_id: str, source_language: str, target_language: str) -> None:
+        with self.lock:
+            for text, translation in translations.items():
+                key = (translator_id, source_language, target_language, text)
+                self.entries[key] = translation
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_many(self, texts: list, translator_id: str, source_language: str, target_language: str) -> dict:
+        """{text: translation} of the texts in the memory, translated by the translator of translator_id (Translator.get_id)."""
+
+        translations = {}
+        with self.lock:
+            for text in texts:
+                key = (translator_id, source_language, target_language, text)
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    translations[text] = self.entries[key]
+
+        missing_texts = [text for text in texts if text not in translations]
+        if self.store is not None and missing_texts:
+            try:
+                stored = self.store.get_many(
+                    missing_texts, translator_id, source_language, target_language
+                )
+            except Exception as e:
+                # the store is an optimization: its misses are translated
+                logger.warning(
+                    f"\n[## TRANSLATION MEMORY WARNING]: Translation Store Unavailable.\nException: {str(e)}"
+                )
+                stored = {}
+            self.remember(stored, translator_id, source_language, target_language)
+            translations.update(stored)
+
+        return translations
+
+    def set_many(self, translations: dict, translator_id: str, source_language: str, target_language: str) -> None:
+        self.remember(translations, translator_id, source_language, target_language)
+        if self.store is not None and translations:
+            try:
+                self.store.set_many(translations, translator_id, source_language, target_language)
+            except Exception as e:
+                logger.warning(
+                    f"\n[## TRANSLATION MEMORY WARNING]: Translations Could Not Be Stored.\nException: {str(e)}"
+                )
+
+
+@lru_cache(maxsize=1)
+def get_translation_memory() -> TranslationMemory:
+    """The translation memory of this process (its LRU is shared by the subtitles)."""
+
+    backend = settings.MOVIO_TRANSLATION_MEMORY_BACKEND
+    if backend == "redis":
+        store = RedisTranslationStore()
+    elif backend == "sqlite":
+        store = SQLiteTranslationStore()
+    else:
+        store = None
+    return TranslationMemory(store)
+
+
+class TranslationMemoryTranslator(Translator):
+    """Wraps the translator of a subtitle: the texts are looked up in the memory, the misses translated and remembered.
+
+    stats: cues, hits (cues not sent to the translator, the repeats within a batch included),
+    characters_saved and characters_translated.
+    """
+
+    def __init__(self, translator: Translator, memory: TranslationMemory) -> None:
+        self.translator = translator
+        self.translator_id = translator.get_id()
+        self.memory = memory
+        self.max_request_bytes = translator.max_request_bytes
+        self.separator_bytes = translator.separator_bytes
+        self.stats = {"cues": 0, "hits": 0, "characters_saved": 0, "characters_translated": 0}
+        self.lock = threading.Lock()
+
+    def translate_texts(self, texts: list, source_language: str, target_language: str) -> list:
+        normalized_texts = [normalize_cue_text(text) for text in texts]
+        # the distinct texts, in order
+        distinct_texts = list(dict.fromkeys(normalized_texts))
+
+        translations = self.memory.get_many(
+            [text for text in distinct_texts if text],
+            self.translator_id,
+            source_language,
+            target_language,
+        )
+        # an empty cue has nothing to translate
+        translations[""] = ""
+
+        missing_texts = [text for text in distinct_texts if text not in translations]
+        if missing_texts:
+            translated_texts = self.translator.translate_texts(
+                missing_texts, source_language, target_language
+            )
+            if len(translated_texts) != len(missing_texts):
+                raise TranslationError(
+                    f"{len(translated_texts)} texts translated for {len(missing_texts)} texts."
+                )
+            new_translations = dict(zip(missing_texts, translated_texts))
+            self.memory.set_many(
+                new_translations, self.translator_id, source_language, target_language
+            )
+            translations.update(new_translations)
+
+        characters_translated = sum(len(text) for text in missing_texts)
+        characters_saved = sum(len(text) for text in normalized_texts) - characters_translated
+        hits = len(texts) - len(missing_texts)
+        with self.lock:
+            self.stats["cues"] += len(texts)
+            self.stats["hits"] += hits
+            self.stats["characters_saved"] += characters_saved
+            self.stats["characters_translated"] += characters_translated
+        record_translation_memory(hits, len(missing_texts), characters_saved, characters_translated)
+
+        return [translations[text] for text in normalized_texts]
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["cues"], 4) if stats["cues"] else None
+        return stats
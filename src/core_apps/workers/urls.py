@@ -0,0 +1,7 @@
+from django.urls import path
+
+from core_apps.workers.views import VideoPipelineStatusAPIView
+
+urlpatterns = [
+    path("videos/<str:video_id>/status/", VideoPipelineStatusAPIView.as_view(), name="video-pipeline-status"),
+]
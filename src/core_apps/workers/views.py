@@ -1,3 +1,25 @@
-from django.shortcuts import render
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
 
-# Create your views here.
+from core_apps.workers.pipeline_status import get_pipeline_status
+
+
+class VideoPipelineStatusAPIView(APIView):
+    '''Live status of the processing pipeline of a video: current stage, per stage durations, encode and upload progress'''
+
+    def get(self, request, video_id):
+        try:
+            pipeline_status = get_pipeline_status(video_id)
+        except Exception as e:
+            return Response(
+                {"detail": f"pipeline status store unavailable: {str(e)}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        if pipeline_status is None:
+            return Response(
+                {"detail": "no pipeline status for this video"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(pipeline_status, status=status.HTTP_200_OK)
@@ -0,0 +1,374 @@
+"""
+Local workspace of a video: the source, the mp4, the subtitle and the segments.
+
+Every video reserves a share of the disk budget of its node before the download
+(MOVIO_WORKSPACE_BUDGET_FACTOR x the source size), the download waits while the budget is full.
+The files are removed as soon as no later stage needs them:
+- the source once transcoded (extract_cc runs before the transcode)
+- the mp4 once segmented
+- each segment once its upload is confirmed
+so the peak disk of a video is max(source + mp4, mp4 + segments) instead of their sum.
+finish_video_pipeline removes whatever is left and releases the reservation, on every path.
+
+The workspaces are indexed (owning video_id, node, last activity) for the orphaned workspace
+sweeper (workspace_sweeper), which reclaims what a crashed worker or a lost chain left behind.
+"""
+
+import os
+import json
+import shutil
+import logging
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.workers.pipeline_status import NODE_HOSTNAME, status_writer
+
+logger = logging.getLogger(__name__)
+
+# redis hash of the workspace reservations of a node: {video_id: "reserved_bytes:reserved_at"},
+# the node is the storage of the workspaces (get_workspace_node_id)
+WORKSPACE_BUDGET_KEY = "movio:workspace-budget:{hostname}"
+
+# id of the storage, in MOVIO_LOCAL_VIDEO_STORAGE_ROOT
+WORKSPACE_NODE_ID_FILENAME = ".movio-workspace-node-id"
+
+# redis hash of the workspace index: {workspace name: json}, the workspace name is the raw video filename
+WORKSPACE_INDEX_KEY = "movio:workspace-index"
+
+# redis hash of the RAM scratch reservations of a node (see scratch), same format as the workspace budget
+SCRATCH_BUDGET_KEY = "movio:scratch-budget:{hostname}"
+
+
+def get_workspace_name(mq_data: dict) -> str:
+    # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
+    return mq_data["video_filename_with_extention"].split(".")[0]
+
+
+def get_ram_scratch_paths(mq_data: dict) -> dict:
+    """Paths of the mp4 and of the segments of a video in the RAM scratch (settings.MOVIO_SCRATCH_RAM_DIR)."""
+
+    raw_video_filename = get_workspace_name(mq_data)
+    return {
+        "local_mp4_video_file_path": os.path.join(
+            settings.MOVIO_SCRATCH_RAM_DIR, "mp4", f"{raw_video_filename}.mp4"
+        ),
+        "mp4_segment_files_output_dir": os.path.join(
+            settings.MOVIO_SCRATCH_RAM_DIR, "segments", raw_video_filename
+        ),
+    }
+
+
+def get_local_video_paths(mq_data: dict) -> dict:
+    """Local paths used by the pipeline for a video, the same paths the tasks derive from the mq data.
+
+    The mp4 and the segments are in the RAM scratch when the pipeline placed them there (mq_data["scratch"]).
+    """
+
+    # video_filename_with_extention: 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2.mkv
+    video_filename_with_extention = mq_data["video_filename_with_extention"]
+
+    # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2
+    raw_video_filename = video_filename_with_extention.split(".")[0]
+
+    local_video_file_path = os.path.join(
+        settings.MOVIO_LOCAL_VIDEO_STORAGE_S3_DOWNLOAD_DIR,
+        video_filename_with_extention,
+    )
+
+    local_video_paths = {
+        "local_video_file_path": local_video_file_path,
+        "local_mp4_video_file_path": local_video_file_path.split(".")[0] + ".mp4",
+        "local_cc_file_path": os.path.join(
+            settings.MOVIO_LOCAL_CC_STORAGE_ROOT, f"{raw_video_filename}.vtt"
+        ),
+        "mp4_segment_files_output_dir": os.path.join(
+            settings.MOVIO_LOCAL_VIDEO_STORAGE_SEGMENTS_ROOT_DIR, raw_video_filename
+        ),
+    }
+
+    scratch = mq_data.get("scratch") or {}
+    ram_scratch_paths = get_ram_scratch_paths(mq_data)
+    if scratch.get("mp4") == "ram":
+        local_video_paths["local_mp4_video_file_path"] = ram_scratch_paths[
+            "local_mp4_video_file_path"
+        ]
+    if scratch.get("segments") == "ram":
+        local_video_paths["mp4_segment_files_output_dir"] = ram_scratch_paths[
+            "mp4_segment_files_output_dir"
+        ]
+
+    return local_video_paths
+
+
+def get_translated_cc_file_path(local_cc_file_path: str, lang: str) -> str:
+    """BASE_DIR/movio-local-cc-files/video_filename.bn.vtt: a subtitle translated in the worker."""
+
+    return f"{os.path.splitext(local_cc_file_path)[0]}.{lang}.vtt"
+
+
+def remove_local_video_files(mq_data: dict) -> bool:
+    """Remove every local file of a video (source, mp4, subtitle and segments), returns True on success."""
+
+    local_video_paths = get_local_video_paths(mq_data)
+    file_paths = [
+        local_video_paths[key]
+        for key in ("local_video_file_path", "local_mp4_video_file_path", "local_cc_file_path")
+    ]
+    # the subtitles translated in the worker, kept until the manifest is edited
+    file_paths.extend(
+        get_translated_cc_file_path(local_video_paths["local_cc_file_path"], lang)
+        for lang in settings.MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES
+    )
+    dir_paths = [local_video_paths["mp4_segment_files_output_dir"]]
+
+    if mq_data.get("scratch"):
+        # both tiers: the RAM scratch might have fallen back to the disk on a retry
+        ram_scratch_paths = get_ram_scratch_paths(mq_data)
+        file_paths.append(ram_scratch_paths["local_mp4_video_file_path"])
+        dir_paths.append(ram_scratch_paths["mp4_segment_files_output_dir"])
+        mq_data = {**mq_data, "scratch": None}
+        disk_paths = get_local_video_paths(mq_data)
+        file_paths.append(disk_paths["local_mp4_video_file_path"])
+        dir_paths.append(disk_paths["mp4_segment_files_output_dir"])
+
+    try:
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        for dir_path in dir_paths:
+            if os.path.exists(dir_path):
+                shutil.rmtree(dir_path)
+
+        return True
+
+    except OSError as e:
+        logger.error(
+            f"\n[XX WORKSPACE CLEANUP ERROR XX]: Local Files Could Not Be Removed.\nVideo: {mq_data.get('video_filename_with_extention')}\nException: {str(e)}"
+        )
+        return False
+
+
+def touch_workspace_index(mq_data: dict) -> None:
+    """Record the activity of the workspace of a video, called when a stage of its pipeline starts.
+
+    Queued on the pipeline status writer (task_prerun must not wait on redis), a dropped write only
+    ages the entry: the sweeper also goes by the file writes and the pipeline status.
+    """
+
+    entry = json.dumps(
+        {
+            "video_id": mq_data.get("video_id"),
+            "node": get_workspace_node_id(),
+            "last_activity_at": time.time(),
+        }
+    )
+    workspace_name = get_workspace_name(mq_data)
+    status_writer.submit(
+        lambda pipeline: pipeline.hset(WORKSPACE_INDEX_KEY, workspace_name, entry)
+    )
+
+
+def get_workspace_index() -> dict:
+    """{workspace name: {"video_id", "node", "last_activity_at"}}"""
+
+    return {
+        workspace_name: json.loads(entry)
+        for workspace_name, entry in get_redis_client()
+        .hgetall(WORKSPACE_INDEX_KEY)
+        .items()
+    }
+
+
+def release_workspace_budget(workspace_node: str, video_id: str) -> None:
+    get_redis_client().hdel(
+        WORKSPACE_BUDGET_KEY.format(hostname=workspace_node), video_id
+    )
+
+
+def release_scratch_budget(scratch_node: str, video_id: str) -> None:
+    get_redis_client().hdel(SCRATCH_BUDGET_KEY.format(hostname=scratch_node), video_id)
+
+
+def remove_workspace_file(path: str) -> int:
+    """Remove a file no later stage needs, returns the bytes freed (0 when already removed)."""
+
+    try:
+        size_bytes = os.path.getsize(path)
+        os.remove(path)
+        return size_bytes
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        # left for finish_video_pipeline
+        logger.warning(
+            f"\n[## WORKSPACE CLEANUP WARNING]: Local File Could Not Be Removed.\nFile: {path}\nException: {str(e)}"
+        )
+        return 0
+
+
+@lru_cache(maxsize=None)
+def read_workspace_node_id(storage_root: str) -> str:
+    """The id written in the storage root, written first if missing (the first worker to use the volume)."""
+
+    os.makedirs(storage_root, exist_ok=True)
+    node_id_path = os.path.join(storage_root, WORKSPACE_NODE_ID_FILENAME)
+    if not os.path.exists(node_id_path):
+        tmp_path = f"{node_id_path}.{uuid.uuid4().hex}"
+        with open(tmp_path, "w") as node_id_file:
+            node_id_file.write(f"{NODE_HOSTNAME}-{uuid.uuid4().hex[:12]}")
+        try:
+            # atomic and never overwrites: the workers starting together all read the first id written
+            os.link(tmp_path, node_id_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    with open(node_id_path) as node_id_file:
+        return node_id_file.read().strip()
+
+
+def get_workspace_node_id() -> str:
+    """Id of the storage of the workspaces of this worker: the node of its disk budget.
+
+    The worker containers of a host mount the same storage volume: they share its budget, whatever their hostname.
+    """
+
+    if settings.MOVIO_WORKSPACE_NODE_ID:
+        return settings.MOVIO_WORKSPACE_NODE_ID
+    return read_workspace_node_id(str(settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT))
+
+
+def get_workspace_disk_budget() -> int:
+    """Disk budget of the workspaces of this node, in bytes."""
+
+    if settings.MOVIO_WORKSPACE_DISK_BUDGET_BYTES:
+        return settings.MOVIO_WORKSPACE_DISK_BUDGET_BYTES
+
+    storage_root = settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT
+    storage_root.mkdir(parents=True, exist_ok=True)
+    return int(
+        shutil.disk_usage(storage_root).total * settings.MOVIO_WORKSPACE_DISK_BUDGET_RATIO
+    )
+
+
+def reserve_workspace_budget(video_id: str, reserved_bytes: int) -> bool:
+    """Reserve reserved_bytes of the disk budget of this node, returns False when it doesn't fit.
+
+    A video alone on the node is always admitted, even over the budget, so it can't wait forever.
+    """
+
+    return reserve_node_budget(
+        WORKSPACE_BUDGET_KEY.format(hostname=get_workspace_node_id()),
+        get_workspace_disk_budget(),
+        video_id,
+        reserved_bytes,
+        admit_alone=True,
+    )
+
+
+def reserve_node_budget(
+    budget_key: str,
+    budget_bytes: int,
+    video_id: str,
+    reserved_bytes: int,
+    admit_alone: bool = False,
+) -> bool:
+    """Reserve reserved_bytes of a budget shared by the workers of a node (redis hash budget_key).
+
+    admit_alone: a video alone is admitted even over the budget.
+    """
+
+    redis_client = get_redis_client()
+    min_reserved_at = time.time() - settings.MOVIO_WORKSPACE_RESERVATION_TTL_SECONDS
+
+    def reserve(pipe) -> bool:
+        reserved_total_bytes = 0
+        stale_video_ids = []
+        for other_video_id, reservation in pipe.hgetall(budget_key).items():
+            other_reserved_bytes, reserved_at = reservation.split(":")
+            if float(reserved_at) < min_reserved_at:
+                stale_video_ids.append(other_video_id)
+            elif other_video_id != video_id:
+                reserved_total_bytes += int(other_reserved_bytes)
+
+        fits = reserved_total_bytes + reserved_bytes <= budget_bytes or (
+            admit_alone and reserved_total_bytes == 0
+        )
+
+        pipe.multi()
+        if stale_video_ids:
+            pipe.hdel(budget_key, *stale_video_ids)
+        if fits:
+            pipe.hset(budget_key, video_id, f"{int(reserved_bytes)}:{time.time()}")
+        return fits
+
+    # optimistic locking: retried when another worker changes the reservations meanwhile
+    return redis_client.transaction(reserve, budget_key, value_from_callable=True)
+
+
+def reserve_video_workspace(mq_data: dict) -> bool:
+    """Reserve the workspace of a video before its download, returns False when the node budget is full.
+
+    The reservation is recorded in the mq data (workspace_node, workspace_reserved_bytes), so it is
+    released on the right node whichever worker ends the pipeline.
+    """
+
+    if mq_data.get("workspace_node"):
+        # already reserved (the download task is retried)
+        return True
+
+    source_bytes = mq_data.get("s3_file_size_bytes")
+    if not source_bytes:
+        from core_apps.mq_manager.priority_lanes import get_s3_object_size
+
+        try:
+            source_bytes = get_s3_object_size(mq_data["s3_file_key"])
+        except Exception as e:
+            # the download fails on its own if the object is gone
+            logger.warning(
+                f"\n[## WORKSPACE BUDGET WARNING]: Source Size Unknown, Workspace Not Budgeted.\nException: {str(e)}"
+            )
+            return True
+
+    reserved_bytes = int(source_bytes * settings.MOVIO_WORKSPACE_BUDGET_FACTOR)
+
+    try:
+        if not reserve_workspace_budget(mq_data["video_id"], reserved_bytes):
+            return False
+    except Exception as e:
+        # redis down: the pipeline runs without a budget
+        logger.warning(
+            f"\n[## WORKSPACE BUDGET WARNING]: Workspace Budget Could Not Be Reserved.\nException: {str(e)}"
+        )
+        return True
+
+    mq_data["workspace_node"] = get_workspace_node_id()
+    mq_data["workspace_reserved_bytes"] = reserved_bytes
+    return True
+
+
+def release_video_workspace(mq_data: dict) -> None:
+    """Remove what is left of the workspace of a video and release its reservation, once the pipeline ends."""
+
+    remove_local_video_files(mq_data)
+
+    # queued behind the index touches of this process, so a late touch can't recreate the entry
+    workspace_name = get_workspace_name(mq_data)
+    status_writer.submit(lambda pipeline: pipeline.hdel(WORKSPACE_INDEX_KEY, workspace_name))
+
+    try:
+        if mq_data.get("workspace_node"):
+            release_workspace_budget(mq_data["workspace_node"], mq_data["video_id"])
+        if (mq_data.get("scratch") or {}).get("node"):
+            release_scratch_budget(mq_data["scratch"]["node"], mq_data["video_id"])
+    except Exception as e:
+        # the reservation expires after MOVIO_WORKSPACE_RESERVATION_TTL_SECONDS anyway
+        logger.warning(
+            f"\n[## WORKSPACE BUDGET WARNING]: Workspace Reservation Could Not Be Released.\nException: {str(e)}"
+        )
@@ -0,0 +1,279 @@
+"""
+Orphaned workspace sweeper.
+
+A crashed worker or a lost chain leaves its files under tmp-s3-downloads, tmp-segments and
+movio-local-cc-files, finish_video_pipeline never runs for it. The sweeper (celery beat, and the
+sweep_workspaces command) groups the local files by workspace, joins them with the workspace index
+(owning video_id, last activity) and the pipeline status, and reclaims the stale workspaces
+oldest-first until the disk usage of MOVIO_LOCAL_VIDEO_STORAGE_ROOT is under the target.
+
+A workspace is stale once idle (no file write, no stage started) for:
+- MOVIO_WORKSPACE_SWEEP_GRACE_SECONDS when its pipeline is over (finished, failed or cancelled)
+- MOVIO_WORKSPACE_SWEEP_STALE_SECONDS otherwise: still running for the pipeline status (the worker
+  died), or unknown (never indexed, or the status expired)
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+
+from core_apps.common.metrics import record_workspace_reclaimed
+from core_apps.common.redis_utils import get_redis_client
+from core_apps.workers.pipeline_status import (
+    CANCELLED,
+    FAILED,
+    FINISHED,
+    get_pipeline_status,
+)
+from core_apps.workers.workspace import (
+    WORKSPACE_INDEX_KEY,
+    get_workspace_index,
+    release_workspace_budget,
+)
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = (FINISHED, FAILED, CANCELLED)
+
+
+def get_workspace_roots() -> dict:
+    """{kind: directory} of the workspace files, the segments directories hold a directory per workspace."""
+
+    return {
+        "download": str(settings.MOVIO_LOCAL_VIDEO_STORAGE_S3_DOWNLOAD_DIR),
+        "segments": str(settings.MOVIO_LOCAL_VIDEO_STORAGE_SEGMENTS_ROOT_DIR),
+        "subtitle": str(settings.MOVIO_LOCAL_CC_STORAGE_ROOT),
+        # the RAM scratch of this host (scratch)
+        "ram-mp4": os.path.join(settings.MOVIO_SCRATCH_RAM_DIR, "mp4"),
+        "ram-segments": os.path.join(settings.MOVIO_SCRATCH_RAM_DIR, "segments"),
+    }
+
+
+def get_path_usage(path: str) -> tuple:
+    """(size in bytes, last modification) of a file, or of every file of a directory."""
+
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    size_bytes = 0
+    modified_at = os.stat(path).st_mtime
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            try:
+                stat = os.stat(os.path.join(root, file))
+            except FileNotFoundError:
+                continue
+            size_bytes += stat.st_size
+            modified_at = max(modified_at, stat.st_mtime)
+    return size_bytes, modified_at
+
+
+def scan_workspaces() -> dict:
+    """{workspace name: {"paths", "size_bytes", "modified_at"}} of the local workspace files."""
+
+    workspaces = {}
+    for root in get_workspace_roots().values():
+        if not os.path.isdir(root):
+            continue
+
+        for entry in os.scandir(root):
+            # 7317dea7-39ac-4311-b6ea-f5920fc90c86__test2(.mkv|.mp4|.vtt|/)
+            workspace_name = entry.name.split(".")[0]
+            try:
+                size_bytes, modified_at = get_path_usage(entry.path)
+            except FileNotFoundError:
+                # removed by its pipeline meanwhile
+                continue
+
+            workspace = workspaces.setdefault(
+                workspace_name, {"paths": [], "size_bytes": 0, "modified_at": 0.0}
+            )
+            workspace["paths"].append(entry.path)
+            workspace["size_bytes"] += size_bytes
+            workspace["modified_at"] = max(workspace["modified_at"], modified_at)
+
+    return workspaces
+
+
+def get_disk_usage() -> tuple:
+    """(used bytes, total bytes) of the disk of MOVIO_LOCAL_VIDEO_STORAGE_ROOT."""
+
+    storage_root = settings.MOVIO_LOCAL_VIDEO_STORAGE_ROOT
+    storage_root.mkdir(parents=True, exist_ok=True)
+    usage = shutil.disk_usage(storage_root)
+    return usage.used, usage.total
+
+
+def prune_workspace_index(index: dict, workspaces: dict, now: float) -> int:
+    """Drop the index entries without local files (a lost chain cleaned up by another path) once expired."""
+
+    min_last_activity_at = now - settings.MOVIO_PIPELINE_STATUS_TTL_SECONDS
+    expired_workspace_names = [
+        workspace_name
+        for workspace_name, entry in index.items()
+        if workspace_name not in workspaces
+        and (entry.get("last_activity_at") or 0) < min_last_activity_at
+    ]
+    if expired_workspace_names:
+        get_redis_client().hdel(WORKSPACE_INDEX_KEY, *expired_workspace_names)
+    return len(expired_workspace_names)
+
+
+def get_stale_workspaces(workspaces: dict, index: dict, now: float) -> tuple:
+    """(stale workspaces oldest-first, count of the in flight ones), each workspace annotated with its owner."""
+
+    stale_workspaces = []
+    in_flight = 0
+    for workspace_name, workspace in workspaces.items():
+        entry = index.get(workspace_name) or {}
+        video_id = entry.get("video_id")
+
+        status = None
+        if video_id is not None:
+            try:
+                status = get_pipeline_status(video_id)
+            except Exception:
+                status = None
+
+        last_activity_at = max(
+            workspace["modified_at"],
+            entry.get("last_activity_at") or 0,
+            (status or {}).get("updated_at") or 0,
+        )
+        state = (status or {}).get("state")
+        idle_seconds = now - last_activity_at
+        stale_seconds = (
+            settings.MOVIO_WORKSPACE_SWEEP_GRACE_SECONDS
+            if state in TERMINAL_STATES
+            else settings.MOVIO_WORKSPACE_SWEEP_STALE_SECONDS
+        )
+
+        if idle_seconds < stale_seconds:
+            in_flight += 1
+            continue
+
+        stale_workspaces.append(
+            {
+                "workspace": workspace_name,
+                "video_id": video_id,
+                "node": entry.get("node"),
+                "state": state,
+                "idle_seconds": round(idle_seconds),
+                "size_bytes": workspace["size_bytes"],
+                "paths": workspace["paths"],
+                "last_activity_at": last_activity_at,
+            }
+        )
+
+    stale_workspaces.sort(key=lambda workspace: workspace["last_activity_at"])
+    return stale_workspaces, in_flight
+
+
+def reclaim_workspace(workspace: dict) -> int:
+    """Remove the files of a stale workspace, drop it from the index and release its budget, returns the bytes reclaimed."""
+
+    reclaimed_bytes = 0
+    for path in workspace["paths"]:
+        try:
+            size_bytes, _ = get_path_usage(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            reclaimed_bytes += size_bytes
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(
+                f"\n[XX WORKSPACE SWEEP ERROR XX]: Workspace File Could Not Be Removed.\nFile: {path}\nException: {str(e)}"
+            )
+
+    try:
+        get_redis_client().hdel(WORKSPACE_INDEX_KEY, workspace["workspace"])
+        if workspace["video_id"] and workspace["node"]:
+            release_workspace_budget(workspace["node"], workspace["video_id"])
+    except Exception as e:
+        logger.warning(
+            f"\n[## WORKSPACE SWEEP WARNING]: Workspace Index Could Not Be Updated.\nException: {str(e)}"
+        )
+
+    record_workspace_reclaimed(reclaimed_bytes)
+    return reclaimed_bytes
+
+
+def sweep_orphaned_workspaces(
+    target_usage_ratio: float = None, reclaim_all: bool = False, dry_run: bool = False
+) -> dict:
+    """Reclaim the stale workspaces oldest-first until the disk usage is under target_usage_ratio.
+
+    reclaim_all: reclaim every stale workspace, whatever the disk usage.
+    dry_run: only report what would be reclaimed.
+    """
+
+    if target_usage_ratio is None:
+        target_usage_ratio = settings.MOVIO_WORKSPACE_SWEEP_TARGET_USAGE_RATIO
+
+    now = time.time()
+    workspaces = scan_workspaces()
+
+    try:
+        index = get_workspace_index()
+        if not dry_run:
+            prune_workspace_index(index, workspaces, now)
+    except Exception as e:
+        # without the index every workspace is unknown: only the long stale delay applies
+        logger.warning(
+            f"\n[## WORKSPACE SWEEP WARNING]: Workspace Index Unavailable.\nException: {str(e)}"
+        )
+        index = {}
+
+    stale_workspaces, in_flight = get_stale_workspaces(workspaces, index, now)
+
+    used_bytes, total_bytes = get_disk_usage()
+    usage_ratio_before = used_bytes / total_bytes
+    reclaimed = []
+    reclaimed_bytes = 0
+
+    for workspace in stale_workspaces:
+        if not reclaim_all and used_bytes / total_bytes < target_usage_ratio:
+            break
+
+        if dry_run:
+            workspace_bytes = workspace["size_bytes"]
+            used_bytes -= workspace_bytes
+        else:
+            workspace_bytes = reclaim_workspace(workspace)
+            used_bytes, total_bytes = get_disk_usage()
+
+        reclaimed_bytes += workspace_bytes
+        reclaimed.append(
+            {
+                "workspace": workspace["workspace"],
+                "video_id": workspace["video_id"],
+                "state": workspace["state"],
+                "idle_seconds": workspace["idle_seconds"],
+                "reclaimed_bytes": workspace_bytes,
+            }
+        )
+
+    report = {
+        "dry_run": dry_run,
+        "workspaces": len(workspaces),
+        "workspace_bytes": sum(workspace["size_bytes"] for workspace in workspaces.values()),
+        "in_flight": in_flight,
+        "stale": len(stale_workspaces),
+        "reclaimed": reclaimed,
+        "reclaimed_bytes": reclaimed_bytes,
+        "target_usage_ratio": target_usage_ratio,
+        "usage_ratio_before": usage_ratio_before,
+        "usage_ratio_after": used_bytes / total_bytes,
+    }
+    logger.info(
+        f"\n[=> WORKSPACE SWEEP SUCCESS]: {len(reclaimed)} Workspaces Reclaimed, {reclaimed_bytes} Bytes.\n{json.dumps({key: value for key, value in report.items() if key != 'reclaimed'})}"
+    )
+    return report
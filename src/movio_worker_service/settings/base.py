@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from environ import Env
+from kombu.common import Broadcast
 from pathlib import Path
 
 env = Env()
@@ -136,3 +137,537 @@ MOVIO_LOCAL_CC_STORAGE_ROOT = BASE_DIR / "movio-local-cc-files"
 
 # Traget languages to transranslate the subtiles: bengali, hindi, french, spanish
 MOVIO_SUBTITLE_TRANSLATE_TARGET_LANGUAGES = ["en", "bn", "hi", "fr", "es"] 
+
+# Duration of the DASH segments (seconds), of the video and audio and of the segmented subtitles
+MOVIO_DASH_SEGMENT_DURATION_SECONDS = 4
+
+##############################
+
+# Subtitle Translation
+
+# "lambda": the extracted subtitle is uploaded to the raw cc bucket, translated by the Lambda (S3 event).
+# "worker": translated in the worker (translate_subtitles), the languages ready are known before the publish.
+MOVIO_SUBTITLE_TRANSLATION_MODE = env("MOVIO_SUBTITLE_TRANSLATION_MODE", default="lambda")
+
+# translator backend of the worker mode: "aws" (Amazon Translate), "local" (deterministic
+# offline stub, tests and benchmarks) or the dotted path of a Translator subclass
+MOVIO_SUBTITLE_TRANSLATOR = env("MOVIO_SUBTITLE_TRANSLATOR", default="aws")
+
+# language of the extracted subtitle, uploaded as is
+MOVIO_SUBTITLE_SOURCE_LANGUAGE = "en"
+
+# The subtitles available in the worker (the extracted one, the ones translated in the worker mode)
+# are split into WebVTT segments of MOVIO_DASH_SEGMENT_DURATION_SECONDS, described by a SegmentTemplate
+# in the MPD. The whole files are still uploaded to subtitles/.
+MOVIO_SUBTITLE_SEGMENTED_DELIVERY = env.bool(
+    "MOVIO_SUBTITLE_SEGMENTED_DELIVERY", default=True
+)
+
+# max cues per batch, a batch is a single request of the translator (also under its request size limit)
+MOVIO_SUBTITLE_TRANSLATE_BATCH_CUES = env.int(
+    "MOVIO_SUBTITLE_TRANSLATE_BATCH_CUES", default=200
+)
+
+# requests in flight (batches x languages translated concurrently) per subtitle
+MOVIO_SUBTITLE_TRANSLATE_CONCURRENCY = env.int(
+    "MOVIO_SUBTITLE_TRANSLATE_CONCURRENCY", default=8
+)
+
+# simulated round trip of every request of the "local" translator
+MOVIO_SUBTITLE_LOCAL_TRANSLATOR_LATENCY_SECONDS = env.float(
+    "MOVIO_SUBTITLE_LOCAL_TRANSLATOR_LATENCY_SECONDS", default=0.0
+)
+
+##############################
+
+# Translation Memory
+
+# Cue translations remembered by (normalized text, source language, target language): an in-process
+# LRU in front of "redis" (shared by the workers), "sqlite" (a file of the node) or "none" (the LRU only).
+MOVIO_TRANSLATION_MEMORY_ENABLED = env.bool("MOVIO_TRANSLATION_MEMORY_ENABLED", default=True)
+MOVIO_TRANSLATION_MEMORY_BACKEND = env("MOVIO_TRANSLATION_MEMORY_BACKEND", default="redis")
+
+# entries of the in-process LRU (per worker process)
+MOVIO_TRANSLATION_MEMORY_LRU_ENTRIES = env.int(
+    "MOVIO_TRANSLATION_MEMORY_LRU_ENTRIES", default=50000
+)
+
+# redis: an entry expires this long after its last write
+MOVIO_TRANSLATION_MEMORY_TTL_SECONDS = env.int(
+    "MOVIO_TRANSLATION_MEMORY_TTL_SECONDS", default=90 * 24 * 60 * 60
+)
+
+# sqlite: out of the local workspace roots (the sweeper would reclaim it)
+MOVIO_TRANSLATION_MEMORY_SQLITE_PATH = env(
+    "MOVIO_TRANSLATION_MEMORY_SQLITE_PATH",
+    default=str(BASE_DIR / "movio-translation-memory" / "translation-memory.sqlite3"),
+)
+
+# Amazon Translate: max size of a request (the service limit is 10,000 bytes of UTF-8 text)
+MOVIO_AWS_TRANSLATE_MAX_REQUEST_BYTES = env.int(
+    "MOVIO_AWS_TRANSLATE_MAX_REQUEST_BYTES", default=9000
+)
+
+##############################
+
+# Compressed Text Uploads
+
+# The manifests (.mpd) and subtitles (.vtt) delivered from the segments bucket are stored gzip compressed
+# (Content-Encoding: gzip) with their Content-Type and Cache-Control, the binary segments are untouched.
+MOVIO_S3_COMPRESS_TEXT_ASSETS = env.bool("MOVIO_S3_COMPRESS_TEXT_ASSETS", default=True)
+MOVIO_S3_GZIP_LEVEL = env.int("MOVIO_S3_GZIP_LEVEL", default=9)
+
+# smaller files are stored as they are (the gzip overhead outweighs the saving)
+MOVIO_S3_COMPRESSION_MIN_BYTES = env.int("MOVIO_S3_COMPRESSION_MIN_BYTES", default=512)
+
+# also store a brotli variant at <key>.br (needs the optional brotli package), for a CDN selecting it by Accept-Encoding
+MOVIO_S3_BROTLI_VARIANTS = env.bool("MOVIO_S3_BROTLI_VARIANTS", default=False)
+MOVIO_S3_BROTLI_QUALITY = env.int("MOVIO_S3_BROTLI_QUALITY", default=11)
+
+# threads of the compression pool of a worker process (the batch uploads go on meanwhile)
+MOVIO_S3_COMPRESSION_THREADS = env.int("MOVIO_S3_COMPRESSION_THREADS", default=2)
+
+MOVIO_S3_MANIFEST_CACHE_CONTROL = env(
+    "MOVIO_S3_MANIFEST_CACHE_CONTROL", default="public, max-age=60"
+)
+MOVIO_S3_SUBTITLE_CACHE_CONTROL = env(
+    "MOVIO_S3_SUBTITLE_CACHE_CONTROL", default="public, max-age=31536000, immutable"
+)
+
+##############################
+
+# Result Message Payload
+
+# The extracted subtitle of the video process result message: a larger one is referenced by its S3 object
+# (bucket, key, sha256 and size) instead of being inlined in the message. Opt-in, once the API Service reads
+# subtitle_en_vtt_s3 (None: always inlined, as the API Service has always read it).
+MOVIO_RESULT_SUBTITLE_INLINE_MAX_BYTES = env.int(
+    "MOVIO_RESULT_SUBTITLE_INLINE_MAX_BYTES", default=None
+)
+
+# encoding of an inlined subtitle, subtitle_en_vtt_content_encoding in the message: "identity" (the plain
+# text, as the API Service has always read it), or opt-in "gzip" / "zstd" (base64 of the compressed text,
+# zstd needs the optional zstandard package, gzip without it) once the consumers decode the encoding
+MOVIO_RESULT_SUBTITLE_ENCODING = env("MOVIO_RESULT_SUBTITLE_ENCODING", default="identity")
+
+##############################
+
+# Transfer Integrity
+
+# S3 additional checksum computed while the files stream (uploads and the raw video download):
+# "CRC32", "CRC32C" (needs the optional crc32c package, CRC32 without it) or "none" (plain transfers)
+MOVIO_S3_CHECKSUM_ALGORITHM = env("MOVIO_S3_CHECKSUM_ALGORITHM", default="CRC32")
+
+# the raw video download is checked against the size and checksum of the object
+MOVIO_S3_VERIFY_DOWNLOADS = env.bool("MOVIO_S3_VERIFY_DOWNLOADS", default=True)
+
+##############################
+
+# S3 Request Rate Limiting
+
+# Every S3 request attempt waits for a token of the bucket of its (bucket, read / write, prefix),
+# "redis": the buckets are shared by the workers, "local": per process.
+MOVIO_S3_RATE_LIMIT_ENABLED = env.bool("MOVIO_S3_RATE_LIMIT_ENABLED", default=True)
+MOVIO_S3_RATE_LIMIT_BACKEND = env("MOVIO_S3_RATE_LIMIT_BACKEND", default="redis")
+
+# rates of a prefix (requests per second, the S3 limits), the prefix: the first N directories of the key
+# (segments/<uuid__name>: a prefix per video)
+MOVIO_S3_RATE_LIMIT_WRITE_PER_SECOND = env.float("MOVIO_S3_RATE_LIMIT_WRITE_PER_SECOND", default=3500)
+MOVIO_S3_RATE_LIMIT_READ_PER_SECOND = env.float("MOVIO_S3_RATE_LIMIT_READ_PER_SECOND", default=5500)
+MOVIO_S3_RATE_LIMIT_PREFIX_DEPTH = env.int("MOVIO_S3_RATE_LIMIT_PREFIX_DEPTH", default=2)
+
+# burst of a bucket: this many seconds of its rate
+MOVIO_S3_RATE_LIMIT_BURST_SECONDS = 1.0
+
+# AIMD: a SlowDown multiplies the rate of the bucket (and the concurrency limit of the process) by the
+# factor, at most once per interval; the rate grows back by the increase every second, down to the min rate
+MOVIO_S3_RATE_LIMIT_DECREASE_FACTOR = 0.5
+MOVIO_S3_RATE_LIMIT_DECREASE_INTERVAL_SECONDS = 1.0
+MOVIO_S3_RATE_LIMIT_INCREASE_PER_SECOND = 50
+MOVIO_S3_RATE_LIMIT_MIN_PER_SECOND = 20
+
+# the bucket of an idle prefix expires (its rate starts again at the S3 rate)
+MOVIO_S3_RATE_LIMIT_IDLE_TTL_SECONDS = 300
+
+# redis unreachable: each process uses a local bucket with rate / this (about the processes of the fleet),
+# redis is tried again after the retry time
+MOVIO_S3_RATE_LIMIT_FALLBACK_PROCESSES = env.int("MOVIO_S3_RATE_LIMIT_FALLBACK_PROCESSES", default=8)
+MOVIO_S3_RATE_LIMIT_REDIS_RETRY_SECONDS = 30
+
+# S3 requests in flight of a process (AIMD between the min and the max), the max is the connection pool
+MOVIO_S3_MAX_CONCURRENCY = env.int("MOVIO_S3_MAX_CONCURRENCY", default=20)
+MOVIO_S3_MIN_CONCURRENCY = 2
+
+# retries of botocore ("standard": full jitter exponential backoff), and the backoff of the task retries
+MOVIO_S3_RETRY_MODE = env("MOVIO_S3_RETRY_MODE", default="standard")
+MOVIO_S3_MAX_ATTEMPTS = env.int("MOVIO_S3_MAX_ATTEMPTS", default=5)
+MOVIO_S3_RETRY_BACKOFF_BASE_SECONDS = 1
+MOVIO_S3_RETRY_BACKOFF_CAP_SECONDS = 60
+
+##############################
+
+# Preview Clip
+
+# A short, low resolution preview clip is generated in parallel with the main chain
+# so that the API Service has something to show for long uploads.
+MOVIO_PREVIEW_CLIP_ENABLED = env.bool("MOVIO_PREVIEW_CLIP_ENABLED", default=True)
+
+# Only the first N seconds of the video are encoded for the preview.
+MOVIO_PREVIEW_CLIP_DURATION_SECONDS = env.int(
+    "MOVIO_PREVIEW_CLIP_DURATION_SECONDS", default=30
+)
+MOVIO_PREVIEW_CLIP_RESOLUTION = "426x240"
+MOVIO_PREVIEW_CLIP_FFMPEG_PRESET = "ultrafast"
+
+# Preview clips will be saved in this directory before the S3 upload
+MOVIO_LOCAL_VIDEO_STORAGE_PREVIEW_DIR = MOVIO_LOCAL_VIDEO_STORAGE_ROOT / "tmp-previews"
+
+# Dedicated celery queue for the preview task, so it never waits behind full length encodes.
+MOVIO_PREVIEW_CELERY_QUEUE = "movio-preview"
+
+# The raw S3 object is held while the preview reads it: the chain defers its delete to the preview task.
+# The hold expires after this, if the preview worker is lost mid task.
+MOVIO_PREVIEW_SOURCE_HOLD_TTL_SECONDS = env.int(
+    "MOVIO_PREVIEW_SOURCE_HOLD_TTL_SECONDS", default=2 * 60 * 60
+)
+
+##############################
+
+# Priority Lanes
+
+# Each submission is classified into a lane by the S3 object size (S3 HEAD) or, if probing is
+# enabled, by the video duration (ffprobe). Lanes are checked in order, the first lane whose thresholds
+# are not exceeded wins. Each lane has its own celery queue, hence its own worker allocation.
+# Celery priority with the Redis broker: 0 is the highest priority.
+MOVIO_PRIORITY_LANES = [
+    {
+        "name": "short",
+        "queue": "movio-lane-short",
+        "priority": 0,
+        "max_size_bytes": env.int(
+            "MOVIO_PRIORITY_LANE_SHORT_MAX_SIZE_BYTES", default=100 * 1024 * 1024
+        ),
+        "max_duration_seconds": env.int(
+            "MOVIO_PRIORITY_LANE_SHORT_MAX_DURATION_SECONDS", default=5 * 60
+        ),
+    },
+    {
+        "name": "standard",
+        "queue": "movio-lane-standard",
+        "priority": 3,
+        "max_size_bytes": env.int(
+            "MOVIO_PRIORITY_LANE_STANDARD_MAX_SIZE_BYTES", default=1024 * 1024 * 1024
+        ),
+        "max_duration_seconds": env.int(
+            "MOVIO_PRIORITY_LANE_STANDARD_MAX_DURATION_SECONDS", default=30 * 60
+        ),
+    },
+    {
+        # no thresholds: everything else
+        "name": "long",
+        "queue": "movio-lane-long",
+        "priority": 6,
+        "max_size_bytes": None,
+        "max_duration_seconds": None,
+    },
+]
+
+# Lane used when the submission couldn't be classified (S3 HEAD or probe failure)
+MOVIO_PRIORITY_LANE_DEFAULT = "standard"
+
+# Probe the duration with ffprobe (through a presigned url) instead of relying on the object size only.
+# The probe runs in the background while the submission is queued, a submission released before its
+# probe is done is classified by size.
+MOVIO_PRIORITY_LANE_PROBE_DURATION = env.bool(
+    "MOVIO_PRIORITY_LANE_PROBE_DURATION", default=False
+)
+MOVIO_PRIORITY_LANE_PROBE_THREADS = 2
+
+# Number of recent queue delay samples kept per lane for the report
+MOVIO_PRIORITY_LANE_QUEUE_DELAY_SAMPLES = 1000
+
+##############################
+
+# Fair Share Dispatch
+
+# The consumer keeps per user virtual queues and releases the submissions to celery with
+# (weighted) round robin, so one user bulk uploading can't monopolize the workers.
+
+# Max pipelines in flight, all users together
+MOVIO_FAIR_SHARE_MAX_IN_FLIGHT = env.int("MOVIO_FAIR_SHARE_MAX_IN_FLIGHT", default=8)
+
+# Max pipelines in flight per user
+MOVIO_FAIR_SHARE_PER_USER_MAX_IN_FLIGHT = env.int(
+    "MOVIO_FAIR_SHARE_PER_USER_MAX_IN_FLIGHT", default=2
+)
+
+# Per user overrides of the in flight cap: {user_id: max_in_flight}
+MOVIO_FAIR_SHARE_USER_MAX_IN_FLIGHT = {}
+
+# Per user weights (default 1): a user with weight 2 gets twice the share of a user with weight 1
+MOVIO_FAIR_SHARE_USER_WEIGHTS = {}
+
+# In flight entries older than this are considered dead (chain died without reaching a terminal task)
+MOVIO_FAIR_SHARE_IN_FLIGHT_TTL_SECONDS = 6 * 60 * 60
+
+# The consumer retries to release the queued submissions at this interval
+MOVIO_FAIR_SHARE_RELEASE_INTERVAL_SECONDS = 2
+
+# A submission that could not be dispatched (broker or redis down) stays queued, and the release is
+# paused for this delay, doubled on every consecutive failure up to the max
+MOVIO_FAIR_SHARE_DISPATCH_RETRY_SECONDS = 1
+MOVIO_FAIR_SHARE_DISPATCH_RETRY_MAX_SECONDS = 60
+
+# Unacked messages held by the consumer, the messages are acked once released to celery
+MOVIO_MQ_CONSUMER_PREFETCH_COUNT = env.int(
+    "MOVIO_MQ_CONSUMER_PREFETCH_COUNT", default=500
+)
+
+##############################
+
+# Admission Control (consumer backpressure)
+
+# The consumer stops consuming and dispatching when one of the limits is hit, and resumes once
+# every signal is back under MOVIO_ADMISSION_RESUME_RATIO of its limit.
+
+# Free disk space of MOVIO_LOCAL_VIDEO_STORAGE_ROOT to keep, after the pending downloads
+MOVIO_ADMISSION_MIN_FREE_DISK_BYTES = env.int(
+    "MOVIO_ADMISSION_MIN_FREE_DISK_BYTES", default=5 * 1024 * 1024 * 1024
+)
+
+# Messages waiting in the celery queues of the pipeline
+MOVIO_ADMISSION_MAX_QUEUE_DEPTH = env.int("MOVIO_ADMISSION_MAX_QUEUE_DEPTH", default=50)
+
+# ffmpeg encodes running (transcode and dash segmentation)
+MOVIO_ADMISSION_MAX_IN_FLIGHT_ENCODES = env.int(
+    "MOVIO_ADMISSION_MAX_IN_FLIGHT_ENCODES", default=6
+)
+
+MOVIO_ADMISSION_RESUME_RATIO = 0.8
+
+# Reservations and encodes older than this are considered dead (worker crashed)
+MOVIO_ADMISSION_RESERVATION_TTL_SECONDS = 60 * 60
+MOVIO_ADMISSION_ENCODE_TTL_SECONDS = 6 * 60 * 60
+
+##############################
+
+# Workspace Disk Budget
+
+# Every video reserves MOVIO_WORKSPACE_BUDGET_FACTOR x its source size of the disk budget of the
+# node before its download. With the incremental cleanup the peak disk of a video is
+# max(source + mp4, mp4 + segments), the segments being the 3 renditions of the DASH ladder.
+
+# 0: MOVIO_WORKSPACE_DISK_BUDGET_RATIO of the disk size of MOVIO_LOCAL_VIDEO_STORAGE_ROOT
+MOVIO_WORKSPACE_DISK_BUDGET_BYTES = env.int("MOVIO_WORKSPACE_DISK_BUDGET_BYTES", default=0)
+MOVIO_WORKSPACE_DISK_BUDGET_RATIO = 0.8
+
+MOVIO_WORKSPACE_BUDGET_FACTOR = env.float("MOVIO_WORKSPACE_BUDGET_FACTOR", default=2.5)
+
+# The budget is shared by the workers of the same storage: the containers mounting the same
+# MOVIO_LOCAL_VIDEO_STORAGE_ROOT volume (not their hostnames, one per container).
+# None: an id written in the volume by the first worker that uses it.
+MOVIO_WORKSPACE_NODE_ID = env("MOVIO_WORKSPACE_NODE_ID", default=None)
+
+# the download task is retried every MOVIO_WORKSPACE_RESERVE_RETRY_SECONDS while the budget is full,
+# the pipeline fails after MOVIO_WORKSPACE_RESERVE_MAX_RETRIES
+MOVIO_WORKSPACE_RESERVE_RETRY_SECONDS = 30
+MOVIO_WORKSPACE_RESERVE_MAX_RETRIES = env.int(
+    "MOVIO_WORKSPACE_RESERVE_MAX_RETRIES", default=60
+)
+
+# Reservations older than this are considered dead (worker crashed)
+MOVIO_WORKSPACE_RESERVATION_TTL_SECONDS = 6 * 60 * 60
+
+##############################
+
+# Orphaned Workspace Sweeper
+
+# Celery beat task (and the sweep_workspaces command): the stale workspaces are reclaimed
+# oldest-first until the disk usage of MOVIO_LOCAL_VIDEO_STORAGE_ROOT is under the target.
+MOVIO_WORKSPACE_SWEEP_INTERVAL_SECONDS = env.int(
+    "MOVIO_WORKSPACE_SWEEP_INTERVAL_SECONDS", default=10 * 60
+)
+MOVIO_WORKSPACE_SWEEP_TARGET_USAGE_RATIO = env.float(
+    "MOVIO_WORKSPACE_SWEEP_TARGET_USAGE_RATIO", default=0.7
+)
+
+# idle time (no file write, no stage started) after which a workspace is stale: its pipeline is
+# over (finished, failed, cancelled), or still running / unknown (crashed worker, lost chain)
+MOVIO_WORKSPACE_SWEEP_GRACE_SECONDS = 15 * 60
+MOVIO_WORKSPACE_SWEEP_STALE_SECONDS = env.int(
+    "MOVIO_WORKSPACE_SWEEP_STALE_SECONDS", default=6 * 60 * 60
+)
+
+# Broadcast (fanout) queue of the sweep: every worker consuming it gets a copy and sweeps its own node,
+# one worker per node consumes it (CELERY_WORKER_QUEUES), see: docker/dev/django/celery/worker/start
+MOVIO_WORKSPACE_SWEEP_CELERY_QUEUE = "movio-workspace-sweep"
+CELERY_TASK_QUEUES = (Broadcast(MOVIO_WORKSPACE_SWEEP_CELERY_QUEUE),)
+
+# Periodic tasks, see: docker/dev/django/celery/beat/start
+CELERY_BEAT_SCHEDULE = {
+    "sweep-orphaned-workspaces": {
+        "task": "core_apps.workers.tasks.sweep_orphaned_workspaces_periodic_task",
+        "schedule": MOVIO_WORKSPACE_SWEEP_INTERVAL_SECONDS,
+        "options": {"queue": MOVIO_WORKSPACE_SWEEP_CELERY_QUEUE},
+    },
+}
+
+##############################
+
+# RAM Scratch Tier (segment output)
+
+# The segments (and with MOVIO_SCRATCH_RAM_MP4 the intermediate mp4) are written to a tmpfs when the
+# estimated output of the video fits the memory budget of the node, to the disk otherwise.
+# A submission can force the tier: "scratch_tier": "ram" / "disk".
+MOVIO_SCRATCH_RAM_ENABLED = env.bool("MOVIO_SCRATCH_RAM_ENABLED", default=False)
+MOVIO_SCRATCH_RAM_MP4 = env.bool("MOVIO_SCRATCH_RAM_MP4", default=False)
+MOVIO_SCRATCH_RAM_DIR = env("MOVIO_SCRATCH_RAM_DIR", default="/dev/shm/movio-scratch")
+
+# memory of the node the RAM scratch of all the videos may take (the tmpfs free space is checked too)
+MOVIO_SCRATCH_RAM_BUDGET_BYTES = env.int(
+    "MOVIO_SCRATCH_RAM_BUDGET_BYTES", default=2 * 1024 * 1024 * 1024
+)
+
+# margin over the nominal bitrates of the output (x264 overshoots its target bitrate)
+MOVIO_SCRATCH_RAM_ESTIMATE_FACTOR = 1.25
+
+##############################
+
+# Dedupe Window
+
+# Duplicate submissions (same video_id and s3_file_key) are dropped while the first pipeline is
+# in flight or recently finished. "redis": shared with the workers, "local": consumer process only.
+MOVIO_DEDUPE_BACKEND = env("MOVIO_DEDUPE_BACKEND", default="redis")
+MOVIO_DEDUPE_IN_FLIGHT_TTL_SECONDS = 6 * 60 * 60
+MOVIO_DEDUPE_FINISHED_TTL_SECONDS = env.int(
+    "MOVIO_DEDUPE_FINISHED_TTL_SECONDS", default=60 * 60
+)
+
+##############################
+
+# Cancellation and Deadlines
+
+# A "cancel" message on the submission exchange sets the cancellation flag of the video for this long
+MOVIO_CANCELLATION_TTL_SECONDS = 24 * 60 * 60
+
+# Default deadline of a pipeline, from its dispatch, when the submission has no "deadline_at" (None: no deadline)
+MOVIO_PIPELINE_DEFAULT_DEADLINE_SECONDS = env.int(
+    "MOVIO_PIPELINE_DEFAULT_DEADLINE_SECONDS", default=None
+)
+
+
+##############################
+
+# FFmpeg Runner
+
+# ffmpeg is killed when its output doesn't advance for this long
+MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS = env.int(
+    "MOVIO_FFMPEG_STALL_TIMEOUT_SECONDS", default=120
+)
+
+# Hard timeout of a single ffmpeg command
+MOVIO_FFMPEG_TIMEOUT_SECONDS = env.int("MOVIO_FFMPEG_TIMEOUT_SECONDS", default=4 * 60 * 60)
+
+# Last ffmpeg stderr lines kept for the error payload
+MOVIO_FFMPEG_STDERR_TAIL_LINES = env.int("MOVIO_FFMPEG_STDERR_TAIL_LINES", default=40)
+
+# How often the ffmpeg progress is published to the pipeline status store
+MOVIO_FFMPEG_PROGRESS_PUBLISH_INTERVAL_SECONDS = env.int(
+    "MOVIO_FFMPEG_PROGRESS_PUBLISH_INTERVAL_SECONDS", default=5
+)
+
+
+##############################
+
+# Pipeline Status
+
+# Pipeline status entries (per video, per node) expire after this long without an update
+MOVIO_PIPELINE_STATUS_TTL_SECONDS = env.int(
+    "MOVIO_PIPELINE_STATUS_TTL_SECONDS", default=24 * 60 * 60
+)
+
+# Pending status updates of a process, the updates are dropped (never block a task) when it's full
+MOVIO_PIPELINE_STATUS_QUEUE_SIZE = env.int("MOVIO_PIPELINE_STATUS_QUEUE_SIZE", default=10000)
+
+
+##############################
+
+# Metrics
+
+# Port of the standalone Prometheus exporter (manage.py run_metrics_exporter) of the celery worker hosts
+MOVIO_METRICS_EXPORTER_PORT = env.int("MOVIO_METRICS_EXPORTER_PORT", default=9808)
+
+
+##############################
+
+# Task Profiling (opt-in, per video: "profile": true in the submission, or its video_id listed below)
+
+# profile every video (diagnostics only)
+MOVIO_TASK_PROFILING_ENABLED = env.bool("MOVIO_TASK_PROFILING_ENABLED", default=False)
+MOVIO_TASK_PROFILING_VIDEO_IDS = env.list("MOVIO_TASK_PROFILING_VIDEO_IDS", default=[])
+
+# "cprofile": deterministic (.prof), "sampling": stack samples of the task thread (.folded), lower overhead
+MOVIO_TASK_PROFILING_MODE = env("MOVIO_TASK_PROFILING_MODE", default="cprofile")
+MOVIO_TASK_PROFILING_SAMPLE_INTERVAL_SECONDS = env.float(
+    "MOVIO_TASK_PROFILING_SAMPLE_INTERVAL_SECONDS", default=0.005
+)
+
+# artifacts: <dir>/<video_id>/<stage>-<task_id>.{prof,folded,json}, moved to the bucket when set
+MOVIO_TASK_PROFILING_DIR = env(
+    "MOVIO_TASK_PROFILING_DIR", default=str(BASE_DIR / "movio-task-profiles")
+)
+MOVIO_TASK_PROFILING_S3_BUCKET = env("MOVIO_TASK_PROFILING_S3_BUCKET", default=None)
+MOVIO_TASK_PROFILING_S3_PREFIX = env(
+    "MOVIO_TASK_PROFILING_S3_PREFIX", default="movio-task-profiles"
+)
+
+
+##############################
+
+# MQ Traffic Capture and Replay
+
+# JSONL file the consumer appends the received submission messages to, with their timing (None: not recorded)
+MOVIO_MQ_CAPTURE_PATH = env("MOVIO_MQ_CAPTURE_PATH", default=None)
+# recording stops once the capture file reaches this size
+MOVIO_MQ_CAPTURE_MAX_BYTES = env.int("MOVIO_MQ_CAPTURE_MAX_BYTES", default=1024 * 1024 * 1024)
+
+# presigned urls of the synthetic raw videos uploaded by a replay
+MOVIO_MQ_REPLAY_PRESIGNED_URL_EXPIRES_SECONDS = env.int(
+    "MOVIO_MQ_REPLAY_PRESIGNED_URL_EXPIRES_SECONDS", default=24 * 60 * 60
+)
+
+
+##############################
+
+# Local Backends (benchmarks and load tests, no AWS / CloudAMQP)
+
+# "aws": boto3 S3 client, "local": filesystem stand-in under MOVIO_LOCAL_S3_ROOT (presigned urls are local paths)
+MOVIO_S3_BACKEND = env("MOVIO_S3_BACKEND", default="aws")
+MOVIO_LOCAL_S3_ROOT = env("MOVIO_LOCAL_S3_ROOT", default=str(BASE_DIR / "movio-local-s3"))
+
+# injected faults of the local S3, per request: latency + uniform jitter, transfer time at the bandwidth (0: unlimited),
+# transient errors (SlowDown 503, InternalError 500) retried up to MOVIO_LOCAL_S3_MAX_ATTEMPTS as botocore does
+MOVIO_LOCAL_S3_LATENCY_SECONDS = env.float("MOVIO_LOCAL_S3_LATENCY_SECONDS", default=0.0)
+MOVIO_LOCAL_S3_LATENCY_JITTER_SECONDS = env.float(
+    "MOVIO_LOCAL_S3_LATENCY_JITTER_SECONDS", default=0.0
+)
+MOVIO_LOCAL_S3_BANDWIDTH_BYTES_PER_SECOND = env.int(
+    "MOVIO_LOCAL_S3_BANDWIDTH_BYTES_PER_SECOND", default=0
+)
+MOVIO_LOCAL_S3_ERROR_RATE = env.float("MOVIO_LOCAL_S3_ERROR_RATE", default=0.0)
+MOVIO_LOCAL_S3_THROTTLE_RATE = env.float("MOVIO_LOCAL_S3_THROTTLE_RATE", default=0.0)
+MOVIO_LOCAL_S3_MAX_ATTEMPTS = env.int("MOVIO_LOCAL_S3_MAX_ATTEMPTS", default=5)
+
+# "cloudamqp": RabbitMQ at CLOUD_AMQP_URL, "local": in-process broker stand-in (consumer and publisher in one process)
+MOVIO_AMQP_BACKEND = env("MOVIO_AMQP_BACKEND", default="cloudamqp")
+
+# injected faults of the local broker: connection failures (AMQPConnectionError on connect) and publish latency
+MOVIO_LOCAL_AMQP_CONNECTION_ERROR_RATE = env.float(
+    "MOVIO_LOCAL_AMQP_CONNECTION_ERROR_RATE", default=0.0
+)
+MOVIO_LOCAL_AMQP_PUBLISH_LATENCY_SECONDS = env.float(
+    "MOVIO_LOCAL_AMQP_PUBLISH_LATENCY_SECONDS", default=0.0
+)
+
+# seed of the injected faults, for reproducible load tests (None: random)
+MOVIO_LOCAL_FAULT_SEED = env.int("MOVIO_LOCAL_FAULT_SEED", default=None)
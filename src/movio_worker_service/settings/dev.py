@@ -58,6 +58,12 @@ DJANGO_APP_PORT = env("DJANGO_APP_PORT")
 CELERY_BROKER_URL = env("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
+# Redis priority queues for the priority lanes (0 is the highest priority)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "queue_order_strategy": "priority",
+    "priority_steps": list(range(10)),
+}
+
 
 CELERY_RESULT_BACKEND_MAX_RETRIES = 15
 CELERY_TASK_SEND_SENT_EVENT = True
@@ -66,6 +72,21 @@ CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 if USE_TZ:
     CELERY_TIMEZONE = TIME_ZONE
 
+# ######################### Redis
+
+# Shared low latency store used by the workers and the consumer (lane stats, pipeline state etc.)
+MOVIO_REDIS_URL = env("MOVIO_REDIS_URL", default=CELERY_BROKER_URL)
+
+# The preview task has its own queue (and worker), see: docker/dev/django/celery/worker/start
+CELERY_TASK_ROUTES = {
+    "core_apps.workers.tasks.generate_video_preview_clip": {
+        "queue": MOVIO_PREVIEW_CELERY_QUEUE
+    },
+}
+
+# A queue per worker (<worker hostname>.dq2): the tasks of a video with a RAM scratch stay on its worker
+CELERY_WORKER_DIRECT = True
+
 # ######################### File Storage
 
 AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
@@ -99,6 +120,9 @@ AWS_MOVIO_S3_SEGMENTS_BUCKET_ROOT = "segments"
 # Root of video subtitles in S3
 AWS_MOVIO_S3_SUBTITLES_BUCKET_ROOT = "subtitles"
 
+# Root of video preview clips in S3
+AWS_MOVIO_S3_PREVIEWS_BUCKET_ROOT = "previews"
+
 
 # ########################## RabbitMQ Config
 
@@ -8,6 +8,9 @@ urlpatterns = [
     
     # Common APP 
     path("api/v1/common/", include("core_apps.common.urls")), 
+
+    # Workers APP 
+    path("api/v1/", include("core_apps.workers.urls")), 
     
              
 ]